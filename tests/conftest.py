@@ -0,0 +1,78 @@
+"""
+测试环境：导入 zeek_py 之前把日志、数据、情报与校验缓存目录指向临时目录，
+测试不读写仓库中的 logs/、data/ 等目录。
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+import pytest
+
+_TMP = Path(tempfile.mkdtemp(prefix="zeek-py-tests-"))
+os.environ.update(
+    ZEEK_LOGS_DIR=str(_TMP / "logs"),
+    STORAGE_BACKEND="memory",
+    STORAGE_DATA_DIR=str(_TMP / "data"),
+    INTEL_DIR=str(_TMP / "intel"),
+    ZEEK_CHECK_CACHE=str(_TMP / "zeek_script_check.json"),
+    ZEEK_BIN=str(_TMP / "no-zeek"),
+)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from zeek_py.models import Flow, FlowBatch, ThreatEvent  # noqa: E402
+
+
+def make_batch(
+    ts: Iterable[float],
+    orig_h: str = "10.0.0.1",
+    resp_h: str = "10.0.0.2",
+    resp_p: int = 80,
+    service: Optional[str] = None,
+    conn_state: str = "SF",
+    size: int = 100,
+) -> FlowBatch:
+    """按 ts 列表构造一批 flow，uid 为 C<序号>，其它字段取固定值。"""
+    batch = FlowBatch()
+    for i, t in enumerate(ts):
+        batch.append(
+            t, f"C{i}", orig_h, 40000, resp_h, resp_p, "tcp", service, 1.0, size, size, conn_state
+        )
+    return batch
+
+
+def make_flow(ts: float, uid: str = "C0", **fields: object) -> Flow:
+    values = dict(
+        orig_h="10.0.0.1", orig_p=40000, resp_h="10.0.0.2", resp_p=80, proto="tcp"
+    )
+    values.update(fields)
+    return Flow(ts=datetime.fromtimestamp(ts, tz=timezone.utc), uid=uid, **values)
+
+
+def make_threat(ts: float, note: str = "Test::Notice", **fields: object) -> ThreatEvent:
+    values = dict(msg="test", src="10.0.0.1", level="Notice", source="notice")
+    values.update(fields)
+    return ThreatEvent(ts=datetime.fromtimestamp(ts, tz=timezone.utc), note=note, **values)
+
+
+@pytest.fixture
+def api_client(monkeypatch):
+    """
+    不触发启动钩子（不自动启动 Zeek）的 TestClient，返回 (client, storage)；
+    接口读写一个新的存储，响应缓存同样换成空的，避免命中其它测试的条目。
+    """
+    from fastapi.testclient import TestClient
+
+    from zeek_py import api
+    from zeek_py.cache import ResponseCache
+    from zeek_py.storage import InMemoryStorage
+
+    store = InMemoryStorage(max_flows=1000, max_threats=1000, max_http=1000)
+    monkeypatch.setattr(api, "storage", store)
+    monkeypatch.setattr(api, "response_cache", ResponseCache(1 << 20))
+    return TestClient(api.app), store
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import base64
+
+from conftest import make_batch, make_threat
+
+from zeek_py.storage import InMemoryStorage
+
+T0 = 1_700_000_000.0
+
+
+def _uids(resp) -> list[str]:
+    return [f["uid"] for f in resp.json()]
+
+
+def test_cursor_walks_every_record_once(api_client):
+    client, store = api_client
+    store.add_flow_batch(make_batch([T0 + i for i in range(25)]))
+    # after_seq=-1 从最早的记录开始，之后按到达顺序用游标向后翻页
+    resp = client.get("/api/flows", params={"limit": 10, "after_seq": -1})
+    seen = _uids(resp)
+    while True:
+        cursor = resp.headers["X-Next-Cursor"]
+        resp = client.get("/api/flows", params={"limit": 10, "cursor": cursor})
+        assert resp.status_code == 200
+        if not resp.json():
+            break
+        seen += _uids(resp)
+    assert seen == [f"C{i}" for i in range(25)]
+
+    # 新写入的记录从最后一个游标处继续
+    store.add_flow_batch(make_batch([T0 + 100]))
+    resp = client.get("/api/flows", params={"limit": 10, "cursor": cursor})
+    assert len(resp.json()) == 1 and resp.headers["X-Last-Seq"] == "25"
+
+
+def test_cursor_reports_evicted_records(api_client, monkeypatch):
+    client, _ = api_client
+    from zeek_py import api
+
+    store = InMemoryStorage(max_flows=10, max_threats=10, max_http=10)
+    monkeypatch.setattr(api, "storage", store)
+    store.add_flow_batch(make_batch([T0 + i for i in range(5)]))
+    cursor = client.get("/api/flows", params={"limit": 5, "after_seq": -1}).headers["X-Next-Cursor"]
+
+    # 游标之后写入 20 条，内存只保留最新 10 条：其中 10 条已被淘汰
+    store.add_flow_batch(make_batch([T0 + 5 + i for i in range(20)]))
+    resp = client.get("/api/flows", params={"limit": 100, "cursor": cursor})
+    assert resp.status_code == 200
+    assert resp.headers["X-Skipped"] == "10"
+    assert [f["ts"] for f in resp.json()] == sorted(f["ts"] for f in resp.json())
+    assert len(resp.json()) == 10 and resp.headers["X-Last-Seq"] == "24"
+
+
+def test_cursor_from_previous_process_is_gone(api_client, monkeypatch):
+    client, store = api_client
+    store.add_flow_batch(make_batch([T0]))
+    cursor = client.get("/api/flows", params={"after_seq": -1}).headers["X-Next-Cursor"]
+    assert client.get("/api/flows", params={"cursor": cursor}).status_code == 200
+    monkeypatch.setattr(store, "epoch", "restarted")
+    assert client.get("/api/flows", params={"cursor": cursor}).status_code == 410
+
+
+def test_cursor_validation(api_client):
+    client, store = api_client
+    store.add_threats([make_threat(T0)])
+    cursor = client.get("/api/threats", params={"after_seq": -1}).headers["X-Next-Cursor"]
+    # 不同接口的游标不能混用
+    assert client.get("/api/flows", params={"cursor": cursor}).status_code == 400
+    assert client.get("/api/logs/notice", params={"cursor": cursor}).status_code == 400
+    garbage = base64.urlsafe_b64encode(b"nonsense").decode()
+    assert client.get("/api/flows", params={"cursor": garbage}).status_code == 400
+    assert client.get(
+        "/api/threats", params={"cursor": cursor, "after_seq": 0}
+    ).status_code == 400
+    assert client.get(
+        "/api/threats", params={"cursor": cursor, "since_ts": T0}
+    ).status_code == 400
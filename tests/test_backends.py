@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+from conftest import make_batch, make_threat
+
+from zeek_py.backends import SqliteBackend, StorageBackend
+from zeek_py.storage import InMemoryStorage
+
+DAY = 86400.0
+# 昨天的某一时刻：写线程按保存天数清理分区，测试数据不能太旧
+T0 = (time.time() // DAY - 1) * DAY + 100.0
+
+
+def test_sqlite_round_trip_across_partitions(tmp_path):
+    backend = SqliteBackend(tmp_path / "db.sqlite3", flush_interval=0.05)
+    try:
+        backend.write_flow_batch(make_batch([T0, T0 + 1, T0 + DAY]))
+        backend.write_threats([make_threat(T0 + 2)])
+        assert backend.sync()
+        flows = backend.query_flows(10)
+        assert [f.ts.timestamp() for f in flows] == [T0, T0 + 1, T0 + DAY]
+        assert [f.ts.timestamp() for f in backend.query_flows(1)] == [T0 + DAY]
+        assert len(backend.query_flows(10, since_ts=T0 + 0.5, until_ts=T0 + 1)) == 1
+        assert [t.note for t in backend.query_threats(10)] == ["Test::Notice"]
+        assert backend.max_ts()[:2] == (T0 + DAY, T0 + 2)
+    finally:
+        backend.close()
+
+
+def test_sqlite_queue_is_bounded_by_rows(tmp_path):
+    backend = SqliteBackend(tmp_path / "db.sqlite3", flush_interval=0.01, max_pending_rows=10)
+    release = threading.Event()
+    flush = backend._flush
+
+    def slow_flush(*args):
+        release.wait(5)
+        flush(*args)
+
+    backend._flush = slow_flush  # type: ignore[method-assign]
+    try:
+        # 单个超过上限的批次在队列为空时仍可入队
+        backend.write_flow_batch(make_batch([T0 + i for i in range(15)]))
+        writer = threading.Thread(target=backend.write_flow_batch, args=(make_batch([T0] * 5),))
+        writer.start()
+        time.sleep(0.2)
+        assert writer.is_alive()
+        release.set()
+        writer.join(5)
+        assert not writer.is_alive()
+        assert backend.sync()
+        assert len(backend.query_flows(100)) == 20
+    finally:
+        release.set()
+        backend.close()
+
+
+def test_page_falls_back_to_unflushed_backend_rows(tmp_path):
+    # 写线程要等 60 秒才提交：被内存淘汰的记录只在写队列中
+    backend = SqliteBackend(tmp_path / "db.sqlite3", flush_interval=60.0)
+    storage = InMemoryStorage(max_flows=4, max_threats=4, max_http=4, backend=backend)
+    try:
+        storage.add_flow_batch(make_batch([T0 + i for i in range(10)]))
+        since = datetime.fromtimestamp(T0, tz=timezone.utc)
+        page = storage.page_flows(limit=100, since=since)
+        assert [f.ts.timestamp() for f in page.items] == [T0 + i for i in range(10)]
+    finally:
+        backend.close()
+
+
+def test_backend_interface_is_abstract():
+    class WriteOnly(StorageBackend):
+        def write_flow(self, flow) -> None:
+            pass
+
+    with pytest.raises(TypeError):
+        WriteOnly()
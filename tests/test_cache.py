@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from conftest import make_batch, make_threat
+
+from zeek_py.cache import CachedResponse, ResponseCache
+
+T0 = 1_700_000_000.0
+
+
+def test_entries_expire_on_version_and_since_range():
+    cache = ResponseCache(1 << 20)
+    entry = cache.put("k", CachedResponse((1, 2), b"[]", {}, since_lo=100.0, since_hi=200.0))
+    assert cache.get("k", (1, 2), 150.0) is entry
+    assert cache.get("k", (1, 2), 100.0) is entry and cache.get("k", (1, 2), 200.0) is entry
+    assert cache.get("k", (1, 3), 150.0) is None
+    assert cache.get("k", (1, 2), 99.0) is None and cache.get("k", (1, 2), 201.0) is None
+    # since_ts 为空视为 -inf，只有下限不限的条目命中
+    assert cache.get("k", (1, 2)) is None
+    assert cache.get("other", (1, 2), 150.0) is None
+
+
+def test_lru_eviction_by_bytes():
+    # 每个条目约 656 字节（含固定开销），上限内放得下 5 个
+    cache = ResponseCache(3500)
+    for key in "abcde":
+        cache.put(key, CachedResponse((0,), b"x" * 400, {}))
+    assert cache.get("a", (0,)) is not None
+    # 总量超限：淘汰最久未使用的 b
+    cache.put("f", CachedResponse((0,), b"x" * 400, {}))
+    assert [k for k in "abcdef" if cache.get(k, (0,)) is not None] == ["a", "c", "d", "e", "f"]
+    # 超过上限 1/4 的响应不缓存
+    cache.put("big", CachedResponse((0,), b"x" * 1000, {}))
+    assert cache.get("big", (0,)) is None
+    assert ResponseCache(0).put("k", CachedResponse((0,), b"[]", {})).body == b"[]"
+
+
+def test_etag_matching():
+    entry = CachedResponse((0,), b"[1]", {})
+    assert entry.etag == CachedResponse((5,), b"[1]", {}).etag != CachedResponse((0,), b"[2]", {}).etag
+    assert entry.matches(entry.etag)
+    assert entry.matches(f'"other", W/{entry.etag}')
+    assert entry.matches("*")
+    assert not entry.matches(None) and not entry.matches('"other"')
+
+
+def test_endpoint_cache_follows_write_version(api_client, monkeypatch):
+    client, store = api_client
+    store.add_flow_batch(make_batch([T0, T0 + 1]))
+    calls = []
+    page_flows = store.page_flows
+    monkeypatch.setattr(store, "page_flows", lambda **kw: calls.append(kw) or page_flows(**kw))
+
+    first = client.get("/api/flows", params={"limit": 10})
+    etag = first.headers["ETag"]
+    # 参数顺序、写法不同但取值相同：同一条目
+    again = client.get("/api/flows?limit=10&proto=")
+    assert again.content == first.content and len(calls) == 1
+    not_modified = client.get("/api/flows", params={"limit": 10}, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304 and not not_modified.content
+    assert not_modified.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+
+    # 告警写入不影响流量接口的缓存
+    store.add_threats([make_threat(T0)])
+    client.get("/api/flows", params={"limit": 10})
+    assert len(calls) == 1
+
+    store.add_flow_batch(make_batch([T0 + 2]))
+    fresh = client.get("/api/flows", params={"limit": 10}, headers={"If-None-Match": etag})
+    assert fresh.status_code == 200 and len(fresh.json()) == 3
+    assert fresh.headers["ETag"] != etag and len(calls) == 2
+
+
+def test_since_polling_hits_cache_within_range(api_client, monkeypatch):
+    client, store = api_client
+    store.add_flow_batch(make_batch([T0 + 10, T0 + 20]))
+    calls = []
+    page_flows = store.page_flows
+    monkeypatch.setattr(store, "page_flows", lambda **kw: calls.append(kw) or page_flows(**kw))
+
+    body = client.get("/api/flows", params={"since_ts": T0}).content
+    # 结果不满 limit 条：since 在 [T0, 最早的 ts] 之间前移时结果不变
+    assert client.get("/api/flows", params={"since_ts": T0 + 5}).content == body
+    assert client.get("/api/flows", params={"since_ts": T0 + 10}).content == body
+    assert len(calls) == 1
+    assert len(client.get("/api/flows", params={"since_ts": T0 + 15}).json()) == 1
+    assert len(client.get("/api/flows", params={"since_ts": T0 - 5}).json()) == 2
+    assert len(calls) == 3
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import random
+
+from zeek_py.models import FlowBatch
+from zeek_py.parsers.conn_parser import parse_conn_chunk, parse_conn_line, parse_conn_lines
+from zeek_py.parsers.schema import LogSchema
+
+FIELDS = (
+    "ts", "uid", "id.orig_h", "id.orig_p", "id.resp_h", "id.resp_p",
+    "proto", "service", "duration", "orig_bytes", "resp_bytes", "conn_state",
+)
+SCHEMA = LogSchema(FIELDS)
+
+
+def _dump(flows):
+    return [f.model_dump() for f in flows]
+
+
+def _row(rng: random.Random, i: int) -> str:
+    values = [
+        f"{1_700_000_000 + i * 0.25:.6f}",
+        f"C{i}",
+        f"10.0.{rng.randrange(4)}.{rng.randrange(256)}",
+        str(rng.randrange(1024, 65536)),
+        f"192.168.1.{rng.randrange(256)}",
+        rng.choice(["53", "80", "443", "-"]),
+        rng.choice(["tcp", "udp"]),
+        rng.choice(["dns", "http", "-", "(empty)"]),
+        rng.choice([f"{rng.random():.6f}", "-"]),
+        rng.choice([str(rng.randrange(10**6)), "-"]),
+        rng.choice([str(rng.randrange(10**6)), "-"]),
+        rng.choice(["SF", "S0", "REJ", "-"]),
+    ]
+    return "\t".join(values)
+
+
+def test_chunk_matches_line_parser():
+    rng = random.Random(7)
+    lines = [_row(rng, i) for i in range(500)]
+    batch = parse_conn_chunk("\n".join(lines) + "\n", SCHEMA)
+    assert _dump(batch.flows()) == _dump(parse_conn_lines(lines, SCHEMA))
+    assert len(batch) == 500
+
+
+def test_chunk_skips_bad_rows_like_line_parser():
+    rng = random.Random(3)
+    lines = [_row(rng, i) for i in range(20)]
+    lines[4] = "-\t" + lines[4].split("\t", 1)[1]  # ts 缺失
+    lines[9] = lines[9] + "\textra"  # 多一个字段
+    lines[13] = "garbage"
+    batch = parse_conn_chunk("\n".join(lines) + "\n", SCHEMA)
+    expected = parse_conn_lines(lines, SCHEMA)
+    assert len(expected) == 17
+    assert _dump(batch.flows()) == _dump(expected)
+
+
+def test_chunk_rejects_rows_whose_field_counts_cancel_out():
+    # 第一行多一个字段、第二行少一个字段：总字段数恰好等于 2 * 12
+    long_row = "\t".join(["1700000000.0", "C1", "10.0.0.1", "1", "10.0.0.2", "80",
+                          "tcp", "-", "1.0", "1", "1", "SF", "2.0"])
+    short_row = "\t".join(["C2", "10.0.0.1", "1", "10.0.0.2", "80",
+                           "tcp", "-", "1.0", "1", "1", "SF"])
+    text = long_row + "\n" + short_row + "\n"
+    assert parse_conn_lines([long_row, short_row], SCHEMA) == []
+    assert len(parse_conn_chunk(text, SCHEMA)) == 0
+
+
+def test_chunk_custom_markers_match_line_parser():
+    schema = LogSchema(FIELDS, separator="|", empty_field="EMPTY", unset_field="UNSET")
+    lines = [
+        "1700000000.5|C1|10.0.0.1|5000|10.0.0.2|80|tcp|UNSET|UNSET|UNSET|12|EMPTY",
+        "1700000001.5|C2|10.0.0.1|5001|10.0.0.2|53|udp|dns|0.01|10|20|SF",
+    ]
+    batch = parse_conn_chunk("\n".join(lines) + "\n", schema)
+    assert _dump(batch.flows()) == _dump(parse_conn_lines(lines, schema))
+
+
+def test_line_wrapper_keeps_legacy_header_behaviour():
+    rng = random.Random(5)
+    row = _row(rng, 1)
+    assert parse_conn_line("#fields\t" + "\t".join(FIELDS) + "\n") is None
+    flow = parse_conn_line(row + "\n")
+    assert flow is not None and flow.uid == "C1"
+    assert parse_conn_line(row, SCHEMA) == flow
+    assert parse_conn_line("short\trow") is None
+
+
+def test_fallback_keeps_rows_with_oversized_byte_counts():
+    # 短行使整块退回逐行解析；超出 int64 的字节数按缺失处理，不能让整块解析失败
+    huge = "\t".join(["1700000000.0", "C1", "10.0.0.1", "1", "10.0.0.2", "80",
+                      "tcp", "-", "1.0", str(2**63), "5", "SF"])
+    short = "\t".join(["1700000001.0", "C2", "10.0.0.1"])
+    ok = "\t".join(["1700000002.0", "C3", "10.0.0.1", "1", "10.0.0.2", "80",
+                    "tcp", "-", "1.0", "7", "8", "SF"])
+    batch = parse_conn_chunk("\n".join([huge, short, ok]) + "\n", SCHEMA)
+    assert list(batch.uid) == ["C1", "C3"]
+    assert list(batch.orig_bytes) == [-1, 7] and list(batch.resp_bytes) == [5, 8]
+    flows = batch.flows()
+    assert flows[0].orig_bytes is None and flows[1].orig_bytes == 7
+
+    # 单条 Flow 经 from_flows 写入同样不报错
+    big = flows[1].model_copy(update={"resp_bytes": 2**70})
+    assert list(FlowBatch.from_flows([big]).resp_bytes) == [-1]
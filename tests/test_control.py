@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import stat
+import time
+
+import httpx
+import pytest
+
+from zeek_py import api, zeek_check
+from zeek_py.config import settings
+from zeek_py.zeek_check import ScriptValidator
+from zeek_py.zeek_runner import ZeekRunner
+
+# zeek -N：参数中含 bad 的规则不可加载，含 slow 的规则校验很慢；单条校验记录起止
+CHECK_ZEEK = """#!/bin/sh
+if [ "$1" = "--version" ]; then echo "zeek version 0.0-test"; exit 0; fi
+if [ "$#" -eq 2 ]; then echo "start" >> "{calls}"; fi
+code=0
+for arg in "$@"; do
+    case "$arg" in *bad*) code=1;; *slow*) sleep 5;; esac
+done
+if [ "$#" -eq 2 ]; then sleep 0.2; echo "end" >> "{calls}"; fi
+exit $code
+"""
+
+# 启动：脚本中含 BROKEN 时立即退出，否则持续运行
+RUN_ZEEK = """#!/bin/sh
+for arg in "$@"; do script="$arg"; done
+if grep -q BROKEN "$script"; then exit 1; fi
+exec sleep 60
+"""
+
+
+def _install(tmp_path, monkeypatch, text: str):
+    zeek = tmp_path / "zeek"
+    zeek.write_text(text)
+    zeek.chmod(zeek.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(settings, "zeek_bin", zeek)
+
+
+@pytest.fixture
+def validator(tmp_path, monkeypatch):
+    calls = tmp_path / "calls.txt"
+    _install(tmp_path, monkeypatch, CHECK_ZEEK.format(calls=calls))
+    v = ScriptValidator(tmp_path / "cache.json")
+    monkeypatch.setattr(api, "script_validator", v)
+    return calls
+
+
+def test_validate_reports_invalid_rules(api_client, validator):
+    client, _ = api_client
+    rules = ["policy/a", "policy/bad", "base/b", "custom/bad", "pyrule/portscan", "pyrule/nope", 7]
+    resp = client.post("/api/rules/validate", json={"rules": rules})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert not body["ok"] and body["invalid"] == ["policy/bad", "pyrule/nope", "7"]
+    assert client.post("/api/rules/validate", json={"rules": "policy/a"}).status_code == 400
+
+
+def test_per_rule_checks_are_concurrent_and_bounded(api_client, validator, monkeypatch):
+    client, _ = api_client
+    monkeypatch.setattr(settings, "zeek_check_concurrency", 2)
+    rules = [f"policy/bad{i}" for i in range(6)]
+    started = time.monotonic()
+    body = client.post("/api/rules/validate", json={"rules": rules}).json()
+    elapsed = time.monotonic() - started
+    assert body["invalid"] == rules
+    running = peak = 0
+    for line in validator.read_text().split():
+        running += 1 if line == "start" else -1
+        peak = max(peak, running)
+    assert peak == 2
+    # 6 条、并发 2、每条 0.2 秒：约 0.6 秒，明显少于串行的 1.2 秒
+    assert elapsed < 1.1
+
+
+def test_timed_out_check_is_invalid_and_not_cached(tmp_path, api_client, validator, monkeypatch):
+    client, _ = api_client
+    monkeypatch.setattr(zeek_check, "_CHECK_TIMEOUT", 0.3)
+    started = time.monotonic()
+    body = client.post("/api/rules/validate", json={"rules": ["policy/a", "policy/slow"]}).json()
+    assert body["invalid"] == ["policy/slow"]
+    # 批量校验（0.3 + 0.5 × 2 秒）与单条校验都超时后结束，不等 zeek 退出
+    assert time.monotonic() - started < 3
+    results = json.loads((tmp_path / "cache.json").read_text())["results"]
+    assert results == {"policy/a": True}
+
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch):
+    _install(tmp_path, monkeypatch, RUN_ZEEK)
+    scripts = tmp_path / "scripts"
+    scripts.mkdir()
+    monkeypatch.setattr(settings, "zeek_scripts_dir", scripts)
+    monkeypatch.setattr(settings, "logs_dir", tmp_path / "logs")
+    r = ZeekRunner()
+    monkeypatch.setattr(api, "zeek_runner", r)
+    yield r
+    r.stop()
+
+
+def _set_custom_rule(text: str) -> None:
+    path = settings.zeek_scripts_dir / "rules_config.json"
+    path.write_text(json.dumps({"enabled_rules": [], "custom_rule": text}))
+
+
+def _start_alongside_status() -> tuple[httpx.Response, float, float]:
+    """并发请求启动与状态接口，返回 (启动响应, 状态接口耗时, 启动接口耗时)。"""
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            t0 = time.monotonic()
+
+            async def timed(coro):
+                resp = await coro
+                return resp, time.monotonic() - t0
+
+            start = asyncio.create_task(timed(client.post("/api/control/start")))
+            await asyncio.sleep(0.1)
+            _, status_elapsed = await timed(client.get("/api/status"))
+            resp, start_elapsed = await start
+            return resp, status_elapsed, start_elapsed
+
+    return asyncio.run(run())
+
+
+def test_start_waits_without_blocking_the_loop(runner):
+    _set_custom_rule("# ok")
+    resp, status_elapsed, start_elapsed = _start_alongside_status()
+    assert resp.status_code == 200 and runner.running
+    # 启动后的观察期内其它请求照常返回
+    assert start_elapsed >= 1.0 and status_elapsed < 0.5
+
+
+def test_start_reports_immediate_exit(runner):
+    _set_custom_rule("BROKEN")
+    resp, _, start_elapsed = _start_alongside_status()
+    assert resp.status_code == 500 and "zeek_stderr.log" in resp.json()["detail"]
+    # 进程提前退出时不等满观察期
+    assert start_elapsed < 1.0
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from zeek_py.detection import RuleEngine, _Rule
+from zeek_py.models import FlowBatch
+
+T0 = 1_700_000_000.0
+MB = 1024 * 1024
+
+
+def _batch(rows) -> FlowBatch:
+    """rows: (ts, orig_h, resp_h, resp_p, conn_state, bytes)。"""
+    batch = FlowBatch()
+    for i, (ts, src, dst, port, state, size) in enumerate(rows):
+        batch.append(ts, f"C{i}", src, 40000, dst, port, "tcp", None, 1.0, size, 0, state)
+    return batch
+
+
+def _notes(events) -> list[str]:
+    return [ev.note for ev in events]
+
+
+def test_port_scan_alerts_once_per_window():
+    engine = RuleEngine(["pyrule/portscan"])
+    probes = [(T0 + i, "10.0.0.9", "10.0.0.1", 1000 + i, "REJ", 0) for i in range(40)]
+    # 建立成功的连接不计入
+    ok = [(T0 + i, "10.0.0.9", "10.0.0.1", 5000 + i, "SF", 0) for i in range(40)]
+    assert engine.process(_batch(probes[:24] + ok)) == []
+    events = engine.process(_batch(probes[24:]))
+    assert _notes(events) == ["PyRule::Port_Scan"]
+    assert events[0].src == "10.0.0.9" and events[0].dst == "10.0.0.1"
+    assert events[0].ts.timestamp() == T0 + 24 and events[0].source == "pyrule"
+    # 下一个窗口重新计数
+    later = [(T0 + 100 + i, "10.0.0.9", "10.0.0.1", 2000 + i, "S0", 0) for i in range(25)]
+    assert _notes(engine.process(_batch(later))) == ["PyRule::Port_Scan"]
+
+
+def test_address_scan_and_unsorted_batch():
+    engine = RuleEngine(["pyrule/portscan"])
+    rows = [(T0 + i, "10.0.0.9", f"10.1.0.{i}", 22, "S0", 0) for i in range(30)]
+    random.Random(19).shuffle(rows)
+    events = engine.process(_batch(rows))
+    assert _notes(events) == ["PyRule::Address_Scan"]
+    # 乱序批次按 ts 处理：第 25 个主机（ts = T0 + 24）触发
+    assert events[0].ts.timestamp() == T0 + 24 and events[0].dst is None
+
+
+def test_volume_spike_after_warmup():
+    engine = RuleEngine(["pyrule/volume"])
+    baseline = [(T0 + w * 60, "10.0.0.5", "10.0.0.1", 443, "SF", 1 * MB) for w in range(5)]
+    assert engine.process(_batch(baseline)) == []
+    spike = [(T0 + 5 * 60 + i, "10.0.0.5", "10.0.0.1", 443, "SF", 20 * MB) for i in range(5)]
+    events = engine.process(_batch(spike))
+    assert _notes(events) == ["PyRule::Volume_Spike"]
+    assert events[0].ts.timestamp() == T0 + 5 * 60 + 2
+    # 不到 min_bytes 的突增不告警
+    other = RuleEngine(["pyrule/volume"])
+    small = [(T0 + w * 60, "10.0.0.6", "10.0.0.1", 443, "SF", 1000 * (1 + 99 * (w == 6)))
+             for w in range(7)]
+    assert other.process(_batch(small)) == []
+
+
+def test_beaconing_requires_stable_intervals():
+    rng = random.Random(19)
+    engine = RuleEngine(["pyrule/beacon"])
+    ts = T0
+    stable = []
+    for _ in range(15):
+        stable.append((ts, "10.0.0.7", "203.0.113.5", 443, "SF", 100))
+        ts += 30 + rng.uniform(-0.5, 0.5)
+    jitter = []
+    ts = T0
+    for _ in range(15):
+        jitter.append((ts, "10.0.0.8", "203.0.113.5", 443, "SF", 100))
+        ts += rng.uniform(5, 120)
+    events = engine.process(_batch(stable + jitter))
+    assert _notes(events) == ["PyRule::Beaconing"]
+    assert events[0].src == "10.0.0.7" and events[0].dst == "203.0.113.5"
+    # 第 11 条连接给出第 10 个间隔
+    assert events[0].uid == "C10"
+
+
+def test_configure_keeps_state_and_expires_idle_keys():
+    engine = RuleEngine(["pyrule/portscan", "pyrule/unknown", "misc/scan-port"])
+    assert engine.rules == ["portscan"]
+    probes = [(T0 + i, "10.0.0.9", "10.0.0.1", 1000 + i, "REJ", 0) for i in range(20)]
+    engine.process(_batch(probes))
+    engine.configure(["pyrule/beacon", "pyrule/portscan"])
+    assert engine.rules == ["beacon", "portscan"]
+    more = [(T0 + 20 + i, "10.0.0.9", "10.0.0.1", 2000 + i, "REJ", 0) for i in range(5)]
+    assert _notes(engine.process(_batch(more))) == ["PyRule::Port_Scan"]
+
+    portscan = engine._rules[1]
+    assert portscan.states
+    # 记录时间前进超过 TTL：空闲 key 被清除
+    engine.process(_batch([(T0 + 10_000, "10.0.0.1", "10.0.0.2", 80, "SF", 0)]))
+    assert not portscan.states
+    engine.configure([])
+    assert engine.process(_batch(probes)) == []
+
+
+def test_persistent_beacon_alerts_again_after_realert_interval():
+    engine = RuleEngine(["pyrule/beacon"])
+    rows = [(T0 + 30.0 * i, "10.0.0.7", "203.0.113.5", 443, "SF", 100) for i in range(270)]
+    events = engine.process(_batch(rows))
+    assert _notes(events) == ["PyRule::Beaconing", "PyRule::Beaconing"]
+    first, second = (ev.ts.timestamp() for ev in events)
+    # 首次告警后 3600 秒内静默，之后重新统计 10 个间隔再告警
+    assert first == T0 + 300 and second == T0 + 300 + 3600 + 300
+
+
+def test_incomplete_rule_cannot_be_instantiated():
+    class NoProcess(_Rule):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        NoProcess()
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import math
+import random
+from datetime import datetime, timezone
+
+from zeek_py.models import Flow, FlowBatch
+from zeek_py.storage import InMemoryStorage, _StringTable
+
+T0 = 1_700_000_000.0
+
+
+def _random_flow(rng: random.Random, i: int) -> Flow:
+    return Flow(
+        ts=datetime.fromtimestamp(T0 + i * 0.5, tz=timezone.utc),
+        # 偶尔出现超过定长 uid 列宽度的 uid
+        uid=f"C{i}" if rng.random() < 0.9 else f"CLONG{i:030d}",
+        orig_h=f"10.{i % 7}.{rng.randrange(256)}.{rng.randrange(256)}",
+        orig_p=rng.randrange(65536),
+        resp_h=rng.choice(["192.168.0.1", "2001:db8::1", f"172.16.{i % 50}.1"]),
+        resp_p=rng.choice([0, 53, 443, 65535]),
+        proto=rng.choice(["tcp", "udp", "icmp"]),
+        service=rng.choice([None, "dns", "ssl,http"]),
+        duration=rng.choice([None, 0.0, rng.random() * 100]),
+        orig_bytes=rng.choice([None, 0, rng.randrange(10**12)]),
+        resp_bytes=rng.choice([None, 0, rng.randrange(10**6)]),
+        conn_state=rng.choice([None, "SF", "S0", "REJ"]),
+    )
+
+
+def test_columns_round_trip_through_ring_wraparound(monkeypatch):
+    # 阈值调小，覆盖驻留表整理（compact）后 id 列重写
+    monkeypatch.setattr(_StringTable, "_MIN_COMPACT", 64)
+    rng = random.Random(4)
+    flows = [_random_flow(rng, i) for i in range(2000)]
+    store = InMemoryStorage(max_flows=300, max_threats=10, max_http=10)
+    for lo in range(0, len(flows), 170):
+        store.add_flow_batch(FlowBatch.from_flows(flows[lo : lo + 170]))
+
+    got = store.list_flows(limit=1000)
+    assert [f.model_dump() for f in got] == [f.model_dump() for f in flows[-300:]]
+    raw = store.page_flows(limit=1000, raw=True).items
+    assert raw == [f.model_dump() for f in flows[-300:]]
+    assert len(store._flows._store._hosts) < 1000
+
+
+def test_batch_missing_value_conventions():
+    flow = Flow(
+        ts=datetime.fromtimestamp(T0, tz=timezone.utc),
+        uid="C1",
+        orig_h="10.0.0.1",
+        orig_p=1,
+        resp_h="10.0.0.2",
+        resp_p=2,
+        proto="tcp",
+    )
+    batch = FlowBatch.from_flows([flow])
+    assert math.isnan(batch.duration[0])
+    assert (batch.orig_bytes[0], batch.resp_bytes[0]) == (-1, -1)
+    assert batch.flows() == [flow]
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import functools
+import random
+from datetime import datetime, timezone
+
+from conftest import make_threat
+
+from zeek_py import storage as storage_module
+from zeek_py.models import FlowBatch, FlowFilter, ThreatFilter
+from zeek_py.storage import InMemoryStorage
+
+T0 = 1_700_000_000.0
+HOSTS = [f"10.0.0.{i}" for i in range(6)]
+STATES = ["SF", "S0", "REJ", None]
+
+
+def _fill(store: InMemoryStorage, rng: random.Random, count: int) -> list[tuple]:
+    """写入 count 条随机 flow，返回按到达顺序（seq）排列的字段元组。"""
+    rows = []
+    for start in range(0, count, 37):
+        batch = FlowBatch()
+        for i in range(start, min(start + 37, count)):
+            row = (
+                T0 + rng.randrange(100_000) / 100, f"C{rng.randrange(count // 4)}",
+                rng.choice(HOSTS), rng.choice([40000, 53, 443]), rng.choice(HOSTS),
+                rng.choice([53, 80, 443]), rng.choice(["tcp", "udp"]),
+                rng.choice([None, "dns", "http"]), 1.0, 1, 1, rng.choice(STATES),
+            )
+            batch.append(*row)
+            rows.append(row)
+        store.add_flow_batch(batch)
+    return rows
+
+
+def _random_filter(rng: random.Random) -> FlowFilter:
+    return FlowFilter(
+        orig_h=rng.choice([None, None, *HOSTS]),
+        resp_h=rng.choice([None, None, *HOSTS]),
+        port=rng.choice([None, None, 53, 80, 443, 40000]),
+        proto=rng.choice([None, "tcp", "udp"]),
+        service=rng.choice([None, None, "dns"]),
+        uid=rng.choice([None, None, None, "C1", "C7"]),
+        conn_state=rng.choice([None, *STATES[:3]]),
+    )
+
+
+def _matches(row: tuple, flt: FlowFilter) -> bool:
+    ts, uid, orig_h, orig_p, resp_h, resp_p, proto, service, *_, state = row
+    return (
+        flt.orig_h in (None, orig_h)
+        and flt.resp_h in (None, resp_h)
+        and flt.port in (None, orig_p, resp_p)
+        and flt.proto in (None, proto)
+        and flt.service in (None, service)
+        and flt.uid in (None, uid)
+        and flt.conn_state in (None, state)
+    )
+
+
+def _check_against_scan(
+    store: InMemoryStorage, rows: list[tuple], capacity: int, rng: random.Random
+) -> None:
+    # 内存只保留最新的 capacity 条
+    retained = list(enumerate(rows))[-capacity:]
+    for _ in range(150):
+        flt = _random_filter(rng)
+        since_ts = T0 + rng.randrange(1000)
+        since = datetime.fromtimestamp(since_ts, tz=timezone.utc)
+        got = store.page_flows(limit=20, since=since, flt=flt).items
+        expected = sorted(r[0] for _, r in retained if r[0] >= since_ts and _matches(r, flt))
+        assert [f.ts.timestamp() for f in got] == expected[-20:]
+
+        after = rng.randrange(-1, len(rows))
+        page = store.page_flows(limit=15, after_seq=after, flt=flt)
+        expected_seq = [s for s, r in retained if s > after and _matches(r, flt)][:15]
+        assert [f.uid for f in page.items] == [rows[s][1] for s in expected_seq]
+        if expected_seq:
+            assert page.last_seq >= expected_seq[-1]
+
+
+def test_indexed_filters_match_full_scan():
+    rng = random.Random(16)
+    store = InMemoryStorage(max_flows=500, max_threats=10, max_http=10)
+    rows = _fill(store, rng, 1500)
+    _check_against_scan(store, rows, 500, rng)
+
+
+def test_unindexed_filters_fall_back_to_scan(monkeypatch):
+    monkeypatch.setattr(
+        storage_module, "_flow_indexes", functools.partial(storage_module._flow_indexes, fields=())
+    )
+    rng = random.Random(17)
+    store = InMemoryStorage(max_flows=300, max_threats=10, max_http=10)
+    assert not store._flows.indexed
+    rows = _fill(store, rng, 700)
+    _check_against_scan(store, rows, 300, rng)
+
+
+def test_threat_filters_and_connection_join(api_client):
+    client, store = api_client
+    store.add_threats([
+        make_threat(T0, uid="Ca", src="10.0.0.1", dst="10.0.0.2", proto="tcp"),
+        make_threat(T0 + 1, uid="Cb", src="10.0.0.3", dst="10.0.0.1", proto="udp"),
+        make_threat(T0 + 2, uid="Ca", src="10.0.0.1", dst="10.0.0.4", proto="tcp"),
+    ])
+    batch = FlowBatch()
+    batch.append(T0, "Ca", "10.0.0.1", 40000, "10.0.0.2", 80, "tcp", None, 1.0, 1, 1, "SF")
+    batch.append(T0 + 1, "Cb", "10.0.0.3", 40000, "10.0.0.1", 53, "udp", "dns", 1.0, 1, 1, "SF")
+    store.add_flow_batch(batch)
+
+    assert [t.uid for t in store.list_threats(flt=ThreatFilter(src="10.0.0.1"))] == ["Ca", "Ca"]
+    assert [t.uid for t in store.list_threats(flt=ThreatFilter(dst="10.0.0.1"))] == ["Cb"]
+    assert len(store.list_threats(flt=ThreatFilter(uid="Ca", proto="udp"))) == 0
+
+    body = client.get("/api/connections/Ca").json()
+    assert [f["resp_p"] for f in body["flows"]] == [80]
+    assert [t["dst"] for t in body["threats"]] == ["10.0.0.2", "10.0.0.4"]
+    assert body["http"] == []
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import json
+import random
+import time
+from datetime import datetime, timezone
+
+from conftest import make_batch
+
+from zeek_py.backends import SqliteBackend
+from zeek_py.models import FlowFilter, HttpFlow
+from zeek_py.parsers.http_parser import parse_http_chunk, parse_http_json
+from zeek_py.parsers.schema import LogSchema
+from zeek_py.storage import InMemoryStorage
+
+DAY = 86400.0
+T0 = (time.time() // DAY - 1) * DAY + 100.0
+HTTP_FIELDS = (
+    "ts", "uid", "id.orig_h", "id.orig_p", "id.resp_h", "id.resp_p", "trans_depth",
+    "method", "host", "uri", "referrer", "version", "user_agent", "status_code", "status_msg",
+    "request_body_len", "response_body_len", "resp_mime_types",
+)
+
+
+def _http(ts: float, uid: str, status: int = 200) -> HttpFlow:
+    return HttpFlow(
+        ts=datetime.fromtimestamp(ts, tz=timezone.utc), uid=uid, orig_h="10.0.0.1",
+        orig_p=40000, resp_h="10.0.0.2", resp_p=80, method="GET", host="example.com",
+        uri="/", status_code=status,
+    )
+
+
+def test_http_tsv_and_json_agree():
+    tsv = (
+        "1700000000.500000\tCa\t10.0.0.1\t40000\t10.0.0.2\t80\t1\tGET\texample.com\t/index\t-"
+        "\t1.1\tcurl/8\t200\tOK\t0\t512\ttext/html,image/png\n"
+        "1700000001.000000\tCb\t10.0.0.1\t40001\t10.0.0.2\t80\t1\tPOST\t-\t/up\t(empty)"
+        "\t1.1\t-\t-\t-\t10\t-\t-\n"
+        "short\trow\n"
+    )
+    objs = [
+        {"ts": 1700000000.5, "uid": "Ca", "id.orig_h": "10.0.0.1", "id.orig_p": 40000,
+         "id.resp_h": "10.0.0.2", "id.resp_p": 80, "trans_depth": 1, "method": "GET",
+         "host": "example.com", "uri": "/index", "version": "1.1", "user_agent": "curl/8",
+         "status_code": 200, "status_msg": "OK", "request_body_len": 0,
+         "response_body_len": 512, "resp_mime_types": ["text/html", "image/png"]},
+        {"ts": 1700000001.0, "uid": "Cb", "id.orig_h": "10.0.0.1", "id.orig_p": 40001,
+         "id.resp_h": "10.0.0.2", "id.resp_p": 80, "trans_depth": 1, "method": "POST",
+         "uri": "/up", "referrer": "", "version": "1.1", "request_body_len": 10},
+    ]
+    from_tsv = parse_http_chunk(tsv, LogSchema(HTTP_FIELDS))
+    from_json = parse_http_json([json.dumps(o) for o in objs] + ["{broken"])
+    assert from_tsv == from_json
+    assert from_tsv[0].resp_mime_types == "text/html,image/png"
+    assert from_tsv[1].referrer is None and from_tsv[1].status_code is None
+
+
+def test_http_page_by_uid_and_seq():
+    store = InMemoryStorage(max_flows=10, max_threats=10, max_http=50)
+    store.add_http_flows([_http(T0 + i, f"C{i % 3}") for i in range(30)])
+    got = store.list_http_flows(limit=100, uid="C1")
+    assert [f.ts.timestamp() for f in got] == [T0 + i for i in range(1, 30, 3)]
+    assert [f.uid for f in store.list_http_flows(limit=2)] == ["C1", "C2"]
+    page = store.page_http_flows(limit=5, after_seq=24, uid="C0")
+    assert [f.ts.timestamp() for f in page.items] == [T0 + 27]
+    assert page.last_seq == 29
+
+
+def test_http_endpoint_serves_http_records(api_client):
+    client, store = api_client
+    store.add_http_flows([_http(T0, "Ca", 404), _http(T0 + 1, "Cb")])
+    store.add_flow_batch(make_batch([T0], service="http"))
+    body = client.get("/api/flows/http").json()
+    assert [(r["uid"], r["status_code"]) for r in body] == [("Ca", 404), ("Cb", 200)]
+
+
+def test_service_partition_matches_full_scan():
+    rng = random.Random(15)
+    store = InMemoryStorage(max_flows=300, max_threats=10, max_http=10)
+    kept = []
+    for i in range(50):
+        service = rng.choice([None, "dns", "http", "ssl"])
+        ts = [T0 + rng.randrange(100_000) / 100 for _ in range(rng.randint(1, 20))]
+        store.add_flow_batch(make_batch(ts, service=service))
+        kept.extend((t, service) for t in ts)
+    # 内存只保留最新的 300 条（按到达顺序淘汰）
+    kept = kept[-300:]
+    since = datetime.fromtimestamp(T0 + 200, tz=timezone.utc)
+    for service in ("dns", "http", "ssl", "ftp"):
+        got = store.page_flows(limit=40, since=since, flt=FlowFilter(service=service)).items
+        expected = sorted(t for t, s in kept if s == service and t >= T0 + 200)[-40:]
+        assert [f.ts.timestamp() for f in got] == expected
+
+
+def test_sqlite_http_round_trip(tmp_path):
+    backend = SqliteBackend(tmp_path / "db.sqlite3", flush_interval=0.05)
+    try:
+        backend.write_http_flows([_http(T0, "Ca"), _http(T0 + DAY, "Cb"), _http(T0 + 2, "Ca")])
+        assert backend.sync()
+        assert [f.uid for f in backend.query_http_flows(10)] == ["Ca", "Ca", "Cb"]
+        assert [f.ts.timestamp() for f in backend.query_http_flows(10, uid="Ca")] == [T0, T0 + 2]
+        assert backend.query_http_flows(10, uid="Ca")[0] == _http(T0, "Ca")
+    finally:
+        backend.close()
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import gzip
+import time
+from datetime import datetime, timezone
+
+import pytest
+from conftest import make_batch
+
+from zeek_py import importer as importer_module
+from zeek_py.backends import SqliteBackend
+from zeek_py.importer import ArchiveImporter
+from zeek_py.parsers.archive import iter_archive
+from zeek_py.storage import InMemoryStorage
+
+DAY = 86400.0
+T0 = (time.time() // DAY - 1) * DAY + 100.0
+FIELDS = (
+    "ts", "uid", "id.orig_h", "id.orig_p", "id.resp_h", "id.resp_p",
+    "proto", "service", "duration", "orig_bytes", "resp_bytes", "conn_state",
+)
+
+
+def _write_conn_gz(path, start: float, count: int) -> None:
+    lines = ["#separator \\x09", "#fields\t" + "\t".join(FIELDS)]
+    for i in range(count):
+        lines.append(
+            f"{start + i:.6f}\tH{i}\t10.1.0.1\t5000\t10.1.0.2\t443\ttcp\tssl\t0.5\t10\t20\tSF"
+        )
+    with gzip.open(path, "wt") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def test_iter_archive_yields_bounded_chunks(tmp_path):
+    path = tmp_path / "conn.00:00:00-01:00:00.log.gz"
+    _write_conn_gz(path, T0, 1000)
+    chunks = list(iter_archive(str(path), batch_bytes=4096, chunk_records=100))
+    assert len(chunks) > 5
+    # 每段最多超出一个解析批次（4096 字节约 60 行）
+    assert all(len(c.records) < 200 for c in chunks)
+    assert sum(len(c.records) for c in chunks) == 1000
+    assert sum(c.lines for c in chunks) == 1002
+    assert sum(c.bytes_read for c in chunks) == path.stat().st_size
+    ts = [t for c in chunks for t in c.records.ts]
+    assert ts == [T0 + i for i in range(1000)]
+
+
+@pytest.fixture
+def backed_storage(tmp_path, monkeypatch):
+    backend = SqliteBackend(tmp_path / "db.sqlite3", flush_interval=0.05)
+    store = InMemoryStorage(max_flows=50, max_threats=50, max_http=50, backend=backend)
+    monkeypatch.setattr(importer_module, "storage", store)
+    yield store
+    backend.close()
+
+
+def test_import_goes_to_backend_without_evicting_live_flows(tmp_path, backed_storage):
+    live_ts = [float(int(time.time()) - 10 + i) for i in range(10)]
+    backed_storage.add_flow_batch(make_batch(live_ts))
+
+    archives = tmp_path / "archives"
+    archives.mkdir()
+    _write_conn_gz(archives / "conn.00:00:00-01:00:00.log.gz", T0, 300)
+    _write_conn_gz(archives / "conn.01:00:00-02:00:00.log.gz", T0 + 3600, 300)
+    stats = ArchiveImporter().run([archives], workers=2)
+
+    assert stats.errors == []
+    assert (stats.files_done, stats.records) == (2, 600)
+    # 实时数据仍全部在内存缓冲中
+    assert len(backed_storage._flows) == 10
+    page = backed_storage.page_flows(
+        limit=1000, since=datetime.fromtimestamp(T0, tz=timezone.utc)
+    )
+    got = [f.ts.timestamp() for f in page.items]
+    assert got == [T0 + i for i in range(300)] + [T0 + 3600 + i for i in range(300)] + live_ts
+    since = datetime.fromtimestamp(T0 - 100, tz=timezone.utc)
+    buckets = backed_storage.aggregate_flows(3600, since=since)
+    assert sum(b.flow_count for b in buckets) == 610
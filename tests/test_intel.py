@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+from zeek_py.intel import INTEL_DOMAIN, INTEL_SUBNET, IntelStore, _PrefixTrie
+from zeek_py.models import FlowBatch, HttpFlow
+
+T0 = 1_700_000_000.0
+
+
+def _random_networks(rng: random.Random, width: int, count: int) -> list[tuple[int, int]]:
+    nets = []
+    for _ in range(count):
+        # 长度集中在跳转表的 16 位上下，另有一部分与已有网段嵌套或重复
+        if nets and rng.random() < 0.3:
+            key, parent = rng.choice(nets)
+            length = min(width, max(1, parent + rng.randint(-4, 6)))
+            key |= rng.getrandbits(width) & ((1 << (width - parent)) - 1)
+        else:
+            length = rng.choice([1, 4, 8, 12, 15, 16, 17, 20, 24, 28, width - 1, width])
+            key = rng.getrandbits(width)
+        key &= ((1 << length) - 1) << (width - length)
+        nets.append((key, length))
+    return nets
+
+
+def _brute_lookup(nets: list[tuple[int, int]], addr: int, width: int):
+    best = None
+    for i, (key, length) in enumerate(nets):
+        if (addr ^ key) >> (width - length) == 0 and (best is None or length > nets[best][1]):
+            best = i
+    return best
+
+
+@pytest.mark.parametrize("width", [32, 128])
+def test_trie_matches_brute_force(width):
+    rng = random.Random(width)
+    nets = _random_networks(rng, width, 400)
+    trie = _PrefixTrie(width)
+    for i, (key, length) in enumerate(nets):
+        trie.insert(key, length, (str(i), INTEL_SUBNET, None))
+    # 一半地址取自网段内部，另一半随机
+    addrs = [
+        key | (rng.getrandbits(width) & ((1 << (width - length)) - 1))
+        for key, length in rng.choices(nets, k=1500)
+    ] + [rng.getrandbits(width) for _ in range(1500)]
+    expected = [_brute_lookup(nets, a, width) for a in addrs]
+
+    def check() -> None:
+        for addr, want in zip(addrs, expected):
+            hit = trie.lookup(addr)
+            assert (None if hit is None else int(hit[0])) == want
+
+    check()
+    trie.freeze()
+    check()
+    assert trie.size == len(set(nets))
+
+
+def _write(path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+def test_store_loads_files_and_matches(tmp_path):
+    _write(
+        tmp_path / "feeds" / "zeek.intel",
+        "#fields\tindicator\tindicator_type\tmeta.source\tmeta.desc\n"
+        "198.51.100.7\tIntel::ADDR\tfeed\tc2 server\n"
+        "203.0.113.0/24\tIntel::SUBNET\tfeed\t-\n"
+        "Evil.Example.\tIntel::DOMAIN\tfeed\tphishing\n"
+        "deadbeef\tIntel::FILE_HASH\tfeed\t-\n",
+    )
+    _write(tmp_path / "plain.txt", "# 注释\n10.66.0.0/16\n2001:db8::/32  # v6\nbad.example\n\n")
+    store = IntelStore(tmp_path)
+    store.reload()
+    store._thread.join(5)
+    stats = store.stats()
+    assert (stats.addrs, stats.subnets, stats.domains, stats.skipped) == (1, 3, 2, 1)
+    assert not stats.loading and len(stats.files) == 2
+
+    batch = FlowBatch()
+    for i, (src, dst) in enumerate([
+        ("10.66.1.2", "198.51.100.7"),
+        ("10.0.0.1", "203.0.113.200"),
+        ("2001:db8::1", "2001:db9::1"),
+        ("10.0.0.1", "10.0.0.2"),
+        ("not-an-ip", "203.0.114.1"),
+    ]):
+        batch.append(T0 + i, f"C{i}", src, 1, dst, 80, "tcp", None, 1.0, 1, 1, "SF")
+    events = store.match_flows(batch)
+    assert [(ev.uid, ev.note) for ev in events] == [
+        ("C0", "10.66.0.0/16"), ("C0", "198.51.100.7"), ("C1", "203.0.113.0/24"),
+        ("C2", "2001:db8::/32"),
+    ]
+    assert events[1].msg.endswith("（c2 server）") and events[1].source == "intel"
+
+    ts = datetime.fromtimestamp(T0, tz=timezone.utc)
+    http = [
+        HttpFlow(ts=ts, uid="H1", orig_h="10.0.0.1", orig_p=1, resp_h="10.0.0.2", resp_p=80,
+                 host=host)
+        for host in ("evil.example:8080", "EVIL.EXAMPLE", "[::1]:80", None, "good.example")
+    ]
+    hits = store.match_http(http)
+    assert [ev.level for ev in hits] == [INTEL_DOMAIN, INTEL_DOMAIN]
+    assert store.stats().matches == 6
+
+
+def test_index_prefers_exact_address_and_longest_prefix(tmp_path):
+    _write(tmp_path / "list.txt", "10.0.0.0/8\n10.1.0.0/16\n10.1.2.3\n10.1.0.0/16\n")
+    store = IntelStore(tmp_path)
+    store._load()
+    index = store._index
+    assert index.match_addr("10.1.2.3")[0] == "10.1.2.3"
+    assert index.match_addr("10.1.9.9")[0] == "10.1.0.0/16"
+    assert index.match_addr("10.200.0.1")[0] == "10.0.0.0/8"
+    assert index.match_addr("11.0.0.1") is None
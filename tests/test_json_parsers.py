@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import json
+import random
+
+from zeek_py.parsers.conn_parser import parse_conn_json, parse_conn_lines
+from zeek_py.parsers.reader import LogReader
+from zeek_py.parsers.schema import LogSchema
+from zeek_py.parsers.threat_parser import parse_notice_json, parse_notice_lines
+
+CONN_FIELDS = (
+    "ts", "uid", "id.orig_h", "id.orig_p", "id.resp_h", "id.resp_p",
+    "proto", "service", "duration", "orig_bytes", "resp_bytes", "conn_state",
+)
+
+
+def _record(rng: random.Random, i: int) -> dict:
+    rec = {
+        "ts": 1_700_000_000 + i * 0.125,
+        "uid": f"C{i}",
+        "id.orig_h": f"10.0.0.{i % 250}",
+        "id.orig_p": rng.randrange(65536),
+        "id.resp_h": "10.0.1.1",
+        "id.resp_p": rng.choice([53, 80, 443]),
+        "proto": rng.choice(["tcp", "udp"]),
+        "service": rng.choice([None, "dns", "http"]),
+        "duration": rng.choice([None, 0.5, 12.25]),
+        "orig_bytes": rng.choice([None, 0, 1234]),
+        "resp_bytes": rng.choice([None, 99]),
+        "conn_state": rng.choice([None, "SF", "S0"]),
+    }
+    # Zeek 的 JSON writer 省略未设置的字段
+    return {k: v for k, v in rec.items() if v is not None}
+
+
+def _tsv(rec: dict) -> str:
+    return "\t".join(str(rec[f]) if f in rec else "-" for f in CONN_FIELDS)
+
+
+def test_conn_json_matches_tsv():
+    rng = random.Random(6)
+    records = [_record(rng, i) for i in range(300)]
+    lines = [json.dumps(r) for r in records]
+    lines.insert(10, '{"ts": 1700000000.0, "uid": broken')
+    lines.insert(20, "")
+    got = parse_conn_json(lines).flows()
+    expected = parse_conn_lines([_tsv(r) for r in records], LogSchema(CONN_FIELDS))
+    assert [f.model_dump() for f in got] == [f.model_dump() for f in expected]
+
+
+def test_conn_json_iso8601_timestamps():
+    lines = [
+        json.dumps({"ts": "2023-11-14T22:13:20.500000Z", "uid": "C1", "id.orig_h": "10.0.0.1",
+                    "id.orig_p": 1, "id.resp_h": "10.0.0.2", "id.resp_p": 2, "proto": "tcp"}),
+    ]
+    (flow,) = parse_conn_json(lines).flows()
+    assert flow.ts.timestamp() == 1_700_000_000.5
+
+
+def test_notice_json_normalizes_like_tsv():
+    obj = {"ts": 1700000000.0, "uid": "C1", "id.orig_h": "10.0.0.1", "note": "Scan::Port_Scan",
+           "msg": "", "severity": True}
+    (from_json,) = parse_notice_json([json.dumps(obj)])
+    schema = LogSchema(("ts", "uid", "id.orig_h", "note", "msg", "severity"))
+    (from_tsv,) = parse_notice_lines(["1700000000.0\tC1\t10.0.0.1\tScan::Port_Scan\t(empty)\tT"], schema)
+    assert from_json == from_tsv
+    assert from_json.msg is None and from_json.level == "T"
+
+
+def test_reader_detects_format_per_segment():
+    # 同一文件先 ASCII 后 JSON（切换 LogAscii::use_json 后重启），按数据段识别格式
+    rng = random.Random(7)
+    records = [_record(rng, i) for i in range(4)]
+    text = (
+        "#separator \\x09\n#fields\t" + "\t".join(CONN_FIELDS) + "\n"
+        + "".join(_tsv(r) + "\n" for r in records[:2])
+        + "#close\t2023-11-14-22-13-20\n"
+        + "".join(json.dumps(r) + "\n" for r in records[2:])
+    )
+    batches = LogReader.for_log("conn.log").parse(text)
+    assert [f.uid for b in batches for f in b.flows()] == ["C0", "C1", "C2", "C3"]
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import random
+import time
+
+from conftest import make_batch
+
+from zeek_py.models import FlowBatch
+from zeek_py.pipeline import (
+    _event_concat,
+    _event_take,
+    _flow_concat,
+    _flow_ts,
+    _OrderedMerge,
+)
+from zeek_py.zeek_runner import _ZeekWorker
+
+
+def _list_merge(out: list, sources: int, **kwargs) -> _OrderedMerge:
+    return _OrderedMerge(
+        out.extend, sources, lambda ts: ts, _event_take, _event_concat, **kwargs
+    )
+
+
+def test_merge_emits_in_ts_order_up_to_low_watermark():
+    out: list = []
+    merge = _list_merge(out, 2, max_lag=1000.0)
+    merge.push(0, [1.0, 3.0, 5.0])
+    merge.push(1, [2.0, 4.0])
+    merge.flush()
+    # 来源 1 只见到 4.0：5.0 要等到低水位越过它
+    assert out == [1.0, 2.0, 3.0, 4.0]
+    merge.push(1, [4.5, 6.0])
+    merge.flush()
+    assert out == [1.0, 2.0, 3.0, 4.0, 4.5, 5.0]
+    merge.flush(force=True)
+    assert out[-1] == 6.0
+
+
+def test_merge_interleaves_random_sources_in_order():
+    rng = random.Random(12)
+    streams = [sorted(rng.uniform(0, 100) for _ in range(200)) for _ in range(3)]
+    out: list = []
+    merge = _list_merge(out, 3, max_lag=1000.0)
+    # 尚未推送过的来源视为空闲、不参与低水位，先让每个来源都推送一次
+    for src in range(3):
+        merge.push(src, streams[src][:1])
+    pos = [1, 1, 1]
+    while any(p < len(s) for p, s in zip(pos, streams)):
+        src = rng.randrange(3)
+        n = rng.randint(1, 20)
+        chunk = streams[src][pos[src] : pos[src] + n]
+        pos[src] += n
+        merge.push(src, chunk)
+        if rng.random() < 0.3:
+            merge.flush()
+    merge.flush(force=True)
+    assert out == sorted(x for s in streams for x in s)
+
+
+def test_merge_does_not_wait_for_lagging_or_idle_source():
+    out: list = []
+    merge = _list_merge(out, 2, max_lag=5.0, idle_seconds=0.2)
+    merge.push(0, [1.0])
+    merge.push(1, [100.0])
+    merge.flush()
+    # 来源 0 落后超过 max_lag：95 以下的记录直接输出
+    assert out == [1.0]
+    merge.push(1, [101.0])
+    merge.flush()
+    assert out == [1.0]
+    time.sleep(0.25)
+    # 两个来源都空闲：全部输出
+    merge.flush()
+    assert out == [1.0, 100.0, 101.0]
+
+
+def test_merge_reorders_flow_batches():
+    out: list[FlowBatch] = []
+    merge = _OrderedMerge(out.append, 2, _flow_ts, FlowBatch.take, _flow_concat, max_lag=1000.0)
+    merge.push(0, make_batch([10.0, 30.0]))
+    merge.push(1, make_batch([20.0, 40.0]))
+    merge.flush(force=True)
+    assert [list(b.ts) for b in out] == [[10.0, 20.0, 30.0, 40.0]]
+
+
+def test_worker_restart_backoff(tmp_path):
+    worker = _ZeekWorker(0, tmp_path / "worker-1", ["sh", "-c", "exit 3"])
+    worker.spawn()
+    worker.proc.wait()
+    start = worker.started_at
+
+    worker.check(start + 0.1)
+    assert worker.last_exit_code == 3 and worker.next_start == start + 1.1
+    worker.check(start + 0.5)
+    assert worker.restarts == 0
+    worker.check(start + 1.1)
+    assert worker.restarts == 1
+    worker.proc.wait()
+
+    # 连续快速退出：间隔翻倍
+    worker.check(worker.started_at + 0.1)
+    assert worker.next_start == worker.started_at + 2.1
+    worker.next_start = 0.0
+
+    # 稳定运行超过 STABLE_SECONDS 后退出：间隔恢复为 1 秒
+    worker.check(worker.started_at + _ZeekWorker.STABLE_SECONDS + 1)
+    assert worker.next_start == worker.started_at + _ZeekWorker.STABLE_SECONDS + 2
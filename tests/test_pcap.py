@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import random
+import struct
+from pathlib import Path
+
+from zeek_py.pcap import LINKTYPE_ETHERNET, LINKTYPE_RAW, split_pcap
+
+
+def _ipv4(src: str, dst: str, sport: int, dport: int, proto: int = 6, frag: int = 0) -> bytes:
+    ip = struct.pack(
+        "!BBHHHBBH4s4s", 0x45, 0, 40, 0, frag, 64, proto, 0,
+        bytes(map(int, src.split("."))), bytes(map(int, dst.split("."))),
+    )
+    return ip + struct.pack("!HH", sport, dport) + b"\0" * 16
+
+
+def _ether(payload: bytes, vlan: bool = False) -> bytes:
+    head = b"\x02" * 12
+    if vlan:
+        head += b"\x81\x00\x00\x07"
+    return head + b"\x08\x00" + payload
+
+
+def _write_pcap(path: Path, packets: list[bytes], linktype: int, order: str = "<") -> None:
+    with path.open("wb") as f:
+        f.write(struct.pack(order + "IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, linktype))
+        for i, pkt in enumerate(packets):
+            f.write(struct.pack(order + "IIII", 1_700_000_000 + i, i, len(pkt), len(pkt)))
+            f.write(pkt)
+
+
+def _read_pcap(path: Path, order: str = "<") -> tuple[bytes, list[bytes]]:
+    data = path.read_bytes()
+    packets = []
+    pos = 24
+    while pos < len(data):
+        (n,) = struct.unpack_from(order + "I", data, pos + 8)
+        packets.append(data[pos : pos + 16 + n])
+        pos += 16 + n
+    return data[:24], packets
+
+
+def _flows(rng: random.Random, n: int) -> list[tuple[tuple, bytes]]:
+    """(无方向流标识, 报文) 列表：每条流的报文双向交替出现。"""
+    conns = [
+        (f"10.0.{rng.randrange(4)}.{rng.randrange(256)}", f"192.168.0.{rng.randrange(256)}",
+         rng.randrange(1024, 65536), rng.choice([53, 80, 443]))
+        for _ in range(40)
+    ]
+    out = []
+    for _ in range(n):
+        src, dst, sport, dport = rng.choice(conns)
+        key = frozenset([(src, sport), (dst, dport)])
+        if rng.random() < 0.5:
+            src, dst, sport, dport = dst, src, dport, sport
+        out.append((key, _ipv4(src, dst, sport, dport)))
+    return out
+
+
+def _assert_flows_kept_together(shards: list[Path], keyed: list[tuple], order: str = "<") -> None:
+    records = {}
+    for i, shard in enumerate(shards):
+        _, packets = _read_pcap(shard, order)
+        for rec in packets:
+            records[rec] = i
+    by_flow: dict = {}
+    for key, rec in keyed:
+        by_flow.setdefault(key, set()).add(records[rec])
+    assert all(len(s) == 1 for s in by_flow.values())
+    assert len({i for s in by_flow.values() for i in s}) > 1
+
+
+def test_split_keeps_each_flow_in_one_shard(tmp_path):
+    rng = random.Random(11)
+    keyed = [(k, _ether(p, vlan=rng.random() < 0.3)) for k, p in _flows(rng, 500)]
+    src = tmp_path / "in.pcap"
+    _write_pcap(src, [p for _, p in keyed], LINKTYPE_ETHERNET)
+    original_header, original = _read_pcap(src)
+
+    shards = split_pcap(src, tmp_path / "out", 4)
+    assert len(shards) == 4
+    split = []
+    for shard in shards:
+        header, packets = _read_pcap(shard)
+        assert header == original_header
+        # 分片内保持原始顺序
+        assert packets == sorted(packets, key=original.index)
+        split.extend(packets)
+    assert sorted(split) == sorted(original)
+
+    # 报文记录带有序号时间戳，各不相同，可以反查所在分片
+    ts_keyed = [(k, rec) for (k, _), rec in zip(keyed, original)]
+    _assert_flows_kept_together(shards, ts_keyed)
+
+
+def test_split_big_endian_raw_ip_and_fragments(tmp_path):
+    rng = random.Random(12)
+    keyed = _flows(rng, 200)
+    # 同一地址对的分片报文没有端口，与端口无关地落在同一分片
+    keyed += [
+        (("frag",), _ipv4("10.9.9.9", "10.8.8.8", rng.randrange(65536), 0, proto=17, frag=0x2000 | i))
+        for i in range(20)
+    ]
+    src = tmp_path / "raw.pcap"
+    _write_pcap(src, [p for _, p in keyed], LINKTYPE_RAW, order=">")
+    _, original = _read_pcap(src, ">")
+    shards = split_pcap(src, tmp_path / "out", 3)
+    _assert_flows_kept_together(shards, [(k, rec) for (k, _), rec in zip(keyed, original)], ">")
+
+
+def test_split_drops_truncated_tail_and_keeps_unsplittable(tmp_path):
+    src = tmp_path / "in.pcap"
+    _write_pcap(src, [_ether(_ipv4("10.0.0.1", "10.0.0.2", 1000, 80))] * 3, LINKTYPE_ETHERNET)
+    with src.open("ab") as f:
+        f.write(struct.pack("<IIII", 0, 0, 100, 100) + b"\0" * 10)
+    shards = split_pcap(src, tmp_path / "out", 2)
+    assert sum(len(_read_pcap(p)[1]) for p in shards) == 3
+
+    pcapng = tmp_path / "in.pcapng"
+    pcapng.write_bytes(b"\x0a\x0d\x0d\x0a" + b"\0" * 60)
+    assert split_pcap(pcapng, tmp_path / "out", 4) == [pcapng]
+    assert split_pcap(src, tmp_path / "out", 1) == [src]
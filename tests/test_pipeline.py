@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from zeek_py import pipeline as pipeline_module
+from zeek_py.pipeline import (
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP_NEWEST,
+    OVERFLOW_DROP_OLDEST,
+    IngestPipeline,
+    _Batch,
+)
+from zeek_py.storage import InMemoryStorage
+
+CONN_FIELDS = (
+    "ts", "uid", "id.orig_h", "id.orig_p", "id.resp_h", "id.resp_p",
+    "proto", "service", "duration", "orig_bytes", "resp_bytes", "conn_state",
+)
+NOTICE_FIELDS = ("ts", "uid", "id.orig_h", "id.resp_h", "note", "msg")
+
+
+def _header(fields) -> str:
+    return "#separator \\x09\n#fields\t" + "\t".join(fields) + "\n"
+
+
+def _conn_rows(start: int, count: int) -> str:
+    return "".join(
+        f"{1_700_000_000 + i}.0\tC{i}\t10.0.0.1\t40000\t10.0.0.2\t80\ttcp\t-\t1.0\t1\t1\tSF\n"
+        for i in range(start, start + count)
+    )
+
+
+def _wait_for(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = InMemoryStorage(max_flows=10_000, max_threats=100, max_http=100)
+    monkeypatch.setattr(pipeline_module, "storage", store)
+    return store
+
+
+def test_ingests_each_log_through_its_own_channel(tmp_path, store):
+    (tmp_path / "conn.log").write_text(_header(CONN_FIELDS) + _conn_rows(0, 2000))
+    (tmp_path / "notice.log").write_text(
+        _header(NOTICE_FIELDS) + "1700000000.5\tC1\t10.0.0.1\t10.0.0.2\tScan::Port_Scan\tscan\n"
+    )
+    pipe = IngestPipeline(tmp_path, parser_workers=2, batch_bytes=4096)
+    pipe.start()
+    try:
+        _wait_for(lambda: len(store._flows) == 2000 and len(store._threats) == 1)
+        with (tmp_path / "conn.log").open("a") as f:
+            f.write(_conn_rows(2000, 10))
+        _wait_for(lambda: len(store._flows) == 2010)
+    finally:
+        pipe.stop()
+    stats = {s.name: s for s in pipe.stats()}
+    assert stats["conn.log"].records_ingested == 2010
+    assert stats["conn.log"].lines_read == 2012  # 含两行头部
+    assert stats["notice.log"].records_ingested == 1
+    # 多个解析 worker 并发写入，按 ts 查询仍然有序
+    since = datetime.fromtimestamp(0, tz=timezone.utc)
+    ts = [f.ts.timestamp() for f in store.list_flows(limit=5000, since=since)]
+    assert ts == sorted(ts) and len(set(ts)) == 2010
+
+
+@pytest.mark.parametrize("policy", [OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST])
+def test_full_queue_applies_overflow_policy(tmp_path, policy):
+    pipe = IngestPipeline(tmp_path, queue_size=2, conn_overflow=policy)
+    ch = pipe._channels[0]
+    batches = [_Batch(None, f"{{\"n\": {i}}}\n") for i in range(5)]
+    for batch in batches:
+        pipe._enqueue(ch, batch)
+    kept = [ch.queue.get_nowait() for _ in range(ch.queue.qsize())]
+    assert kept == (batches[-2:] if policy == OVERFLOW_DROP_OLDEST else batches[:2])
+    stats = ch.stats()
+    assert (stats.batches_dropped, stats.lines_dropped) == (3, 3)
+    # 告警类日志总是阻塞策略，不丢数据
+    alerts = [c for c in pipe._channels if c.name in ("notice.log", "intel.log", "weird.log")]
+    assert {c.overflow for c in alerts} == {OVERFLOW_BLOCK}
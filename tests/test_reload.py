@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import json
+import stat
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from zeek_py import pipeline as pipeline_module
+from zeek_py.config import settings
+from zeek_py.pipeline import IngestPipeline
+from zeek_py.storage import InMemoryStorage
+from zeek_py.zeek_runner import ZeekRunner, local_zeek_path
+
+FIELDS = (
+    "ts", "uid", "id.orig_h", "id.orig_p", "id.resp_h", "id.resp_p",
+    "proto", "service", "duration", "orig_bytes", "resp_bytes", "conn_state",
+)
+HEADER = "#separator \\x09\n#fields\t" + "\t".join(FIELDS) + "\n"
+
+
+def _rows(*ts: float) -> str:
+    return "".join(
+        f"{t:.6f}\tC{t:g}\t10.0.0.1\t40000\t10.0.0.2\t80\ttcp\t-\t1.0\t1\t1\tSF\n" for t in ts
+    )
+
+
+def _append(path, text: str) -> None:
+    with path.open("a", encoding="utf-8") as f:
+        f.write(text)
+
+
+def _wait_for(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.05)
+
+
+def test_handover_keeps_each_connection_once(tmp_path, monkeypatch):
+    store = InMemoryStorage(max_flows=100, max_threats=10, max_http=10)
+    monkeypatch.setattr(pipeline_module, "storage", store)
+
+    def stored() -> list[float]:
+        since = datetime.fromtimestamp(0, tz=timezone.utc)
+        return [f.ts.timestamp() for f in store.page_flows(limit=100, since=since).items]
+
+    old_dir, new_dir = tmp_path / "old", tmp_path / "new"
+    old_dir.mkdir()
+    new_dir.mkdir()
+    old_log, new_log = old_dir / "conn.log", new_dir / "conn.log"
+    old_log.write_text(HEADER + _rows(100, 101))
+
+    pipe = IngestPipeline(old_dir, parser_workers=1)
+    pipe.start()
+    try:
+        _wait_for(lambda: len(stored()) == 2)
+        # 新一代已就绪：两代并行期间都看到了 102.7 这条连接
+        new_log.write_text(HEADER + _rows(101.8, 102.7, 103))
+        pipe.begin_handover([new_dir], cutover=102.5)
+        _append(old_log, _rows(102, 102.7))
+        pipe.complete_handover()
+        _wait_for(lambda: len(stored()) == 5)
+        _append(new_log, _rows(104))
+        _wait_for(lambda: len(stored()) == 6)
+    finally:
+        pipe.stop()
+    assert sorted(stored()) == [100, 101, 102, 102.7, 103, 104]
+
+
+# 最后一个参数为脚本路径；脚本中含 BROKEN 时模拟 Zeek 加载失败立即退出
+FAKE_ZEEK = """#!/bin/sh
+for arg in "$@"; do script="$arg"; done
+if grep -q BROKEN "$script"; then exit 1; fi
+exec sleep 60
+"""
+
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch):
+    zeek = tmp_path / "zeek"
+    zeek.write_text(FAKE_ZEEK)
+    zeek.chmod(zeek.stat().st_mode | stat.S_IEXEC)
+    scripts = tmp_path / "scripts"
+    scripts.mkdir()
+    monkeypatch.setattr(settings, "zeek_bin", zeek)
+    monkeypatch.setattr(settings, "zeek_scripts_dir", scripts)
+    monkeypatch.setattr(settings, "zeek_reload_grace", 0.5)
+    monkeypatch.setattr(settings, "logs_dir", tmp_path / "logs")
+    r = ZeekRunner()
+    yield r
+    r.stop()
+
+
+def _set_custom_rule(text: str) -> None:
+    path = settings.zeek_scripts_dir / "rules_config.json"
+    path.write_text(json.dumps({"enabled_rules": [], "custom_rule": text}))
+
+
+def test_failed_reload_leaves_running_config_untouched(runner):
+    _set_custom_rule("# v1")
+    runner.start()
+    current = local_zeek_path(0)
+    assert runner._workers[0].cmd[-1] == str(current)
+    before = current.read_text()
+
+    _set_custom_rule("BROKEN")
+    with pytest.raises(RuntimeError):
+        runner.reload()
+    assert runner.running and runner._generation == 0
+    # 旧进程（以及监督线程重启它时）仍加载原来的脚本
+    assert current.read_text() == before
+    assert "BROKEN" in local_zeek_path(1).read_text()
+
+    _set_custom_rule("# v2")
+    assert runner.reload()
+    assert runner._generation == 1
+    assert runner._workers[0].cmd[-1] == str(local_zeek_path(1))
+    assert "# v2" in local_zeek_path(1).read_text()
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import importlib
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from typing import List
+
+from conftest import make_batch, make_threat
+from pydantic import TypeAdapter
+
+from zeek_py import serialize
+from zeek_py.backends import SqliteBackend
+from zeek_py.models import Flow, FlowAggregateBucket, HttpFlow, ThreatEvent
+from zeek_py.serialize import dumps
+from zeek_py.storage import InMemoryStorage
+
+DAY = 86400.0
+T0 = (time.time() // DAY - 1) * DAY + 100.25
+
+
+def _flows_batch():
+    batch = make_batch([T0, T0 + 0.5, T0 + 1.000001], service="dns")
+    batch.append(T0 + 2, "Cx", "fe80::1", 5353, "ff02::fb", 5353, "udp", None, None, None, None, None)
+    return batch
+
+
+def _model_json(model, items) -> bytes:
+    return TypeAdapter(List[model]).dump_json(items)
+
+
+def test_raw_pages_encode_like_models():
+    store = InMemoryStorage(max_flows=10, max_threats=10, max_http=10)
+    store.add_flow_batch(_flows_batch())
+    store.add_threats([make_threat(T0, uid="C1", dst=None), make_threat(T0 + 1.5, level=None)])
+    store.add_http_flows([
+        HttpFlow(ts=datetime.fromtimestamp(T0, tz=timezone.utc), uid="C1", orig_h="10.0.0.1",
+                 orig_p=1, resp_h="10.0.0.2", resp_p=80, method="GET", status_code=200),
+    ])
+    for model, page in (
+        (Flow, store.page_flows),
+        (ThreatEvent, store.page_threats),
+        (HttpFlow, store.page_http_flows),
+    ):
+        models = page(limit=10).items
+        raw = page(limit=10, raw=True).items
+        assert [model(**item) for item in raw] == models
+        assert dumps(raw) == _model_json(model, models)
+        # 游标读取走同一条路径
+        assert dumps(page(limit=10, after_seq=-1, raw=True).items) == _model_json(model, models)
+
+
+def test_backend_rows_encode_like_models(tmp_path):
+    backend = SqliteBackend(tmp_path / "db.sqlite3", flush_interval=0.05)
+    store = InMemoryStorage(max_flows=2, max_threats=10, max_http=10, backend=backend)
+    try:
+        store.add_flow_batch(_flows_batch())
+        since = datetime.fromtimestamp(T0 - 1, tz=timezone.utc)
+        models = store.page_flows(limit=10, since=since).items
+        raw = store.page_flows(limit=10, since=since, raw=True).items
+        assert len(models) == 4
+        assert dumps(raw) == _model_json(Flow, models)
+    finally:
+        backend.close()
+
+
+def test_models_and_stdlib_fallback(monkeypatch):
+    bucket = FlowAggregateBucket(
+        bucket_start=datetime.fromtimestamp(T0, tz=timezone.utc),
+        bucket_end=datetime.fromtimestamp(T0 + 60, tz=timezone.utc),
+        flow_count=1, orig_bytes_sum=2, resp_bytes_sum=3,
+    )
+    assert dumps([bucket]) == _model_json(FlowAggregateBucket, [bucket])
+
+    store = InMemoryStorage(max_flows=10, max_threats=10, max_http=10)
+    store.add_flow_batch(_flows_batch())
+    raw = store.page_flows(limit=10, raw=True).items
+    expected = dumps(raw)
+    # 未安装 orjson 时退化为标准库 json，输出的 JSON 相同
+    orjson = sys.modules["orjson"]
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    try:
+        fallback = importlib.reload(serialize)
+        assert json.loads(fallback.dumps(raw)) == json.loads(expected)
+        assert fallback.dumps([bucket]) == _model_json(FlowAggregateBucket, [bucket])
+    finally:
+        sys.modules["orjson"] = orjson
+        importlib.reload(serialize)
+
+
+def test_list_endpoint_matches_response_model(api_client):
+    client, store = api_client
+    store.add_flow_batch(_flows_batch())
+    body = client.get("/api/flows").content
+    assert body == _model_json(Flow, store.list_flows(limit=100))
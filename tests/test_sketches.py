@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import random
+from collections import Counter
+
+from conftest import make_batch
+
+from zeek_py.sketches import HeavyHitters, window_totals
+
+T0 = 1_700_000_000.0
+
+
+def _zipf_stream(rng: random.Random, count: int, keys: int) -> list[str]:
+    weights = [1 / (i + 1) for i in range(keys)]
+    return rng.choices([f"k{i}" for i in range(keys)], weights, k=count)
+
+
+def test_space_saving_bounds_hold_across_windows():
+    rng = random.Random(17)
+    hh = HeavyHitters(capacity=32, window_seconds=60, windows=10)
+    truth: Counter = Counter()
+    for window in range(12):
+        stream = _zipf_stream(rng, 4000, 2000)
+        for i in range(0, len(stream), 250):
+            hh.add(window, Counter(stream[i : i + 250]))
+        if window >= 2:
+            # 只有最近 10 个时间窗参与统计
+            truth.update(stream)
+
+    base = sum(s.floor for s in hh._summaries.values())
+    assert base > 0
+    top = hh.top(10_000)
+    for key, estimate, error in top:
+        assert estimate - error <= truth[key] <= estimate
+    # 真实值超过 base 的 key 在某个时间窗中一定被跟踪，不会漏报
+    reported = {key for key, _, _ in top}
+    assert {key for key, value in truth.items() if value > base} <= reported
+    # 偏斜分布下头部的 key 排名准确
+    assert [key for key, _, _ in hh.top(3)] == [key for key, _ in truth.most_common(3)]
+
+
+def test_exact_until_capacity_and_since_alignment():
+    hh = HeavyHitters(capacity=8, window_seconds=60, windows=5)
+    hh.add(100, {"a": 5, "b": 1})
+    hh.add(101, {"b": 7})
+    hh.add(101, {"c": 2})
+    assert hh.top(5) == [("b", 8, 0), ("a", 5, 0), ("c", 2, 0)]
+    # since_ts 所在的时间窗整体参与统计
+    assert hh.top(5, since_ts=101 * 60 + 59.9) == [("b", 7, 0), ("c", 2, 0)]
+    # 新时间窗使过旧的窗口失效；比保留范围还早的乱序数据被忽略
+    hh.add(105, {"d": 1})
+    hh.add(100, {"a": 100})
+    assert [key for key, _, _ in hh.top(5)] == ["b", "c", "d"]
+
+
+def test_window_totals_groups_by_window():
+    ts = [0.5, 59.9, 60.0, 130.0, 61.0]
+    keys = ["a", "b", "a", "a", "a"]
+    assert window_totals(ts, keys, None, 60) == [(0, {"a": 1, "b": 1}), (1, {"a": 2}), (2, {"a": 1})]
+    assert window_totals(ts, keys, [1, 2, 3, 4, 5], 60) == [
+        (0, {"a": 1, "b": 2}), (1, {"a": 8}), (2, {"a": 4})
+    ]
+    assert window_totals([5.0, 6.0], ["x", "x"], [3, 4], 60) == [(0, {"x": 7})]
+
+
+def test_top_endpoint(api_client):
+    client, store = api_client
+    store.add_flow_batch(make_batch([T0] * 3, orig_h="10.0.0.1", size=10))
+    store.add_flow_batch(make_batch([T0 + 1], orig_h="10.0.0.9", size=100))
+    by_bytes = client.get("/api/flows/top", params={"by": "orig_h"}).json()
+    assert [(i["key"], i["value"], i["error"]) for i in by_bytes] == [
+        ("10.0.0.9", 200, 0), ("10.0.0.1", 60, 0)
+    ]
+    by_flows = client.get("/api/flows/top", params={"by": "orig_h", "metric": "flows"}).json()
+    assert [i["key"] for i in by_flows] == ["10.0.0.1", "10.0.0.9"]
+    assert client.get("/api/flows/top", params={"by": "uid"}).status_code == 400
+    assert client.get("/api/flows/top", params={"metric": "packets"}).status_code == 400
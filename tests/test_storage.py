@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import random
+from datetime import datetime, timezone
+
+import pytest
+from conftest import make_threat
+
+from zeek_py import storage as storage_module
+from zeek_py.storage import InMemoryStorage, _TimeIndex
+
+T0 = 1_700_000_000.0
+
+
+def _dt(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts, tz=timezone.utc)
+
+
+def test_time_index_matches_sorted_list(monkeypatch):
+    # 小块便于覆盖块分裂与跨块删除
+    monkeypatch.setattr(storage_module, "_CHUNK_SIZE", 8)
+    rng = random.Random(1)
+    index = _TimeIndex()
+    expected: list[tuple[float, int]] = []
+    seq = 0
+    for _ in range(40):
+        ts = [T0 + rng.randrange(200) for _ in range(rng.randrange(1, 20))]
+        if rng.random() < 0.5:
+            ts.sort()
+        index.extend(ts, range(seq, seq + len(ts)))
+        expected.extend(zip(ts, range(seq, seq + len(ts))))
+        seq += len(ts)
+        for t, s in rng.sample(expected, min(len(expected), 3)):
+            index.remove(t, s)
+            expected.remove((t, s))
+    expected.sort()
+    for since in (None, T0, T0 + 50.5, T0 + 199, T0 + 500):
+        for limit in (1, 7, 10_000):
+            rows = [s for t, s in expected if since is None or t >= since]
+            assert index.tail(limit, since) == rows[-limit:]
+
+
+def test_since_limit_with_out_of_order_arrivals_and_eviction():
+    rng = random.Random(2)
+    store = InMemoryStorage(max_flows=10, max_threats=300, max_http=10)
+    arrived = []
+    for i in range(1000):
+        # 大体递增，夹杂最多晚到 30 秒的记录
+        ts = T0 + i - rng.choice([0, 0, 0, rng.uniform(0, 30)])
+        arrived.append(ts)
+    for lo in range(0, 1000, 37):
+        store.add_threats([make_threat(t) for t in arrived[lo : lo + 37]])
+
+    kept = sorted(arrived[-300:])  # 按到达顺序淘汰最早的记录
+    for since in (None, T0 + 700, T0 + 850.5, T0 + 2000):
+        for limit in (1, 50, 1000):
+            got = store.list_threats(limit, since=_dt(since) if since else None)
+            want = [t for t in kept if since is None or t >= since][-limit:]
+            assert [e.ts.timestamp() for e in got] == pytest.approx(want)
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from conftest import make_batch, make_threat
+
+from zeek_py import api
+from zeek_py.serialize import dumps
+from zeek_py.storage import InMemoryStorage
+from zeek_py.stream import StreamFilter, StreamHub
+
+T0 = 1_700_000_000.0
+
+
+def _collect(flt: StreamFilter, publish) -> list[str]:
+    """订阅后在线程中发布，返回收到的 SSE 消息（不含 retry 行）。"""
+
+    async def run() -> list[str]:
+        hub = StreamHub(buffer=16)
+        events = hub.events(flt)
+        assert (await events.__anext__()).startswith("retry:")
+        await asyncio.to_thread(publish, hub)
+        messages = []
+        while True:
+            try:
+                messages.append(await asyncio.wait_for(events.__anext__(), 0.2))
+            except asyncio.TimeoutError:
+                break
+        await events.aclose()
+        return messages
+
+    return asyncio.run(run())
+
+
+def _data(message: str) -> list:
+    return json.loads(message.split("data: ", 1)[1])
+
+
+def test_flow_events_match_rest_encoding():
+    batch = make_batch([T0, T0 + 0.25], service="http")
+    batch.duration[1] = float("nan")
+    store = InMemoryStorage(max_flows=10, max_threats=10, max_http=10)
+    store.add_flow_batch(batch)
+    rest = json.loads(dumps(store.page_flows(limit=10, raw=True).items))
+
+    messages = _collect(StreamFilter(), lambda hub: hub.publish_flows(batch))
+    assert len(messages) == 1 and messages[0].startswith("event: flows\n")
+    assert _data(messages[0]) == rest
+
+
+def test_filters_apply_per_subscriber():
+    batch = make_batch([T0, T0 + 1], orig_h="10.9.9.9")
+    threat = make_threat(T0, proto="tcp", source="intel")
+
+    def publish(hub: StreamHub) -> None:
+        hub.publish_flows(batch)
+        hub.publish_threats([threat])
+
+    assert _collect(StreamFilter(proto="udp"), publish) == []
+    got = _collect(StreamFilter(proto="tcp", source="intel"), publish)
+    assert [m.split("\n", 1)[0] for m in got] == ["event: flows", "event: threats"]
+    assert _collect(StreamFilter(host="10.0.0.1", kinds=frozenset({"flows"})), publish) == []
+
+
+def test_stream_endpoint_lowercases_proto(monkeypatch):
+    seen = []
+    monkeypatch.setattr(api.stream_hub, "events", lambda flt: seen.append(flt) or iter(()))
+    api.api_stream(types="flows", host=None, proto="TCP", service="HTTP", source=None)
+    assert seen[0].proto == "tcp" and seen[0].service == "http"
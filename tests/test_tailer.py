@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+
+from zeek_py.tailer import LogTailer, LogWatcher
+
+
+def _append(path, data: bytes) -> None:
+    with path.open("ab") as f:
+        f.write(data)
+
+
+def test_returns_only_complete_lines(tmp_path):
+    path = tmp_path / "conn.log"
+    tailer = LogTailer(path)
+    assert tailer.read() == b""  # 文件尚不存在
+    _append(path, b"a\nb")
+    assert tailer.read() == b"a\n"
+    _append(path, b"c\nd\n")
+    assert tailer.read() == b"bc\nd\n"
+    assert tailer.read() == b""
+
+
+def test_rotation_reads_old_file_to_eof_first(tmp_path):
+    path = tmp_path / "conn.log"
+    tailer = LogTailer(path)
+    _append(path, b"1\n")
+    assert tailer.read() == b"1\n"
+    # Zeek 轮转：旧文件改名，最后一行没有换行；随即创建新文件
+    _append(path, b"2\n3")
+    os.rename(path, tmp_path / "conn.2024-01-01.log")
+    _append(path, b"4\n")
+    assert tailer.read() == b"2\n3\n4\n"
+
+
+def test_truncation_restarts_from_beginning(tmp_path):
+    path = tmp_path / "conn.log"
+    tailer = LogTailer(path)
+    _append(path, b"old line 1\nold line 2\npartial")
+    assert tailer.read() == b"old line 1\nold line 2\n"
+    with path.open("wb") as f:
+        f.write(b"new\n")
+    assert tailer.read() == b"new\n"
+
+
+def test_watcher_reports_changed_files_and_wakes(tmp_path):
+    watcher = LogWatcher(tmp_path)
+    try:
+        _append(tmp_path / "notice.log", b"x\n")
+        changed = watcher.wait(timeout=2.0)
+        if watcher.event_driven:
+            assert changed == {"notice.log"}
+
+        threading.Timer(0.1, watcher.wake).start()
+        t = time.monotonic()
+        assert watcher.wait(timeout=10.0) is None
+        assert time.monotonic() - t < 5.0
+    finally:
+        watcher.close()
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from zeek_py.parsers.schema import LogSchema
+from zeek_py.parsers.threat_parser import (
+    parse_notice_chunk,
+    parse_notice_line,
+    parse_notice_lines,
+    parse_weird_line,
+)
+
+NOTICE_FIELDS = ("ts", "uid", "id.orig_h", "id.resp_h", "note", "msg", "severity")
+WEIRD_FIELDS = ("ts", "uid", "id.orig_h", "id.resp_h", "name", "addl", "notice", "source")
+
+NOTICE_ROWS = [
+    "1700000000.0\tC1\t10.0.0.1\t10.0.0.2\tScan::Port_Scan\tscanned\t-",
+    "1700000001.0\t-\t10.0.0.3\t-\tSSH::Password_Guessing\t(empty)\t3",
+    "-\tC3\t10.0.0.1\t10.0.0.2\tMissing::Ts\tx\t-",
+]
+
+
+def test_notice_chunk_matches_lines():
+    schema = LogSchema(NOTICE_FIELDS)
+    events = parse_notice_lines(NOTICE_ROWS, schema)
+    assert [e.note for e in events] == ["Scan::Port_Scan", "SSH::Password_Guessing"]
+    assert events[1].msg is None and events[1].level == "3"
+    assert parse_notice_chunk("\n".join(NOTICE_ROWS) + "\n", schema) == events
+
+
+def test_line_wrappers_track_headers_per_log_type():
+    assert parse_notice_line("#fields\t" + "\t".join(NOTICE_FIELDS)) is None
+    assert parse_weird_line("#fields\t" + "\t".join(WEIRD_FIELDS)) is None
+    notice = parse_notice_line(NOTICE_ROWS[0] + "\n")
+    weird = parse_weird_line("1700000002.0\tC9\t10.0.0.1\t10.0.0.2\tbad_checksum\t-\tF\tworker-1")
+    assert notice is not None and notice.source == "notice" and notice.src == "10.0.0.1"
+    assert weird is not None and weird.note == "bad_checksum" and weird.level == "worker-1"
+    assert parse_notice_line(NOTICE_ROWS[0], LogSchema(NOTICE_FIELDS)) == notice
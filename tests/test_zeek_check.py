@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import asyncio
+import stat
+
+import pytest
+
+from zeek_py.config import settings
+from zeek_py.zeek_check import ScriptValidator
+
+# 记录每次调用的参数；参数中含 bad 的规则不可加载
+FAKE_ZEEK = """#!/bin/sh
+echo "$@" >> "{calls}"
+if [ "$1" = "--version" ]; then echo "zeek version 0.0-test"; exit 0; fi
+for arg in "$@"; do
+    case "$arg" in *bad*) exit 1;; esac
+done
+exit 0
+"""
+
+
+@pytest.fixture
+def fake_zeek(tmp_path, monkeypatch):
+    calls = tmp_path / "calls.txt"
+    script = tmp_path / "zeek"
+    script.write_text(FAKE_ZEEK.format(calls=calls))
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(settings, "zeek_bin", script)
+
+    def invocations() -> list[str]:
+        return calls.read_text().splitlines() if calls.exists() else []
+
+    return invocations
+
+
+def test_cold_cache_uses_one_batch_call_then_hits_cache(tmp_path, fake_zeek):
+    validator = ScriptValidator(tmp_path / "cache.json")
+    rules = ["policy/a", "policy/b", "policy/c"]
+    assert validator.check_sync(rules) == dict.fromkeys(rules, True)
+    assert fake_zeek() == ["--version", "-N policy/a policy/b policy/c"]
+
+    # 新实例从持久化的缓存读取，不再启动 zeek
+    assert ScriptValidator(tmp_path / "cache.json").check_sync(rules[:2]) == dict.fromkeys(
+        rules[:2], True
+    )
+    assert len(fake_zeek()) == 2
+
+
+def test_failed_batch_falls_back_to_per_rule_checks(tmp_path, fake_zeek):
+    validator = ScriptValidator(tmp_path / "cache.json")
+    result = validator.check_sync(["policy/a", "policy/bad", "policy/a"])
+    assert result == {"policy/a": True, "policy/bad": False}
+    assert sorted(fake_zeek()[2:]) == ["-N policy/a", "-N policy/bad"]
+
+
+def test_check_sync_inside_running_loop(tmp_path, fake_zeek):
+    validator = ScriptValidator(tmp_path / "cache.json")
+
+    async def startup_hook() -> dict:
+        # 同步启动钩子在事件循环线程中直接调用 check_sync
+        return validator.check_sync(["policy/a", "policy/bad"])
+
+    assert asyncio.run(startup_hook()) == {"policy/a": True, "policy/bad": False}
+
+
+def test_missing_zeek_is_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "zeek_bin", tmp_path / "missing")
+    validator = ScriptValidator(tmp_path / "cache.json")
+    assert validator.check_sync(["policy/a"]) == {"policy/a": False}
+    assert not (tmp_path / "cache.json").exists()
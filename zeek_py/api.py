@@ -1,30 +1,47 @@
 from __future__ import annotations
 
+import asyncio
+import base64
+import binascii
+import math
 import os
 from datetime import datetime, timezone
-import time
-from typing import List, Optional
+from typing import AsyncIterator, Callable, Hashable, List, Optional, Sequence, Tuple
 
-from fastapi import FastAPI, HTTPException, Query, Body
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Query, Body, Request, Response
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 
-from .config import settings
+from .config import load_rules_config, settings
 from .models import (
+    ConnectionRecords,
     Flow,
-    # 新增 HTTP 流量模型目前仍沿用 Flow 结构，如后续需要可单独扩展
+    FlowFilter,
+    HttpFlow,
     ThreatEvent,
+    ThreatFilter,
     ZeekStatus,
     FlowAggregateBucket,
     ThreatAggregateBucket,
+    TopItem,
+    ImportStats,
+    IntelStats,
+    ReplayStats,
 )
-from .storage import storage
+from .cache import CachedResponse, response_cache
+from .detection import PYRULE_PREFIX, PYRULES, rule_engine
+from .importer import importer
+from .intel import intel_store
+from .serialize import dumps
+from .storage import FLOW_TOP_DIMENSIONS, FLOW_TOP_METRICS, Page, storage
+from .stream import STREAM_KINDS, StreamFilter, stream_hub
+from .zeek_check import script_validator
 from .zeek_runner import zeek_runner
 
 import json
 from pathlib import Path
-import subprocess
 
 app = FastAPI(title="Zeek-Py 网络流量分析 API")
 
@@ -49,20 +66,32 @@ def api_status() -> ZeekStatus:
         zeek_bin=str(settings.zeek_bin),
         logs_dir=str(settings.logs_dir),
         iface=settings.capture_iface,
+        ingest=zeek_runner.ingest_stats(),
+        replay=zeek_runner.replay_stats(),
+        workers=zeek_runner.workers_status(),
     )
 
 
+# 启动后观察 Zeek 进程的时间（秒）：期间退出视为启动失败
+_START_GRACE_SECONDS = 1.0
+
+
 @app.post("/api/control/start")
-def api_start_zeek() -> dict:
+async def api_start_zeek() -> dict:
     if zeek_runner.running:
         return {"ok": True, "message": "Zeek 已在运行"}
+    # 生成 local.zeek、拉起进程等阻塞操作放到线程池，不占用事件循环
     try:
-        zeek_runner.start()
+        await run_in_threadpool(zeek_runner.start)
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    # 启动后短暂等待一下，确认进程没有立刻退出，否则前端会感觉“点了启动但马上又变未运行”
-    time.sleep(1.0)
+    # 启动后短暂观察，确认进程没有立刻退出，否则前端会感觉“点了启动但马上又变未运行”；
+    # 异步等待，期间不占用线程，进程提前退出时立即返回
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + _START_GRACE_SECONDS
+    while zeek_runner.running and loop.time() < deadline:
+        await asyncio.sleep(0.1)
     if not zeek_runner.running:
         raise HTTPException(
             status_code=500,
@@ -83,172 +112,534 @@ def api_stop_zeek() -> dict:
     return {"ok": True, "message": "Zeek 已停止"}
 
 
+@app.post("/api/control/reload")
+async def api_reload_zeek() -> dict:
+    """
+    按当前规则配置热加载 Zeek：新进程与旧进程并行启动，就绪后切换，抓包与入库不中断。
+
+    新进程启动失败时继续使用旧进程并返回 500；Zeek 未运行时规则在下次启动时生效。
+    """
+    try:
+        reloaded = await run_in_threadpool(zeek_runner.reload)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not reloaded:
+        return {"ok": True, "message": "Zeek 未运行，新规则将在下次启动时生效"}
+    return {"ok": True, "message": "Zeek 已按新规则热加载"}
+
+
+@app.post("/api/control/replay", response_model=ReplayStats)
+def api_start_replay(payload: dict = Body(...)) -> ReplayStats:
+    """
+    离线回放 pcap（zeek -r），不需要网卡与实时流量。
+
+    请求体示例：
+    {
+        "pcaps": ["incident-2024-01-01.pcap"],
+        "jobs": 8
+    }
+
+    相对路径以 ZEEK_PCAP_DIR 为基准；大文件按流切分后由 jobs 个 Zeek 进程并行分析，
+    输出日志导入存储。立即返回初始统计，进度见 /api/status 的 replay 字段。
+    """
+    pcaps = payload.get("pcaps") or []
+    jobs = payload.get("jobs")
+    if not isinstance(pcaps, list) or not pcaps or not all(isinstance(p, str) for p in pcaps):
+        raise HTTPException(status_code=400, detail="pcaps 必须为非空字符串数组")
+    if jobs is not None and (not isinstance(jobs, int) or jobs <= 0):
+        raise HTTPException(status_code=400, detail="jobs 必须为正整数")
+    try:
+        return zeek_runner.start_replay([settings.pcap_dir / p for p in pcaps], jobs)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409 if zeek_runner.replaying else 400, detail=str(e))
+
+
+@app.post("/api/import", response_model=ImportStats)
+def api_start_import(payload: dict = Body(...)) -> ImportStats:
+    """
+    后台导入轮转后的历史日志（conn/http/notice/intel/weird，支持 .log.gz）。
+
+    请求体示例：
+    {
+        "paths": ["2024-01-01", "/var/log/zeek/2024-01-02/conn.00:00:00-01:00:00.log.gz"],
+        "workers": 4
+    }
+
+    相对路径以日志目录（ZEEK_LOGS_DIR）为基准，目录会递归查找日志文件。
+    立即返回初始统计，进度通过 GET /api/import 查看。
+    """
+    paths = payload.get("paths") or []
+    workers = payload.get("workers")
+    if not isinstance(paths, list) or not paths or not all(isinstance(p, str) for p in paths):
+        raise HTTPException(status_code=400, detail="paths 必须为非空字符串数组")
+    if workers is not None and (not isinstance(workers, int) or workers <= 0):
+        raise HTTPException(status_code=400, detail="workers 必须为正整数")
+
+    resolved = [settings.logs_dir / p for p in paths]
+    missing = [str(p) for p in resolved if not p.exists()]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"路径不存在: {', '.join(missing)}")
+    try:
+        return importer.start(resolved, workers)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/api/import", response_model=ImportStats)
+def api_import_status() -> ImportStats:
+    """当前（或最近一次）导入任务的进度与吞吐。"""
+    return importer.stats()
+
+
+@app.get("/api/intel", response_model=IntelStats)
+def api_intel_status() -> IntelStats:
+    """情报指标库的加载状态、各类指标数量与命中计数。"""
+    return intel_store.stats()
+
+
+@app.post("/api/intel/reload", response_model=IntelStats)
+def api_reload_intel() -> IntelStats:
+    """
+    从 INTEL_DIR 重新加载情报文件。
+
+    加载在后台进行，完成前仍按旧的指标匹配；立即返回当前状态，进度通过 GET /api/intel 查看。
+    """
+    return intel_store.reload()
+
+
+# ---- 游标分页 ----
+#
+# 游标为不透明字符串，内含 storage.epoch / 记录类型 / seq；服务重启后 seq 重新编号，
+# 旧游标返回 410，客户端应不带游标重新拉取。after_seq 为同一语义的原始 seq。
+
+_CURSOR_QUERY = Query(None, description="上一页响应头 X-Next-Cursor 给出的游标，从该位置之后继续")
+_AFTER_SEQ_QUERY = Query(None, ge=-1, description="只返回 seq 大于该值的记录（按到达顺序）")
+
+
+def _encode_cursor(kind: str, seq: int) -> str:
+    raw = f"{storage.epoch}:{kind}:{seq}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _decode_cursor(kind: str, cursor: str) -> int:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        epoch, cursor_kind, seq = raw.split(":")
+        value = int(seq)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="cursor 无效")
+    if cursor_kind != kind:
+        raise HTTPException(status_code=400, detail="cursor 不属于该接口")
+    if epoch != storage.epoch:
+        raise HTTPException(status_code=410, detail="cursor 已失效（服务已重启），请不带 cursor 重新拉取")
+    return value
+
+
+def _after_seq(
+    kind: str, cursor: Optional[str], after_seq: Optional[int], since_ts: Optional[float]
+) -> Optional[int]:
+    if cursor is not None and after_seq is not None:
+        raise HTTPException(status_code=400, detail="cursor 与 after_seq 只能指定一个")
+    if (cursor is not None or after_seq is not None) and since_ts is not None:
+        raise HTTPException(status_code=400, detail="cursor/after_seq 不能与 since_ts 同时使用")
+    if cursor is not None:
+        return _decode_cursor(kind, cursor)
+    return after_seq
+
+
+def _page_headers(kind: str, page: Page) -> dict[str, str]:
+    headers = {
+        "X-Next-Cursor": _encode_cursor(kind, page.last_seq),
+        "X-Last-Seq": str(page.last_seq),
+    }
+    if page.skipped:
+        headers["X-Skipped"] = str(page.skipped)
+    return headers
+
+
+def _since(since_ts: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(since_ts, tz=timezone.utc) if since_ts is not None else None
+
+
+# ---- 响应缓存 ----
+#
+# 明细、聚合与排行接口返回序列化好的 JSON（见 cache），键为校验后的查询参数，
+# 按相关记录类型的写入版本失效；ETag 相同时返回 304。
+#
+# 这些接口直接返回 Response：明细从存储取出字段 dict（raw=True），由 orjson 一次编码
+# （见 serialize），不再逐条构造、校验 pydantic 模型；response_model 仍然声明，只用于 OpenAPI。
+
+# 超过该大小的响应体分块发送（chunked），单次写入不独占事件循环
+_STREAM_BYTES = 256 * 1024
+_STREAM_CHUNK = 64 * 1024
+
+
+async def _chunks(body: bytes) -> AsyncIterator[bytes]:
+    view = memoryview(body)
+    for i in range(0, len(body), _STREAM_CHUNK):
+        yield view[i : i + _STREAM_CHUNK]
+
+
+def _cached(
+    request: Request,
+    key: Hashable,
+    kinds: Tuple[str, ...],
+    build: Callable[[Tuple[int, ...]], CachedResponse],
+    since_ts: Optional[float] = None,
+) -> Response:
+    """
+    命中缓存时直接返回（If-None-Match 一致时 304），否则调用 build 生成并写入缓存。
+
+    版本号在查询前读取：查询期间有写入时条目的版本偏旧，下次请求即重新生成。
+    """
+    versions = tuple(storage.version(kind) for kind in kinds)
+    entry = response_cache.get(key, versions, since_ts)
+    if entry is None:
+        entry = response_cache.put(key, build(versions))
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache", **entry.headers}
+    if entry.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    if len(entry.body) > _STREAM_BYTES:
+        return StreamingResponse(
+            _chunks(entry.body), media_type="application/json", headers=headers
+        )
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+def _page_since_range(
+    items: Sequence[dict], since_ts: Optional[float], limit: int
+) -> Tuple[float, float]:
+    """
+    明细分页结果（ts >= since 的最新 limit 条）保持不变的 since 范围。
+
+    上限为结果中最早的 ts（再往后会排除已返回的记录）；结果不满 limit 条时下限为本次的 since
+    （再往前可能多出记录），满 limit 条时更早的记录无论如何排不进前 limit 条，下限不限。
+    """
+    hi = min((item["ts"].timestamp() for item in items), default=math.inf)
+    if len(items) >= limit or since_ts is None:
+        return -math.inf, hi
+    return since_ts, hi
+
+
+def _cached_page(
+    request: Request,
+    kind: str,
+    version: str,
+    key: Hashable,
+    limit: int,
+    since_ts: Optional[float],
+    query: Callable[[], Page],
+) -> Response:
+    """query 返回 raw=True 的一页（字段 dict）。"""
+
+    def build(versions: Tuple[int, ...]) -> CachedResponse:
+        page = query()
+        lo, hi = _page_since_range(page.items, since_ts, limit)
+        return CachedResponse(versions, dumps(page.items), _page_headers(kind, page), lo, hi)
+
+    return _cached(request, key, (version,), build, since_ts)
+
+
+def _flows_page(
+    request: Request,
+    limit: int,
+    since_ts: Optional[float],
+    cursor: Optional[str],
+    after_seq: Optional[int],
+    flt: Optional[FlowFilter] = None,
+) -> Response:
+    seq = _after_seq("flows", cursor, after_seq, since_ts)
+    flt = flt or FlowFilter()
+    return _cached_page(
+        request,
+        "flows",
+        "flows",
+        ("flows", limit, seq, flt),
+        limit,
+        since_ts,
+        lambda: storage.page_flows(
+            limit=limit, since=_since(since_ts), after_seq=seq, flt=flt, raw=True
+        ),
+    )
+
+
+def _threats_page(
+    request: Request,
+    limit: int,
+    since_ts: Optional[float],
+    cursor: Optional[str],
+    after_seq: Optional[int],
+    source: Optional[str] = None,
+    flt: Optional[ThreatFilter] = None,
+) -> Response:
+    # 按来源过滤的接口共用告警的 seq 空间，游标按来源区分，避免混用
+    kind = f"threats-{source}" if source else "threats"
+    seq = _after_seq(kind, cursor, after_seq, since_ts)
+    flt = (flt or ThreatFilter())._replace(source=source)
+    return _cached_page(
+        request,
+        kind,
+        "threats",
+        (kind, limit, seq, flt),
+        limit,
+        since_ts,
+        lambda: storage.page_threats(
+            limit=limit, since=_since(since_ts), after_seq=seq, flt=flt, raw=True
+        ),
+    )
+
+
 @app.get("/api/flows", response_model=List[Flow])
 def api_list_flows(
+    request: Request,
     limit: int = Query(100, ge=1, le=1000),
     since_ts: Optional[float] = Query(None, description="从此 UNIX 时间戳（秒）之后的记录"),
-) -> List[Flow]:
-    since_dt = (
-        datetime.fromtimestamp(since_ts, tz=timezone.utc) if since_ts is not None else None
+    cursor: Optional[str] = _CURSOR_QUERY,
+    after_seq: Optional[int] = _AFTER_SEQ_QUERY,
+    orig_h: Optional[str] = Query(None, description="源 IP"),
+    resp_h: Optional[str] = Query(None, description="目的 IP"),
+    port: Optional[int] = Query(None, ge=0, le=65535, description="源或目的端口"),
+    proto: Optional[str] = Query(None, description="协议：tcp/udp/icmp"),
+    service: Optional[str] = Query(None, description="只返回该 service 的流量，例如 dns / ssl"),
+    uid: Optional[str] = Query(None, description="Zeek 连接 UID"),
+    conn_state: Optional[str] = Query(None, description="连接状态，例如 S0 / REJ / SF"),
+) -> Response:
+    """
+    流量明细；过滤条件均为等值匹配，可任意组合。主机 / 端口 / uid / conn_state 有哈希索引，
+    只扫描命中的记录，不随缓冲大小变慢。
+    """
+    flt = FlowFilter(
+        orig_h=orig_h or None,
+        resp_h=resp_h or None,
+        port=port,
+        proto=proto.lower() if proto else None,
+        service=service.lower() if service else None,
+        uid=uid or None,
+        conn_state=conn_state or None,
     )
-    return storage.list_flows(limit=limit, since=since_dt)
+    return _flows_page(request, limit, since_ts, cursor, after_seq, flt)
 
 
-@app.get("/api/flows/http", response_model=List[Flow])
+@app.get("/api/flows/http", response_model=List[HttpFlow])
 def api_list_http_flows(
+    request: Request,
     limit: int = Query(100, ge=1, le=1000),
     since_ts: Optional[float] = Query(None, description="从此 UNIX 时间戳（秒）之后的记录"),
-) -> List[Flow]:
+    cursor: Optional[str] = _CURSOR_QUERY,
+    after_seq: Optional[int] = _AFTER_SEQ_QUERY,
+) -> Response:
     """
-    HTTP 流量明细接口：基于 /api/flows 结果进行筛选，只返回 service 为 http 的流。
-
-    如后续需要更丰富的 HTTP 维度（method/host/uri 等），可以在 models/storage 中
-    扩展专门的 HttpFlow 结构，并从 Zeek http.log 解析注入。
+    HTTP 请求明细接口：来自 Zeek http.log（method / host / uri / 状态码等），
+    直接在 HTTP 记录自己的时间索引上切片，不再从 conn 流量中筛选。
     """
-    since_dt = (
-        datetime.fromtimestamp(since_ts, tz=timezone.utc) if since_ts is not None else None
+    seq = _after_seq("http", cursor, after_seq, since_ts)
+    return _cached_page(
+        request,
+        "http",
+        "http",
+        ("http", limit, seq),
+        limit,
+        since_ts,
+        lambda: storage.page_http_flows(
+            limit=limit, since=_since(since_ts), after_seq=seq, raw=True
+        ),
     )
-    all_flows = storage.list_flows(limit=10_000, since=since_dt)
-    http_flows = [f for f in all_flows if (f.service or "").lower() == "http"]
-    # 按时间排序后截取最新 limit 条，避免返回过多
-    http_flows_sorted = sorted(http_flows, key=lambda f: f.ts)[-limit:]
-    return http_flows_sorted
 
 
 @app.get("/api/threats", response_model=List[ThreatEvent])
 def api_list_threats(
+    request: Request,
     limit: int = Query(100, ge=1, le=1000),
     since_ts: Optional[float] = Query(None, description="从此 UNIX 时间戳（秒）之后的记录"),
-) -> List[ThreatEvent]:
-    since_dt = (
-        datetime.fromtimestamp(since_ts, tz=timezone.utc) if since_ts is not None else None
+    cursor: Optional[str] = _CURSOR_QUERY,
+    after_seq: Optional[int] = _AFTER_SEQ_QUERY,
+    src: Optional[str] = Query(None, description="源地址"),
+    dst: Optional[str] = Query(None, description="目的地址"),
+    uid: Optional[str] = Query(None, description="关联连接的 UID，可与 /api/flows?uid= 对照"),
+    proto: Optional[str] = Query(None, description="协议：tcp/udp/icmp"),
+) -> Response:
+    """告警明细；src / dst / uid 有哈希索引，proto 为复核条件。"""
+    flt = ThreatFilter(
+        src=src or None,
+        dst=dst or None,
+        uid=uid or None,
+        proto=proto.lower() if proto else None,
+    )
+    return _threats_page(request, limit, since_ts, cursor, after_seq, flt=flt)
+
+
+@app.get("/api/connections/{uid}", response_model=ConnectionRecords)
+def api_connection_records(
+    uid: str,
+    limit: int = Query(100, ge=1, le=1000, description="每类记录最多返回条数"),
+) -> ConnectionRecords:
+    """
+    按 uid 关联同一连接的 conn 流量、HTTP 请求与告警（notice/intel/weird），
+    三类记录均走 uid 哈希索引（持久化后端为 uid 索引）。
+    """
+    return ConnectionRecords(
+        uid=uid,
+        flows=storage.list_flows(limit=limit, flt=FlowFilter(uid=uid)),
+        http=storage.list_http_flows(limit=limit, uid=uid),
+        threats=storage.list_threats(limit=limit, flt=ThreatFilter(uid=uid)),
     )
-    return storage.list_threats(limit=limit, since=since_dt)
 
 
 @app.get("/api/logs/notice", response_model=List[ThreatEvent])
 def api_list_notice_logs(
+    request: Request,
     limit: int = Query(100, ge=1, le=1000),
     since_ts: Optional[float] = Query(None, description="从此 UNIX 时间戳（秒）之后的记录"),
-) -> List[ThreatEvent]:
-    since_dt = (
-        datetime.fromtimestamp(since_ts, tz=timezone.utc) if since_ts is not None else None
-    )
-    return storage.list_threats(limit=limit, since=since_dt, source="notice")
+    cursor: Optional[str] = _CURSOR_QUERY,
+    after_seq: Optional[int] = _AFTER_SEQ_QUERY,
+) -> Response:
+    return _threats_page(request, limit, since_ts, cursor, after_seq, source="notice")
 
 
 @app.get("/api/logs/intel", response_model=List[ThreatEvent])
 def api_list_intel_logs(
+    request: Request,
     limit: int = Query(100, ge=1, le=1000),
     since_ts: Optional[float] = Query(None, description="从此 UNIX 时间戳（秒）之后的记录"),
-) -> List[ThreatEvent]:
-    since_dt = (
-        datetime.fromtimestamp(since_ts, tz=timezone.utc) if since_ts is not None else None
-    )
-    return storage.list_threats(limit=limit, since=since_dt, source="intel")
+    cursor: Optional[str] = _CURSOR_QUERY,
+    after_seq: Optional[int] = _AFTER_SEQ_QUERY,
+) -> Response:
+    return _threats_page(request, limit, since_ts, cursor, after_seq, source="intel")
 
 
 @app.get("/api/logs/weird", response_model=List[ThreatEvent])
 def api_list_weird_logs(
+    request: Request,
     limit: int = Query(100, ge=1, le=1000),
     since_ts: Optional[float] = Query(None, description="从此 UNIX 时间戳（秒）之后的记录"),
-) -> List[ThreatEvent]:
-    since_dt = (
-        datetime.fromtimestamp(since_ts, tz=timezone.utc) if since_ts is not None else None
-    )
-    return storage.list_threats(limit=limit, since=since_dt, source="weird")
+    cursor: Optional[str] = _CURSOR_QUERY,
+    after_seq: Optional[int] = _AFTER_SEQ_QUERY,
+) -> Response:
+    return _threats_page(request, limit, since_ts, cursor, after_seq, source="weird")
 
 
 @app.get("/api/logs/conn", response_model=List[Flow])
 def api_list_conn_logs(
+    request: Request,
     limit: int = Query(100, ge=1, le=1000),
     since_ts: Optional[float] = Query(None, description="从此 UNIX 时间戳（秒）之后的记录"),
-) -> List[Flow]:
+    cursor: Optional[str] = _CURSOR_QUERY,
+    after_seq: Optional[int] = _AFTER_SEQ_QUERY,
+) -> Response:
     """
     conn.log 明细接口，语义上等价于 /api/flows，便于前端按“日志类型”访问。
     """
-    since_dt = (
-        datetime.fromtimestamp(since_ts, tz=timezone.utc) if since_ts is not None else None
+    return _flows_page(request, limit, since_ts, cursor, after_seq)
+
+
+@app.get("/api/stream")
+def api_stream(
+    types: str = Query(
+        "flows,http,threats", description="订阅的记录类型，逗号分隔：flows/http/threats"
+    ),
+    host: Optional[str] = Query(None, description="只推送该 IP 作为源或目的的记录"),
+    proto: Optional[str] = Query(None, description="只推送该协议（tcp/udp/icmp）"),
+    service: Optional[str] = Query(None, description="只推送该 service 的流量，例如 http"),
+    source: Optional[str] = Query(None, description="只推送该来源的告警：notice/intel/weird"),
+) -> StreamingResponse:
+    """
+    实时推送新入库的流量与告警（Server-Sent Events），替代前端定时轮询。
+
+    每批新记录推送一条消息：`event: flows` / `event: http` / `event: threats`，data 为 JSON 数组，
+    记录结构与 /api/flows、/api/flows/http、/api/threats 相同。客户端消费过慢、缓冲超过 STREAM_BUFFER
+    条消息时，服务端发送 `event: overflow` 后断开，客户端应重新拉取列表后再订阅。
+    """
+    kinds = frozenset(t.strip() for t in types.split(",") if t.strip())
+    if not kinds or not kinds <= set(STREAM_KINDS):
+        raise HTTPException(status_code=400, detail="types 只能为 flows/http/threats 的组合")
+    flt = StreamFilter(
+        kinds=kinds,
+        host=host or None,
+        proto=proto.lower() if proto else None,
+        service=service.lower() if service else None,
+        source=source or None,
+    )
+    return StreamingResponse(
+        stream_hub.events(flt),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    return storage.list_flows(limit=limit, since=since_dt)
 
 
 @app.get("/api/flows/aggregate", response_model=List[FlowAggregateBucket])
 def api_aggregate_flows(
+    request: Request,
     bucket_seconds: int = Query(60, ge=1, le=3600, description="聚合时间桶大小（秒）"),
     since_ts: Optional[float] = Query(
         None, description="从此 UNIX 时间戳（秒）之后的记录参与聚合"
     ),
-) -> List[FlowAggregateBucket]:
+) -> Response:
     """
     普通流量聚合接口：按时间桶统计流量数量和字节数。
+
+    数据来自 storage 中写入时增量维护的按秒汇总，代价只与时间桶数量有关。
     """
-    from datetime import timezone
+    # 汇总按整秒计算，since_ts 的小数部分不影响结果
+    since_sec = math.floor(since_ts) if since_ts else None
+    since_dt = _since(since_sec)
 
-    since_dt = datetime.fromtimestamp(since_ts, tz=timezone.utc) if since_ts else None
-    flows = storage.list_flows(limit=10_000, since=since_dt)
+    def build(versions: Tuple[int, ...]) -> CachedResponse:
+        buckets = storage.aggregate_flows(bucket_seconds=bucket_seconds, since=since_dt)
+        return CachedResponse(versions, dumps(buckets), {})
 
-    buckets: dict[int, FlowAggregateBucket] = {}
-    for f in flows:
-        ts_sec = int(f.ts.timestamp())
-        bucket_start_sec = ts_sec - (ts_sec % bucket_seconds)
-        bucket_end_sec = bucket_start_sec + bucket_seconds
+    return _cached(request, ("flows-aggregate", bucket_seconds, since_sec), ("flows",), build)
 
-        key = bucket_start_sec
-        if key not in buckets:
-            buckets[key] = FlowAggregateBucket(
-                bucket_start=datetime.fromtimestamp(bucket_start_sec, tz=f.ts.tzinfo),
-                bucket_end=datetime.fromtimestamp(bucket_end_sec, tz=f.ts.tzinfo),
-                flow_count=0,
-                orig_bytes_sum=0,
-                resp_bytes_sum=0,
-            )
 
-        b = buckets[key]
-        b.flow_count += 1
-        b.orig_bytes_sum += f.orig_bytes or 0
-        b.resp_bytes_sum += f.resp_bytes or 0
+@app.get("/api/flows/top", response_model=List[TopItem])
+def api_top_flows(
+    request: Request,
+    by: str = Query("orig_h", description="排行维度：orig_h / resp_h / resp_p"),
+    metric: str = Query("bytes", description="排行指标：bytes（orig_bytes + resp_bytes）/ flows（条数）"),
+    n: int = Query(20, ge=1, le=100, description="返回前 n 项"),
+    since_ts: Optional[float] = Query(
+        None, description="从此 UNIX 时间戳（秒）所在的时间窗开始统计，默认为全部保留时间窗"
+    ),
+) -> Response:
+    """
+    Top-N 排行（如“最近 1 小时按字节数排名前 20 的源 IP”）。
+
+    数据来自写入时按时间窗增量维护的 Space-Saving 摘要，覆盖保留时间窗内的全部流量
+    （不受明细缓冲容量限制），查询代价与流量大小无关。结果为估计值，误差上界见 error。
+    """
+    if by not in FLOW_TOP_DIMENSIONS:
+        raise HTTPException(status_code=400, detail="by 只能为 orig_h/resp_h/resp_p")
+    if metric not in FLOW_TOP_METRICS:
+        raise HTTPException(status_code=400, detail="metric 只能为 bytes/flows")
+    since_dt = datetime.fromtimestamp(since_ts, tz=timezone.utc) if since_ts else None
+    # 按时间窗对齐：同一时间窗内的 since_ts 结果相同
+    window = math.floor(since_ts) // settings.top_window_seconds if since_ts else None
 
-    return [buckets[k] for k in sorted(buckets.keys())]
+    def build(versions: Tuple[int, ...]) -> CachedResponse:
+        top = storage.top_flows(by=by, metric=metric, n=n, since=since_dt)
+        return CachedResponse(versions, dumps(top), {})
+
+    return _cached(request, ("flows-top", by, metric, n, window), ("flows",), build)
 
 
 @app.get("/api/threats/aggregate", response_model=List[ThreatAggregateBucket])
 def api_aggregate_threats(
+    request: Request,
     bucket_seconds: int = Query(60, ge=1, le=3600, description="聚合时间桶大小（秒）"),
     since_ts: Optional[float] = Query(
         None, description="从此 UNIX 时间戳（秒）之后的记录参与聚合"
     ),
-) -> List[ThreatAggregateBucket]:
+) -> Response:
     """
     威胁/告警聚合接口：按时间桶统计威胁数量，并按 level/note 细分。
     """
-    from datetime import timezone
-
-    since_dt = datetime.fromtimestamp(since_ts, tz=timezone.utc) if since_ts else None
-    threats = storage.list_threats(limit=10_000, since=since_dt)
-
-    buckets: dict[int, ThreatAggregateBucket] = {}
-    for t in threats:
-        ts_sec = int(t.ts.timestamp())
-        bucket_start_sec = ts_sec - (ts_sec % bucket_seconds)
-        bucket_end_sec = bucket_start_sec + bucket_seconds
+    since_sec = math.floor(since_ts) if since_ts else None
+    since_dt = _since(since_sec)
 
-        key = bucket_start_sec
-        if key not in buckets:
-            buckets[key] = ThreatAggregateBucket(
-                bucket_start=datetime.fromtimestamp(bucket_start_sec, tz=t.ts.tzinfo),
-                bucket_end=datetime.fromtimestamp(bucket_end_sec, tz=t.ts.tzinfo),
-                threat_count=0,
-            )
+    def build(versions: Tuple[int, ...]) -> CachedResponse:
+        buckets = storage.aggregate_threats(bucket_seconds=bucket_seconds, since=since_dt)
+        return CachedResponse(versions, dumps(buckets), {})
 
-        b = buckets[key]
-        b.threat_count += 1
-        if t.level:
-            b.by_level[t.level] = b.by_level.get(t.level, 0) + 1
-        if t.note:
-            b.by_note[t.note] = b.by_note.get(t.note, 0) + 1
-
-    return [buckets[k] for k in sorted(buckets.keys())]
+    return _cached(request, ("threats-aggregate", bucket_seconds, since_sec), ("threats",), build)
 
 
 @app.get("/api/rules")
@@ -262,28 +653,8 @@ def api_get_rules() -> dict:
         "data_display_days": 7
     }
     """
-    config_path = settings.zeek_scripts_dir / "rules_config.json"
-    if not config_path.is_file():
-        # 默认 7 天
-        return {
-            "enabled_rules": [],
-            "custom_rule": "",
-            "data_retention_days": 7,
-            "data_display_days": 7,
-        }
-
-    try:
-        with config_path.open("r", encoding="utf-8") as f:
-            cfg = json.load(f)
-    except Exception:
-        cfg = {}
-    # 兼容旧版本：字段缺失时给默认值 7
-    return {
-        "enabled_rules": cfg.get("enabled_rules") or [],
-        "custom_rule": cfg.get("custom_rule") or "",
-        "data_retention_days": cfg.get("data_retention_days") or 7,
-        "data_display_days": cfg.get("data_display_days") or 7,
-    }
+    # 文件缺失或字段缺失时默认 7 天，兼容旧版本配置
+    return load_rules_config()
 
 
 @app.post("/api/rules")
@@ -293,11 +664,14 @@ def api_set_rules(payload: dict = Body(...)) -> dict:
 
     请求体示例：
     {
-        "enabled_rules": ["policy/protocols/conn/scan", "custom/portscan"],
+        "enabled_rules": ["policy/protocols/conn/scan", "custom/portscan", "pyrule/beacon"],
         "custom_rule": "event zeek_init() { ... }",
         "data_retention_days": 7,
         "data_display_days": 7
     }
+
+    pyrule/* 为 Python 侧检测规则（portscan / volume / beacon），保存后立即生效；
+    其余规则在下次启动 Zeek 或 POST /api/control/reload 热加载后生效。
     """
     enabled_rules = payload.get("enabled_rules") or []
     custom_rule = payload.get("custom_rule") or ""
@@ -351,11 +725,13 @@ def api_set_rules(payload: dict = Body(...)) -> dict:
             detail=f"保存规则配置失败（{e.__class__.__name__}: {e}）",
         )
 
+    # Python 规则（pyrule/*）不经过 Zeek，保存后立即生效
+    rule_engine.configure(enabled_rules)
     return {"ok": True}
 
 
 @app.post("/api/rules/validate")
-def api_validate_rules(payload: dict = Body(...)) -> dict:
+async def api_validate_rules(payload: dict = Body(...)) -> dict:
     """
     校验给定规则路径在当前 Zeek 环境中是否可加载。
 
@@ -375,32 +751,23 @@ def api_validate_rules(payload: dict = Body(...)) -> dict:
     if not isinstance(rules, list):
         raise HTTPException(status_code=400, detail="rules 必须为数组")
 
-    invalid: list[str] = []
+    # 只对 Zeek 内置脚本路径调用 zeek -N 检查，custom/* 之类前端自己管理；
+    # 结果按 Zeek 版本缓存，未缓存的规则批量 / 并发检查，Zeek 不可用或超时的规则视为无效
+    scripts = [
+        rule
+        for rule in rules
+        if isinstance(rule, str) and (rule.startswith("policy/") or rule.startswith("base/"))
+    ]
+    loadable = await script_validator.check(scripts)
 
+    invalid: list[str] = []
     for rule in rules:
         if not isinstance(rule, str):
             invalid.append(str(rule))
-            continue
-        # 只对 Zeek 内置脚本路径做检查，custom/* 之类前端自己管理
-        if not (rule.startswith("policy/") or rule.startswith("base/")):
-            continue
-
-        # 调用 Zeek 检查脚本是否存在：
-        # zeek -N <script-path>
-        try:
-            proc = subprocess.run(
-                [str(settings.zeek_bin), "-N", rule],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=5.0,
-            )
-        except Exception:
-            # Zeek 不可用时，直接认为此规则无效，防止运行期崩溃
-            invalid.append(rule)
-            continue
-
-        if proc.returncode != 0:
+        elif rule.startswith(PYRULE_PREFIX):
+            if rule[len(PYRULE_PREFIX):] not in PYRULES:
+                invalid.append(rule)
+        elif rule in loadable and not loadable[rule]:
             invalid.append(rule)
 
     return {
@@ -418,17 +785,30 @@ def create_app() -> FastAPI:
     return app
 
 
+@app.on_event("shutdown")
+def _shutdown_flush_storage() -> None:
+    """退出时刷写持久化后端中尚未落盘的数据。"""
+    storage.close()
+
+
+@app.on_event("startup")
+def _startup_load_intel() -> None:
+    """后台加载情报指标，不阻塞 API 启动。"""
+    intel_store.reload()
+
+
 @app.on_event("startup")
-def _startup_autostart_zeek() -> None:
+async def _startup_autostart_zeek() -> None:
     """
     开发/演示模式下可自动启动 Zeek，避免“API 已启动但没有流量”的困惑。
 
     通过环境变量控制：AUTO_START_ZEEK=1/true/yes/on
+    启动过程（生成 local.zeek、校验规则）是阻塞调用，放到线程池执行，不占用事件循环。
     """
     flag = os.environ.get("AUTO_START_ZEEK", "").strip().lower()
     if flag in {"1", "true", "yes", "on"}:
         try:
-            zeek_runner.start()
+            await run_in_threadpool(zeek_runner.start)
         except Exception:
             # API 应能起来，即使 Zeek 启动失败（例如网卡权限问题）
             pass
@@ -0,0 +1,614 @@
+from __future__ import annotations
+
+import abc
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Sequence, Union
+
+from .config import load_rules_config
+from .models import Flow, FlowBatch, FlowFilter, HttpFlow, ThreatEvent, ThreatFilter
+
+Record = Union[Flow, ThreatEvent, HttpFlow]
+
+# 写队列中的刷写请求：写线程收到后立即提交已收集的记录（见 SqliteBackend.sync）
+_FLUSH = object()
+
+
+class StorageBackend(abc.ABC):
+    """
+    持久化存储后端接口。
+
+    InMemoryStorage 负责最近数据的快速查询，后端负责长期保存：
+    - write_* 只负责入队，不应阻塞调用方太久；
+    - query_* 返回 [since_ts, until_ts] 区间内按 ts 升序的最后 limit 条。
+
+    写入与查询接口必须实现；sync / rollup_* / close 有默认实现（无需等待、无可回灌的数据）。
+    """
+
+    @abc.abstractmethod
+    def write_flow(self, flow: Flow) -> None:
+        """写入单条 flow。"""
+
+    @abc.abstractmethod
+    def write_threat(self, threat: ThreatEvent) -> None:
+        """写入单条告警。"""
+
+    def write_flows(self, flows: Sequence[Flow]) -> None:
+        for flow in flows:
+            self.write_flow(flow)
+
+    def write_threats(self, threats: Sequence[ThreatEvent]) -> None:
+        for threat in threats:
+            self.write_threat(threat)
+
+    def write_flow_batch(self, batch: FlowBatch) -> None:
+        """按列批量写入；默认转换为 Flow 列表，后端可直接按行元组写入。"""
+        self.write_flows(batch.flows())
+
+    @abc.abstractmethod
+    def write_http_flows(self, flows: Sequence[HttpFlow]) -> None:
+        """批量写入 http.log 记录。"""
+
+    @abc.abstractmethod
+    def query_flows(
+        self,
+        limit: int,
+        since_ts: Optional[float] = None,
+        until_ts: Optional[float] = None,
+        flt: Optional[FlowFilter] = None,
+    ) -> List[Flow]:
+        """查询 flow，flt 为等值过滤条件。"""
+
+    @abc.abstractmethod
+    def query_threats(
+        self,
+        limit: int,
+        since_ts: Optional[float] = None,
+        until_ts: Optional[float] = None,
+        flt: Optional[ThreatFilter] = None,
+    ) -> List[ThreatEvent]:
+        """查询告警，flt 为等值过滤条件。"""
+
+    @abc.abstractmethod
+    def query_http_flows(
+        self,
+        limit: int,
+        since_ts: Optional[float] = None,
+        until_ts: Optional[float] = None,
+        uid: Optional[str] = None,
+    ) -> List[HttpFlow]:
+        """查询 http.log 记录，uid 不为空时只返回该连接的记录。"""
+
+    @abc.abstractmethod
+    def max_ts(self) -> tuple[Optional[float], Optional[float], Optional[float]]:
+        """返回已持久化的 (flow 最大 ts, threat 最大 ts, http 最大 ts)。"""
+
+    def sync(self, timeout: float = 5.0) -> bool:
+        """等待此前写入的记录全部可被 query_* 查到，超时返回 False。"""
+        return True
+
+    def rollup_flows(self, until_ts: float) -> Iterator[tuple[int, int, int, int]]:
+        """按秒汇总已持久化的 flow：(秒, 条数, orig_bytes 和, resp_bytes 和)。"""
+        return iter(())
+
+    def rollup_distinct(self, column: str, until_ts: float) -> Iterator[tuple[int, object]]:
+        """已持久化 flow 中 column 每分钟出现过的取值：(分钟起始秒, 取值)。"""
+        return iter(())
+
+    def rollup_threats(
+        self, until_ts: float
+    ) -> Iterator[tuple[int, Optional[str], Optional[str], int]]:
+        """按秒汇总已持久化的告警：(秒, level, note, 条数)。"""
+        return iter(())
+
+    def rollup_top_flows(
+        self, column: str, since_ts: float, until_ts: float, window_seconds: int
+    ) -> Iterator[tuple[int, object, int, int]]:
+        """按时间窗与 column 汇总已持久化的 flow：(时间窗, key, 条数, 字节数)。"""
+        return iter(())
+
+    def close(self) -> None:
+        pass
+
+
+_FLOW_COLUMNS = (
+    "ts",
+    "uid",
+    "orig_h",
+    "orig_p",
+    "resp_h",
+    "resp_p",
+    "proto",
+    "service",
+    "duration",
+    "orig_bytes",
+    "resp_bytes",
+    "conn_state",
+)
+_THREAT_COLUMNS = (
+    "ts",
+    "note",
+    "msg",
+    "src",
+    "dst",
+    "uid",
+    "proto",
+    "level",
+    "source",
+)
+_HTTP_COLUMNS = (
+    "ts",
+    "uid",
+    "orig_h",
+    "orig_p",
+    "resp_h",
+    "resp_p",
+    "trans_depth",
+    "method",
+    "host",
+    "uri",
+    "referrer",
+    "user_agent",
+    "status_code",
+    "status_msg",
+    "request_body_len",
+    "response_body_len",
+    "resp_mime_types",
+)
+_FLOW_DDL = (
+    "ts REAL NOT NULL, uid TEXT, orig_h TEXT, orig_p INTEGER, resp_h TEXT, "
+    "resp_p INTEGER, proto TEXT, service TEXT, duration REAL, "
+    "orig_bytes INTEGER, resp_bytes INTEGER, conn_state TEXT"
+)
+_THREAT_DDL = (
+    "ts REAL NOT NULL, note TEXT, msg TEXT, src TEXT, dst TEXT, uid TEXT, "
+    "proto TEXT, level TEXT, source TEXT"
+)
+_HTTP_DDL = (
+    "ts REAL NOT NULL, uid TEXT, orig_h TEXT, orig_p INTEGER, resp_h TEXT, "
+    "resp_p INTEGER, trans_depth INTEGER, method TEXT, host TEXT, uri TEXT, "
+    "referrer TEXT, user_agent TEXT, status_code INTEGER, status_msg TEXT, "
+    "request_body_len INTEGER, response_body_len INTEGER, resp_mime_types TEXT"
+)
+_DDL = {"flows": _FLOW_DDL, "threats": _THREAT_DDL, "http": _HTTP_DDL}
+
+
+@lru_cache(maxsize=64)
+def _day_partition(day: int) -> str:
+    return datetime.fromtimestamp(day * 86400, tz=timezone.utc).strftime("%Y%m%d")
+
+
+def _partition_of(ts: float) -> str:
+    return _day_partition(int(ts // 86400))
+
+
+def _conditions(flt: Optional[NamedTuple]) -> list[tuple[str, tuple]]:
+    """过滤条件 -> SQL 条件；字段名即列名，port 匹配 orig_p 或 resp_p。"""
+    if flt is None:
+        return []
+    where: list[tuple[str, tuple]] = []
+    for column, value in flt._asdict().items():
+        if value is None:
+            continue
+        if column == "port":
+            where.append(("(orig_p = ? OR resp_p = ?)", (value, value)))
+        else:
+            where.append((f"{column} = ?", (value,)))
+    return where
+
+
+class SqliteBackend(StorageBackend):
+    """
+    基于 SQLite（WAL 模式）的持久化后端。
+
+    - 按 UTC 日期分区建表：flows_YYYYMMDD / threats_YYYYMMDD / http_YYYYMMDD；
+    - 解析线程只负责入队，由独立写线程批量 executemany 提交；
+      队列按记录条数限长（max_pending_rows），写入过慢时阻塞入队方形成背压；
+    - 写线程定期按 rules_config.json 中的 data_retention_days 整表删除过期分区；
+    - WAL 模式下 API 线程读取不会阻塞写入。
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        batch_size: int = 5_000,
+        flush_interval: float = 1.0,
+        max_pending_rows: int = 200_000,
+        purge_interval: float = 3600.0,
+    ) -> None:
+        self._db_path = db_path
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._purge_interval = purge_interval
+        # 队列本身不限长，按尚未提交的记录条数限流：超过 max_pending_rows 时阻塞解析线程，
+        # 形成背压而不是丢数据（单个超大批次在队列为空时仍可入队）
+        self._queue: "queue.Queue[object]" = queue.Queue()
+        self._max_pending_rows = max_pending_rows
+        self._rows_cond = threading.Condition()
+        self._enqueued_rows = 0
+        self._flushed_rows = 0
+        self._local = threading.local()
+        self._writer: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+        self._db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+
+    # ---- 连接与分区 ----
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self._db_path), timeout=30.0)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _partitions(self, conn: sqlite3.Connection, kind: str) -> list[str]:
+        """返回某类数据的全部分区日期（升序）。"""
+        rows = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE ?",
+            (f"{kind}_%",),
+        ).fetchall()
+        return sorted(name[len(kind) + 1 :] for (name,) in rows)
+
+    def _ensure_partition(self, conn: sqlite3.Connection, kind: str, day: str) -> None:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {kind}_{day} ({_DDL[kind]})")
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {kind}_{day}_ts ON {kind}_{day} (ts)"
+        )
+        # 按 uid 关联 flow / http / 告警时不必扫描整个分区
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {kind}_{day}_uid ON {kind}_{day} (uid)"
+        )
+
+    # ---- 写入 ----
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._start_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._writer_loop, name="storage-sqlite-writer", daemon=True
+                )
+                self._writer.start()
+
+    def _put(self, item: Union[Record, list, FlowBatch], rows: int) -> None:
+        self._ensure_writer()
+        with self._rows_cond:
+            self._rows_cond.wait_for(
+                lambda: self._enqueued_rows == self._flushed_rows
+                or self._enqueued_rows - self._flushed_rows + rows <= self._max_pending_rows
+            )
+            self._enqueued_rows += rows
+            # 在条件锁内入队，保证队列顺序与计数一致
+            self._queue.put(item)
+
+    def write_flow(self, flow: Flow) -> None:
+        self._put(flow, 1)
+
+    def write_threat(self, threat: ThreatEvent) -> None:
+        self._put(threat, 1)
+
+    def write_flows(self, flows: Sequence[Flow]) -> None:
+        # 整批作为一个队列元素，减少队列操作次数
+        items = list(flows)
+        self._put(items, len(items))
+
+    def write_threats(self, threats: Sequence[ThreatEvent]) -> None:
+        items = list(threats)
+        self._put(items, len(items))
+
+    def write_flow_batch(self, batch: FlowBatch) -> None:
+        # 列式批次直接入队，写线程按行元组写入，不构造 Flow
+        self._put(batch, len(batch))
+
+    def write_http_flows(self, flows: Sequence[HttpFlow]) -> None:
+        items = list(flows)
+        self._put(items, len(items))
+
+    def sync(self, timeout: float = 5.0) -> bool:
+        """
+        等待此前入队的记录全部提交到 SQLite。
+
+        内存缓冲淘汰记录时不等待落盘，查询回退到后端前调用，
+        避免刚被淘汰、仍在写队列中的记录两边都查不到。
+        """
+        with self._rows_cond:
+            target = self._enqueued_rows
+            if self._flushed_rows >= target:
+                return True
+            self._queue.put(_FLUSH)
+            return self._rows_cond.wait_for(lambda: self._flushed_rows >= target, timeout)
+
+    def _writer_loop(self) -> None:
+        conn = self._connect()
+        known: set[str] = set()
+        last_purge = 0.0
+        stopping = False
+
+        while not stopping:
+            batch: list[Union[Record, FlowBatch]] = []
+            pending = 0
+            deadline = time.monotonic() + self._flush_interval
+            while pending < self._batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                if item is _FLUSH:
+                    break
+                if isinstance(item, list):
+                    batch.extend(item)
+                    pending += len(item)
+                else:
+                    batch.append(item)
+                    pending += len(item) if isinstance(item, FlowBatch) else 1
+
+            if batch:
+                try:
+                    self._flush(conn, batch, known)
+                except Exception as e:
+                    # 写入失败不应拖垮解析线程，丢弃该批并打印提示
+                    print(f"[storage] SQLite 批量写入失败: {e}")
+                # 失败的批次也计为已处理，入队方与 sync() 不会一直等待
+                with self._rows_cond:
+                    self._flushed_rows += pending
+                    self._rows_cond.notify_all()
+
+            now = time.monotonic()
+            if now - last_purge >= self._purge_interval:
+                last_purge = now
+                try:
+                    known.difference_update(self.purge_expired(conn))
+                except Exception as e:
+                    print(f"[storage] 清理过期分区失败: {e}")
+
+    def _flush(
+        self,
+        conn: sqlite3.Connection,
+        batch: list[Union[Record, FlowBatch]],
+        known: set[str],
+    ) -> None:
+        grouped: dict[str, list[tuple]] = {}
+        for rec in batch:
+            if isinstance(rec, FlowBatch):
+                if not len(rec):
+                    continue
+                first = _partition_of(rec.ts[0])
+                if first == _partition_of(min(rec.ts)) == _partition_of(max(rec.ts)):
+                    # 整批落在同一天（绝大多数情况）
+                    grouped.setdefault(f"flows_{first}", []).extend(rec.rows())
+                else:
+                    for row in rec.rows():
+                        grouped.setdefault(f"flows_{_partition_of(row[0])}", []).append(row)
+                continue
+            ts = rec.ts.timestamp()
+            if isinstance(rec, Flow):
+                table = f"flows_{_partition_of(ts)}"
+                row = (ts,) + tuple(getattr(rec, c) for c in _FLOW_COLUMNS[1:])
+            elif isinstance(rec, HttpFlow):
+                table = f"http_{_partition_of(ts)}"
+                row = (ts,) + tuple(getattr(rec, c) for c in _HTTP_COLUMNS[1:])
+            else:
+                table = f"threats_{_partition_of(ts)}"
+                row = (ts,) + tuple(getattr(rec, c) for c in _THREAT_COLUMNS[1:])
+            grouped.setdefault(table, []).append(row)
+
+        with conn:
+            for table, rows in grouped.items():
+                kind, day = table.split("_", 1)
+                if table not in known:
+                    self._ensure_partition(conn, kind, day)
+                    known.add(table)
+                placeholders = ", ".join("?" * len(rows[0]))
+                conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+
+    def purge_expired(self, conn: Optional[sqlite3.Connection] = None) -> list[str]:
+        """整表删除超过 data_retention_days 的分区，返回被删除的表名。"""
+        conn = conn or self._connect()
+        retention_days = int(load_rules_config()["data_retention_days"])
+        cutoff = (
+            datetime.now(tz=timezone.utc) - timedelta(days=retention_days)
+        ).strftime("%Y%m%d")
+
+        dropped: list[str] = []
+        with conn:
+            for kind in _DDL:
+                for day in self._partitions(conn, kind):
+                    if day < cutoff:
+                        conn.execute(f"DROP TABLE IF EXISTS {kind}_{day}")
+                        dropped.append(f"{kind}_{day}")
+        if dropped:
+            conn.execute("PRAGMA incremental_vacuum")
+        return dropped
+
+    # ---- 查询 ----
+
+    def _query_tail(
+        self,
+        kind: str,
+        columns: tuple[str, ...],
+        limit: int,
+        since_ts: Optional[float],
+        until_ts: Optional[float],
+        conditions: Sequence[tuple[str, tuple]] = (),
+    ) -> list[tuple]:
+        conn = self._connect()
+        since_day = _partition_of(since_ts) if since_ts is not None else None
+        until_day = _partition_of(until_ts) if until_ts is not None else None
+
+        where: list[str] = []
+        params: list[object] = []
+        if since_ts is not None:
+            where.append("ts >= ?")
+            params.append(since_ts)
+        if until_ts is not None:
+            where.append("ts <= ?")
+            params.append(until_ts)
+        for sql, values in conditions:
+            where.append(sql)
+            params.extend(values)
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+        # 从最新分区向前查，凑够 limit 条即停止，只触及需要的分区
+        rows: list[tuple] = []
+        for day in reversed(self._partitions(conn, kind)):
+            if until_day is not None and day > until_day:
+                continue
+            if since_day is not None and day < since_day:
+                break
+            part = conn.execute(
+                f"SELECT {', '.join(columns)} FROM {kind}_{day} {where_sql} "
+                "ORDER BY ts DESC LIMIT ?",
+                (*params, limit - len(rows)),
+            ).fetchall()
+            rows.extend(part)
+            if len(rows) >= limit:
+                break
+        rows.reverse()
+        return rows
+
+    def query_flows(
+        self,
+        limit: int,
+        since_ts: Optional[float] = None,
+        until_ts: Optional[float] = None,
+        flt: Optional[FlowFilter] = None,
+    ) -> List[Flow]:
+        rows = self._query_tail(
+            "flows", _FLOW_COLUMNS, limit, since_ts, until_ts, _conditions(flt)
+        )
+        return [
+            Flow.model_construct(
+                ts=datetime.fromtimestamp(row[0], tz=timezone.utc),
+                **dict(zip(_FLOW_COLUMNS[1:], row[1:])),
+            )
+            for row in rows
+        ]
+
+    def query_threats(
+        self,
+        limit: int,
+        since_ts: Optional[float] = None,
+        until_ts: Optional[float] = None,
+        flt: Optional[ThreatFilter] = None,
+    ) -> List[ThreatEvent]:
+        rows = self._query_tail(
+            "threats", _THREAT_COLUMNS, limit, since_ts, until_ts, _conditions(flt)
+        )
+        return [
+            ThreatEvent.model_construct(
+                ts=datetime.fromtimestamp(row[0], tz=timezone.utc),
+                **dict(zip(_THREAT_COLUMNS[1:], row[1:])),
+            )
+            for row in rows
+        ]
+
+    def query_http_flows(
+        self,
+        limit: int,
+        since_ts: Optional[float] = None,
+        until_ts: Optional[float] = None,
+        uid: Optional[str] = None,
+    ) -> List[HttpFlow]:
+        conditions = [("uid = ?", (uid,))] if uid is not None else []
+        rows = self._query_tail("http", _HTTP_COLUMNS, limit, since_ts, until_ts, conditions)
+        return [
+            HttpFlow.model_construct(
+                ts=datetime.fromtimestamp(row[0], tz=timezone.utc),
+                **dict(zip(_HTTP_COLUMNS[1:], row[1:])),
+            )
+            for row in rows
+        ]
+
+    def max_ts(self) -> tuple[Optional[float], Optional[float], Optional[float]]:
+        conn = self._connect()
+        result: list[Optional[float]] = []
+        for kind in ("flows", "threats", "http"):
+            value = None
+            for day in reversed(self._partitions(conn, kind)):
+                (value,) = conn.execute(f"SELECT MAX(ts) FROM {kind}_{day}").fetchone()
+                if value is not None:
+                    break
+            result.append(value)
+        return result[0], result[1], result[2]
+
+    def rollup_flows(self, until_ts: float) -> Iterator[tuple[int, int, int, int]]:
+        conn = self._connect()
+        for day in self._partitions(conn, "flows"):
+            yield from conn.execute(
+                f"SELECT CAST(ts AS INTEGER) AS sec, COUNT(*), "
+                f"SUM(COALESCE(orig_bytes, 0)), SUM(COALESCE(resp_bytes, 0)) "
+                f"FROM flows_{day} WHERE ts <= ? GROUP BY sec",
+                (until_ts,),
+            )
+
+    def rollup_distinct(self, column: str, until_ts: float) -> Iterator[tuple[int, object]]:
+        conn = self._connect()
+        for day in self._partitions(conn, "flows"):
+            yield from conn.execute(
+                f"SELECT CAST(ts AS INTEGER) / 60 * 60 AS minute, {column} "
+                f"FROM flows_{day} WHERE ts <= ? GROUP BY minute, {column}",
+                (until_ts,),
+            )
+
+    def rollup_threats(
+        self, until_ts: float
+    ) -> Iterator[tuple[int, Optional[str], Optional[str], int]]:
+        conn = self._connect()
+        for day in self._partitions(conn, "threats"):
+            yield from conn.execute(
+                f"SELECT CAST(ts AS INTEGER) AS sec, level, note, COUNT(*) "
+                f"FROM threats_{day} WHERE ts <= ? GROUP BY sec, level, note",
+                (until_ts,),
+            )
+
+    def rollup_top_flows(
+        self, column: str, since_ts: float, until_ts: float, window_seconds: int
+    ) -> Iterator[tuple[int, object, int, int]]:
+        conn = self._connect()
+        since_day = _partition_of(since_ts)
+        for day in self._partitions(conn, "flows"):
+            if day < since_day:
+                continue
+            yield from conn.execute(
+                f"SELECT CAST(ts AS INTEGER) / ? AS w, {column}, COUNT(*), "
+                f"SUM(COALESCE(orig_bytes, 0) + COALESCE(resp_bytes, 0)) "
+                f"FROM flows_{day} WHERE ts >= ? AND ts <= ? GROUP BY w, {column}",
+                (window_seconds, since_ts, until_ts),
+            )
+
+    def close(self) -> None:
+        """通知写线程刷完队列后退出。"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join(timeout=30)
+
+
+def create_backend(name: str, data_dir: Path) -> Optional[StorageBackend]:
+    """根据配置名创建后端，memory 表示不做持久化。"""
+    name = name.strip().lower()
+    if name in ("", "memory"):
+        return None
+    if name == "sqlite":
+        return SqliteBackend(data_dir / "zeek_py.sqlite3")
+    raise ValueError(f"未知的存储后端: {name}")
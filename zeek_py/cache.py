@@ -0,0 +1,95 @@
+"""
+读接口的响应缓存：缓存序列化好的 JSON，按存储写入版本号失效。
+
+- 键为规范化后的查询参数（已校验的取值，与 URL 中参数的顺序、写法无关）；
+- 每个条目记录生成时相关记录类型的写入版本（storage.version），版本变化即视为过期，
+  没有新数据时轮询直接返回缓存，不访问存储；
+- 明细分页的结果在一段 since_ts 范围内都不变（见 api._page_since_range），
+  条目记录该范围，since_ts 随时间前移的轮询仍能命中；
+- LRU 淘汰，总字节数不超过 max_bytes；ETag 为内容摘要，配合 If-None-Match 返回 304。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from .config import settings
+
+# 单个条目的固定开销估计（键、元组与对象头），计入内存上限
+_ENTRY_OVERHEAD = 256
+
+
+class CachedResponse:
+    __slots__ = ("versions", "since_lo", "since_hi", "body", "etag", "headers", "size")
+
+    def __init__(
+        self,
+        versions: Tuple[int, ...],
+        body: bytes,
+        headers: Dict[str, str],
+        since_lo: float = -math.inf,
+        since_hi: float = math.inf,
+    ) -> None:
+        self.versions = versions
+        self.since_lo = since_lo
+        self.since_hi = since_hi
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.headers = headers
+        self.size = len(body) + sum(len(k) + len(v) for k, v in headers.items()) + _ENTRY_OVERHEAD
+
+    def matches(self, etags: Optional[str]) -> bool:
+        """If-None-Match（可为逗号分隔的多个值或 *，弱校验）是否与本条目一致。"""
+        if not etags:
+            return False
+        for tag in etags.split(","):
+            tag = tag.strip()
+            if tag == "*" or tag.removeprefix("W/") == self.etag:
+                return True
+        return False
+
+
+class ResponseCache:
+    """线程安全的 LRU 缓存；max_bytes 为 0 时不缓存。"""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(
+        self, key: Hashable, versions: Tuple[int, ...], since_ts: Optional[float] = None
+    ) -> Optional[CachedResponse]:
+        """版本一致且 since_ts（None 视为不限）落在条目的有效范围内时返回条目。"""
+        since = -math.inf if since_ts is None else since_ts
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.versions != versions:
+                return None
+            if not entry.since_lo <= since <= entry.since_hi:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, entry: CachedResponse) -> CachedResponse:
+        """写入（替换同键的旧条目）并按 LRU 淘汰；超过上限 1/4 的大响应不缓存。"""
+        if entry.size > self.max_bytes // 4:
+            return entry
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+        return entry
+
+
+response_cache = ResponseCache(settings.response_cache_bytes)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import json
 import os
 from pathlib import Path
 from typing import Optional
@@ -33,10 +34,110 @@ class Settings:
         # 网络接口（抓实时流量），可通过环境变量修改
         self.capture_iface: str = os.environ.get("ZEEK_IFACE", "eth0")
 
+        # 抓包进程数：大于 1 时启动多个 Zeek，通过 AF_PACKET fanout 分担流量，
+        # 各自写入 <logs_dir>/worker-N；fanout_id 与 fanout_id + 1（热加载时使用）需在本机唯一
+        self.zeek_workers: int = int(os.environ.get("ZEEK_WORKERS", "1"))
+        self.zeek_fanout_id: int = int(os.environ.get("ZEEK_FANOUT_ID", "23"))
+
+        # 热加载规则时新一代 Zeek 需连续运行的秒数，之后才停止旧进程并切换（见 ZeekRunner.reload）
+        self.zeek_reload_grace: float = float(os.environ.get("ZEEK_RELOAD_GRACE", "3"))
+
+        # 逐条校验 Zeek 脚本（zeek -N）时并发的进程数上限
+        self.zeek_check_concurrency: int = int(
+            os.environ.get("ZEEK_CHECK_CONCURRENCY", "4")
+        )
+
+        # 是否让 Zeek 输出 JSON 日志（policy/tuning/json-logs），默认 ASCII；
+        # 解析端按文件头自动识别格式，切换后无需其它配置
+        self.zeek_json_logs: bool = os.environ.get(
+            "ZEEK_JSON_LOGS", ""
+        ).strip().lower() in {"1", "true", "yes", "on"}
+
+        # 离线 pcap 回放：pcap 目录（相对路径以此为基准）、并行 Zeek 进程数，
+        # 以及单个文件超过多少字节时按流切分给多个进程
+        self.pcap_dir: Path = Path(
+            os.environ.get("ZEEK_PCAP_DIR", self.project_root / "pcaps")
+        )
+        self.replay_jobs: int = int(os.environ.get("REPLAY_JOBS", str(os.cpu_count() or 1)))
+        self.replay_split_bytes: int = int(
+            os.environ.get("REPLAY_SPLIT_BYTES", str(64 * 1024 * 1024))
+        )
+
         # Python API 监听地址与端口
         self.api_host: str = os.environ.get("API_HOST", "0.0.0.0")
         self.api_port: int = int(os.environ.get("API_PORT", "8000"))
 
+        # 内存存储容量（条数），Flow 为列式存储，可设置到百万级
+        self.storage_max_flows: int = int(
+            os.environ.get("STORAGE_MAX_FLOWS", "1000000")
+        )
+        self.storage_max_threats: int = int(
+            os.environ.get("STORAGE_MAX_THREATS", "100000")
+        )
+        self.storage_max_http: int = int(os.environ.get("STORAGE_MAX_HTTP", "200000"))
+        # Flow 维护哈希索引的字段（逗号分隔，可选 orig_h/resp_h/port/uid/conn_state）。
+        # 每个索引都增加写入开销（全部开启时存储写入吞吐约为不建索引的 1/3）与约 8 字节/条内存
+        # （port 为 16 字节）；未建索引的字段仍可过滤，但需顺序扫描
+        self.storage_flow_indexes: tuple[str, ...] = tuple(
+            name.strip()
+            for name in os.environ.get(
+                "STORAGE_FLOW_INDEXES", "orig_h,resp_h,port,uid,conn_state"
+            ).split(",")
+            if name.strip()
+        )
+
+        # /api/flows/aggregate 基数估计（不同源 IP / 目的 IP / 目的端口数）的 HyperLogLog 精度 p：
+        # 相对误差约 1.04 / sqrt(2^p)（默认 9 约 4.6%）；分钟与小时粒度上每个有流量的时间片
+        # 占 3 × 2^p 字节，默认满 14 天分钟数据约 30 MB
+        self.rollup_hll_precision: int = int(os.environ.get("ROLLUP_HLL_PRECISION", "9"))
+
+        # /api/flows/top：按时间窗维护 Space-Saving 摘要，每个摘要最多跟踪 TOP_CAPACITY 个 key；
+        # 时间窗 TOP_WINDOW_SECONDS 秒，保留 TOP_WINDOWS 个（默认最近 1 小时）。
+        # 内存上限约为 窗口数 × 6 个摘要 × 容量 个 key，与流量大小无关
+        self.top_capacity: int = int(os.environ.get("TOP_CAPACITY", "256"))
+        self.top_window_seconds: int = int(os.environ.get("TOP_WINDOW_SECONDS", "60"))
+        self.top_windows: int = int(os.environ.get("TOP_WINDOWS", "60"))
+
+        # 情报指标（IOC）文件目录：采集时按 IP / 网段 / 域名匹配新记录（见 intel），
+        # 目录不存在时不匹配；修改文件后通过 POST /api/intel/reload 重新加载
+        self.intel_dir: Path = Path(
+            os.environ.get("INTEL_DIR", self.project_root / "intel")
+        )
+
+        # 读接口（/api/flows、/api/flows/http、/api/threats 及聚合、排行）的响应缓存上限（字节），0 为不缓存；
+        # 按存储写入版本失效，没有新数据时轮询直接返回缓存
+        self.response_cache_bytes: int = int(
+            os.environ.get("RESPONSE_CACHE_BYTES", str(64 * 1024 * 1024))
+        )
+
+        # 日志采集流水线：conn.log 解析 worker 数量与模式（thread/process）、
+        # 每个通道的队列容量（批次数）以及 conn.log 队列满时的策略
+        self.ingest_parser_workers: int = int(
+            os.environ.get("INGEST_PARSER_WORKERS", "2")
+        )
+        self.ingest_parser_mode: str = os.environ.get("INGEST_PARSER_MODE", "thread")
+        self.ingest_queue_size: int = int(os.environ.get("INGEST_QUEUE_SIZE", "64"))
+        self.ingest_conn_overflow: str = os.environ.get("INGEST_CONN_OVERFLOW", "block")
+
+        # /api/stream 每个客户端最多缓冲的消息数（每批记录一条），超出即断开该客户端
+        self.stream_buffer: int = int(os.environ.get("STREAM_BUFFER", "256"))
+
+        # 离线归档导入（/api/import 与 python -m zeek_py.importer）的进程数，默认 CPU 核数
+        self.import_workers: int = int(
+            os.environ.get("IMPORT_WORKERS", str(os.cpu_count() or 1))
+        )
+
+        # 持久化后端：memory（不持久化）/ sqlite
+        self.storage_backend: str = os.environ.get("STORAGE_BACKEND", "memory")
+        self.storage_data_dir: Path = Path(
+            os.environ.get("STORAGE_DATA_DIR", self.project_root / "data")
+        )
+
+        # Zeek 脚本可加载性校验结果的缓存文件（按 Zeek 可执行文件与版本失效，见 zeek_check）
+        self.zeek_check_cache: Path = Path(
+            os.environ.get("ZEEK_CHECK_CACHE", self.storage_data_dir / "zeek_script_check.json")
+        )
+
     @property
     def zeek_exists(self) -> bool:
         return self.zeek_bin.is_file() and os.access(self.zeek_bin, os.X_OK)
@@ -45,3 +146,25 @@ class Settings:
 settings = Settings()
 
 
+def load_rules_config() -> dict:
+    """
+    读取 /api/rules 保存的规则配置（zeek_scripts/rules_config.json）。
+
+    文件不存在或字段缺失时使用默认值（保存/显示时间默认 7 天）。
+    """
+    config_path = settings.zeek_scripts_dir / "rules_config.json"
+    cfg: dict = {}
+    if config_path.is_file():
+        try:
+            with config_path.open("r", encoding="utf-8") as f:
+                cfg = json.load(f)
+        except Exception:
+            cfg = {}
+    return {
+        "enabled_rules": cfg.get("enabled_rules") or [],
+        "custom_rule": cfg.get("custom_rule") or "",
+        "data_retention_days": cfg.get("data_retention_days") or 7,
+        "data_display_days": cfg.get("data_display_days") or 7,
+    }
+
+
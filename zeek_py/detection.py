@@ -0,0 +1,355 @@
+"""
+Python 侧的流式检测规则（告警来源 source="pyrule"）。
+
+规则挂在采集流水线上，对每批新入库的 conn 记录增量更新按 key 维护的状态，
+不回扫存储：
+- 时间以记录自身的 ts 为准（实时采集与回放一致），每个 key 使用自己的固定窗口；
+- 超过 TTL 没有新记录的 key 定期整体清除，状态条数另有上限，内存有界；
+- 同一 key 在一个窗口内只告警一次。
+
+在 /api/rules 的 enabled_rules 中以 "pyrule/<名称>" 启用，保存后立即生效，
+不需要重启 Zeek。
+"""
+
+from __future__ import annotations
+
+import abc
+import math
+import operator
+import threading
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from .config import load_rules_config
+from .models import FlowBatch, ThreatEvent
+
+PYRULE_PREFIX = "pyrule/"
+
+# 未建立成功的连接状态：扫描探测绝大多数落在这些状态上
+_FAILED_STATES = frozenset({"S0", "REJ", "RSTOS0", "RSTRH", "SH", "SHR"})
+
+
+def _event(batch: FlowBatch, i: int, note: str, msg: str, dst: Optional[str]) -> ThreatEvent:
+    """由触发告警的第 i 条记录生成告警（src / uid / proto 取自该记录）。"""
+    return ThreatEvent(
+        ts=datetime.fromtimestamp(batch.ts[i], tz=timezone.utc),
+        note=note,
+        msg=msg,
+        src=batch.orig_h[i],
+        dst=dst,
+        uid=batch.uid[i],
+        proto=batch.proto[i],
+        level="Notice",
+        source="pyrule",
+    )
+
+
+class _Rule(abc.ABC):
+    """单条规则：states 的值都有 last 属性（该 key 最后出现的时间），用于 TTL 清除。"""
+
+    name = ""
+    ttl: float = 3600.0
+    max_keys: int = 200_000
+
+    def __init__(self) -> None:
+        self.states: Dict[object, object] = {}
+
+    @abc.abstractmethod
+    def process(self, batch: FlowBatch, order: Sequence[int], out: List[ThreatEvent]) -> None:
+        """按 order 的顺序处理 batch 中的记录，命中的告警追加到 out。"""
+
+    def expire(self, now: float) -> None:
+        cutoff = now - self.ttl
+        states = self.states
+        for key in [k for k, s in states.items() if s.last < cutoff]:  # type: ignore[attr-defined]
+            del states[key]
+
+
+class _ScanState:
+    __slots__ = ("last", "start", "seen", "alarmed")
+
+    def __init__(self, ts: float) -> None:
+        self.last = ts
+        self.start = ts
+        self.seen: set = set()
+        self.alarmed = False
+
+
+class PortScanRule(_Rule):
+    """
+    扫描（fan-out）：同一源在 window 秒内的失败连接
+    - 涉及同一目的主机的 ports 个不同端口 → PyRule::Port_Scan（状态键 (orig_h, resp_h, None)）；
+    - 涉及同一目的端口的 hosts 个不同主机 → PyRule::Address_Scan（状态键 (orig_h, None, resp_p)）。
+
+    集合达到阈值即告警并清空，窗口内不再增长。
+    """
+
+    name = "portscan"
+    ttl = 600.0
+
+    def __init__(self, window: float = 60.0, ports: int = 25, hosts: int = 25) -> None:
+        super().__init__()
+        self.window = window
+        self.port_threshold = ports
+        self.host_threshold = hosts
+
+    def process(self, batch: FlowBatch, order: Sequence[int], out: List[ThreatEvent]) -> None:
+        ts_col, conn_state = batch.ts, batch.conn_state
+        orig_h, resp_h, resp_p = batch.orig_h, batch.resp_h, batch.resp_p
+        for i in order:
+            if conn_state[i] not in _FAILED_STATES:
+                continue
+            ts, src, dst, port = ts_col[i], orig_h[i], resp_h[i], resp_p[i]
+            if self._track(ts, (src, dst, None), port, self.port_threshold):
+                msg = f"{src} 在 {self.window:g} 秒内向 {dst} 的 {self.port_threshold} 个端口发起了失败连接"
+                out.append(_event(batch, i, "PyRule::Port_Scan", msg, dst))
+            if self._track(ts, (src, None, port), dst, self.host_threshold):
+                msg = f"{src} 在 {self.window:g} 秒内向 {self.host_threshold} 个主机的 {port} 端口发起了失败连接"
+                out.append(_event(batch, i, "PyRule::Address_Scan", msg, None))
+
+    def _track(self, ts: float, key: tuple, target: object, threshold: int) -> bool:
+        """记录一次探测，达到阈值时返回 True。"""
+        st = self.states.get(key)
+        if st is None or ts - st.start >= self.window:
+            if st is None and len(self.states) >= self.max_keys:
+                return False
+            st = self.states[key] = _ScanState(ts)
+        elif ts > st.last:
+            st.last = ts
+        if st.alarmed:
+            return False
+        st.seen.add(target)
+        if len(st.seen) < threshold:
+            return False
+        st.alarmed = True
+        st.seen.clear()
+        return True
+
+
+class _VolumeState:
+    __slots__ = ("last", "start", "bytes", "baseline", "windows", "alarmed")
+
+    def __init__(self, ts: float) -> None:
+        self.last = ts
+        self.start = ts
+        self.bytes = 0
+        self.baseline = 0.0
+        self.windows = 0
+        self.alarmed = False
+
+
+class VolumeSpikeRule(_Rule):
+    """
+    流量突增：同一源在一个 window 内的字节数（orig_bytes + resp_bytes）
+    超过 factor × 历史基线（各窗口字节数的指数移动平均）且不少于 min_bytes → PyRule::Volume_Spike。
+
+    至少观察过 warmup 个窗口才开始判断；空闲的窗口按 0 字节计入基线。
+    """
+
+    name = "volume"
+    ttl = 3600.0
+
+    def __init__(
+        self,
+        window: float = 60.0,
+        factor: float = 10.0,
+        min_bytes: int = 50 * 1024 * 1024,
+        alpha: float = 0.3,
+        warmup: int = 3,
+    ) -> None:
+        super().__init__()
+        self.window = window
+        self.factor = factor
+        self.min_bytes = min_bytes
+        self.alpha = alpha
+        self.warmup = warmup
+
+    def process(self, batch: FlowBatch, order: Sequence[int], out: List[ThreatEvent]) -> None:
+        ts_col, orig_bytes, resp_bytes = batch.ts, batch.orig_bytes, batch.resp_bytes
+        orig_h = batch.orig_h
+        states = self.states
+        window, alpha = self.window, self.alpha
+        for i in order:
+            ts = ts_col[i]
+            src = orig_h[i]
+            st = states.get(src)
+            if st is None:
+                if len(states) >= self.max_keys:
+                    continue
+                st = states[src] = _VolumeState(ts)
+            elif ts - st.start >= window:
+                # 关闭当前窗口，中间空闲的窗口按 0 字节衰减基线
+                elapsed = int((ts - st.start) // window)
+                st.baseline = (st.baseline * (1 - alpha) + st.bytes * alpha) * (1 - alpha) ** (
+                    elapsed - 1
+                )
+                st.windows += elapsed
+                st.start += elapsed * window
+                st.bytes = 0
+                st.alarmed = False
+            if ts > st.last:
+                st.last = ts
+            ob, rb = orig_bytes[i], resp_bytes[i]
+            st.bytes += (ob if ob > 0 else 0) + (rb if rb > 0 else 0)
+            if (
+                not st.alarmed
+                and st.windows >= self.warmup
+                and st.bytes >= self.min_bytes
+                and st.bytes >= self.factor * st.baseline
+            ):
+                st.alarmed = True
+                ratio = st.bytes / st.baseline if st.baseline else math.inf
+                msg = (
+                    f"{src} 在 {window:g} 秒内传输 {st.bytes} 字节，"
+                    f"约为基线 {st.baseline:.0f} 字节的 {ratio:.1f} 倍"
+                )
+                out.append(_event(batch, i, "PyRule::Volume_Spike", msg, None))
+
+
+class _BeaconState:
+    __slots__ = ("last", "n", "mean", "m2", "alarmed", "alarmed_at")
+
+    def __init__(self, ts: float) -> None:
+        self.last = ts
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.alarmed = False
+        self.alarmed_at = ts
+
+
+class BeaconRule(_Rule):
+    """
+    周期性外联（beaconing）：同一 (orig_h, resp_h, resp_p) 的连接间隔
+    在 count 次以上保持稳定（变异系数不超过 max_cv），且平均间隔不短于 min_interval 秒
+    → PyRule::Beaconing。
+
+    间隔的均值与方差用 Welford 算法增量更新；短于 min_interval / 4 的间隔视作同一次突发，不计入。
+    告警后 realert 秒内不再告警，之后重新统计，持续的周期性外联按 realert 为窗口重复告警。
+    """
+
+    name = "beacon"
+    ttl = 3600.0
+
+    def __init__(
+        self,
+        count: int = 10,
+        max_cv: float = 0.1,
+        min_interval: float = 5.0,
+        realert: float = 3600.0,
+    ) -> None:
+        super().__init__()
+        self.count = count
+        self.max_cv = max_cv
+        self.min_interval = min_interval
+        self.realert = realert
+
+    def process(self, batch: FlowBatch, order: Sequence[int], out: List[ThreatEvent]) -> None:
+        ts_col = batch.ts
+        orig_h, resp_h, resp_p = batch.orig_h, batch.resp_h, batch.resp_p
+        states = self.states
+        burst = self.min_interval / 4
+        for i in order:
+            ts = ts_col[i]
+            key = (orig_h[i], resp_h[i], resp_p[i])
+            st = states.get(key)
+            if st is None:
+                if len(states) < self.max_keys:
+                    states[key] = _BeaconState(ts)
+                continue
+            interval = ts - st.last
+            if interval < burst:
+                # 乱序到达（interval < 0）或同一次突发
+                continue
+            st.last = ts
+            if st.alarmed:
+                if ts - st.alarmed_at < self.realert:
+                    continue
+                # 告警窗口结束：从下一个间隔开始重新统计
+                st.alarmed = False
+                st.n, st.mean, st.m2 = 0, 0.0, 0.0
+                continue
+            st.n += 1
+            delta = interval - st.mean
+            st.mean += delta / st.n
+            st.m2 += delta * (interval - st.mean)
+            if st.n < self.count:
+                continue
+            cv = math.sqrt(st.m2 / st.n) / st.mean
+            if cv <= self.max_cv and st.mean >= self.min_interval:
+                st.alarmed = True
+                st.alarmed_at = ts
+                msg = (
+                    f"{key[0]} 每隔约 {st.mean:.1f} 秒连接 {key[1]}:{key[2]}"
+                    f"（{st.n} 次，变异系数 {cv:.3f}）"
+                )
+                out.append(_event(batch, i, "PyRule::Beaconing", msg, key[1]))
+            elif st.n >= 4 * self.count:
+                # 长时间不稳定：重新开始统计，适应间隔的变化
+                st.n, st.mean, st.m2 = 0, 0.0, 0.0
+
+
+# 可启用的规则：enabled_rules 中的 "pyrule/<名称>"
+PYRULES: Dict[str, Callable[[], _Rule]] = {
+    PortScanRule.name: PortScanRule,
+    VolumeSpikeRule.name: VolumeSpikeRule,
+    BeaconRule.name: BeaconRule,
+}
+
+
+class RuleEngine:
+    """
+    按批评估已启用的 Python 规则；process 可在多个解析 worker 中并发调用（内部加锁）。
+
+    TTL 清除按记录时间每隔 ttl / 4 做一次整表扫描，均摊到每条记录上是常数。
+    """
+
+    def __init__(self, enabled: Iterable[str] = ()) -> None:
+        self._lock = threading.Lock()
+        self._rules: List[_Rule] = []
+        self._now = -math.inf
+        self._next_expire = -math.inf
+        self.configure(enabled)
+
+    @property
+    def rules(self) -> List[str]:
+        return [rule.name for rule in self._rules]
+
+    def configure(self, enabled: Iterable[str]) -> None:
+        """按 enabled_rules 启用规则；已启用的规则保留状态，其它键忽略。"""
+        names = [
+            rule[len(PYRULE_PREFIX):]
+            for rule in enabled
+            if isinstance(rule, str) and rule.startswith(PYRULE_PREFIX)
+        ]
+        with self._lock:
+            current = {rule.name: rule for rule in self._rules}
+            self._rules = [
+                current.get(name) or PYRULES[name]()
+                for name in dict.fromkeys(names)
+                if name in PYRULES
+            ]
+
+    def process(self, batch: FlowBatch) -> List[ThreatEvent]:
+        if not self._rules or not len(batch):
+            return []
+        ts = batch.ts
+        # 同一 worker 的输出基本有序，乱序时按 ts 排序后处理
+        if all(map(operator.le, ts, islice(ts, 1, None))):
+            order: Sequence[int] = range(len(ts))
+        else:
+            order = sorted(range(len(ts)), key=ts.__getitem__)
+        out: List[ThreatEvent] = []
+        with self._lock:
+            for rule in self._rules:
+                rule.process(batch, order, out)
+            self._now = max(self._now, ts[order[-1]])
+            if self._now >= self._next_expire:
+                for rule in self._rules:
+                    rule.expire(self._now)
+                self._next_expire = self._now + min(rule.ttl for rule in self._rules) / 4
+        return out
+
+
+rule_engine = RuleEngine(load_rules_config()["enabled_rules"])
@@ -0,0 +1,198 @@
+"""
+离线导入轮转后的 Zeek 历史日志（conn.*.log.gz 等）。
+
+- 每个归档文件交给进程池中的一个 worker：流式解压、按块切分并解析，
+  结果按段（见 parsers.archive.CHUNK_RECORDS）经有界队列传回，内存占用与归档大小无关；
+- 主进程按文件顺序逐段写入 storage.add_history：挂接持久化后端时直接落盘，
+  不进入实时数据的内存缓冲；未挂接后端时写入内存缓冲，会淘汰较早的实时记录；
+- 导入进度与吞吐（行/秒、MB/秒）通过 stats() 查看。
+
+命令行用法：
+    python -m zeek_py.importer /var/log/zeek/2024-01-01 conn.01:00:00-02:00:00.log.gz ...
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Optional, Sequence
+
+from .config import settings
+from .models import ImportStats
+from .parsers.archive import ArchiveResult, log_type, parse_archive
+from .storage import storage
+
+# 每个在途归档最多缓存的结果段数（worker 超前解析的上限）
+_QUEUE_CHUNKS = 2
+
+
+def find_archives(paths: Iterable[Path]) -> List[Path]:
+    """
+    展开目录（递归查找支持的 *.log / *.log.gz），返回按路径排序的文件列表。
+
+    显式给出的文件原样保留，不支持的类型在导入时计入 files_skipped。
+    """
+    found: set[Path] = set()
+    for path in paths:
+        if path.is_dir():
+            found.update(p for p in path.rglob("*.log*") if p.is_file() and log_type(p))
+        else:
+            found.add(path)
+    return sorted(found)
+
+
+class ArchiveImporter:
+    """离线归档导入任务；同一时间只运行一个导入。"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = ImportStats()
+        self._started = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self) -> ImportStats:
+        with self._lock:
+            stats = self._stats.model_copy(deep=True)
+        stats.running = self.running
+        if self._started:
+            if stats.running:
+                stats.elapsed_seconds = time.perf_counter() - self._started
+            elapsed = stats.elapsed_seconds
+            if elapsed > 0:
+                stats.lines_per_sec = stats.lines / elapsed
+                stats.mb_per_sec = stats.bytes_decoded / elapsed / (1024 * 1024)
+        return stats
+
+    def start(self, paths: Sequence[Path], workers: Optional[int] = None) -> ImportStats:
+        """在后台线程中开始导入，立即返回初始统计。"""
+        files = find_archives(paths)
+        with self._lock:
+            if self.running:
+                raise RuntimeError("已有导入任务在运行")
+            self._stats = ImportStats(running=True, files_total=len(files))
+            self._started = time.perf_counter()
+            self._thread = threading.Thread(
+                target=self._run, args=(files, workers), name="archive-import", daemon=True
+            )
+            self._thread.start()
+        return self.stats()
+
+    def run(self, paths: Sequence[Path], workers: Optional[int] = None) -> ImportStats:
+        """同步导入（命令行使用），返回最终统计。"""
+        self.start(paths, workers)
+        assert self._thread is not None
+        self._thread.join()
+        return self.stats()
+
+    def _run(self, files: List[Path], workers: Optional[int]) -> None:
+        supported = [str(p) for p in files if log_type(p) is not None]
+        with self._lock:
+            self._stats.files_skipped = len(files) - len(supported)
+        workers = max(1, min(workers or settings.import_workers, len(supported) or 1))
+        ctx = multiprocessing.get_context("spawn")
+        try:
+            with ctx.Manager() as manager, ProcessPoolExecutor(
+                max_workers=workers, mp_context=ctx
+            ) as executor:
+
+                def submit(path: str) -> tuple[str, Any, Future[int]]:
+                    out = manager.Queue(_QUEUE_CHUNKS)
+                    return path, out, executor.submit(parse_archive, path, out)
+
+                # 按文件顺序写入：归档按时间命名，存储中的新数据最后写入；
+                # 最多 2×workers 个归档在途，每个最多缓存 _QUEUE_CHUNKS 段结果
+                pending: deque[tuple[str, Any, Future[int]]] = deque()
+                todo = iter(supported)
+                for path in islice(todo, workers * 2):
+                    pending.append(submit(path))
+                while pending:
+                    path, out, future = pending.popleft()
+                    for result in _drain(out, future):
+                        self._store(result)
+                    nxt = next(todo, None)
+                    if nxt is not None:
+                        pending.append(submit(nxt))
+                    try:
+                        future.result()
+                    except Exception as e:
+                        # 出错前已写入的段保留
+                        with self._lock:
+                            self._stats.files_skipped += 1
+                            self._stats.errors.append(f"{path}: {e}")
+                        continue
+                    with self._lock:
+                        self._stats.files_done += 1
+        except Exception as e:
+            # 进程池异常等：记录原因后结束本次导入
+            with self._lock:
+                self._stats.errors.append(f"导入中止: {e}")
+        finally:
+            with self._lock:
+                self._stats.elapsed_seconds = time.perf_counter() - self._started
+
+    def _store(self, result: ArchiveResult) -> None:
+        storage.add_history(result.log, result.records)
+        with self._lock:
+            s = self._stats
+            s.lines += result.lines
+            s.records += len(result.records)
+            s.bytes_read += result.bytes_read
+            s.bytes_decoded += result.bytes_decoded
+
+
+def _drain(out: Any, future: Future[int]) -> Iterator[ArchiveResult]:
+    """依次取出一个归档的各段结果，直到 worker 放入结束标记（worker 异常退出时也会结束）。"""
+    while True:
+        try:
+            result = out.get(timeout=0.5)
+        except queue.Empty:
+            if future.done() and out.empty():
+                return
+            continue
+        if result is None:
+            return
+        yield result
+
+
+importer = ArchiveImporter()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m zeek_py.importer",
+        description="导入轮转后的 Zeek 历史日志（conn/http/notice/intel/weird，支持 .gz）",
+    )
+    parser.add_argument("paths", nargs="+", type=Path, help="日志文件或目录（递归查找）")
+    parser.add_argument(
+        "-j", "--workers", type=int, default=None, help="解析进程数（默认 IMPORT_WORKERS）"
+    )
+    args = parser.parse_args(argv)
+
+    if settings.storage_backend == "memory":
+        print("[import] 警告: STORAGE_BACKEND=memory，导入结果只写入内存缓冲，不会持久化")
+    try:
+        stats = importer.run(args.paths, args.workers)
+    finally:
+        storage.close()
+    for err in stats.errors:
+        print(f"[import] 跳过 {err}")
+    print(
+        f"[import] 文件 {stats.files_done}/{stats.files_total}（跳过 {stats.files_skipped}），"
+        f"{stats.lines} 行 / {stats.records} 条记录，耗时 {stats.elapsed_seconds:.1f}s，"
+        f"{stats.lines_per_sec:,.0f} 行/s，{stats.mb_per_sec:.1f} MB/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""
+情报指标（IOC）匹配：在采集流水线中把新记录与情报列表比对（告警来源 source="intel"）。
+
+与 Zeek 自身的 intel.log 独立，适合几十万条规模的 IP / 网段 / 域名列表：
+- 单个 IP 与域名放在哈希集合中，网段放在按地址位压缩的前缀树（Patricia trie）中，
+  每次查找最多比较地址位数（32 / 128）个节点，与列表大小无关；
+- conn 记录按 orig_h / resp_h 匹配 IP 与网段，http 记录按 host 匹配域名；
+- 重新加载在后台线程中构建新的索引，构建完成后整体替换引用，采集线程不等待。
+
+情报文件放在 INTEL_DIR（默认 <项目>/intel）下，支持两种格式：
+- Zeek Intel 框架的输入文件（#fields indicator indicator_type meta.source ...，制表符分隔），
+  只使用 Intel::ADDR / Intel::SUBNET / Intel::DOMAIN 三类；
+- 纯文本，每行一个 IP、CIDR 或域名（# 开头为注释），按内容自动识别类型。
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .config import settings
+from .models import FlowBatch, HttpFlow, IntelStats, ThreatEvent
+
+INTEL_ADDR = "Intel::ADDR"
+INTEL_SUBNET = "Intel::SUBNET"
+INTEL_DOMAIN = "Intel::DOMAIN"
+
+# 每个索引缓存的地址查找结果数：流量中的地址高度重复，绝大多数查找命中缓存
+_LOOKUP_CACHE = 65536
+
+# 前缀树跳转表按地址高 16 位索引（65536 项）
+_STRIDE = 16
+
+# (指标原文, 类型, 来源描述)
+_Indicator = Tuple[str, str, Optional[str]]
+
+
+class _PrefixTrie:
+    """
+    按地址位压缩的二叉前缀树，最长前缀匹配。
+
+    节点为 [前缀（地址宽度的整数，低位为 0）, 前缀长度, 指标, 0 分支, 1 分支]；
+    只有分叉处和实际网段处才有节点，节点数不超过网段数的 2 倍。
+
+    加载完成后 freeze() 按地址的高 _STRIDE 位建一张跳转表（level compression），
+    查找直接从表项开始，省去前面十几层逐位比较；freeze 之后不再插入。
+    """
+
+    __slots__ = ("width", "root", "size", "table")
+
+    def __init__(self, width: int) -> None:
+        self.width = width
+        self.root: list = [0, 0, None, None, None]
+        self.size = 0
+        self.table: Optional[List[Tuple[Optional[list], Optional[_Indicator]]]] = None
+
+    def insert(self, key: int, length: int, value: _Indicator) -> None:
+        width = self.width
+        parent: list = self.root
+        node: Optional[list] = self.root
+        side = 0
+        while node is not None:
+            diff = (key ^ node[0]).bit_length()
+            common = min(length, node[1], width - diff)
+            if common == node[1]:
+                if common == length:
+                    # 重复的网段保留先加载的一条
+                    if node[2] is None:
+                        node[2] = value
+                        self.size += 1
+                    return
+                parent, side = node, 3 + ((key >> (width - 1 - node[1])) & 1)
+                node = node[side]
+                continue
+            # 在 node 之上插入：新网段本身是公共前缀，或者新建分叉节点
+            if common == length:
+                fork = [key, length, value, None, None]
+            else:
+                mask = ((1 << common) - 1) << (width - common)
+                fork = [key & mask, common, None, None, None]
+                fork[3 + ((key >> (width - 1 - common)) & 1)] = [key, length, value, None, None]
+            fork[3 + ((node[0] >> (width - 1 - common)) & 1)] = node
+            parent[side] = fork
+            self.size += 1
+            return
+        parent[side] = [key, length, value, None, None]
+        self.size += 1
+
+    def freeze(self) -> None:
+        """
+        建跳转表：第 s 项为高 _STRIDE 位等于 s 的地址在查找路径上第一个
+        前缀长度不少于 _STRIDE 的节点，以及此前经过的最长匹配网段。
+        """
+        width = self.width
+        table = []
+        for slot in range(1 << _STRIDE):
+            addr = slot << (width - _STRIDE)
+            node: Optional[list] = self.root
+            best = None
+            while node is not None and node[1] < _STRIDE:
+                length = node[1]
+                if length and (addr ^ node[0]) >> (width - length):
+                    node = None
+                    break
+                if node[2] is not None:
+                    best = node[2]
+                node = node[3 + ((addr >> (width - 1 - length)) & 1)]
+            table.append((node, best))
+        self.table = table
+
+    def lookup(self, addr: int) -> Optional[_Indicator]:
+        width = self.width
+        if self.table is not None:
+            node, best = self.table[addr >> (width - _STRIDE)]
+        else:
+            node, best = self.root, None
+        while node is not None:
+            length = node[1]
+            if length and (addr ^ node[0]) >> (width - length):
+                break
+            if node[2] is not None:
+                best = node[2]
+            if length == width:
+                break
+            node = node[3 + ((addr >> (width - 1 - length)) & 1)]
+        return best
+
+
+class _IntelIndex:
+    """一次加载的全部指标；构建完成后只读，可被多个采集线程同时查询。"""
+
+    def __init__(self) -> None:
+        self.addrs: Dict[str, _Indicator] = {}
+        self.domains: Dict[str, _Indicator] = {}
+        self.subnets = {4: _PrefixTrie(32), 6: _PrefixTrie(128)}
+        self.match_addr = lru_cache(maxsize=_LOOKUP_CACHE)(self._match_addr)
+
+    def freeze(self) -> None:
+        """加载完成后调用：为非空的前缀树建跳转表。"""
+        for trie in self.subnets.values():
+            if trie.size:
+                trie.freeze()
+
+    def __len__(self) -> int:
+        return len(self.addrs) + len(self.domains) + self.subnet_count
+
+    @property
+    def subnet_count(self) -> int:
+        return self.subnets[4].size + self.subnets[6].size
+
+    def add(self, indicator: str, kind: Optional[str], source: Optional[str]) -> bool:
+        """加入一条指标，kind 为 None 时按内容识别；无法识别或不支持的类型返回 False。"""
+        text = indicator.strip()
+        if kind in (None, INTEL_ADDR, INTEL_SUBNET) and text:
+            try:
+                net = ipaddress.ip_network(text, strict=False)
+            except ValueError:
+                if kind is not None:
+                    return False
+            else:
+                if net.prefixlen == net.max_prefixlen:
+                    self.addrs.setdefault(str(net.network_address), (text, INTEL_ADDR, source))
+                else:
+                    self.subnets[net.version].insert(
+                        int(net.network_address), net.prefixlen, (text, INTEL_SUBNET, source)
+                    )
+                return True
+        if kind in (None, INTEL_DOMAIN):
+            domain = text.rstrip(".").lower()
+            if domain and " " not in domain and "/" not in domain:
+                self.domains.setdefault(domain, (text, INTEL_DOMAIN, source))
+                return True
+        return False
+
+    def _match_addr(self, addr: str) -> Optional[_Indicator]:
+        hit = self.addrs.get(addr)
+        if hit is not None or not self.subnet_count:
+            return hit
+        # inet_pton 比 ipaddress.ip_address 快一个数量级
+        version, family = (6, socket.AF_INET6) if ":" in addr else (4, socket.AF_INET)
+        try:
+            packed = socket.inet_pton(family, addr)
+        except OSError:
+            return None
+        return self.subnets[version].lookup(int.from_bytes(packed, "big"))
+
+    def match_domain(self, host: Optional[str]) -> Optional[_Indicator]:
+        if not host or not self.domains:
+            return None
+        # Host 头可能带端口；IPv6 字面量（[::1]:8080）不是域名
+        if host[0] == "[":
+            return None
+        return self.domains.get(host.partition(":")[0].rstrip(".").lower())
+
+
+def _load_file(index: _IntelIndex, path: Path) -> Tuple[int, int]:
+    """把一个情报文件读入 index，返回 (加载条数, 跳过条数)。"""
+    loaded = skipped = 0
+    columns: Optional[List[str]] = None
+    with path.open("r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            if line.startswith("#"):
+                if line.startswith("#fields"):
+                    columns = line.split("\t")[1:]
+                continue
+            if columns is not None:
+                row = dict(zip(columns, line.split("\t")))
+                indicator = row.get("indicator") or ""
+                kind: Optional[str] = row.get("indicator_type") or None
+                source = row.get("meta.desc") or row.get("meta.source")
+                if source in ("-", ""):
+                    source = None
+            else:
+                indicator, kind, source = line.split("#", 1)[0].strip(), None, None
+                if not indicator:
+                    continue
+            if index.add(indicator, kind, source or path.name):
+                loaded += 1
+            else:
+                skipped += 1
+    return loaded, skipped
+
+
+def _event(
+    ts: float, hit: _Indicator, src: str, dst: str, uid: str, proto: Optional[str], seen: str
+) -> ThreatEvent:
+    indicator, kind, source = hit
+    msg = f"{seen} 命中情报 {indicator}"
+    if source:
+        msg += f"（{source}）"
+    return ThreatEvent(
+        ts=datetime.fromtimestamp(ts, tz=timezone.utc),
+        note=indicator,
+        msg=msg,
+        src=src,
+        dst=dst,
+        uid=uid,
+        proto=proto,
+        level=kind,
+        source="intel",
+    )
+
+
+class IntelStore:
+    """
+    情报指标库：reload() 在后台线程中从 intel_dir 重新加载，match_* 供采集流水线调用。
+
+    查询只读取当前索引的引用，替换索引是一次赋值；加载期间仍按旧索引匹配。
+    """
+
+    def __init__(self, intel_dir: Path) -> None:
+        self.intel_dir = intel_dir
+        self._index = _IntelIndex()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = IntelStats()
+        self._matches = 0
+
+    @property
+    def loading(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self) -> IntelStats:
+        with self._lock:
+            stats = self._stats.model_copy(deep=True)
+            stats.loading = self.loading
+            stats.matches = self._matches
+        return stats
+
+    def reload(self) -> IntelStats:
+        """在后台重新加载情报文件；已在加载时不重复启动。"""
+        with self._lock:
+            if not self.loading:
+                self._thread = threading.Thread(
+                    target=self._load, name="intel-loader", daemon=True
+                )
+                self._thread.start()
+        return self.stats()
+
+    def _load(self) -> None:
+        started = time.monotonic()
+        index = _IntelIndex()
+        files: List[str] = []
+        errors: List[str] = []
+        skipped = 0
+        paths = (
+            sorted(p for p in self.intel_dir.rglob("*") if p.is_file() and not p.name.startswith("."))
+            if self.intel_dir.is_dir()
+            else []
+        )
+        for path in paths:
+            try:
+                _, bad = _load_file(index, path)
+            except OSError as e:
+                errors.append(f"{path}: {e}")
+                continue
+            files.append(str(path))
+            skipped += bad
+        index.freeze()
+        self._index = index
+        with self._lock:
+            self._stats.files = files
+            self._stats.addrs = len(index.addrs)
+            self._stats.subnets = index.subnet_count
+            self._stats.domains = len(index.domains)
+            self._stats.skipped = skipped
+            self._stats.errors = errors
+            self._stats.loaded_at = datetime.now(timezone.utc)
+            self._stats.load_seconds = round(time.monotonic() - started, 3)
+
+    def match_flows(self, batch: FlowBatch) -> List[ThreatEvent]:
+        """按 orig_h / resp_h 匹配 IP 与网段，每条命中的记录与指标生成一条告警。"""
+        index = self._index
+        if not index.addrs and not index.subnet_count:
+            return []
+        match = index.match_addr
+        out: List[ThreatEvent] = []
+        orig_h, resp_h = batch.orig_h, batch.resp_h
+        for i, (src, dst) in enumerate(zip(orig_h, resp_h)):
+            hit_src = match(src)
+            hit_dst = match(dst)
+            if hit_src is None and hit_dst is None:
+                continue
+            for hit, seen in ((hit_src, src), (hit_dst, dst)):
+                if hit is not None:
+                    out.append(
+                        _event(batch.ts[i], hit, src, dst, batch.uid[i], batch.proto[i], seen)
+                    )
+        self._count(len(out))
+        return out
+
+    def match_http(self, flows: Iterable[HttpFlow]) -> List[ThreatEvent]:
+        """按 Host 匹配域名。"""
+        index = self._index
+        if not index.domains:
+            return []
+        out: List[ThreatEvent] = []
+        for f in flows:
+            hit = index.match_domain(f.host)
+            if hit is not None:
+                out.append(
+                    _event(f.ts.timestamp(), hit, f.orig_h, f.resp_h, f.uid, "tcp", f.host or "")
+                )
+        self._count(len(out))
+        return out
+
+    def _count(self, n: int) -> None:
+        if n:
+            with self._lock:
+                self._matches += n
+
+
+intel_store = IntelStore(settings.intel_dir)
@@ -1,10 +1,16 @@
 from __future__ import annotations
 
-from datetime import datetime
-from typing import Optional
+import math
+from array import array
+from datetime import datetime, timezone
+from typing import Iterator, List, NamedTuple, Optional, Sequence, Union
 
 from pydantic import BaseModel, Field
 
+# array("q") 可表示的范围
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
 
 class Flow(BaseModel):
     """普通网络流量（基于 Zeek conn.log）"""
@@ -23,6 +29,212 @@ class Flow(BaseModel):
     conn_state: Optional[str] = None
 
 
+class FlowBatch:
+    """
+    按列存放的一批 Flow，用于解析 → 存储 → 持久化之间的整批传递（不是 API 模型）。
+
+    - ts / 端口 / duration / 字节数为 array 列，缺失值约定与存储一致：
+      duration 为 NaN，字节数为 -1；
+    - 字符串列为 list，service / conn_state 缺失为 None；
+    - 各列长度相同，第 i 行即第 i 条记录。
+    """
+
+    __slots__ = (
+        "ts",
+        "uid",
+        "orig_h",
+        "orig_p",
+        "resp_h",
+        "resp_p",
+        "proto",
+        "service",
+        "duration",
+        "orig_bytes",
+        "resp_bytes",
+        "conn_state",
+    )
+
+    def __init__(self) -> None:
+        self.ts = array("d")
+        self.uid: List[str] = []
+        self.orig_h: List[str] = []
+        self.orig_p = array("H")
+        self.resp_h: List[str] = []
+        self.resp_p = array("H")
+        self.proto: List[str] = []
+        self.service: List[Optional[str]] = []
+        self.duration = array("d")
+        self.orig_bytes = array("q")
+        self.resp_bytes = array("q")
+        self.conn_state: List[Optional[str]] = []
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def append(
+        self,
+        ts: float,
+        uid: str,
+        orig_h: str,
+        orig_p: int,
+        resp_h: str,
+        resp_p: int,
+        proto: str,
+        service: Optional[str],
+        duration: Optional[float],
+        orig_bytes: Optional[int],
+        resp_bytes: Optional[int],
+        conn_state: Optional[str],
+    ) -> None:
+        """
+        逐行追加（非批量路径使用）。端口超出 0~65535 时按缺失（0）处理，
+        字节数超出 int64 范围时按缺失（-1）处理，与按列解析一致。
+        """
+        if not 0 <= orig_p <= 0xFFFF:
+            orig_p = 0
+        if not 0 <= resp_p <= 0xFFFF:
+            resp_p = 0
+        if orig_bytes is None or not _INT64_MIN <= orig_bytes <= _INT64_MAX:
+            orig_bytes = -1
+        if resp_bytes is None or not _INT64_MIN <= resp_bytes <= _INT64_MAX:
+            resp_bytes = -1
+        self.ts.append(ts)
+        self.uid.append(uid)
+        self.orig_h.append(orig_h)
+        self.orig_p.append(orig_p)
+        self.resp_h.append(resp_h)
+        self.resp_p.append(resp_p)
+        self.proto.append(proto)
+        self.service.append(service)
+        self.duration.append(math.nan if duration is None else duration)
+        self.orig_bytes.append(orig_bytes)
+        self.resp_bytes.append(resp_bytes)
+        self.conn_state.append(conn_state)
+
+    def extend(self, other: "FlowBatch") -> None:
+        """按列拼接另一批（离线导入时把整个归档合并为一批写入）。"""
+        for name in self.__slots__:
+            getattr(self, name).extend(getattr(other, name))
+
+    def take(self, rows: Sequence[int]) -> "FlowBatch":
+        """按行号取出若干行组成新的一批（多 worker 合并时按 ts 重排使用）。"""
+        batch = FlowBatch()
+        for name in self.__slots__:
+            column = getattr(self, name)
+            picked = [column[i] for i in rows]
+            if isinstance(column, array):
+                setattr(batch, name, array(column.typecode, picked))
+            else:
+                setattr(batch, name, picked)
+        return batch
+
+    @classmethod
+    def from_flows(cls, flows: Sequence[Flow]) -> "FlowBatch":
+        batch = cls()
+        for f in flows:
+            batch.append(
+                f.ts.timestamp(),
+                f.uid,
+                f.orig_h,
+                f.orig_p,
+                f.resp_h,
+                f.resp_p,
+                f.proto,
+                f.service,
+                f.duration,
+                f.orig_bytes,
+                f.resp_bytes,
+                f.conn_state,
+            )
+        return batch
+
+    def rows(self) -> Iterator[tuple]:
+        """逐行返回 (ts, uid, orig_h, orig_p, resp_h, resp_p, proto, service,
+        duration, orig_bytes, resp_bytes, conn_state)，缺失值为 None。"""
+        for ts, uid, orig_h, orig_p, resp_h, resp_p, proto, service, dur, ob, rb, state in zip(
+            self.ts,
+            self.uid,
+            self.orig_h,
+            self.orig_p,
+            self.resp_h,
+            self.resp_p,
+            self.proto,
+            self.service,
+            self.duration,
+            self.orig_bytes,
+            self.resp_bytes,
+            self.conn_state,
+        ):
+            yield (
+                ts,
+                uid,
+                orig_h,
+                orig_p,
+                resp_h,
+                resp_p,
+                proto,
+                service,
+                None if dur != dur else dur,
+                None if ob < 0 else ob,
+                None if rb < 0 else rb,
+                state,
+            )
+
+    def flows(self) -> List[Flow]:
+        return [
+            Flow(
+                ts=datetime.fromtimestamp(ts, tz=timezone.utc),
+                uid=uid,
+                orig_h=orig_h,
+                orig_p=orig_p,
+                resp_h=resp_h,
+                resp_p=resp_p,
+                proto=proto,
+                service=service,
+                duration=duration,
+                orig_bytes=orig_bytes,
+                resp_bytes=resp_bytes,
+                conn_state=conn_state,
+            )
+            for (
+                ts,
+                uid,
+                orig_h,
+                orig_p,
+                resp_h,
+                resp_p,
+                proto,
+                service,
+                duration,
+                orig_bytes,
+                resp_bytes,
+                conn_state,
+            ) in self.rows()
+        ]
+
+
+class HttpFlow(BaseModel):
+    """HTTP 请求/响应（基于 Zeek http.log，每个请求一条）"""
+
+    ts: datetime = Field(..., description="时间戳")
+    uid: str
+    orig_h: str
+    orig_p: int
+    resp_h: str
+    resp_p: int
+    trans_depth: Optional[int] = Field(None, description="同一连接中的请求序号")
+    method: Optional[str] = None
+    host: Optional[str] = None
+    uri: Optional[str] = None
+    referrer: Optional[str] = None
+    user_agent: Optional[str] = None
+    status_code: Optional[int] = None
+    status_msg: Optional[str] = None
+    request_body_len: Optional[int] = None
+    response_body_len: Optional[int] = None
+    resp_mime_types: Optional[str] = Field(None, description="响应 MIME 类型，多个以逗号分隔")
+
+
 class ThreatEvent(BaseModel):
     """威胁/告警事件（基于 Zeek notice.log / intel.log / weird.log 等）"""
 
@@ -43,6 +255,45 @@ class ThreatEvent(BaseModel):
     )
 
 
+class FlowFilter(NamedTuple):
+    """流量明细的等值过滤条件（不是 API 模型）；为 None 的条件不过滤，port 匹配 orig_p 或 resp_p。"""
+
+    orig_h: Optional[str] = None
+    resp_h: Optional[str] = None
+    port: Optional[int] = None
+    proto: Optional[str] = None
+    service: Optional[str] = None
+    uid: Optional[str] = None
+    conn_state: Optional[str] = None
+
+
+class ThreatFilter(NamedTuple):
+    """告警明细的等值过滤条件（不是 API 模型）；为 None 的条件不过滤。"""
+
+    src: Optional[str] = None
+    dst: Optional[str] = None
+    uid: Optional[str] = None
+    proto: Optional[str] = None
+    source: Optional[str] = None
+
+
+class ConnectionRecords(BaseModel):
+    """同一连接（uid）关联的 conn / http / 告警记录"""
+
+    uid: str
+    flows: list[Flow] = Field(default_factory=list)
+    http: list[HttpFlow] = Field(default_factory=list)
+    threats: list[ThreatEvent] = Field(default_factory=list)
+
+
+class TopItem(BaseModel):
+    """Top-N 统计中的一项（/api/flows/top）"""
+
+    key: Union[str, int] = Field(..., description="IP 或端口号")
+    value: int = Field(..., description="估计值（流量条数或字节数），不低于真实值")
+    error: int = Field(..., description="最大高估量，真实值不低于 value - error")
+
+
 class FlowAggregateBucket(BaseModel):
     """普通流量聚合桶"""
 
@@ -51,6 +302,10 @@ class FlowAggregateBucket(BaseModel):
     flow_count: int = Field(..., description="该时间桶内的流量条数")
     orig_bytes_sum: int = Field(..., description="orig_bytes 总和（缺失按 0 处理）")
     resp_bytes_sum: int = Field(..., description="resp_bytes 总和（缺失按 0 处理）")
+    # 基数为 HyperLogLog 估计值；bucket_seconds 不是 60 的整数倍时为 None
+    distinct_orig_h: Optional[int] = Field(None, description="不同源 IP 数（估计）")
+    distinct_resp_h: Optional[int] = Field(None, description="不同目的 IP 数（估计）")
+    distinct_resp_p: Optional[int] = Field(None, description="不同目的端口数（估计）")
 
 
 class ThreatAggregateBucket(BaseModel):
@@ -67,11 +322,94 @@ class ThreatAggregateBucket(BaseModel):
     )
 
 
+class IngestChannelStats(BaseModel):
+    """单个日志采集通道的运行统计"""
+
+    name: str = Field(..., description="日志文件名，例如 conn.log")
+    queue_depth: int = Field(..., description="当前排队中的批次数")
+    queue_capacity: int = Field(..., description="队列容量（批次数）")
+    overflow_policy: str = Field(..., description="队列满时的策略：block/drop_oldest/drop_newest")
+    parser_workers: int = Field(..., description="解析 worker 数量")
+    lines_read: int = Field(..., description="累计读取的行数")
+    records_ingested: int = Field(..., description="累计入库的记录数")
+    batches_dropped: int = Field(..., description="因队列溢出丢弃的批次数")
+    lines_dropped: int = Field(..., description="因队列溢出丢弃的行数")
+
+
+class ImportStats(BaseModel):
+    """离线归档导入的进度与吞吐统计"""
+
+    running: bool = Field(False, description="是否正在导入")
+    files_total: int = Field(0, description="待导入的归档文件数")
+    files_done: int = Field(0, description="已完成的归档文件数")
+    files_skipped: int = Field(0, description="不支持的日志类型或读取失败而跳过的文件数")
+    lines: int = Field(0, description="已读取的行数（含头部行）")
+    records: int = Field(0, description="已写入存储的记录数")
+    bytes_read: int = Field(0, description="已读取的文件字节数（压缩后）")
+    bytes_decoded: int = Field(0, description="解压后的文本字节数")
+    elapsed_seconds: float = Field(0.0, description="已耗时（秒）")
+    lines_per_sec: float = Field(0.0, description="平均每秒处理行数")
+    mb_per_sec: float = Field(0.0, description="平均每秒处理的解压后数据量（MB）")
+    errors: list[str] = Field(default_factory=list, description="读取失败的文件及原因")
+
+
+class ReplayStats(BaseModel):
+    """离线 pcap 回放（zeek -r）的进度与吞吐统计"""
+
+    running: bool = Field(False, description="是否正在回放")
+    pcaps: list[str] = Field(default_factory=list, description="回放的 pcap 文件")
+    jobs: int = Field(0, description="并行的 Zeek 进程数")
+    shards: int = Field(0, description="切分后交给 Zeek 的分片（文件）数")
+    shards_done: int = Field(0, description="已完成分析的分片数")
+    pcap_bytes: int = Field(0, description="pcap 总字节数")
+    output_dir: str = Field("", description="本次回放的日志输出目录")
+    split_seconds: float = Field(0.0, description="按流切分耗时（秒）")
+    zeek_seconds: float = Field(0.0, description="Zeek 分析耗时（秒）")
+    elapsed_seconds: float = Field(0.0, description="总耗时（秒），含日志导入")
+    mb_per_sec: float = Field(0.0, description="切分 + 分析阶段的 pcap 吞吐（MB/秒）")
+    ingest: Optional[ImportStats] = Field(None, description="输出日志导入存储的统计")
+    errors: list[str] = Field(default_factory=list, description="失败的分片及原因")
+
+
+class IntelStats(BaseModel):
+    """情报指标库（见 intel）的加载状态与命中计数"""
+
+    loading: bool = Field(False, description="是否正在后台加载")
+    files: list[str] = Field(default_factory=list, description="已加载的情报文件")
+    addrs: int = Field(0, description="单个 IP 指标数")
+    subnets: int = Field(0, description="网段（CIDR）指标数")
+    domains: int = Field(0, description="域名指标数")
+    skipped: int = Field(0, description="无法识别或不支持的类型而跳过的行数")
+    loaded_at: Optional[datetime] = Field(None, description="最近一次加载完成的时间")
+    load_seconds: float = Field(0.0, description="最近一次加载耗时（秒）")
+    matches: int = Field(0, description="启动以来产生的命中告警数")
+    errors: list[str] = Field(default_factory=list, description="读取失败的文件及原因")
+
+
+class ZeekWorkerStatus(BaseModel):
+    """单个 Zeek 抓包进程的运行状态"""
+
+    index: int = Field(..., description="worker 序号（从 1 开始）")
+    pid: Optional[int] = Field(None, description="进程 PID（未运行时为空）")
+    running: bool = Field(..., description="是否正在运行")
+    restarts: int = Field(0, description="意外退出后被自动重启的次数")
+    last_exit_code: Optional[int] = Field(None, description="最近一次退出码")
+    uptime_seconds: float = Field(0.0, description="本次启动以来的运行时间（秒）")
+    logs_dir: str = Field(..., description="该进程的日志目录")
+
+
 class ZeekStatus(BaseModel):
     running: bool
     pid: Optional[int] = None
     zeek_bin: str
     logs_dir: str
     iface: str
+    ingest: list[IngestChannelStats] = Field(
+        default_factory=list, description="日志采集流水线各通道统计"
+    )
+    replay: Optional[ReplayStats] = Field(None, description="最近一次 pcap 回放的统计")
+    workers: list[ZeekWorkerStatus] = Field(
+        default_factory=list, description="各 Zeek 抓包进程的状态"
+    )
 
 
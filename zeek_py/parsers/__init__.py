@@ -2,7 +2,12 @@
 Zeek 日志解析模块。
 
 - conn_parser: 解析 conn.log 为 Flow
-- threat_parser: 解析 notice.log / intel.log 为 ThreatEvent
+- http_parser: 解析 http.log 为 HttpFlow
+- threat_parser: 解析 notice.log / intel.log / weird.log 为 ThreatEvent
+- schema / reader: 每个日志文件一个 LogReader，维护该文件的头部（LogSchema）
+
+两种日志格式均支持：默认 ASCII（TSV，parse_*_lines）与 JSON（parse_*_json），
+采集流水线按文件头自动识别。
 """
 
 
@@ -0,0 +1,62 @@
+"""
+Zeek JSON 日志（policy/tuning/json-logs）的解码工具。
+
+优先使用 orjson（C 实现，比标准库快数倍），未安装时退化为标准库 json。
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterator, List, Optional, Sequence
+
+try:
+    import orjson
+
+    loads: Callable[[str], Any] = orjson.loads
+    JSONDecodeError: type[Exception] = orjson.JSONDecodeError
+except ImportError:  # pragma: no cover - 取决于运行环境
+    loads = json.loads
+    JSONDecodeError = json.JSONDecodeError
+
+
+def iter_objects(lines: Sequence[str]) -> Iterator[dict[str, Any]]:
+    """逐行解码 JSON 对象，跳过空行、# 注释行与损坏的行。"""
+    for line in lines:
+        if not line or line[0] != "{":
+            continue
+        try:
+            obj = loads(line)
+        except JSONDecodeError:
+            continue
+        if type(obj) is dict:
+            yield obj
+
+
+def loads_numbers(values: Sequence[str]) -> Optional[List[Any]]:
+    """
+    把一列数字字符串整体作为 JSON 数组解码（比逐个 int()/float() 快）。
+
+    含有非 JSON 数字的值（"-"、"nan"、前导 0 等）时解码失败或长度不符，返回 None，
+    由调用方退回逐个转换。
+    """
+    try:
+        nums = loads("[" + ",".join(values) + "]")
+    except JSONDecodeError:
+        return None
+    if type(nums) is not list or len(nums) != len(values):
+        return None
+    return nums
+
+
+def parse_ts(value: Any) -> Optional[datetime]:
+    """
+    解析 JSON 日志中的 ts：默认是 epoch 秒（数字），
+    若配置了 JSON::TS_ISO8601 则为 ISO 8601 字符串。
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    return datetime.fromtimestamp(value, tz=timezone.utc)
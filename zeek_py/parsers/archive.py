@@ -0,0 +1,114 @@
+"""
+离线导入时在 worker 进程中执行的部分：流式读取并解析单个日志文件。
+
+只依赖 parsers 与 models，进程池 worker 导入本模块时不会创建 storage / 持久化后端。
+解析结果按段（约 chunk_records 条）经有界队列交给主进程，单个归档再大也不会整体驻留内存。
+"""
+
+from __future__ import annotations
+
+import gzip
+from pathlib import Path
+from typing import Any, Iterator, NamedTuple, Optional
+
+from ..models import FlowBatch
+from .reader import LogReader
+
+# 支持导入的日志类型（与实时采集一致）
+IMPORT_LOGS = ("conn", "http", "notice", "intel", "weird")
+
+# 每次从归档中读取的字节数（解压后）
+_READ_SIZE = 4 * 1024 * 1024
+# 每段结果的记录数上限（按解析批次累积，实际可能多出一个批次）
+CHUNK_RECORDS = 100_000
+
+
+class ArchiveResult(NamedTuple):
+    """单个归档的一段解析结果（在 worker 进程中产生，pickle 后传回主进程）。"""
+
+    path: str
+    log: str
+    records: Any  # conn 为 FlowBatch，http 为 HttpFlow 列表，其余为 ThreatEvent 列表
+    lines: int  # 以下三项为本段的增量
+    bytes_read: int
+    bytes_decoded: int
+
+
+def log_type(path: Path) -> Optional[str]:
+    """按文件名识别日志类型：conn.log / conn.2024-01-01-00:00:00.log.gz -> conn。"""
+    name = path.name
+    if not (name.endswith(".log") or name.endswith(".log.gz")):
+        return None
+    key = name.split(".", 1)[0]
+    return key if key in IMPORT_LOGS else None
+
+
+def iter_archive(
+    path: str, batch_bytes: int = 4 * 1024 * 1024, chunk_records: int = CHUNK_RECORDS
+) -> Iterator[ArchiveResult]:
+    """
+    流式读取并解析一个日志文件（.gz 边读边解压），每累积约 chunk_records 条记录产出一段。
+
+    按块读取后在最后一个换行处切开，不完整的行留到下一块；
+    bytes_read 为该段读取的文件字节数（压缩后），用于导入进度。
+    """
+    p = Path(path)
+    log = log_type(p)
+    if log is None:
+        raise ValueError(f"不支持的日志类型: {p.name}")
+    reader = LogReader.for_log(log)
+
+    def empty() -> Any:
+        return FlowBatch() if log == "conn" else []
+
+    records = empty()
+    lines = decoded = reported = 0
+    rest = b""
+    with p.open("rb") as raw:
+        f = gzip.GzipFile(fileobj=raw) if p.suffix == ".gz" else raw
+        while True:
+            block = f.read(_READ_SIZE)
+            if block:
+                data = rest + block
+                cut = data.rfind(b"\n") + 1
+                data, rest = data[:cut], data[cut:]
+            else:
+                # 文件末尾可能缺少最后的换行
+                data, rest = (rest + b"\n" if rest else b""), b""
+            if data:
+                lines += data.count(b"\n")
+                decoded += len(data)
+                text = data.decode("utf-8", errors="ignore")
+                for schema, chunk in reader.split(text, batch_bytes):
+                    func, args = reader.task(schema, chunk)
+                    records.extend(func(*args))
+                    if len(records) >= chunk_records:
+                        pos = raw.tell()
+                        yield ArchiveResult(path, log, records, lines, pos - reported, decoded)
+                        records, lines, decoded, reported = empty(), 0, 0, pos
+            if not block:
+                break
+        pos = raw.tell()
+    if len(records) or lines or pos > reported:
+        yield ArchiveResult(path, log, records, lines, pos - reported, decoded)
+
+
+def parse_archive(
+    path: str,
+    out: Any,
+    batch_bytes: int = 4 * 1024 * 1024,
+    chunk_records: int = CHUNK_RECORDS,
+) -> int:
+    """
+    进程池 worker 入口：把 iter_archive 的各段依次放入 out（有界队列），返回段数。
+
+    主进程消费慢时 put 阻塞，worker 随之暂停解析；结束（包括出错）时放入 None。
+    """
+    chunks = 0
+    try:
+        for result in iter_archive(path, batch_bytes, chunk_records):
+            out.put(result)
+            chunks += 1
+    finally:
+        out.put(None)
+    return chunks
@@ -1,9 +1,22 @@
 from __future__ import annotations
 
+import math
+from array import array
 from datetime import datetime, timezone
-from typing import Optional
+from functools import lru_cache
+from itertools import repeat
+from typing import Any, List, NamedTuple, Optional, Sequence, Union
 
-from ..models import Flow
+from ..models import Flow, FlowBatch
+from ._json import iter_objects, loads_numbers
+from .schema import (
+    DEFAULT_EMPTY_FIELD,
+    LineSchema,
+    LogSchema,
+    SchemaLike,
+    as_schema,
+    column_index,
+)
 
 
 def _parse_ts(value: str) -> datetime:
@@ -31,43 +44,246 @@ def _to_float(value: str) -> Optional[float]:
         return None
 
 
-# 当前 conn.log 的字段名顺序（在 #fields 行中定义）。
-_CONN_FIELDS: list[str] | None = None
-
+def parse_conn_lines(lines: Sequence[str], schema: SchemaLike) -> List[Flow]:
+    """
+    逐行解析 conn.log 数据行（不含 # 头部行），跳过字段数不符或无法解析的行。
 
-def parse_conn_line(line: str) -> Optional[Flow]:
+    schema 由 LogReader 根据文件头部给出（也可直接传入 #fields 字段列表），
+    不读写模块全局状态，可以在多个线程/进程中并行调用。
     """
-    解析 Zeek 默认 ASCII 格式的 conn.log 单行。
+    schema = as_schema(schema)
+    fields = schema.fields
+    sep = schema.separator
+    # 非默认的缺失值标记统一换成默认标记，复用 _flow_from_data 的判断
+    markers = None
+    if not schema.default_markers:
+        markers = {schema.unset_field: "-", schema.empty_field: "(empty)"}
+    flows: List[Flow] = []
+    n = len(fields)
+    for line in lines:
+        values = line.rstrip("\n").split(sep)
+        if len(values) != n:
+            continue
+        if markers:
+            values = list(map(markers.get, values, values))
+        flow = _flow_from_data(dict(zip(fields, values)))
+        if flow:
+            flows.append(flow)
+    return flows
+
 
-    支持带有如下头部的标准 Zeek 日志格式：
-    - `#fields ts uid id.orig_h id.orig_p id.resp_h id.resp_p proto service duration orig_bytes resp_bytes conn_state ...`
+_LINE_SCHEMA = LineSchema()
+
+
+def parse_conn_line(line: str, schema: Optional[SchemaLike] = None) -> Optional[Flow]:
     """
-    global _CONN_FIELDS
+    解析 conn.log 的单行（兼容旧接口，批量解析请用 parse_conn_lines / LogReader）。
 
+    未给出 schema 时沿用旧行为：#fields 头部行记入模块级状态，之后的数据行按其解析。
+    """
     line = line.rstrip("\n")
-    if not line:
-        return None
+    if schema is None:
+        schema = _LINE_SCHEMA.feed(line)
+        if schema is None:
+            return None
+    flows = parse_conn_lines([line], schema)
+    return flows[0] if flows else None
 
-    # 处理头部行（以 # 开头）
-    if line.startswith("#"):
-        parts = line.split()
-        if len(parts) >= 2 and parts[0] == "#fields":
-            # 记录字段名顺序，后续数据行按此映射
-            _CONN_FIELDS = parts[1:]
-        return None
 
-    # 没有字段定义，无法解析
-    if not _CONN_FIELDS:
-        return None
+class _ConnPlan(NamedTuple):
+    """按 schema 预先编译的整列转换参数：列下标与缺失值替换表。"""
+
+    index: dict[str, int]
+    float_missing: dict[str, str]
+    int_missing: dict[str, str]
+    port_missing: dict[str, str]
+    str_missing: dict[str, Optional[str]]
+
+
+@lru_cache(maxsize=64)
+def _conn_plan(schema: LogSchema) -> _ConnPlan:
+    # dict.get(v, v) 在 C 层完成缺失值替换，不需要逐个判断
+    sentinels = ("", schema.unset_field, schema.empty_field, "N/A", "nan")
+    str_missing: dict[str, Optional[str]] = dict.fromkeys(("", schema.unset_field), None)
+    if schema.empty_field != DEFAULT_EMPTY_FIELD:
+        # 与逐行解析一致：自定义的空集合标记统一为默认的 "(empty)"
+        str_missing[schema.empty_field] = DEFAULT_EMPTY_FIELD
+    return _ConnPlan(
+        index=column_index(schema),
+        float_missing=dict.fromkeys(sentinels, "nan"),
+        int_missing=dict.fromkeys(sentinels, "-1"),
+        port_missing=dict.fromkeys(sentinels, "0"),
+        str_missing=str_missing,
+    )
+
+
+def parse_conn_chunk(data: Union[bytes, str], schema: SchemaLike) -> FlowBatch:
+    """
+    按列批量解析一段 conn.log 数据（若干完整的数据行，不含 # 头部行）。
+
+    - 整段只做一次 split，按 schema 预先算好的列下标切片取出各列；
+    - ts / 端口 / 字节数 / duration 通过 map + array 整列转换，缺失值查表替换；
+    - 结果为 FlowBatch，直接交给 storage.add_flow_batch 按列写入。
+
+    存在字段数不符或无法转换的行时，退回逐行解析（跳过坏行，语义与 parse_conn_lines 一致）。
+    """
+    schema = as_schema(schema)
+    text = data.decode("utf-8", errors="ignore") if isinstance(data, bytes) else data
+    if not text:
+        return FlowBatch()
+    if not text.endswith("\n"):
+        text += "\n"
+
+    plan = _conn_plan(schema)
+    sep = schema.separator
+    n = len(schema.fields)
+    lines = text.split("\n")
+    lines.pop()  # 末尾换行产生的空串
+    rows = len(lines)
+    # 逐行核对分隔符个数：只比较总数时，多一个字段的行与少一个字段的行会互相抵消，
+    # 之后各列整体错位
+    if list(map(str.count, lines, repeat(sep, rows))).count(n - 1) != rows:
+        return FlowBatch.from_flows(parse_conn_lines(lines, schema))
+    cells = text.replace("\n", sep).split(sep)
+    cells.pop()
+
+    index = plan.index
 
-    # 数据行按制表符分割
-    values = line.split("\t")
-    if len(values) != len(_CONN_FIELDS):
-        # 字段数不匹配，跳过
+    def column(name: str, default: Any) -> list:
+        i = index.get(name)
+        return [default] * rows if i is None else cells[i::n]
+
+    ts = _number_column("d", column("ts", "-"))
+    if ts is None:
+        try:
+            ts = array("d", map(float, column("ts", "-")))
+        except ValueError:
+            ts = None
+        if ts is None or any(map(math.isnan, ts)):
+            # ts 缺失或非法的行需要整行跳过
+            return FlowBatch.from_flows(parse_conn_lines(text.splitlines(), schema))
+
+    str_missing = plan.str_missing
+    batch = FlowBatch()
+    batch.ts = ts
+    batch.uid = column("uid", "")
+    batch.orig_h = column("id.orig_h", "")
+    batch.resp_h = column("id.resp_h", "")
+    batch.proto = column("proto", "")
+    service = column("service", None)
+    batch.service = list(map(str_missing.get, service, service))
+    conn_state = column("conn_state", None)
+    batch.conn_state = list(map(str_missing.get, conn_state, conn_state))
+    batch.orig_p = _int_column("H", column("id.orig_p", "0"), plan.port_missing, 0)
+    batch.resp_p = _int_column("H", column("id.resp_p", "0"), plan.port_missing, 0)
+    batch.orig_bytes = _int_column("q", column("orig_bytes", "-"), plan.int_missing, -1)
+    batch.resp_bytes = _int_column("q", column("resp_bytes", "-"), plan.int_missing, -1)
+    duration = column("duration", "-")
+    float_missing = plan.float_missing
+    try:
+        batch.duration = array("d", map(float, map(float_missing.get, duration, duration)))
+    except ValueError:
+        batch.duration = array(
+            "d", [math.nan if v is None else v for v in map(_to_float, duration)]
+        )
+    return batch
+
+
+def _number_column(typecode: str, values: list) -> Optional[array]:
+    """整列按 JSON 数组解码为 array；有非法值时返回 None。"""
+    nums = loads_numbers(values)
+    if nums is None:
         return None
+    try:
+        return array(typecode, nums)
+    except (TypeError, OverflowError):
+        return None
+
+
+def _int_column(typecode: str, values: list, missing: dict, default: int) -> array:
+    # 先按无缺失值直接解码（端口列基本不会缺失），失败再替换缺失标记后重试
+    converted = _number_column(typecode, values)
+    if converted is None:
+        converted = _number_column(typecode, list(map(missing.get, values, values)))
+    if converted is not None:
+        return converted
+    # 个别非法值：逐个转换，非法或越界的按缺失处理
+    out = array(typecode)
+    for v in map(_to_int, values):
+        try:
+            out.append(default if v is None else v)
+        except OverflowError:
+            out.append(default)
+    return out
+
+
+def parse_conn_json(lines: Sequence[str]) -> FlowBatch:
+    """
+    批量解析 JSON 格式（policy/tuning/json-logs）的 conn.log 行。
+
+    JSON 中缺失字段直接省略、数值已是原生类型，因此不需要 "-" 等占位符判断，
+    也不需要 dict(zip(...)) 映射字段：逐列取值后整列转换为 FlowBatch。
+    出现类型不符的记录时退回逐条校验（跳过非法记录）。
+    """
+    objs = [obj for obj in iter_objects(lines) if obj.get("ts") is not None]
+    batch = FlowBatch()
+    if not objs:
+        return batch
+    try:
+        batch.ts = array("d", [obj["ts"] for obj in objs])
+        batch.orig_p = array("H", [obj.get("id.orig_p") or 0 for obj in objs])
+        batch.resp_p = array("H", [obj.get("id.resp_p") or 0 for obj in objs])
+        batch.duration = array(
+            "d", [math.nan if v is None else v for v in (obj.get("duration") for obj in objs)]
+        )
+        batch.orig_bytes = array(
+            "q", [-1 if v is None else v for v in (obj.get("orig_bytes") for obj in objs)]
+        )
+        batch.resp_bytes = array(
+            "q", [-1 if v is None else v for v in (obj.get("resp_bytes") for obj in objs)]
+        )
+        batch.uid = [str(obj.get("uid", "")) for obj in objs]
+        batch.orig_h = [str(obj.get("id.orig_h", "")) for obj in objs]
+        batch.resp_h = [str(obj.get("id.resp_h", "")) for obj in objs]
+        batch.proto = [str(obj.get("proto", "")) for obj in objs]
+        batch.service = [obj.get("service") or None for obj in objs]
+        batch.conn_state = [obj.get("conn_state") or None for obj in objs]
+    except (TypeError, ValueError, OverflowError):
+        # ISO 8601 时间戳或个别字段类型异常
+        return FlowBatch.from_flows(_flows_from_json(objs))
+    return batch
+
+
+def _flows_from_json(objs: Sequence[dict[str, Any]]) -> List[Flow]:
+    """逐条校验构造 Flow；ts（epoch 秒或 ISO 8601）与数值原样交给 pydantic 校验。"""
+    flows: List[Flow] = []
+    for obj in objs:
+        get = obj.get
+        try:
+            flows.append(
+                Flow(
+                    ts=get("ts"),
+                    uid=get("uid", ""),
+                    orig_h=get("id.orig_h", ""),
+                    orig_p=get("id.orig_p") or 0,
+                    resp_h=get("id.resp_h", ""),
+                    resp_p=get("id.resp_p") or 0,
+                    proto=get("proto", ""),
+                    service=get("service") or None,
+                    duration=get("duration"),
+                    orig_bytes=get("orig_bytes"),
+                    resp_bytes=get("resp_bytes"),
+                    conn_state=get("conn_state") or None,
+                )
+            )
+        except ValueError:
+            # pydantic.ValidationError 是 ValueError 的子类
+            continue
+    return flows
 
-    data = dict(zip(_CONN_FIELDS, values))
 
+def _flow_from_data(data: dict[str, str]) -> Optional[Flow]:
+    """将按字段名映射好的一行 conn.log 转为 Flow，解析失败返回 None。"""
     try:
         ts_raw = data.get("ts")
         if not ts_raw or ts_raw in ("-", ""):
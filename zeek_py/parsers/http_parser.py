@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Any, List, Optional, Sequence, Union
+
+from ..models import HttpFlow
+from ._json import iter_objects, parse_ts as _parse_json_ts
+from .schema import SchemaLike, as_schema, row_picker
+
+# 转换时实际读取的字段，解析时只取出这些列
+_HTTP_NAMES = (
+    "ts", "uid", "id.orig_h", "id.orig_p", "id.resp_h", "id.resp_p", "trans_depth",
+    "method", "host", "uri", "referrer", "user_agent", "status_code", "status_msg",
+    "request_body_len", "response_body_len", "resp_mime_types",
+)
+
+
+def _str(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, list):
+        # JSON 日志中的集合字段（resp_mime_types 等）
+        return ",".join(map(str, value)) or None
+    if not isinstance(value, str):
+        return str(value)
+    if value in ("", "-", "(empty)"):
+        return None
+    return value
+
+
+def _int(value: Any) -> Optional[int]:
+    if value is None or isinstance(value, int):
+        return value
+    if value in ("", "-", "(empty)"):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _http_from_data(data: dict[str, Any]) -> Optional[HttpFlow]:
+    """将按字段名映射好的一行 http.log 转为 HttpFlow，解析失败返回 None。"""
+    try:
+        ts = data.get("ts")
+        if ts is None or ts in ("-", ""):
+            return None
+        if not isinstance(ts, datetime):
+            ts = datetime.fromtimestamp(float(ts), tz=timezone.utc)
+        return HttpFlow(
+            ts=ts,
+            uid=data.get("uid") or "",
+            orig_h=data.get("id.orig_h") or "",
+            orig_p=_int(data.get("id.orig_p")) or 0,
+            resp_h=data.get("id.resp_h") or "",
+            resp_p=_int(data.get("id.resp_p")) or 0,
+            trans_depth=_int(data.get("trans_depth")),
+            method=_str(data.get("method")),
+            host=_str(data.get("host")),
+            uri=_str(data.get("uri")),
+            referrer=_str(data.get("referrer")),
+            user_agent=_str(data.get("user_agent")),
+            status_code=_int(data.get("status_code")),
+            status_msg=_str(data.get("status_msg")),
+            request_body_len=_int(data.get("request_body_len")),
+            response_body_len=_int(data.get("response_body_len")),
+            resp_mime_types=_str(data.get("resp_mime_types")),
+        )
+    except Exception:
+        return None
+
+
+def parse_http_lines(lines: Sequence[str], schema: SchemaLike) -> List[HttpFlow]:
+    """批量解析 http.log 数据行（不含 # 头部行），schema 由 LogReader 给出。"""
+    schema = as_schema(schema)
+    width, names, getter, markers = row_picker(schema, _HTTP_NAMES)
+    sep = schema.separator
+    flows: List[HttpFlow] = []
+    for line in lines:
+        values = line.rstrip("\n").split(sep)
+        if len(values) != width:
+            continue
+        picked = getter(values)
+        if markers:
+            picked = map(markers.get, picked, picked)
+        flow = _http_from_data(dict(zip(names, picked)))
+        if flow:
+            flows.append(flow)
+    return flows
+
+
+def parse_http_chunk(data: Union[bytes, str], schema: SchemaLike) -> List[HttpFlow]:
+    """批量解析一段 http.log 数据（若干完整数据行），接口与 parse_conn_chunk 一致。"""
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", errors="ignore")
+    return parse_http_lines(data.splitlines(), schema)
+
+
+def parse_http_json(lines: Sequence[str]) -> List[HttpFlow]:
+    """批量解析 JSON 格式（policy/tuning/json-logs）的 http.log 行。"""
+    flows: List[HttpFlow] = []
+    for obj in iter_objects(lines):
+        try:
+            obj["ts"] = _parse_json_ts(obj.get("ts"))
+        except (TypeError, ValueError, OverflowError, OSError):
+            continue
+        flow = _http_from_data(obj)
+        if flow:
+            flows.append(flow)
+    return flows
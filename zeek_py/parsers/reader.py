@@ -0,0 +1,163 @@
+"""
+单个日志文件的解析状态：当前头部（LogSchema）与对应的解析函数。
+
+每个被跟随/导入的文件各持有一个 LogReader，文件轮转或头部变化时只影响自身，
+多个文件、多个 worker 可以同时解析而不互相覆盖字段顺序。
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Iterator, List, Optional, Sized, Tuple
+
+from .conn_parser import parse_conn_chunk, parse_conn_json
+from .http_parser import parse_http_chunk, parse_http_json
+from .schema import (
+    DEFAULT_EMPTY_FIELD,
+    DEFAULT_SEPARATOR,
+    DEFAULT_SET_SEPARATOR,
+    DEFAULT_UNSET_FIELD,
+    LogSchema,
+)
+from .threat_parser import (
+    parse_intel_chunk,
+    parse_intel_json,
+    parse_notice_chunk,
+    parse_notice_json,
+    parse_weird_chunk,
+    parse_weird_json,
+)
+
+ChunkParser = Callable[[str, LogSchema], Sized]
+JsonParser = Callable[[List[str]], Sized]
+
+# 日志名 -> (ASCII 整块解析函数, JSON 解析函数)
+_PARSERS: dict[str, Tuple[ChunkParser, JsonParser]] = {
+    "conn": (parse_conn_chunk, parse_conn_json),
+    "http": (parse_http_chunk, parse_http_json),
+    "notice": (parse_notice_chunk, parse_notice_json),
+    "intel": (parse_intel_chunk, parse_intel_json),
+    "weird": (parse_weird_chunk, parse_weird_json),
+}
+
+
+def _unescape(value: str) -> str:
+    # #separator 行中的分隔符以 \x09 形式转义
+    if value.startswith("\\x"):
+        try:
+            return bytes.fromhex(value[2:].replace("\\x", "")).decode("utf-8")
+        except ValueError:
+            return value
+    return value
+
+
+class LogReader:
+    """
+    一个 Zeek 日志文件的解析器实例。
+
+    - split() 消费 # 头部行（#separator / #set_separator / #empty_field /
+      #unset_field / #fields / #types），维护当前 schema，并把数据段切成批次；
+    - 日志格式按行首自动识别，JSON 行（{ 开头）不依赖头部；
+    - task() 给出批次对应的 (解析函数, 参数)，可直接提交到线程/进程池。
+    """
+
+    def __init__(self, parse_chunk: ChunkParser, parse_json: JsonParser) -> None:
+        self.parse_chunk = parse_chunk
+        self.parse_json = parse_json
+        self.schema: Optional[LogSchema] = None
+        self._header: dict[str, Any] = {}
+
+    @classmethod
+    def for_log(cls, name: str) -> "LogReader":
+        """按日志名（conn / http / notice / intel / weird，可带 .log 后缀）创建。"""
+        key = name.split(".", 1)[0]
+        try:
+            parse_chunk, parse_json = _PARSERS[key]
+        except KeyError:
+            raise ValueError(f"不支持的日志类型: {name}") from None
+        return cls(parse_chunk, parse_json)
+
+    def reset(self) -> None:
+        """文件被截断/替换时调用，丢弃已读到的头部。"""
+        self.schema = None
+        self._header = {}
+
+    def _header_line(self, line: str) -> None:
+        sep = self._header.get("separator", DEFAULT_SEPARATOR)
+        if line.startswith("#separator"):
+            # 新文件开始：其余头部恢复默认值
+            parts = line.split(None, 1)
+            self._header = {"separator": _unescape(parts[1].strip()) if len(parts) > 1 else sep}
+            self.schema = None
+            return
+        key, found, value = line[1:].partition(sep)
+        if not found:
+            # 兼容以空格分隔的手写头部
+            key, _, value = line[1:].partition(" ")
+        value = value.strip("\r")
+        if key in ("set_separator", "empty_field", "unset_field"):
+            self._header[key] = value
+        elif key in ("fields", "types"):
+            self._header[key] = tuple(value.split(sep) if sep in value else value.split())
+            if key == "types" and self.schema is not None:
+                self.schema = self.schema._replace(types=self._header["types"])
+            elif key == "fields":
+                self.schema = LogSchema(
+                    fields=self._header["fields"],
+                    types=self._header.get("types", ()),
+                    separator=sep,
+                    set_separator=self._header.get("set_separator", DEFAULT_SET_SEPARATOR),
+                    empty_field=self._header.get("empty_field", DEFAULT_EMPTY_FIELD),
+                    unset_field=self._header.get("unset_field", DEFAULT_UNSET_FIELD),
+                )
+
+    def split(
+        self, text: str, max_bytes: int = 256 * 1024
+    ) -> Iterator[Tuple[Optional[LogSchema], str]]:
+        """
+        把一段完整的行（以换行结尾）切成 (schema, 数据) 批次；schema 为 None 表示 JSON。
+
+        头部行更新当前 schema，不产出批次；尚未读到 #fields 的 ASCII 数据行被跳过。
+        """
+        pos = 0
+        n = len(text)
+        while pos < n:
+            head = text[pos]
+            if head == "#":
+                end = text.find("\n", pos)
+                end = n if end < 0 else end + 1
+                self._header_line(text[pos:end].rstrip("\n"))
+                pos = end
+                continue
+            if head == "\n":
+                pos += 1
+                continue
+
+            # 数据段到下一个头部行为止，再按大小在换行处切成批次
+            nxt = text.find("\n#", pos)
+            seg_end = n if nxt < 0 else nxt + 1
+            schema = None if head == "{" else self.schema
+            if schema is None and head != "{":
+                pos = seg_end
+                continue
+            while pos < seg_end:
+                if seg_end - pos <= max_bytes:
+                    cut = seg_end
+                else:
+                    cut = text.find("\n", pos + max_bytes) + 1 or seg_end
+                    cut = min(cut, seg_end)
+                yield schema, text[pos:cut]
+                pos = cut
+
+    def task(self, schema: Optional[LogSchema], data: str) -> Tuple[Callable[..., Sized], tuple]:
+        """批次对应的 (解析函数, 参数)。"""
+        if schema is None:
+            return self.parse_json, (data.splitlines(),)
+        return self.parse_chunk, (data, schema)
+
+    def parse(self, text: str) -> List[Any]:
+        """同步解析一段文本（含头部），返回各批次的解析结果；用于离线导入等场景。"""
+        records: List[Any] = []
+        for schema, data in self.split(text):
+            func, args = self.task(schema, data)
+            records.append(func(*args))
+        return records
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import operator
+from functools import lru_cache
+from typing import Callable, NamedTuple, Optional, Sequence, Union
+
+# Zeek ASCII writer 的默认头部取值
+DEFAULT_SEPARATOR = "\t"
+DEFAULT_SET_SEPARATOR = ","
+DEFAULT_EMPTY_FIELD = "(empty)"
+DEFAULT_UNSET_FIELD = "-"
+
+
+class LogSchema(NamedTuple):
+    """
+    一个 Zeek ASCII 日志文件的头部描述（#separator / #fields / #types 等）。
+
+    不可变且可 pickle，解析批次时随数据一起传给线程/进程中的解析函数，
+    各文件、各 worker 之间不共享任何可变状态。
+    """
+
+    fields: tuple[str, ...]
+    types: tuple[str, ...] = ()
+    separator: str = DEFAULT_SEPARATOR
+    set_separator: str = DEFAULT_SET_SEPARATOR
+    empty_field: str = DEFAULT_EMPTY_FIELD
+    unset_field: str = DEFAULT_UNSET_FIELD
+
+    @property
+    def default_markers(self) -> bool:
+        """分隔符与缺失值标记是否都是 Zeek 默认值。"""
+        return (
+            self.separator == DEFAULT_SEPARATOR
+            and self.empty_field == DEFAULT_EMPTY_FIELD
+            and self.unset_field == DEFAULT_UNSET_FIELD
+        )
+
+
+SchemaLike = Union[LogSchema, Sequence[str]]
+
+
+def as_schema(schema: SchemaLike) -> LogSchema:
+    """兼容直接传入 #fields 字段列表的调用方式。"""
+    if isinstance(schema, LogSchema):
+        return schema
+    return LogSchema(tuple(schema))
+
+
+@lru_cache(maxsize=64)
+def column_index(schema: LogSchema) -> dict[str, int]:
+    """字段名 -> 列下标，同一 schema 只计算一次。"""
+    return {name: i for i, name in enumerate(schema.fields)}
+
+
+class RowPicker(NamedTuple):
+    """按 schema 预先编译的行转换器：字段数、所需列名与取列函数。"""
+
+    width: int
+    names: tuple[str, ...]
+    getter: Callable[[Sequence[str]], tuple]
+    markers: Optional[dict[str, str]]
+
+
+@lru_cache(maxsize=64)
+def row_picker(schema: LogSchema, wanted: tuple[str, ...]) -> RowPicker:
+    """
+    逐行解析（告警、HTTP 等字段较多但只用其中一部分的日志）使用：
+    只取出 wanted 中存在的列；非默认的缺失值标记映射为默认的 "-" / "(empty)"。
+    """
+    index = column_index(schema)
+    names = tuple(name for name in wanted if name in index)
+    idx = [index[name] for name in names]
+    if len(idx) == 1:
+        # 单列时 itemgetter 返回标量而非元组
+        first = idx[0]
+        getter: Callable[[Sequence[str]], tuple] = lambda values: (values[first],)
+    else:
+        getter = operator.itemgetter(*idx) if idx else (lambda values: ())
+    markers = None
+    if schema.unset_field != DEFAULT_UNSET_FIELD or schema.empty_field != DEFAULT_EMPTY_FIELD:
+        markers = {schema.unset_field: "-", schema.empty_field: "(empty)"}
+    return RowPicker(len(schema.fields), names, getter, markers)
+
+
+class LineSchema:
+    """
+    兼容旧的逐行接口 parse_*_line(line)：记住最近一次 #fields 头部行。
+
+    只保存一个 schema，多个文件交替调用会互相覆盖字段顺序；新代码应使用 LogReader。
+    """
+
+    def __init__(self) -> None:
+        self.schema: Optional[LogSchema] = None
+
+    def feed(self, line: str) -> Optional[LogSchema]:
+        """头部行更新 schema 并返回 None；数据行返回当前 schema（尚无 #fields 时为 None）。"""
+        if line.startswith("#"):
+            parts = line.split()
+            if len(parts) >= 2 and parts[0] == "#fields":
+                self.schema = LogSchema(tuple(parts[1:]))
+            return None
+        return self.schema if line else None
@@ -1,61 +1,38 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Any, Callable, List, Optional, Sequence, Union
 
 from ..models import ThreatEvent
+from ._json import iter_objects, parse_ts as _parse_json_ts
+from .schema import LineSchema, SchemaLike, as_schema, row_picker
 
 
-def _parse_ts(value: str) -> datetime:
+def _parse_ts(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        # JSON 路径已提前解析
+        return value
     return datetime.fromtimestamp(float(value), tz=timezone.utc)
 
 
-def _normalize_str(value: str | None) -> Optional[str]:
+def _normalize_str(value: Any) -> Optional[str]:
     if value is None:
         return None
+    if not isinstance(value, str):
+        # JSON 日志中的 bool / 数值 / 集合字段
+        if isinstance(value, bool):
+            # 与 ASCII 日志中的 T/F 保持一致
+            return "T" if value else "F"
+        if isinstance(value, list):
+            return ",".join(map(str, value)) or None
+        return str(value)
     if value in ("", "-", "(empty)", "N/A"):
         return None
     return value
 
 
-# 分别维护 notice.log / intel.log / weird.log 的字段顺序
-_NOTICE_FIELDS: list[str] | None = None
-_INTEL_FIELDS: list[str] | None = None
-_WEIRD_FIELDS: list[str] | None = None
-
-
-def _parse_ascii_line(
-    line: str, *, is_intel: bool
-) -> Optional[ThreatEvent]:
-    """
-    通用解析 Zeek ASCII notice / intel 日志单行。
-    """
-    global _NOTICE_FIELDS, _INTEL_FIELDS
-
-    line = line.rstrip("\n")
-    if not line:
-        return None
-
-    # 头部行
-    if line.startswith("#"):
-        parts = line.split()
-        if len(parts) >= 2 and parts[0] == "#fields":
-            if is_intel:
-                _INTEL_FIELDS = parts[1:]
-            else:
-                _NOTICE_FIELDS = parts[1:]
-        return None
-
-    fields = _INTEL_FIELDS if is_intel else _NOTICE_FIELDS
-    if not fields:
-        return None
-
-    values = line.split("\t")
-    if len(values) != len(fields):
-        return None
-
-    data = dict(zip(fields, values))
-
+def _threat_from_data(data: dict[str, Any], *, is_intel: bool) -> Optional[ThreatEvent]:
+    """将按字段名映射好的一行 notice/intel 日志转为 ThreatEvent。"""
     try:
         ts_raw = data.get("ts")
         if not ts_raw or ts_raw in ("-", ""):
@@ -94,45 +71,16 @@ def _parse_ascii_line(
         return None
 
 
-def parse_notice_line(line: str) -> Optional[ThreatEvent]:
-    """解析 notice.log（ASCII 格式）的一行。"""
-    return _parse_ascii_line(line, is_intel=False)
-
+def _notice_from_data(data: dict[str, Any]) -> Optional[ThreatEvent]:
+    return _threat_from_data(data, is_intel=False)
 
-def parse_intel_line(line: str) -> Optional[ThreatEvent]:
-    """解析 intel.log（ASCII 格式）的一行。"""
-    return _parse_ascii_line(line, is_intel=True)
 
+def _intel_from_data(data: dict[str, Any]) -> Optional[ThreatEvent]:
+    return _threat_from_data(data, is_intel=True)
 
-def parse_weird_line(line: str) -> Optional[ThreatEvent]:
-    """
-    解析 weird.log（ASCII 格式）的一行，并映射为 ThreatEvent。
-
-    典型字段（根据 #fields 行）：
-    ts, uid, id.orig_h, id.orig_p, id.resp_h, id.resp_p, name, addl, notice, peer, source
-    """
-    global _WEIRD_FIELDS
-
-    line = line.rstrip("\n")
-    if not line:
-        return None
-
-    # 头部行：记录字段顺序
-    if line.startswith("#"):
-        parts = line.split()
-        if len(parts) >= 2 and parts[0] == "#fields":
-            _WEIRD_FIELDS = parts[1:]
-        return None
-
-    if not _WEIRD_FIELDS:
-        return None
-
-    values = line.split("\t")
-    if len(values) != len(_WEIRD_FIELDS):
-        return None
-
-    data = dict(zip(_WEIRD_FIELDS, values))
 
+def _weird_from_data(data: dict[str, Any]) -> Optional[ThreatEvent]:
+    """将按字段名映射好的一行 weird.log 转为 ThreatEvent。"""
     try:
         ts_raw = data.get("ts")
         if not ts_raw or ts_raw in ("-", ""):
@@ -164,3 +112,149 @@ def parse_weird_line(line: str) -> Optional[ThreatEvent]:
         )
     except Exception:
         return None
+
+
+# 各转换函数实际读取的字段，解析时只取出这些列
+_THREAT_NAMES = (
+    "ts", "note", "msg", "indicator", "id.orig_h", "id.resp_h", "src", "dst",
+    "uid", "proto", "severity", "fuid", "seen.indicator",
+)
+_WEIRD_NAMES = ("ts", "name", "addl", "id.orig_h", "id.resp_h", "uid", "source", "notice")
+
+
+def _parse_lines(
+    lines: Sequence[str],
+    schema: SchemaLike,
+    wanted: tuple[str, ...],
+    convert: Callable[[dict[str, str]], Optional[ThreatEvent]],
+) -> List[ThreatEvent]:
+    schema = as_schema(schema)
+    width, names, getter, markers = row_picker(schema, wanted)
+    sep = schema.separator
+    events: List[ThreatEvent] = []
+    for line in lines:
+        values = line.rstrip("\n").split(sep)
+        if len(values) != width:
+            continue
+        picked = getter(values)
+        if markers:
+            picked = map(markers.get, picked, picked)
+        ev = convert(dict(zip(names, picked)))
+        if ev:
+            events.append(ev)
+    return events
+
+
+def parse_notice_lines(lines: Sequence[str], schema: SchemaLike) -> List[ThreatEvent]:
+    """
+    批量解析 notice.log 数据行（不含 # 头部行）。
+
+    与 conn_parser.parse_conn_lines 相同，schema 由调用方（LogReader）给出，不依赖模块全局状态。
+    """
+    return _parse_lines(lines, schema, _THREAT_NAMES, _notice_from_data)
+
+
+def parse_intel_lines(lines: Sequence[str], schema: SchemaLike) -> List[ThreatEvent]:
+    """批量解析 intel.log 数据行（不含 # 头部行）。"""
+    return _parse_lines(lines, schema, _THREAT_NAMES, _intel_from_data)
+
+
+def parse_weird_lines(lines: Sequence[str], schema: SchemaLike) -> List[ThreatEvent]:
+    """批量解析 weird.log 数据行（不含 # 头部行）。"""
+    return _parse_lines(lines, schema, _WEIRD_NAMES, _weird_from_data)
+
+
+# 旧的逐行接口按日志类型各记一份 #fields 头部
+_LINE_SCHEMAS = {"notice": LineSchema(), "intel": LineSchema(), "weird": LineSchema()}
+
+
+def _parse_line(
+    line: str,
+    schema: Optional[SchemaLike],
+    kind: str,
+    parse_lines: Callable[[Sequence[str], SchemaLike], List[ThreatEvent]],
+) -> Optional[ThreatEvent]:
+    line = line.rstrip("\n")
+    if schema is None:
+        schema = _LINE_SCHEMAS[kind].feed(line)
+        if schema is None:
+            return None
+    events = parse_lines([line], schema)
+    return events[0] if events else None
+
+
+def parse_notice_line(line: str, schema: Optional[SchemaLike] = None) -> Optional[ThreatEvent]:
+    """
+    解析 notice.log 的单行（兼容旧接口，批量解析请用 parse_notice_lines / LogReader）。
+
+    未给出 schema 时沿用旧行为：#fields 头部行记入模块级状态，之后的数据行按其解析。
+    """
+    return _parse_line(line, schema, "notice", parse_notice_lines)
+
+
+def parse_intel_line(line: str, schema: Optional[SchemaLike] = None) -> Optional[ThreatEvent]:
+    """解析 intel.log 的单行（兼容旧接口）。"""
+    return _parse_line(line, schema, "intel", parse_intel_lines)
+
+
+def parse_weird_line(line: str, schema: Optional[SchemaLike] = None) -> Optional[ThreatEvent]:
+    """解析 weird.log 的单行（兼容旧接口）。"""
+    return _parse_line(line, schema, "weird", parse_weird_lines)
+
+
+def _split_chunk(data: Union[bytes, str]) -> List[str]:
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", errors="ignore")
+    return data.splitlines()
+
+
+def parse_notice_chunk(data: Union[bytes, str], schema: SchemaLike) -> List[ThreatEvent]:
+    """
+    批量解析一段 notice.log 数据（若干完整数据行），接口与 conn_parser.parse_conn_chunk 一致。
+
+    告警日志量小，这里仍逐行转换，只省去逐行调用与头部判断的开销。
+    """
+    return parse_notice_lines(_split_chunk(data), schema)
+
+
+def parse_intel_chunk(data: Union[bytes, str], schema: SchemaLike) -> List[ThreatEvent]:
+    """批量解析一段 intel.log 数据。"""
+    return parse_intel_lines(_split_chunk(data), schema)
+
+
+def parse_weird_chunk(data: Union[bytes, str], schema: SchemaLike) -> List[ThreatEvent]:
+    """批量解析一段 weird.log 数据。"""
+    return parse_weird_lines(_split_chunk(data), schema)
+
+
+def _parse_json(
+    lines: Sequence[str],
+    convert: Callable[[dict[str, Any]], Optional[ThreatEvent]],
+) -> List[ThreatEvent]:
+    events: List[ThreatEvent] = []
+    for obj in iter_objects(lines):
+        try:
+            obj["ts"] = _parse_json_ts(obj.get("ts"))
+        except (TypeError, ValueError, OverflowError, OSError):
+            continue
+        if obj["ts"] is None:
+            continue
+        ev = convert(obj)
+        if ev:
+            events.append(ev)
+    return events
+
+
+def parse_notice_json(lines: Sequence[str]) -> List[ThreatEvent]:
+    """批量解析 JSON 格式（policy/tuning/json-logs）的 notice.log 行。"""
+    return _parse_json(lines, _notice_from_data)
+
+
+def parse_intel_json(lines: Sequence[str]) -> List[ThreatEvent]:
+    """批量解析 JSON 格式的 intel.log 行。"""
+    return _parse_json(lines, _intel_from_data)
+
+
+def parse_weird_json(lines: Sequence[str]) -> List[ThreatEvent]:
+    """批量解析 JSON 格式的 weird.log 行。"""
+    return _parse_json(lines, _weird_from_data)
@@ -0,0 +1,169 @@
+"""
+pcap 文件按流切分，供离线回放时多个 Zeek 进程并行分析。
+
+只处理经典 libpcap 格式（微秒/纳秒时间戳、大小端均可），不依赖第三方库：
+- 按对称的五元组哈希分片，同一连接的双向报文总在同一个分片中；
+- IP 分片报文没有端口，只按地址对哈希；
+- pcapng 或不支持的链路类型无法切分，由调用方整文件交给一个 Zeek 进程。
+"""
+
+from __future__ import annotations
+
+import mmap
+import struct
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Callable, List, Optional
+
+_MAGIC_US = 0xA1B2C3D4
+_MAGIC_NS = 0xA1B23C4D
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+
+# 切分时每攒够这么多报文写出一次
+_FLUSH_PACKETS = 65536
+# 计算流哈希时读取的报文头部长度（足够覆盖多层 VLAN + IPv6 + 端口）
+_HEADER_BYTES = 128
+
+_ETH_VLAN = (0x8100, 0x88A8, 0x9100)
+_ETH_IPV4 = 0x0800
+_ETH_IPV6 = 0x86DD
+
+
+def _ethernet(pkt: bytes) -> tuple[int, int]:
+    off = 12
+    etype = int.from_bytes(pkt[off : off + 2], "big")
+    while etype in _ETH_VLAN:
+        off += 4
+        etype = int.from_bytes(pkt[off : off + 2], "big")
+    return etype, off + 2
+
+
+def _raw(pkt: bytes) -> tuple[int, int]:
+    version = pkt[0] >> 4 if pkt else 0
+    return (_ETH_IPV4 if version == 4 else _ETH_IPV6 if version == 6 else 0), 0
+
+
+def _sll(pkt: bytes) -> tuple[int, int]:
+    return int.from_bytes(pkt[14:16], "big"), 16
+
+
+def _sll2(pkt: bytes) -> tuple[int, int]:
+    return int.from_bytes(pkt[0:2], "big"), 20
+
+
+# 链路类型 -> (以太网类型, 网络层起始偏移) 的解析函数
+_LINK_PARSERS: dict[int, Callable[[bytes], tuple[int, int]]] = {
+    LINKTYPE_ETHERNET: _ethernet,
+    LINKTYPE_RAW: _raw,
+    LINKTYPE_LINUX_SLL: _sll,
+    LINKTYPE_LINUX_SLL2: _sll2,
+}
+
+
+def flow_hash(pkt: bytes, linktype: int) -> int:
+    """报文的对称流哈希；非 IP 报文返回 0。"""
+    etype, off = _LINK_PARSERS[linktype](pkt)
+    if etype == _ETH_IPV4:
+        if len(pkt) < off + 20:
+            return 0
+        ihl = (pkt[off] & 0x0F) * 4
+        proto = pkt[off + 9]
+        src = pkt[off + 12 : off + 16]
+        dst = pkt[off + 16 : off + 20]
+        # MF 标志或分片偏移非 0：分片报文，只按地址对哈希
+        fragmented = int.from_bytes(pkt[off + 6 : off + 8], "big") & 0x3FFF
+        l4 = -1 if fragmented else off + ihl
+    elif etype == _ETH_IPV6:
+        if len(pkt) < off + 40:
+            return 0
+        proto = pkt[off + 6]
+        src = pkt[off + 8 : off + 24]
+        dst = pkt[off + 24 : off + 40]
+        # 带扩展头的报文同样只按地址对哈希
+        l4 = off + 40
+    else:
+        return 0
+
+    if proto in (6, 17, 132) and l4 >= 0 and len(pkt) >= l4 + 4:
+        a = src + pkt[l4 : l4 + 2]
+        b = dst + pkt[l4 + 2 : l4 + 4]
+    else:
+        a, b = src, dst
+    if a > b:
+        a, b = b, a
+    return zlib.crc32(b, zlib.crc32(a, proto))
+
+
+def pcap_linktype(path: Path) -> Optional[int]:
+    """经典 pcap 文件返回链路类型；pcapng 等其它格式返回 None。"""
+    with path.open("rb") as f:
+        header = f.read(24)
+    if len(header) < 24:
+        return None
+    for order in ("<", ">"):
+        magic, _, _, _, _, _, linktype = struct.unpack(order + "IHHiIII", header)
+        if magic in (_MAGIC_US, _MAGIC_NS):
+            return linktype & 0xFFFF
+    return None
+
+
+def can_split(path: Path) -> bool:
+    return pcap_linktype(path) in _LINK_PARSERS
+
+
+def split_pcap(path: Path, out_dir: Path, shards: int) -> List[Path]:
+    """
+    按流哈希把 pcap 切成 shards 个文件（保留原始全局头部），返回分片路径。
+
+    无法切分的文件（pcapng / 不支持的链路类型）原样返回 [path]。
+    """
+    if shards <= 1 or not can_split(path):
+        return [path]
+    out_dir.mkdir(parents=True, exist_ok=True)
+    outputs = [out_dir / f"{path.stem}.{i:02d}.pcap" for i in range(shards)]
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header = mm[:24]
+        order = "<" if struct.unpack("<I", header[:4])[0] in (_MAGIC_US, _MAGIC_NS) else ">"
+        linktype = struct.unpack(order + "I", header[20:24])[0] & 0xFFFF
+        incl_len = struct.Struct(order + "I").unpack_from
+        # 每个分片先收集 (起, 止) 区间，攒够一批后整批写出，避免逐报文 write
+        spans: List[List[tuple[int, int]]] = [[] for _ in range(shards)]
+        writers: List[BinaryIO] = [p.open("wb") for p in outputs]
+        try:
+            for w in writers:
+                w.write(header)
+            end = len(mm)
+            pos = 24
+            pending = 0
+            while pos + 16 <= end:
+                start = pos
+                pos += 16 + incl_len(mm, start + 8)[0]
+                if pos > end:
+                    # 截断的最后一个报文
+                    break
+                try:
+                    # 只取头部参与哈希，不复制整个报文
+                    h = flow_hash(mm[start + 16 : min(pos, start + 16 + _HEADER_BYTES)], linktype)
+                except IndexError:
+                    h = 0
+                spans[h % shards].append((start, pos))
+                pending += 1
+                if pending >= _FLUSH_PACKETS:
+                    _flush(mm, spans, writers)
+                    pending = 0
+            _flush(mm, spans, writers)
+        finally:
+            for w in writers:
+                w.close()
+    return outputs
+
+
+def _flush(mm: mmap.mmap, spans: List[List[tuple[int, int]]], writers: List[BinaryIO]) -> None:
+    for shard, w in zip(spans, writers):
+        if shard:
+            w.writelines([mm[a:b] for a, b in shard])
+            shard.clear()
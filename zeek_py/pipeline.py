@@ -0,0 +1,585 @@
+from __future__ import annotations
+
+import math
+import multiprocessing
+import queue
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Sequence, Union
+
+from .detection import rule_engine
+from .intel import intel_store
+from .models import FlowBatch, HttpFlow, IngestChannelStats, ThreatEvent
+from .parsers.reader import LogReader
+from .parsers.schema import LogSchema
+from .storage import storage
+from .stream import stream_hub
+from .tailer import LogTailer, LogWatcher
+
+# 队列满时的处理策略
+OVERFLOW_BLOCK = "block"  # 阻塞跟随线程（数据仍在文件中，不丢失，只是延迟）
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # 丢弃队列中最旧的一批，优先保证实时性
+OVERFLOW_DROP_NEWEST = "drop_newest"  # 丢弃新读到的一批
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST)
+
+
+class _Batch:
+    """
+    一批待解析的数据（若干完整的行）；schema 为 None 表示 JSON 格式。
+
+    解析结果只保留 since <= ts < until 的记录（热加载切换前后两代 Zeek 的分界，见 IngestPipeline.begin_handover）。
+    """
+
+    __slots__ = ("schema", "data", "since", "until")
+
+    def __init__(
+        self,
+        schema: Optional[LogSchema],
+        data: str,
+        since: float = -math.inf,
+        until: float = math.inf,
+    ) -> None:
+        self.schema = schema
+        self.data = data
+        self.since = since
+        self.until = until
+
+
+class _OrderedMerge:
+    """
+    多个 Zeek worker 的同类日志按 ts 合并后写入 sink。
+
+    各来源的记录先进入缓冲，按低水位（各活跃来源已见到的最大 ts 的最小值）
+    定期排序输出：低水位以下的记录不会再被其它来源“插队”，写入存储时基本有序。
+    空闲来源（idle_seconds 内没有新数据）不参与低水位；落后最新 ts 超过
+    max_lag 秒的记录不再等待，避免个别滞后的 worker 拖住全部输出。
+
+    Zeek 按连接结束时写日志、ts 为连接开始时间，单个 worker 的输出本身也不严格有序，
+    这里只消除多个 worker 之间的交错；个别更晚到达的记录仍由存储的时间索引插入到正确位置。
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[Any], None],
+        sources: int,
+        ts_of: Callable[[Any], Sequence[float]],
+        take: Callable[[Any, Sequence[int]], Any],
+        concat: Callable[[List[Any]], Any],
+        max_lag: float = 5.0,
+        idle_seconds: float = 5.0,
+    ) -> None:
+        self._sink = sink
+        self._ts_of = ts_of
+        self._take = take
+        self._concat = concat
+        self._max_lag = max_lag
+        self._idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        # 输出只在单个线程中进行，保证各次输出之间的顺序
+        self._flush_lock = threading.Lock()
+        self._pending: List[Any] = []
+        self._high = [-math.inf] * sources
+        self._last_push = [0.0] * sources
+
+    def sink_for(self, source: int) -> Callable[[Any], None]:
+        return lambda records: self.push(source, records)
+
+    def push(self, source: int, records: Any) -> None:
+        ts = self._ts_of(records)
+        if not len(ts):
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._pending.append(records)
+            high = max(ts)
+            if high > self._high[source]:
+                self._high[source] = high
+            self._last_push[source] = now
+
+    def flush(self, force: bool = False) -> None:
+        with self._flush_lock:
+            now = time.monotonic()
+            with self._lock:
+                if not self._pending:
+                    return
+                records = self._concat(self._pending)
+                self._pending = []
+                cutoff = math.inf
+                if not force:
+                    active = [
+                        high
+                        for high, last in zip(self._high, self._last_push)
+                        if now - last < self._idle_seconds
+                    ]
+                    if active:
+                        cutoff = max(min(active), max(self._high) - self._max_lag)
+                ts = self._ts_of(records)
+                order = sorted(range(len(ts)), key=ts.__getitem__)
+                k = bisect_right([ts[i] for i in order], cutoff)
+                if k < len(order):
+                    # 低水位以上的记录留到下一轮
+                    self._pending.append(self._take(records, order[k:]))
+            if k:
+                self._sink(self._take(records, order[:k]))
+
+
+def _store_flows(batch: FlowBatch) -> None:
+    storage.add_flow_batch(batch)
+    stream_hub.publish_flows(batch)
+    # Python 检测规则（pyrule/*）在新记录上增量评估、情报指标逐条匹配，
+    # 命中的告警与 notice 等同样入库、推送
+    events = rule_engine.process(batch)
+    events.extend(intel_store.match_flows(batch))
+    if events:
+        _store_threats(events)
+
+
+def _store_threats(events: List[ThreatEvent]) -> None:
+    storage.add_threats(events)
+    stream_hub.publish_threats(events)
+
+
+def _store_http(flows: List[HttpFlow]) -> None:
+    storage.add_http_flows(flows)
+    stream_hub.publish_http(flows)
+    events = intel_store.match_http(flows)
+    if events:
+        _store_threats(events)
+
+
+def _flow_ts(batch: FlowBatch) -> array:
+    return batch.ts
+
+
+def _flow_concat(batches: List[FlowBatch]) -> FlowBatch:
+    merged = FlowBatch()
+    for batch in batches:
+        merged.extend(batch)
+    return merged
+
+
+# 告警与 HTTP 记录都是带 ts 的模型列表，合并方式相同
+def _event_ts(events: List[Any]) -> List[float]:
+    return [ev.ts.timestamp() for ev in events]
+
+
+def _event_take(events: List[Any], rows: Sequence[int]) -> List[Any]:
+    return [events[i] for i in rows]
+
+
+def _event_concat(lists: List[List[Any]]) -> List[Any]:
+    return [ev for events in lists for ev in events]
+
+
+class _Channel:
+    """单一日志文件的采集通道：跟随器 + 有界队列 + 解析 worker。"""
+
+    def __init__(
+        self,
+        name: str,
+        source: int,
+        tailer: LogTailer,
+        sink: Callable[[Any], None],
+        ts_of: Callable[[Any], Sequence[float]],
+        take: Callable[[Any, Sequence[int]], Any],
+        workers: int,
+        queue_size: int,
+        overflow: str,
+        use_executor: bool,
+    ) -> None:
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"未知的队列溢出策略: {overflow}")
+        self.name = name
+        # 所属日志目录（Zeek worker）的序号
+        self.source = source
+        self.tailer = tailer
+        # 当前文件的头部与解析函数，跨启停保留（与跟随器的读取位置保持一致）
+        self.reader = LogReader.for_log(tailer.path.name)
+        self.sink = sink
+        self.ts_of = ts_of
+        self.take = take
+        self.workers = workers
+        self.overflow = overflow
+        self.use_executor = use_executor
+        self.queue: "queue.Queue[Optional[_Batch]]" = queue.Queue(maxsize=queue_size)
+
+        # 热加载：当前文件的记录按 ts 截取的范围，以及切换后要跟随的新文件
+        self.since = -math.inf
+        self.until = math.inf
+        self._next: Optional[LogTailer] = None
+        self._next_since = -math.inf
+        self.switch_requested = threading.Event()
+        self.switched = threading.Event()
+
+        self.lines_read = 0
+        self.records_ingested = 0
+        self.batches_dropped = 0
+        self.lines_dropped = 0
+        # 多个解析 worker 并发更新计数
+        self._counter_lock = threading.Lock()
+
+    def count_ingested(self, n: int) -> None:
+        with self._counter_lock:
+            self.records_ingested += n
+
+    def count_dropped(self, batch: _Batch) -> None:
+        with self._counter_lock:
+            self.batches_dropped += 1
+            self.lines_dropped += batch.data.count("\n")
+
+    def clip(self, records: Any, since: float, until: float) -> Any:
+        """只保留 since <= ts < until 的记录。"""
+        ts = self.ts_of(records)
+        rows = [i for i, t in enumerate(ts) if since <= t < until]
+        return records if len(rows) == len(ts) else self.take(records, rows)
+
+    def begin_handover(self, tailer: LogTailer, cutover: float) -> None:
+        """此后读到的当前文件记录只保留 ts < cutover；切换到 tailer 后只保留 ts >= cutover。"""
+        self._next = tailer
+        self._next_since = cutover
+        self.switched.clear()
+        self.until = cutover
+
+    def switch_tailer(self) -> None:
+        """当前文件已读完：改为从头跟随新文件（由跟随线程调用，或流水线未运行时直接调用）。"""
+        if self._next is None:
+            return
+        self.tailer.close()
+        self.tailer = self._next
+        # 队列中尚未解析的旧批次自带 schema，只用到解析函数，与新的 reader 相同
+        self.reader = LogReader.for_log(self.tailer.path.name)
+        self.since, self.until = self._next_since, math.inf
+        self._next = None
+        self.switch_requested.clear()
+        self.switched.set()
+
+    def stats(self) -> IngestChannelStats:
+        return IngestChannelStats(
+            name=self.name,
+            queue_depth=self.queue.qsize(),
+            queue_capacity=self.queue.maxsize,
+            overflow_policy=self.overflow,
+            parser_workers=self.workers,
+            lines_read=self.lines_read,
+            records_ingested=self.records_ingested,
+            batches_dropped=self.batches_dropped,
+            lines_dropped=self.lines_dropped,
+        )
+
+
+class IngestPipeline:
+    """
+    并发日志采集流水线。
+
+    - 每种日志一个跟随线程，由各自的 LogReader 维护头部并按大小切分批次，放入有界队列；
+    - conn.log 由可配置数量的解析 worker 处理（process 模式下在进程池中解析），
+      告警类日志各自独立的队列与 worker，conn.log 洪峰不会拖慢告警入库；
+    - conn.log 按列整块解析（parse_conn_chunk），FlowBatch 直接按列写入 storage；
+    - http.log 解析为 HttpFlow，写入 storage 中独立的 HTTP 缓冲；
+    - 解析结果按批写入 storage，整批只加一次锁，并发布给 /api/stream 的订阅者；
+    - conn 记录入库后交给 Python 检测规则（见 detection），告警以 source="pyrule" 入库；
+    - conn / http 记录与情报指标（见 intel）比对，命中的告警以 source="intel" 入库；
+    - 队列满时按溢出策略处理，队列深度与丢弃计数可通过 stats() 查看；
+    - 可同时跟随多个日志目录（多个 Zeek worker 各自的输出），每个目录独立的通道，
+      同类日志按 ts 合并后入库（见 _OrderedMerge）；
+    - 热加载规则时新一代 Zeek 写入另一组目录，各通道在旧进程退出、旧文件读完后切换过去
+      （begin_handover / complete_handover），跟随线程、队列与统计保留，以切换时刻为界不丢不重。
+    """
+
+    def __init__(
+        self,
+        logs_dirs: Union[Path, Sequence[Path]],
+        parser_workers: int = 2,
+        parser_mode: str = "thread",
+        queue_size: int = 64,
+        conn_overflow: str = OVERFLOW_BLOCK,
+        batch_bytes: int = 256 * 1024,
+        merge_lag: float = 5.0,
+    ) -> None:
+        if parser_mode not in ("thread", "process"):
+            raise ValueError(f"未知的解析模式: {parser_mode}")
+        dirs = [logs_dirs] if isinstance(logs_dirs, Path) else list(logs_dirs)
+        self._parser_workers = max(1, parser_workers)
+        self._parser_mode = parser_mode
+        self._batch_bytes = batch_bytes
+
+        # 多个 Zeek worker（各自的日志目录）时，同类日志经 _OrderedMerge 按 ts 合并入库
+        self._merges: List[_OrderedMerge] = []
+        flow_sink: Callable[[int], Callable[[Any], None]] = lambda i: _store_flows
+        http_sink: Callable[[int], Callable[[Any], None]] = lambda i: _store_http
+        threat_sink: Callable[[int], Callable[[Any], None]] = lambda i: _store_threats
+        if len(dirs) > 1:
+            flow_merge = _OrderedMerge(
+                _store_flows, len(dirs), _flow_ts, FlowBatch.take, _flow_concat, merge_lag
+            )
+            http_merge = _OrderedMerge(
+                _store_http, len(dirs), _event_ts, _event_take, _event_concat, merge_lag
+            )
+            threat_merge = _OrderedMerge(
+                _store_threats, len(dirs), _event_ts, _event_take, _event_concat, merge_lag
+            )
+            self._merges = [flow_merge, http_merge, threat_merge]
+            flow_sink = flow_merge.sink_for
+            http_sink = http_merge.sink_for
+            threat_sink = threat_merge.sink_for
+
+        use_processes = parser_mode == "process"
+        self._channels: List[_Channel] = []
+        for i, logs_dir in enumerate(dirs):
+            prefix = f"{logs_dir.name}/" if len(dirs) > 1 else ""
+            self._channels.append(
+                _Channel(
+                    f"{prefix}conn.log",
+                    i,
+                    LogTailer(logs_dir / "conn.log"),
+                    flow_sink(i),
+                    _flow_ts,
+                    FlowBatch.take,
+                    workers=self._parser_workers,
+                    queue_size=queue_size,
+                    overflow=conn_overflow,
+                    use_executor=use_processes,
+                )
+            )
+            # http.log 量介于两者之间：独立队列，与 conn.log 相同的溢出策略
+            self._channels.append(
+                _Channel(
+                    f"{prefix}http.log",
+                    i,
+                    LogTailer(logs_dir / "http.log"),
+                    http_sink(i),
+                    _event_ts,
+                    _event_take,
+                    workers=1,
+                    queue_size=queue_size,
+                    overflow=conn_overflow,
+                    use_executor=False,
+                )
+            )
+            # 告警类日志量小但时效性要求高：独立队列、阻塞策略（不丢数据）；
+            # weird.log 也视作“告警”来源之一
+            for log in ("notice.log", "intel.log", "weird.log"):
+                self._channels.append(
+                    _Channel(
+                        f"{prefix}{log}",
+                        i,
+                        LogTailer(logs_dir / log),
+                        threat_sink(i),
+                        _event_ts,
+                        _event_take,
+                        workers=1,
+                        queue_size=queue_size,
+                        overflow=OVERFLOW_BLOCK,
+                        use_executor=False,
+                    )
+                )
+
+        self._stop_event = threading.Event()
+        self._watchers: list[LogWatcher] = []
+        self._tail_threads: list[threading.Thread] = []
+        self._worker_threads: list[threading.Thread] = []
+        self._merge_thread: Optional[threading.Thread] = None
+        self._executor: Optional[Executor] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tail_threads)
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop_event.clear()
+        if self._parser_mode == "process":
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._parser_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+        for ch in self._channels:
+            t = threading.Thread(
+                target=self._tail_loop, args=(ch,), name=f"ingest-tail-{ch.name}", daemon=True
+            )
+            self._tail_threads.append(t)
+            for i in range(ch.workers):
+                w = threading.Thread(
+                    target=self._worker_loop,
+                    args=(ch,),
+                    name=f"ingest-parse-{ch.name}-{i}",
+                    daemon=True,
+                )
+                self._worker_threads.append(w)
+
+        if self._merges:
+            self._merge_thread = threading.Thread(
+                target=self._merge_loop, name="ingest-merge", daemon=True
+            )
+            self._merge_thread.start()
+        for t in self._worker_threads + self._tail_threads:
+            t.start()
+
+    def stop(self) -> None:
+        """停止跟随，等待队列中已读取的批次解析入库后退出。"""
+        if not self.running:
+            return
+        self._stop_event.set()
+        for watcher in list(self._watchers):
+            watcher.wake()
+        for t in self._tail_threads:
+            t.join(timeout=10)
+
+        for ch in self._channels:
+            for _ in range(ch.workers):
+                ch.queue.put(None)
+        for t in self._worker_threads:
+            t.join(timeout=10)
+
+        if self._merge_thread is not None:
+            self._merge_thread.join(timeout=10)
+            self._merge_thread = None
+        for merge in self._merges:
+            merge.flush(force=True)
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._tail_threads = []
+        self._worker_threads = []
+
+    def stats(self) -> List[IngestChannelStats]:
+        return [ch.stats() for ch in self._channels]
+
+    @property
+    def log_names(self) -> List[str]:
+        """各日志目录中跟随的文件名。"""
+        return list(dict.fromkeys(ch.tailer.path.name for ch in self._channels))
+
+    # ---- 热加载切换 ----
+
+    def begin_handover(self, logs_dirs: Sequence[Path], cutover: float) -> None:
+        """
+        准备切换到新的日志目录（与构造时的目录一一对应），在新一代 Zeek 就绪后、停止旧进程前调用。
+
+        cutover 为切换时刻：旧文件只保留 ts < cutover 的记录（旧进程退出时写出的也在内），
+        新文件从头读取、只保留 ts >= cutover 的记录，两代进程并行期间重复看到的连接只入库一次。
+        """
+        for ch in self._channels:
+            ch.begin_handover(LogTailer(logs_dirs[ch.source] / ch.tailer.path.name), cutover)
+
+    def complete_handover(self, timeout: float = 10.0) -> None:
+        """旧进程已退出：各跟随线程读完旧文件后切换到新文件，最多等待 timeout 秒。"""
+        if not self.running:
+            for ch in self._channels:
+                ch.switch_tailer()
+            return
+        for ch in self._channels:
+            ch.switch_requested.set()
+        for watcher in list(self._watchers):
+            watcher.wake()
+        deadline = time.monotonic() + timeout
+        for ch in self._channels:
+            if not ch.switched.wait(max(0.0, deadline - time.monotonic())):
+                print(f"[ingest] {ch.name} 未能在 {timeout:g}s 内切换到新的日志文件")
+
+    # ---- 跟随线程 ----
+
+    def _merge_loop(self) -> None:
+        while not self._stop_event.wait(0.5):
+            for merge in self._merges:
+                try:
+                    merge.flush()
+                except Exception as e:
+                    print(f"[ingest] 合并写入失败: {e}")
+
+    def _tail_loop(self, ch: _Channel) -> None:
+        watcher = LogWatcher(ch.tailer.path.parent)
+        self._watchers.append(watcher)
+        # 首轮直接读取；之后只在本文件有变化时读取，超时兜底检查一次
+        changed: Optional[set[str]] = None
+        try:
+            while not self._stop_event.is_set():
+                if ch.switch_requested.is_set():
+                    # 热加载：旧进程已退出，读完旧文件剩余的行再切换到新目录
+                    try:
+                        self._read_batches(ch)
+                    except Exception as e:
+                        print(f"[ingest] 读取 {ch.name} 失败: {e}")
+                    ch.switch_tailer()
+                    self._watchers.remove(watcher)
+                    watcher.close()
+                    watcher = LogWatcher(ch.tailer.path.parent)
+                    self._watchers.append(watcher)
+                    changed = None
+                    # stop() 可能在新 watcher 登记前已发出唤醒：回到循环开头重新检查停止标志
+                    continue
+                if changed is None or ch.tailer.path.name in changed:
+                    try:
+                        self._read_batches(ch)
+                    except Exception as e:
+                        # 跟随线程不应因异常退出
+                        print(f"[ingest] 读取 {ch.name} 失败: {e}")
+                changed = watcher.wait(timeout=30.0)
+        finally:
+            self._watchers.remove(watcher)
+            watcher.close()
+
+    def _read_batches(self, ch: _Channel) -> None:
+        data = ch.tailer.read()
+        if not data:
+            return
+        text = data.decode("utf-8", errors="ignore")
+        ch.lines_read += text.count("\n")
+
+        # 日志格式按行首自动识别，头部（#separator / #fields 等）由 LogReader 维护。
+        # 跟随器只返回完整的行，text 总以换行结尾。
+        since, until = ch.since, ch.until
+        for schema, chunk in ch.reader.split(text, self._batch_bytes):
+            self._enqueue(ch, _Batch(schema, chunk, since, until))
+
+    def _enqueue(self, ch: _Channel, batch: _Batch) -> None:
+        if ch.overflow == OVERFLOW_BLOCK:
+            # 停止过程中 worker 仍在消费，这里最终总能放入
+            ch.queue.put(batch)
+            return
+        try:
+            ch.queue.put_nowait(batch)
+            return
+        except queue.Full:
+            pass
+        if ch.overflow == OVERFLOW_DROP_OLDEST:
+            try:
+                dropped = ch.queue.get_nowait()
+            except queue.Empty:
+                dropped = None
+            if dropped is not None:
+                ch.count_dropped(dropped)
+            try:
+                ch.queue.put_nowait(batch)
+                return
+            except queue.Full:
+                pass
+        ch.count_dropped(batch)
+
+    # ---- 解析 worker ----
+
+    def _worker_loop(self, ch: _Channel) -> None:
+        while True:
+            batch = ch.queue.get()
+            if batch is None:
+                return
+            func, args = ch.reader.task(batch.schema, batch.data)
+            try:
+                if ch.use_executor and self._executor is not None:
+                    records = self._executor.submit(func, *args).result()
+                else:
+                    records = func(*args)
+                if records and (batch.since > -math.inf or batch.until < math.inf):
+                    records = ch.clip(records, batch.since, batch.until)
+                if records:
+                    ch.sink(records)
+                    ch.count_ingested(len(records))
+            except Exception as e:
+                print(f"[ingest] 解析 {ch.name} 失败: {e}")
@@ -0,0 +1,437 @@
+from __future__ import annotations
+
+import math
+import operator
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import islice
+from typing import Hashable, Iterable, Iterator, Optional, Sequence
+
+# (分辨率秒数, 槽位数)：1 秒粒度保留 1 天，1 分钟粒度保留 14 天，1 小时粒度保留 1 年
+DEFAULT_LEVELS: tuple[tuple[int, int], ...] = (
+    (1, 86_400),
+    (60, 20_160),
+    (3_600, 8_760),
+)
+
+
+# 只在分钟及更粗的粒度上保留基数估计（HyperLogLog），秒级时间片数量太多
+DISTINCT_MIN_RESOLUTION = 60
+
+_MASK64 = (1 << 64) - 1
+
+
+@lru_cache(maxsize=1 << 16)
+def _hll_position(value: Hashable, precision: int) -> int:
+    """
+    value 在 HyperLogLog 中的位置：(寄存器下标 << 6) | 秩。
+
+    hash() 在进程内稳定（寄存器只在本进程内合并），小整数的 hash 即其本身，
+    先经 splitmix64 打散；常见 IP / 端口反复出现，结果缓存。
+    """
+    z = (hash(value) + 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    z ^= z >> 31
+    rest = 64 - precision
+    return (z >> rest) << 6 | (rest - (z & ((1 << rest) - 1)).bit_length() + 1)
+
+
+def hll_positions(values: Iterable[Hashable], precision: int) -> list[int]:
+    """一组取值（调用方先去重）对应的寄存器位置，None 跳过。"""
+    return [_hll_position(v, precision) for v in values if v is not None]
+
+
+def distinct_positions(
+    ts: Sequence[float], columns: Sequence[Sequence[Hashable]], precision: int
+) -> list[tuple[int, list[list[int]]]]:
+    """
+    把一批记录按分钟分组，各列去重后转换为寄存器位置：[(分钟起始秒, [各列位置])]。
+
+    整批落在同一分钟（绝大多数情况）时直接对整列去重。
+    """
+    if not len(ts):
+        return []
+    r = DISTINCT_MIN_RESOLUTION
+    first = math.floor(ts[0]) // r
+    if first == math.floor(min(ts)) // r == math.floor(max(ts)) // r:
+        return [(first * r, [hll_positions(set(col), precision) for col in columns])]
+    groups: dict[int, list[int]] = {}
+    for i, t in enumerate(ts):
+        groups.setdefault(math.floor(t) // r, []).append(i)
+    return [
+        (
+            minute * r,
+            [hll_positions({col[i] for i in rows}, precision) for col in columns],
+        )
+        for minute, rows in sorted(groups.items())
+    ]
+
+
+@lru_cache(maxsize=None)
+def _swar_masks(m: int) -> tuple[int, int]:
+    return int.from_bytes(b"\x80" * m, "big"), int.from_bytes(b"\xff" * m, "big")
+
+
+def _hll_merge(a: bytes, b: bytes) -> bytes:
+    """
+    两组寄存器逐个取最大值。
+
+    寄存器值都小于 128：把整组当作大整数，每字节加上最高位后相减，
+    最高位保留下来的字节即 a >= b，一次大整数运算代替逐字节比较。
+    """
+    m = len(a)
+    high, full = _swar_masks(m)
+    x = int.from_bytes(a, "big")
+    y = int.from_bytes(b, "big")
+    pick = ((((x | high) - y) & high) >> 7) * 0xFF
+    return ((x & pick) | (y & ~pick & full)).to_bytes(m, "big")
+
+
+def cardinality(sketches: Sequence[bytes]) -> int:
+    """合并若干组寄存器（见 Rollup.buckets）并估计基数。"""
+    if not sketches:
+        return 0
+    registers = sketches[0]
+    for other in islice(sketches, 1, None):
+        registers = _hll_merge(registers, other)
+    return _hll_estimate(registers)
+
+
+def _hll_estimate(registers: bytes) -> int:
+    m = len(registers)
+    zeros = registers.count(0)
+    if zeros == m:
+        return 0
+    # 按秩统计寄存器个数（bytearray.count 在 C 层），秩很少超过 20，数够 m 个即停
+    total = float(zeros)
+    seen = zeros
+    rank = 1
+    while seen < m:
+        n = registers.count(rank)
+        seen += n
+        total += n * 2.0**-rank
+        rank += 1
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / total
+    if estimate <= 2.5 * m and zeros:
+        # 小基数时改用线性计数
+        estimate = m * math.log(m / zeros)
+    return round(estimate)
+
+
+class _RollupLevel:
+    """
+    单一分辨率的滚动汇总：环形数组，每个槽位对应一个时间片。
+
+    - 数值指标（计数/字节和）按列存放在 array 中，区间求和走 C 层 sum；
+    - 维度细分（如 by_level/by_note）稀疏存放，只记录有数据的时间片；
+    - 基数估计每个时间片每个维度一组 HyperLogLog 寄存器（2^precision 字节），
+      同样只记录有数据的时间片，区间合并即逐个寄存器取最大值；
+    - 时间前进时清零被复用的槽位，窗口外的旧数据自然淘汰。
+    """
+
+    def __init__(
+        self,
+        resolution: int,
+        slots: int,
+        metrics: int,
+        breakdowns: int,
+        distinct: int = 0,
+        precision: int = 10,
+    ) -> None:
+        self.resolution = resolution
+        self.slots = slots
+        self._cols = [array("q", bytes(8 * slots)) for _ in range(metrics)]
+        self._breakdowns: dict[int, list[dict[str, int]]] = {}
+        self._n_breakdowns = breakdowns
+        self._sketches: dict[int, list[bytearray]] = {}
+        self.distinct = distinct
+        self.precision = precision
+        self.newest: Optional[int] = None
+        self.oldest: Optional[int] = None
+
+    @property
+    def window_lo(self) -> Optional[int]:
+        """窗口内最早的时间片编号。"""
+        if self.newest is None or self.oldest is None:
+            return None
+        return max(self.oldest, self.newest - self.slots + 1)
+
+    def add(
+        self,
+        sec: int,
+        values: Sequence[int],
+        labels: Sequence[Optional[str]],
+        weight: int,
+    ) -> None:
+        key = sec // self.resolution
+        if not self._touch(key):
+            return
+
+        slot = key % self.slots
+        for col, value in zip(self._cols, values):
+            col[slot] += value
+
+        if self._n_breakdowns:
+            dims = self._breakdowns.get(key)
+            if dims is None:
+                dims = self._breakdowns[key] = [{} for _ in range(self._n_breakdowns)]
+            for dim, label in zip(dims, labels):
+                if label:
+                    dim[label] = dim.get(label, 0) + weight
+
+    def add_distinct(self, sec: int, positions: Sequence[Sequence[int]]) -> None:
+        """positions 为各基数维度的寄存器位置（见 hll_positions）。"""
+        key = sec // self.resolution
+        if not self._touch(key):
+            return
+        sketch = self._sketches.get(key)
+        if sketch is None:
+            size = 1 << self.precision
+            sketch = self._sketches[key] = [bytearray(size) for _ in range(self.distinct)]
+        for registers, dim in zip(sketch, positions):
+            for pos in dim:
+                index = pos >> 6
+                rank = pos & 63
+                if registers[index] < rank:
+                    registers[index] = rank
+
+    def _touch(self, key: int) -> bool:
+        """时间片 key 即将写入：推进窗口；比窗口还早的乱序数据返回 False。"""
+        if self.newest is None:
+            self.newest = key
+        elif key > self.newest:
+            self._advance(key)
+        elif key <= self.newest - self.slots:
+            # 在该粒度上已无法保存
+            return False
+        if self.oldest is None or key < self.oldest:
+            self.oldest = key
+        return True
+
+    def _advance(self, key: int) -> None:
+        assert self.newest is not None
+        steps = min(key - self.newest, self.slots)
+        first = (key - steps + 1) % self.slots
+        # 清零即将复用的槽位（可能跨越数组末尾）
+        spans = [(first, min(first + steps, self.slots))]
+        if first + steps > self.slots:
+            spans.append((0, first + steps - self.slots))
+        for lo, hi in spans:
+            zeros = array("q", bytes(8 * (hi - lo)))
+            for col in self._cols:
+                col[lo:hi] = zeros
+
+        for sparse in (self._breakdowns, self._sketches):
+            if not sparse:
+                continue
+            # 移出窗口的时间片：通常只有 1 个，长时间空闲后再取字典过滤
+            expired_lo = self.newest - self.slots + 1
+            expired_hi = key - self.slots + 1
+            if expired_hi - expired_lo <= len(sparse):
+                for k in range(expired_lo, expired_hi):
+                    sparse.pop(k, None)
+            else:
+                for k in [k for k in sparse if k < expired_hi]:
+                    del sparse[k]
+        self.newest = key
+
+    def sums(self, key_lo: int, key_hi: int) -> list[int]:
+        """[key_lo, key_hi) 区间内各指标之和（调用方保证区间在窗口内）。"""
+        lo = key_lo % self.slots
+        n = key_hi - key_lo
+        if lo + n <= self.slots:
+            return [sum(col[lo : lo + n]) for col in self._cols]
+        tail = lo + n - self.slots
+        return [sum(col[lo:]) + sum(col[:tail]) for col in self._cols]
+
+    def breakdown(self, key_lo: int, key_hi: int) -> list[dict[str, int]]:
+        merged: list[dict[str, int]] = [{} for _ in range(self._n_breakdowns)]
+        keys = _sparse_keys(self._breakdowns, key_lo, key_hi)
+        for k in keys:
+            dims = self._breakdowns.get(k)
+            if dims is None:
+                continue
+            for out, dim in zip(merged, dims):
+                for label, count in dim.items():
+                    out[label] = out.get(label, 0) + count
+        return merged
+
+    def sketches(self, key_lo: int, key_hi: int) -> list[list[bytes]]:
+        """
+        [key_lo, key_hi) 区间内各基数维度的寄存器快照（每个时间片一组）。
+
+        持锁期间只做复制，合并与估计（见 cardinality）留给调用方在锁外进行。
+        """
+        out: list[list[bytes]] = [[] for _ in range(self.distinct)]
+        for k in _sparse_keys(self._sketches, key_lo, key_hi):
+            sketch = self._sketches.get(k)
+            if sketch is None:
+                continue
+            for dim, registers in zip(out, sketch):
+                dim.append(bytes(registers))
+        return out
+
+
+def _sparse_keys(sparse: dict, key_lo: int, key_hi: int) -> Sequence[int]:
+    """稀疏存放的时间片中落在 [key_lo, key_hi) 的编号：区间比字典大时改为过滤字典。"""
+    if key_hi - key_lo > len(sparse):
+        return [k for k in sparse if key_lo <= k < key_hi]
+    return range(key_lo, key_hi)
+
+
+class Rollup:
+    """
+    多分辨率按秒滚动汇总，在写入时增量更新。
+
+    查询时按 bucket_seconds 重新分桶：选择能整除桶大小的最粗分辨率，
+    每个桶只做一次数组切片求和，代价取决于桶的数量而不是记录条数；
+    各分辨率保留时间远长于原始记录缓冲，长时间窗口的结果依旧完整。
+    第一个指标约定为计数，计数为 0 的桶不返回。
+
+    distinct 个基数维度（如不同源 IP 数）只在分钟及更粗的粒度上保留，
+    桶大小为其整数倍时按桶合并寄存器，代价同样只与桶的数量有关。
+    """
+
+    def __init__(
+        self,
+        metrics: int,
+        breakdowns: int = 0,
+        levels: Sequence[tuple[int, int]] = DEFAULT_LEVELS,
+        distinct: int = 0,
+        precision: int = 10,
+    ) -> None:
+        self._levels = [
+            _RollupLevel(
+                resolution,
+                slots,
+                metrics,
+                breakdowns,
+                distinct if resolution >= DISTINCT_MIN_RESOLUTION else 0,
+                precision,
+            )
+            for resolution, slots in levels
+        ]
+        self.precision = precision
+
+    def add(
+        self,
+        ts: float,
+        values: Sequence[int],
+        labels: Sequence[Optional[str]] = (),
+        weight: int = 1,
+    ) -> None:
+        sec = math.floor(ts)
+        for level in self._levels:
+            level.add(sec, values, labels, weight)
+
+    def add_many(
+        self,
+        ts: Sequence[float],
+        columns: Sequence[array] = (),
+        missing: Optional[int] = None,
+    ) -> None:
+        """
+        批量写入（不含维度细分）：计数按条数累加，columns 为其余各指标列，
+        列中等于 missing 的值（缺失标记）按 0 计。
+
+        ts 非降序时（绝大多数情况）先按秒切片求和，每秒只写入一次。
+        """
+        secs = array("q", map(math.floor, ts))
+        n = len(secs)
+        if not all(map(operator.le, secs, islice(secs, 1, None))):
+            for i, sec in enumerate(secs):
+                self.add(sec, [1] + [0 if col[i] == missing else col[i] for col in columns])
+            return
+        i = 0
+        while i < n:
+            sec = secs[i]
+            j = bisect_right(secs, sec, i)
+            values = [j - i]
+            for col in columns:
+                seg = col[i:j]
+                total = sum(seg)
+                if missing is not None:
+                    total -= missing * seg.count(missing)
+                values.append(total)
+            self.add(sec, values)
+            i = j
+
+    def add_distinct(self, sec: int, positions: Sequence[Sequence[int]]) -> None:
+        """写入某一秒（同一分钟内任意一秒均可）各基数维度的寄存器位置。"""
+        for level in self._levels:
+            if level.distinct:
+                level.add_distinct(sec, positions)
+
+    def buckets(
+        self,
+        bucket_seconds: int,
+        since_ts: Optional[float] = None,
+    ) -> Iterator[tuple[int, list[int], list[dict[str, int]], list[list[bytes]]]]:
+        """
+        逐个返回 (桶起始秒, 指标和, 维度细分, 各基数维度的寄存器)，按时间升序。
+
+        桶起始与原实现一致：ts - ts % bucket_seconds；since 落在桶中间时，
+        第一个桶只统计 since 之后的部分（用能覆盖该时刻的最细分辨率计算）。
+        寄存器按其所用粒度对齐（since 所在的整分钟 / 整小时都计入），用 cardinality 估计；
+        bucket_seconds 不是分钟的整数倍时为空列表。
+        """
+        candidates = [lv for lv in self._levels if bucket_seconds % lv.resolution == 0]
+        if not candidates:
+            return
+        level = candidates[-1]
+        sketched = [lv for lv in candidates if lv.distinct]
+        window_lo = level.window_lo
+        if window_lo is None or level.newest is None:
+            return
+        r = level.resolution
+
+        lo_sec = window_lo * r
+        if since_ts is not None:
+            lo_sec = max(lo_sec, math.floor(since_ts))
+        end = (level.newest + 1) * r
+
+        bucket = lo_sec - lo_sec % bucket_seconds
+        while bucket < end:
+            lo = max(bucket, lo_sec)
+            hi = min(bucket + bucket_seconds, end)
+            if lo % r:
+                result = self._range_fine(lo, hi)
+            else:
+                result = self._range(level, lo, hi)
+            if result is not None and result[0][0]:
+                distinct = self._sketches(sketched[-1], lo, hi) if sketched else []
+                yield bucket, result[0], result[1], distinct
+            bucket += bucket_seconds
+
+    @staticmethod
+    def _range(
+        level: _RollupLevel, lo_sec: int, hi_sec: int
+    ) -> Optional[tuple[list[int], list[dict[str, int]]]]:
+        r = level.resolution
+        key_lo = max(lo_sec // r, level.window_lo)  # type: ignore[type-var]
+        key_hi = min(-(-hi_sec // r), level.newest + 1)  # type: ignore[operator]
+        if key_hi <= key_lo:
+            return None
+        return level.sums(key_lo, key_hi), level.breakdown(key_lo, key_hi)
+
+    @staticmethod
+    def _sketches(level: _RollupLevel, lo_sec: int, hi_sec: int) -> list[list[bytes]]:
+        r = level.resolution
+        window_lo = level.window_lo
+        if window_lo is None or level.newest is None:
+            return [[] for _ in range(level.distinct)]
+        key_lo = max(lo_sec // r, window_lo)
+        key_hi = min(-(-hi_sec // r), level.newest + 1)
+        return level.sketches(key_lo, key_hi)
+
+    def _range_fine(
+        self, lo_sec: int, hi_sec: int
+    ) -> Optional[tuple[list[int], list[dict[str, int]]]]:
+        for level in self._levels:
+            if level.newest is None:
+                continue
+            if (level.newest - level.slots + 1) * level.resolution <= lo_sec:
+                return self._range(level, lo_sec, hi_sec)
+        return None
@@ -0,0 +1,42 @@
+"""
+API 响应的 JSON 编码。
+
+优先使用 orjson（C 实现，直接编码 dict / datetime，比 pydantic 先构造模型再序列化快一个数量级），
+未安装时退化为标准库 json。输出与 pydantic 的 JSON 一致：datetime 为 UTC、"Z" 结尾。
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from typing import Any
+
+from pydantic import BaseModel
+
+
+def _default(obj: Any) -> Any:
+    # pydantic 模型（聚合桶、排行等）按字段编码，不经过 model_dump
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    raise TypeError(f"无法编码为 JSON: {type(obj).__name__}")
+
+
+try:
+    import orjson
+
+    def dumps(obj: Any) -> bytes:
+        """编码记录字典 / pydantic 模型（可嵌套在列表中）为 JSON 字节串。"""
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_UTC_Z)
+
+except ImportError:  # pragma: no cover - 取决于运行环境
+
+    def _default_std(obj: Any) -> Any:
+        if isinstance(obj, datetime):
+            return obj.isoformat().replace("+00:00", "Z")
+        return _default(obj)
+
+    def dumps(obj: Any) -> bytes:
+        """编码记录字典 / pydantic 模型（可嵌套在列表中）为 JSON 字节串。"""
+        return json.dumps(
+            obj, default=_default_std, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
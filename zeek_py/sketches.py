@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import math
+from collections import Counter
+from heapq import nlargest
+from operator import itemgetter
+from typing import Hashable, Iterable, Mapping, Optional, Sequence
+
+# 默认时间窗：1 分钟一个摘要，保留 60 个（最近 1 小时）
+DEFAULT_WINDOW_SECONDS = 60
+DEFAULT_WINDOWS = 60
+
+
+class _SpaceSaving:
+    """
+    单个时间窗内的 Space-Saving 摘要：最多跟踪 capacity 个 key。
+
+    - counts[key] 是 key 累计值的上界，errors[key] 是最大高估量（缺省为 0），
+      真实值落在 [counts - errors, counts] 内；
+    - floor 是未被跟踪的 key 累计值的上界（被淘汰计数的最大值）；
+    - 按批合并：批内先精确汇总，新 key 以 floor 为起点计入（可合并摘要的标准做法），
+      代价与批内不同 key 的数量有关，而非行数；
+    - 跟踪的 key 超过 2 × capacity 时才截断回 capacity 个，截断代价均摊到每个 key
+      上是常数；截断线上并列的 key 一并淘汰，保证不会卡在上限之上。
+    """
+
+    __slots__ = ("capacity", "counts", "errors", "floor")
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.counts: dict[Hashable, int] = {}
+        self.errors: dict[Hashable, int] = {}
+        self.floor = 0
+
+    def merge(self, exact: Mapping[Hashable, int]) -> None:
+        counts = self.counts
+        errors = self.errors
+        floor = self.floor
+        get = counts.get
+        if not floor:
+            # 尚未截断过：所有计数都是精确值
+            for key, value in exact.items():
+                counts[key] = get(key, 0) + value
+        else:
+            for key, value in exact.items():
+                current = get(key)
+                if current is None:
+                    counts[key] = floor + value
+                    errors[key] = floor
+                else:
+                    counts[key] = current + value
+        if len(counts) > 2 * self.capacity:
+            cut = sorted(counts.values(), reverse=True)[self.capacity]
+            self.floor = max(floor, cut)
+            self.counts = {key: value for key, value in counts.items() if value > cut}
+            self.errors = {key: errors[key] for key in self.counts if key in errors}
+
+
+class HeavyHitters:
+    """
+    按时间窗滚动的 Top-N 统计（heavy hitters），在写入时增量更新。
+
+    每个时间窗一个 Space-Saving 摘要，内存上限为 windows × 2 × capacity 个 key，
+    与流经的记录条数无关；窗口外的摘要整体丢弃。查询时合并所选时间窗的摘要，
+    代价只与时间窗数量和 capacity 有关。
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        window_seconds: int = DEFAULT_WINDOW_SECONDS,
+        windows: int = DEFAULT_WINDOWS,
+    ) -> None:
+        self.capacity = capacity
+        self.window_seconds = window_seconds
+        self.windows = windows
+        self._summaries: dict[int, _SpaceSaving] = {}
+        self.newest: Optional[int] = None
+
+    def add(self, window: int, exact: Mapping[Hashable, int]) -> None:
+        """把某个时间窗（ts // window_seconds）内的精确汇总并入摘要。"""
+        if self.newest is None or window > self.newest:
+            self.newest = window
+            expired = window - self.windows
+            for key in [k for k in self._summaries if k <= expired]:
+                del self._summaries[key]
+        elif window <= self.newest - self.windows:
+            # 比保留范围还早的乱序数据
+            return
+        summary = self._summaries.get(window)
+        if summary is None:
+            summary = self._summaries[window] = _SpaceSaving(self.capacity)
+        summary.merge(exact)
+
+    def top(
+        self, n: int, since_ts: Optional[float] = None
+    ) -> list[tuple[Hashable, int, int]]:
+        """
+        返回 [(key, 估计值, 最大高估量)]，按估计值降序。
+
+        since_ts 按时间窗对齐：其所在的时间窗整体参与统计。
+        多个时间窗合并时，某窗未跟踪的 key 按该窗的 floor 计入，估计值仍是上界。
+        """
+        lo = -math.inf if since_ts is None else math.floor(since_ts) // self.window_seconds
+        picked = [s for w, s in self._summaries.items() if w >= lo]
+        base = sum(s.floor for s in picked)
+        counts: dict[Hashable, int] = {}
+        errors: dict[Hashable, int] = {}
+        for s in picked:
+            floor = s.floor
+            for key, value in s.counts.items():
+                counts[key] = counts.get(key, 0) + value - floor
+                errors[key] = errors.get(key, 0) + s.errors.get(key, 0) - floor
+        best = nlargest(n, counts.items(), key=itemgetter(1))
+        return [(key, base + value, base + errors[key]) for key, value in best]
+
+
+def window_totals(
+    ts: Sequence[float],
+    keys: Sequence[Hashable],
+    weights: Optional[Iterable[int]],
+    window_seconds: int,
+) -> list[tuple[int, dict[Hashable, int]]]:
+    """
+    把一批记录按时间窗精确汇总：[(时间窗, {key: 合计})]。weights 为 None 时按条数计。
+
+    整批落在同一时间窗（绝大多数情况）时一次汇总，计数走 C 层 Counter。
+    """
+    if not len(ts):
+        return []
+    first = math.floor(ts[0]) // window_seconds
+    if first == math.floor(min(ts)) // window_seconds == math.floor(max(ts)) // window_seconds:
+        if weights is None:
+            return [(first, Counter(keys))]
+        totals: dict[Hashable, int] = {}
+        get = totals.get
+        for key, weight in zip(keys, weights):
+            totals[key] = get(key, 0) + weight
+        return [(first, totals)]
+
+    grouped: dict[int, dict[Hashable, int]] = {}
+    for t, key, weight in zip(
+        ts, keys, weights if weights is not None else (1 for _ in keys)
+    ):
+        part = grouped.setdefault(math.floor(t) // window_seconds, {})
+        part[key] = part.get(key, 0) + weight
+    return sorted(grouped.items())
@@ -1,59 +1,1519 @@
 from __future__ import annotations
 
+import math
+import operator
+import secrets
 import threading
-from collections import deque
-from datetime import datetime
-from typing import Deque, List, Optional
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, deque
+from datetime import datetime, timezone
+from heapq import heappush, heapreplace
+from itertools import accumulate, chain, compress, groupby, islice, repeat
+from typing import (
+    Any,
+    Callable,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Protocol,
+    Sequence,
+    TypeVar,
+)
 
-from .models import Flow, ThreatEvent
+from .backends import StorageBackend, create_backend
+from .config import settings
+from .models import (
+    Flow,
+    FlowAggregateBucket,
+    FlowBatch,
+    FlowFilter,
+    HttpFlow,
+    ThreatAggregateBucket,
+    ThreatEvent,
+    ThreatFilter,
+    TopItem,
+)
+from .rollups import Rollup, cardinality, distinct_positions, hll_positions
+from .sketches import HeavyHitters, window_totals
+
+T = TypeVar("T")
+
+# 时间索引每块的目标大小：乱序插入/淘汰的代价受块大小限制，与缓冲总量无关
+_CHUNK_SIZE = 512
+
+
+class _TimeIndex:
+    """
+    按 (ts, seq) 排序的分块索引。
+
+    - ts 为 epoch 秒，seq 为记录到达序号（单调递增）；
+    - 顺序到达（绝大多数情况）时直接追加到最后一块；
+    - 乱序到达时先二分定位所在块，再块内插入，代价为 O(块大小)；
+    - 查询 since 时二分块首 ts 与块内 ts，为 O(log n)。
+    """
+
+    def __init__(self) -> None:
+        # 块内使用 array 紧凑存储，避免每个元素一个 Python float/int 对象
+        self._ts: list[array] = []
+        self._seq: list[array] = []
+        # 每块首元素的 ts，用于二分定位块
+        self._mins: list[float] = []
+
+    def insert(self, ts: float, seq: int) -> None:
+        if not self._ts or ts >= self._ts[-1][-1]:
+            if not self._ts or len(self._ts[-1]) >= _CHUNK_SIZE:
+                self._ts.append(array("d", (ts,)))
+                self._seq.append(array("q", (seq,)))
+                self._mins.append(ts)
+            else:
+                self._ts[-1].append(ts)
+                self._seq[-1].append(seq)
+            return
+
+        # 乱序：seq 总是当前最大值，放在相同 ts 的最后即可保持 (ts, seq) 有序
+        ci = max(bisect_right(self._mins, ts) - 1, 0)
+        chunk_ts = self._ts[ci]
+        chunk_seq = self._seq[ci]
+        pos = bisect_right(chunk_ts, ts)
+        chunk_ts.insert(pos, ts)
+        chunk_seq.insert(pos, seq)
+        self._mins[ci] = chunk_ts[0]
+        if len(chunk_ts) > 2 * _CHUNK_SIZE:
+            half = len(chunk_ts) // 2
+            self._ts[ci : ci + 1] = [chunk_ts[:half], chunk_ts[half:]]
+            self._seq[ci : ci + 1] = [chunk_seq[:half], chunk_seq[half:]]
+            self._mins[ci : ci + 1] = [chunk_ts[0], chunk_ts[half]]
+
+    def extend(self, ts: Sequence[float], seqs: Sequence[int]) -> None:
+        """
+        批量插入一段记录，seqs 与 ts 一一对应且递增（主索引为连续的 range）。
+
+        整段有序且不早于当前最大 ts 时（顺序到达）按块整段追加，否则逐条插入。
+        """
+        n = len(ts)
+        if not n:
+            return
+        if (self._ts and ts[0] < self._ts[-1][-1]) or not all(
+            map(operator.le, ts, islice(ts, 1, None))
+        ):
+            for t, seq in zip(ts, seqs):
+                self.insert(t, seq)
+            return
+
+        pos = 0
+        while pos < n:
+            if not self._ts or len(self._ts[-1]) >= _CHUNK_SIZE:
+                self._ts.append(array("d"))
+                self._seq.append(array("q"))
+                self._mins.append(ts[pos])
+            take = min(_CHUNK_SIZE - len(self._ts[-1]), n - pos)
+            self._ts[-1].extend(ts[pos : pos + take])
+            self._seq[-1].extend(seqs[pos : pos + take])
+            pos += take
+
+    def pop_front(self, seqs: Sequence[int]) -> int:
+        """
+        索引开头恰好依次是 seqs 时（顺序到达的常见情况）整段删除。
+
+        返回实际删除的条数，剩余部分由调用方逐条 remove。
+        """
+        count = len(seqs)
+        removed = 0
+        while removed < count and self._seq:
+            chunk_ts = self._ts[0]
+            chunk_seq = self._seq[0]
+            take = min(count - removed, len(chunk_seq))
+            expected = array("q", seqs[removed : removed + take])
+            if chunk_seq[:take] != expected:
+                take = 0
+                while take < len(expected) and chunk_seq[take] == expected[take]:
+                    take += 1
+                if take == 0:
+                    break
+            del chunk_ts[:take]
+            del chunk_seq[:take]
+            if chunk_ts:
+                self._mins[0] = chunk_ts[0]
+            else:
+                del self._ts[0]
+                del self._seq[0]
+                del self._mins[0]
+            removed += take
+            if removed < count and chunk_ts:
+                # 本块中间出现乱序插入的记录
+                break
+        return removed
+
+    def remove(self, ts: float, seq: int) -> None:
+        # 相同 ts 可能跨块，从可能包含它的第一块开始向后查找
+        ci = max(bisect_left(self._mins, ts) - 1, 0)
+        while ci < len(self._ts):
+            chunk_ts = self._ts[ci]
+            chunk_seq = self._seq[ci]
+            pos = bisect_left(chunk_ts, ts)
+            while pos < len(chunk_ts) and chunk_ts[pos] == ts:
+                if chunk_seq[pos] == seq:
+                    del chunk_ts[pos]
+                    del chunk_seq[pos]
+                    if chunk_ts:
+                        self._mins[ci] = chunk_ts[0]
+                    else:
+                        del self._ts[ci]
+                        del self._seq[ci]
+                        del self._mins[ci]
+                    return
+                pos += 1
+            if pos < len(chunk_ts):
+                return
+            ci += 1
+
+    def tail(
+        self,
+        limit: int,
+        since: Optional[float] = None,
+        accept: Optional[Callable[[int], bool]] = None,
+    ) -> list[int]:
+        """
+        从最新一端向前扫描，返回 ts >= since 的最后 limit 个 seq（按 ts 升序）。
+
+        不带 accept 过滤时只触及结果本身，代价为 O(log n + limit)。
+        """
+        out: list[int] = []
+        ci = len(self._ts) - 1
+        while ci >= 0 and len(out) < limit:
+            chunk_ts = self._ts[ci]
+            chunk_seq = self._seq[ci]
+            lo = 0
+            if since is not None and self._mins[ci] < since:
+                lo = bisect_left(chunk_ts, since)
+            for pos in range(len(chunk_ts) - 1, lo - 1, -1):
+                seq = chunk_seq[pos]
+                if accept is None or accept(seq):
+                    out.append(seq)
+                    if len(out) >= limit:
+                        break
+            if lo > 0:
+                break
+            ci -= 1
+        out.reverse()
+        return out
+
+
+class _HashIndex:
+    """
+    等值查询的哈希索引：key -> 按 seq 递增的 seq 列表（array）。
+
+    - 写入时按 seq 顺序追加，seq 单调递增，列表天然有序；
+    - 淘汰时不逐条删除：查询时二分跳过 < first_seq 的部分，失效条目超过有效条目时
+      统一清理（与 _StringTable 相同的均摊策略），写入/淘汰均摊为 O(1)；
+    - buckets > 0 时按 hash(key) 分桶，用于 uid 这类几乎不重复的 key，
+      避免每个 key 一个列表；同桶的其它 key 由调用方按完整条件复核。
+    """
+
+    _MIN_PRUNE = 1 << 16
+
+    def __init__(self, buckets: int = 0) -> None:
+        self._postings: dict[object, array] = {}
+        self._buckets = buckets
+        self._entries = 0
+        self._prune_at = self._MIN_PRUNE
+
+    def add(self, seqs: Iterable[int], keys: Iterable[object]) -> None:
+        """
+        登记一批 (seq, key)，key 为 None 的跳过；seq 须大于已登记的所有 seq。
+
+        与 _StringTable.intern_many 相同：查表与追加都在 C 层逐条完成，
+        只有新出现的 key 在 Python 层逐个建表。
+        """
+        seqs = list(seqs)
+        keys = list(keys)
+        if None in keys:
+            present = list(map(operator.is_not, keys, repeat(None)))
+            seqs = list(compress(seqs, present))
+            keys = list(compress(keys, present))
+        if self._buckets:
+            keys = list(map(operator.mod, map(hash, keys), repeat(self._buckets)))
+        postings = self._postings
+        found = list(map(postings.get, keys))
+        if None in found:
+            for i in compress(range(len(found)), map(operator.is_, found, repeat(None))):
+                posting = postings.get(keys[i])
+                if posting is None:
+                    posting = postings[keys[i]] = array("q")
+                found[i] = posting
+        deque(map(array.append, found, seqs), maxlen=0)
+        self._entries += len(seqs)
+
+    def prune(self, first_seq: int) -> None:
+        if self._entries <= self._prune_at:
+            return
+        postings = self._postings
+        live = 0
+        for key in list(postings):
+            posting = postings[key]
+            cut = bisect_left(posting, first_seq)
+            if cut == len(posting):
+                del postings[key]
+                continue
+            if cut:
+                del posting[:cut]
+            live += len(posting)
+        self._entries = live
+        self._prune_at = max(self._MIN_PRUNE, 2 * live)
+
+    def lookup(self, key: object, first_seq: int) -> tuple[array, int]:
+        """返回 (seq 列表, 首个未淘汰条目的下标)，列表只读。"""
+        if self._buckets:
+            key = hash(key) % self._buckets
+        posting = self._postings.get(key)
+        if posting is None:
+            return _EMPTY_POSTING, 0
+        return posting, bisect_left(posting, first_seq)
+
+
+_EMPTY_POSTING = array("q")
+
+# 哈希索引的 key 提取：(items, lo, hi, 首行 seq) -> (seq 序列, key 序列)，两者一一对应
+IndexKeys = Callable[[object, int, int, int], tuple[Iterable[int], Iterable[object]]]
+
+
+def _column_keys(name: str) -> IndexKeys:
+    """FlowBatch 某一列作为 key。"""
+
+    def keys(items: object, lo: int, hi: int, first: int) -> tuple[Iterable[int], Iterable[object]]:
+        return range(first, first + hi - lo), getattr(items, name)[lo:hi]
+
+    return keys
+
+
+def _attr_keys(name: str) -> IndexKeys:
+    """记录对象（ThreatEvent / HttpFlow）的某个属性作为 key。"""
+    get = operator.attrgetter(name)
+
+    def keys(items: object, lo: int, hi: int, first: int) -> tuple[Iterable[int], Iterable[object]]:
+        return range(first, first + hi - lo), map(get, items[lo:hi])  # type: ignore[index]
+
+    return keys
+
+
+def _flow_port_keys(items: object, lo: int, hi: int, first: int) -> tuple[Iterable[int], Iterable[object]]:
+    """port 同时匹配 orig_p 与 resp_p：每行登记两个端口（相同时只登记一次），按 seq 交错。"""
+    batch: FlowBatch = items  # type: ignore[assignment]
+    seqs = range(first, first + hi - lo)
+    orig_p = batch.orig_p[lo:hi]
+    resp_p = batch.resp_p[lo:hi]
+    # 与 orig_p 相同的 resp_p 记为 None，由 add 跳过
+    resp_p = list(map(_port_or_none, orig_p, resp_p))
+    return (
+        chain.from_iterable(zip(seqs, seqs)),
+        chain.from_iterable(zip(orig_p, resp_p)),
+    )
+
+
+def _port_or_none(orig_p: int, resp_p: int) -> Optional[int]:
+    return None if resp_p == orig_p else resp_p
+
+
+class _SlotStore(Protocol[T]):
+    """环形缓冲槽位中记录的存储方式。"""
+
+    def put_range(self, slot: int, items: object, lo: int, hi: int) -> None:
+        """把 items 的 [lo, hi) 行写入 [slot, slot + hi - lo) 槽位（不跨越环尾）。"""
+        ...
+
+    def row(self, slot: int) -> object: ...
+
+    def rows(self, slots: Sequence[int]) -> list[object]:
+        """批量取出多个槽位，结果与逐个 row 相同。"""
+        ...
+
+    def build(self, ts: float, row: object) -> T: ...
+
+    def record(self, ts: float, row: object) -> dict[str, Any]:
+        """与 build 相同字段的 dict（不构造模型），供 API 直接编码为 JSON。"""
+        ...
+
+
+class _ObjectSlots(Generic[T]):
+    """直接保存记录对象，适合数量较少的告警事件。"""
+
+    def __init__(self) -> None:
+        self._items: list[T] = []
+
+    def put_range(self, slot: int, items: object, lo: int, hi: int) -> None:
+        rows = items[lo:hi]  # type: ignore[index]
+        if slot == len(self._items):
+            self._items.extend(rows)
+        else:
+            self._items[slot : slot + hi - lo] = rows
+
+    def row(self, slot: int) -> object:
+        return self._items[slot]
+
+    def rows(self, slots: Sequence[int]) -> list[object]:
+        return list(map(self._items.__getitem__, slots))
+
+    def build(self, ts: float, row: object) -> T:
+        return row  # type: ignore[return-value]
+
+    def record(self, ts: float, row: object) -> dict[str, Any]:
+        # pydantic 模型的字段值就在 __dict__ 中，只读使用，不复制
+        return row.__dict__
+
+
+class _StringTable:
+    """
+    字符串驻留表，id 0 固定表示 None。
+
+    写入时不做逐条引用计数；已无记录引用的字符串在表大小超过上次整理后的
+    两倍时统一清理（见 _FlowColumns._compact），均摊到每条记录为 O(1)。
+    """
+
+    _MIN_COMPACT = 4096
+
+    def __init__(self) -> None:
+        # None -> 0 常驻，便于批量查表
+        self._ids: dict[Optional[str], int] = {None: 0}
+        self._strs: list[Optional[str]] = [None]
+        self.compact_at = self._MIN_COMPACT
+
+    def __len__(self) -> int:
+        return len(self._strs) - 1
+
+    def intern_many(self, values: Sequence[Optional[str]]) -> array:
+        """批量驻留，返回 id 列；已有的字符串在 C 层查表，只有新字符串逐个登记。"""
+        ids = self._ids
+        found = list(map(ids.get, values))
+        if None in found:
+            strs = self._strs
+            for i, sid in enumerate(found):
+                if sid is None:
+                    value = values[i]
+                    sid = ids.get(value)
+                    if sid is None:
+                        sid = ids[value] = len(strs)
+                        strs.append(value)
+                    found[i] = sid
+        return array("I", found)
+
+    def lookup(self, sid: int) -> Optional[str]:
+        return self._strs[sid]
+
+    def lookup_many(self, sids: Iterable[int]) -> Iterator[Optional[str]]:
+        return map(self._strs.__getitem__, sids)
+
+    def compact(self, live: set[int]) -> list[int]:
+        """只保留 live 中的 id，返回 旧 id -> 新 id 的映射表（按旧 id 下标）。"""
+        remap = [0] * len(self._strs)
+        strs: list[Optional[str]] = [None]
+        ids: dict[Optional[str], int] = {None: 0}
+        for old in sorted(live):
+            if old == 0:
+                continue
+            value = self._strs[old]
+            remap[old] = ids[value] = len(strs)
+            strs.append(value)
+        self._strs = strs
+        self._ids = ids
+        self.compact_at = max(self._MIN_COMPACT, 2 * len(strs))
+        return remap
+
+
+# uid 按定长 ASCII 存放；Zeek 生成的 uid 一般不超过 20 个字符，超长的放入溢出表
+_UID_WIDTH = 22
+_UID_OVERFLOW = b"\xff" * _UID_WIDTH
+
+
+class _FlowColumns:
+    """
+    按列存放 Flow，取代逐条保存 pydantic 对象。
+
+    - 端口、字节数、持续时间使用 array 定长列，缺失值分别用 -1 / NaN 表示；
+    - 主机、proto、service、conn_state 驻留为整数 id；
+    - 只有在 API 取出一页数据时才构造 Flow 模型。
+
+    单条记录约 100 字节（含时间索引），百万级 Flow 仅需约百 MB 内存。
+    """
+
+    def __init__(self) -> None:
+        self._hosts = _StringTable()
+        self._protos = _StringTable()
+        self._services = _StringTable()
+        self._states = _StringTable()
+
+        self._uid = bytearray()
+        self._uid_overflow: dict[int, str] = {}
+        self._orig_h = array("I")
+        self._resp_h = array("I")
+        self._orig_p = array("H")
+        self._resp_p = array("H")
+        self._proto = array("I")
+        self._service = array("I")
+        self._conn_state = array("I")
+        self._duration = array("d")
+        self._orig_bytes = array("q")
+        self._resp_bytes = array("q")
+
+    def put_range(self, slot: int, items: object, lo: int, hi: int) -> None:
+        batch: FlowBatch = items  # type: ignore[assignment]
+        end = slot + hi - lo
+        appending = slot == len(self._orig_h)
+        if not appending and self._uid_overflow:
+            for s in range(slot, end):
+                self._uid_overflow.pop(s, None)
+
+        uids = list(map(str.encode, batch.uid[lo:hi], repeat("ascii"), repeat("replace")))
+        if uids and max(map(len, uids)) > _UID_WIDTH:
+            for i, uid in enumerate(uids):
+                if len(uid) > _UID_WIDTH:
+                    self._uid_overflow[slot + i] = batch.uid[lo + i]
+                    uids[i] = _UID_OVERFLOW
+        packed = b"".join(map(bytes.ljust, uids, repeat(_UID_WIDTH), repeat(b"\0")))
+
+        # 两个主机列共用一张驻留表，合并为一次查表
+        hosts = self._hosts.intern_many(batch.orig_h[lo:hi] + batch.resp_h[lo:hi])
+        columns = (
+            (self._orig_h, hosts[: end - slot]),
+            (self._resp_h, hosts[end - slot :]),
+            (self._orig_p, batch.orig_p[lo:hi]),
+            (self._resp_p, batch.resp_p[lo:hi]),
+            (self._proto, self._protos.intern_many(batch.proto[lo:hi])),
+            (self._service, self._services.intern_many(batch.service[lo:hi])),
+            (self._conn_state, self._states.intern_many(batch.conn_state[lo:hi])),
+            (self._duration, batch.duration[lo:hi]),
+            (self._orig_bytes, batch.orig_bytes[lo:hi]),
+            (self._resp_bytes, batch.resp_bytes[lo:hi]),
+        )
+        if appending:
+            self._uid += packed
+            for column, values in columns:
+                column.extend(values)
+        else:
+            self._uid[slot * _UID_WIDTH : end * _UID_WIDTH] = packed
+            for column, values in columns:
+                column[slot:end] = values
+        self._compact()
+
+    def _compact(self) -> None:
+        """驻留表膨胀到阈值时，只保留仍被列引用的字符串并重写 id 列。"""
+        for table, columns in (
+            (self._hosts, (self._orig_h, self._resp_h)),
+            (self._protos, (self._proto,)),
+            (self._services, (self._service,)),
+            (self._states, (self._conn_state,)),
+        ):
+            if len(table) <= table.compact_at:
+                continue
+            live: set[int] = set()
+            for column in columns:
+                live.update(column)
+            remap = table.compact(live)
+            for column in columns:
+                column[:] = array("I", map(remap.__getitem__, column))
+
+    def row(self, slot: int) -> object:
+        raw_uid = bytes(self._uid[slot * _UID_WIDTH : (slot + 1) * _UID_WIDTH])
+        if raw_uid == _UID_OVERFLOW:
+            uid = self._uid_overflow[slot]
+        else:
+            uid = raw_uid.rstrip(b"\0").decode("ascii")
+        return (
+            uid,
+            self._hosts.lookup(self._orig_h[slot]),
+            self._orig_p[slot],
+            self._hosts.lookup(self._resp_h[slot]),
+            self._resp_p[slot],
+            self._protos.lookup(self._proto[slot]),
+            self._services.lookup(self._service[slot]),
+            self._duration[slot],
+            self._orig_bytes[slot],
+            self._resp_bytes[slot],
+            self._states.lookup(self._conn_state[slot]),
+        )
+
+    def rows(self, slots: Sequence[int]) -> list[object]:
+        """按列批量取出（每列一次 C 层 map），比逐行 row 快数倍。"""
+        width = _UID_WIDTH
+        uid_col = self._uid
+        overflow = self._uid_overflow
+        uids = [
+            overflow[slot] if raw == _UID_OVERFLOW else raw.rstrip(b"\0").decode("ascii")
+            for slot, raw in zip(
+                slots, [bytes(uid_col[s * width : (s + 1) * width]) for s in slots]
+            )
+        ]
+
+        def column(col: array) -> Iterator:
+            return map(col.__getitem__, slots)
+
+        hosts = self._hosts.lookup_many
+        return list(
+            zip(
+                uids,
+                hosts(column(self._orig_h)),
+                column(self._orig_p),
+                hosts(column(self._resp_h)),
+                column(self._resp_p),
+                self._protos.lookup_many(column(self._proto)),
+                self._services.lookup_many(column(self._service)),
+                column(self._duration),
+                column(self._orig_bytes),
+                column(self._resp_bytes),
+                self._states.lookup_many(column(self._conn_state)),
+            )
+        )
+
+    def build(self, ts: float, row: object) -> Flow:
+        (
+            uid,
+            orig_h,
+            orig_p,
+            resp_h,
+            resp_p,
+            proto,
+            service,
+            duration,
+            orig_bytes,
+            resp_bytes,
+            conn_state,
+        ) = row  # type: ignore[misc]
+        # 列中的数据均来自已校验的 Flow，这里跳过重复校验
+        return Flow.model_construct(
+            ts=datetime.fromtimestamp(ts, tz=timezone.utc),
+            uid=uid,
+            orig_h=orig_h,
+            orig_p=orig_p,
+            resp_h=resp_h,
+            resp_p=resp_p,
+            proto=proto,
+            service=service,
+            duration=None if duration != duration else duration,
+            orig_bytes=None if orig_bytes < 0 else orig_bytes,
+            resp_bytes=None if resp_bytes < 0 else resp_bytes,
+            conn_state=conn_state,
+        )
+
+    def record(self, ts: float, row: object) -> dict[str, Any]:
+        (
+            uid,
+            orig_h,
+            orig_p,
+            resp_h,
+            resp_p,
+            proto,
+            service,
+            duration,
+            orig_bytes,
+            resp_bytes,
+            conn_state,
+        ) = row  # type: ignore[misc]
+        return {
+            "ts": datetime.fromtimestamp(ts, tz=timezone.utc),
+            "uid": uid,
+            "orig_h": orig_h,
+            "orig_p": orig_p,
+            "resp_h": resp_h,
+            "resp_p": resp_p,
+            "proto": proto,
+            "service": service,
+            "duration": None if duration != duration else duration,
+            "orig_bytes": None if orig_bytes < 0 else orig_bytes,
+            "resp_bytes": None if resp_bytes < 0 else resp_bytes,
+            "conn_state": conn_state,
+        }
+
+
+class _TimeIndexedBuffer(Generic[T]):
+    """
+    定长环形缓冲 + 时间索引。
+
+    - 记录按到达顺序写入环形槽位，满后淘汰最早到达的记录；
+    - 同时在 _TimeIndex 中维护 (ts, seq)，支持按时间二分查询；
+    - 所有操作的代价与缓冲总量无关（只与块大小/返回条数有关）；
+    - 槽位内容由 _SlotStore 决定如何存放，持锁期间只取出原始行，
+      构造模型的开销放在锁外（见 build）；
+    - 可选的哈希索引（indexes，名称 -> key 提取）支持按字段等值查找，
+      查询只扫描命中的记录（见 lookup）。
+    """
+
+    def __init__(
+        self,
+        maxlen: int,
+        store: _SlotStore[T],
+        key_of: Optional[Callable[[object, int, int], Sequence[Optional[str]]]] = None,
+        indexes: Optional[Mapping[str, tuple[_HashIndex, IndexKeys]]] = None,
+    ) -> None:
+        self._maxlen = maxlen
+        self._store = store
+        self._slot_ts = array("d")
+        self._first_seq = 0
+        self._next_seq = 0
+        self._index = _TimeIndex()
+        # 已淘汰记录的最大 ts：ts 大于该值的记录一定仍在缓冲中
+        self.evicted_max_ts = -math.inf
+        # 按 key（例如 flow 的 service）分区的时间索引：key_of 给出 items 中 [lo, hi) 行的 key，
+        # 每个槽位记录 key 的 id（0 表示无 key），同一分区的查询直接在分区索引上切片
+        self._key_of = key_of
+        self._slot_key = array("I")
+        self._key_ids: dict[Optional[str], int] = {None: 0}
+        self._partitions: dict[int, _TimeIndex] = {}
+        # 哈希索引按 seq 顺序而非 ts 顺序登记，按 ts 取最新记录时需要知道
+        # 更早到达的记录最大可能的 ts：_slot_maxts 为截至该槽位记录（按到达顺序）的 ts 最大值
+        self._indexes = dict(indexes or {})
+        self._slot_maxts = array("d")
+        self._max_ts = -math.inf
+
+    def __len__(self) -> int:
+        return self._next_seq - self._first_seq
+
+    def extend(self, ts: array, items: object) -> None:
+        """
+        按到达顺序批量写入，ts（array("d")）与 items 的行一一对应，
+        items 的形式由 _SlotStore 决定。满后淘汰最早到达的记录。
+        """
+        n = len(ts)
+        pos = 0
+        while pos < n:
+            # 每段写到环尾为止，保证槽位连续
+            slot = self._next_seq % self._maxlen
+            k = min(n - pos, self._maxlen - slot)
+            over = len(self) + k - self._maxlen
+            if over > 0:
+                self._evict(over)
+            self._store.put_range(slot, items, pos, pos + k)
+            seg = ts[pos : pos + k]
+            if slot == len(self._slot_ts):
+                self._slot_ts.extend(seg)
+            else:
+                self._slot_ts[slot : slot + k] = seg
+            self._index.extend(seg, range(self._next_seq, self._next_seq + k))
+            if self._key_of is not None:
+                self._index_keys(slot, seg, self._key_of(items, pos, pos + k))
+            if self._indexes:
+                self._index_hashed(slot, seg, items, pos, pos + k)
+            self._next_seq += k
+            pos += k
+        for index, _ in self._indexes.values():
+            index.prune(self._first_seq)
+
+    def _index_hashed(self, slot: int, seg: array, items: object, lo: int, hi: int) -> None:
+        maxts = array("d", accumulate(seg, max, initial=self._max_ts))[1:]
+        self._max_ts = maxts[-1]
+        if slot == len(self._slot_maxts):
+            self._slot_maxts.extend(maxts)
+        else:
+            self._slot_maxts[slot : slot + len(maxts)] = maxts
+        for index, keys_of in self._indexes.values():
+            index.add(*keys_of(items, lo, hi, self._next_seq))
+
+    def _index_keys(self, slot: int, seg: array, keys: Sequence[Optional[str]]) -> None:
+        ids = self._key_ids
+        kids = array("I", [ids[k] if k in ids else ids.setdefault(k, len(ids)) for k in keys])
+        if slot == len(self._slot_key):
+            self._slot_key.extend(kids)
+        else:
+            self._slot_key[slot : slot + len(kids)] = kids
+        if kids.count(0) == len(kids):
+            return
+        rows: dict[int, list[int]] = {}
+        for i, kid in enumerate(kids):
+            if kid:
+                rows.setdefault(kid, []).append(i)
+        first = self._next_seq
+        for kid, idx in rows.items():
+            part = self._partitions.get(kid)
+            if part is None:
+                part = self._partitions[kid] = _TimeIndex()
+            part.extend([seg[i] for i in idx], [first + i for i in idx])
+
+    def _evict(self, count: int) -> None:
+        first = self._first_seq
+        removed = self._index.pop_front(range(first, first + count))
+        for seq in range(first + removed, first + count):
+            self._index.remove(self._slot_ts[seq % self._maxlen], seq)
+        if self._partitions:
+            self._evict_keys(first, count)
+
+        start = first % self._maxlen
+        end = start + count
+        if end <= self._maxlen:
+            evicted_max = max(self._slot_ts[start:end])
+        else:
+            evicted_max = max(max(self._slot_ts[start:]), max(self._slot_ts[: end - self._maxlen]))
+        self._first_seq += count
+        if evicted_max > self.evicted_max_ts:
+            self.evicted_max_ts = evicted_max
+
+    def _evict_keys(self, first: int, count: int) -> None:
+        rows: dict[int, list[int]] = {}
+        for seq in range(first, first + count):
+            kid = self._slot_key[seq % self._maxlen]
+            if kid:
+                rows.setdefault(kid, []).append(seq)
+        for kid, seqs in rows.items():
+            part = self._partitions[kid]
+            removed = part.pop_front(seqs)
+            for seq in seqs[removed:]:
+                part.remove(self._slot_ts[seq % self._maxlen], seq)
+
+    def row(self, seq: int) -> tuple[float, object]:
+        slot = seq % self._maxlen
+        return self._slot_ts[slot], self._store.row(slot)
+
+    def rows(self, seqs: Iterable[int]) -> list[tuple[float, object]]:
+        maxlen = self._maxlen
+        slots = [seq % maxlen for seq in seqs]
+        return list(zip(map(self._slot_ts.__getitem__, slots), self._store.rows(slots)))
+
+    def build(self, rows: list[tuple[float, object]]) -> list[T]:
+        build = self._store.build
+        return [build(ts, row) for ts, row in rows]
+
+    def records(self, rows: list[tuple[float, object]]) -> list[dict[str, Any]]:
+        record = self._store.record
+        return [record(ts, row) for ts, row in rows]
+
+    @property
+    def indexed(self) -> Mapping[str, object]:
+        """建有哈希索引的字段名。"""
+        return self._indexes
+
+    def lookup(self, name: str, value: object) -> tuple[array, int]:
+        """哈希索引 name 中 value 对应的 (seq 列表, 起始下标)，下标之后均未淘汰。"""
+        return self._indexes[name][0].lookup(value, self._first_seq)
+
+    def lookup_size(self, name: str, value: object) -> int:
+        """命中条数（分桶索引为同桶条数），用于挑选最有选择性的索引。"""
+        posting, start = self.lookup(name, value)
+        return len(posting) - start
+
+    def tail(
+        self,
+        limit: int,
+        since: Optional[float] = None,
+        accept: Optional[Callable[[object], bool]] = None,
+        key: Optional[str] = None,
+        lookup: Optional[tuple[str, object]] = None,
+    ) -> list[tuple[float, object]]:
+        """
+        ts >= since 的最后 limit 条；指定 key 时只在该分区的索引上查找，
+        指定 lookup=(索引名, 值) 时只扫描该哈希索引命中的记录（accept 仍需包含该条件）。
+        """
+        if lookup is not None:
+            return self._lookup_tail(self.lookup(*lookup), limit, since, accept)
+        index = self._index
+        if key is not None:
+            part = self._partitions.get(self._key_ids.get(key, 0))
+            if part is None:
+                return []
+            index = part
+        seq_accept = None
+        if accept is not None:
+            seq_accept = lambda seq: accept(self.row(seq)[1])  # noqa: E731
+        return self.rows(index.tail(limit, since, seq_accept))
+
+    def _lookup_tail(
+        self,
+        found: tuple[array, int],
+        limit: int,
+        since: Optional[float],
+        accept: Optional[Callable[[object], bool]],
+    ) -> list[tuple[float, object]]:
+        """
+        从最新到达的命中记录向前扫描，用小顶堆保留 (ts, seq) 最大的 limit 条。
+
+        更早到达的记录 ts 不超过 _slot_maxts，低于 since 或不可能进入前 limit 条时即停止；
+        记录基本按时间到达，实际只多扫描乱序的部分。
+        """
+        posting, start = found
+        maxlen = self._maxlen
+        slot_ts = self._slot_ts
+        slot_maxts = self._slot_maxts
+        row = self._store.row
+        heap: list[tuple[float, int, object]] = []
+        for i in range(len(posting) - 1, start - 1, -1):
+            seq = posting[i]
+            slot = seq % maxlen
+            bound = slot_maxts[slot]
+            if since is not None and bound < since:
+                break
+            if len(heap) >= limit and bound <= heap[0][0]:
+                break
+            ts = slot_ts[slot]
+            if since is not None and ts < since:
+                continue
+            if len(heap) >= limit and (ts, seq) < heap[0][:2]:
+                continue
+            item = row(slot)
+            if accept is not None and not accept(item):
+                continue
+            if len(heap) < limit:
+                heappush(heap, (ts, seq, item))
+            else:
+                heapreplace(heap, (ts, seq, item))
+        heap.sort()
+        return [(ts, item) for ts, _, item in heap]
+
+    @property
+    def last_seq(self) -> int:
+        """最近写入记录的 seq；尚无记录时为 -1。"""
+        return self._next_seq - 1
+
+    def after(
+        self,
+        after_seq: int,
+        limit: int,
+        accept: Optional[Callable[[object], bool]] = None,
+        key: Optional[str] = None,
+        lookup: Optional[tuple[str, object]] = None,
+    ) -> tuple[list[tuple[float, object]], int, int]:
+        """
+        按到达顺序返回 seq > after_seq 的至多 limit 条记录。
+
+        槽位即 seq % maxlen，定位起点为 O(1)，代价只与扫描条数有关；
+        指定 lookup 时二分定位哈希索引中的起点，只扫描命中的记录。
+        返回 (行, 最后扫描到的 seq, 因已淘汰而跳过的条数)。
+        """
+        start = after_seq + 1
+        skipped = 0
+        if start < self._first_seq:
+            skipped = self._first_seq - start
+            start = self._first_seq
+        end = self._next_seq
+        if start > end:
+            # 超出当前最大 seq 的游标（例如来自重启前）：从最新位置继续
+            start = end
+        if lookup is not None:
+            posting, first = self.lookup(*lookup)
+            rows: list[tuple[float, object]] = []
+            for i in range(bisect_left(posting, start, first), len(posting)):
+                ts, row = self.row(posting[i])
+                if accept is None or accept(row):
+                    rows.append((ts, row))
+                    if len(rows) >= limit:
+                        return rows, posting[i], skipped
+            return rows, end - 1, skipped
+        if accept is None and key is None:
+            stop = min(end, start + limit)
+            return self.rows(range(start, stop)), stop - 1, skipped
+        # 指定 key 时先比较槽位的 key id，不属于该分区的记录不必取出整行
+        kid = self._key_ids.get(key, -1) if key is not None else None
+        slot_key = self._slot_key
+        maxlen = self._maxlen
+        rows = []
+        seq = start
+        while seq < end and len(rows) < limit:
+            if kid is None or slot_key[seq % maxlen] == kid:
+                ts, row = self.row(seq)
+                if accept is None or accept(row):
+                    rows.append((ts, row))
+            seq += 1
+        return rows, seq - 1, skipped
+
+
+def _flow_service(batch: object, lo: int, hi: int) -> Sequence[Optional[str]]:
+    return batch.service[lo:hi]  # type: ignore[attr-defined]
+
+
+def _uid_buckets(maxlen: int) -> int:
+    # uid 基本不重复：平均每桶约 64 条，桶少则写入时访问的内存集中
+    return max(1, maxlen // 64)
+
+
+def _flow_indexes(
+    maxlen: int, fields: Sequence[str] = settings.storage_flow_indexes
+) -> dict[str, tuple[_HashIndex, IndexKeys]]:
+    # proto 只有 tcp/udp/icmp，service 已有分区索引，二者只作为复核条件
+    available: dict[str, Callable[[], tuple[_HashIndex, IndexKeys]]] = {
+        "orig_h": lambda: (_HashIndex(), _column_keys("orig_h")),
+        "resp_h": lambda: (_HashIndex(), _column_keys("resp_h")),
+        "port": lambda: (_HashIndex(), _flow_port_keys),
+        "uid": lambda: (_HashIndex(_uid_buckets(maxlen)), _column_keys("uid")),
+        "conn_state": lambda: (_HashIndex(), _column_keys("conn_state")),
+    }
+    unknown = set(fields) - set(available)
+    if unknown:
+        raise ValueError(f"不支持建立索引的字段: {', '.join(sorted(unknown))}")
+    return {name: available[name]() for name in fields}
+
+
+def _uid_index(maxlen: int) -> dict[str, tuple[_HashIndex, IndexKeys]]:
+    return {"uid": (_HashIndex(_uid_buckets(maxlen)), _attr_keys("uid"))}
+
+
+def _threat_indexes() -> dict[str, tuple[_HashIndex, IndexKeys]]:
+    return {
+        "src": (_HashIndex(), _attr_keys("src")),
+        "dst": (_HashIndex(), _attr_keys("dst")),
+        "uid": (_HashIndex(), _attr_keys("uid")),
+    }
+
+
+# _FlowColumns.row 中各字段的位置
+_FLOW_ROW_FIELDS = {
+    "uid": 0,
+    "orig_h": 1,
+    "resp_h": 3,
+    "proto": 5,
+    "service": 6,
+    "conn_state": 10,
+}
+
+
+def _flow_accept(flt: FlowFilter) -> Optional[Callable[[object], bool]]:
+    checks = [
+        (_FLOW_ROW_FIELDS[name], value)
+        for name, value in flt._asdict().items()
+        if value is not None and name != "port"
+    ]
+    port = flt.port
+    if not checks and port is None:
+        return None
+
+    def accept(row: object) -> bool:
+        for pos, value in checks:
+            if row[pos] != value:  # type: ignore[index]
+                return False
+        return port is None or row[2] == port or row[4] == port  # type: ignore[index]
+
+    return accept
+
+
+def _object_accept(flt: NamedTuple) -> Optional[Callable[[object], bool]]:
+    checks = [(name, value) for name, value in flt._asdict().items() if value is not None]
+    if not checks:
+        return None
+    return lambda item: all(getattr(item, name) == value for name, value in checks)
+
+
+def _pick_lookup(buffer: _TimeIndexedBuffer, flt: NamedTuple) -> Optional[tuple[str, object]]:
+    """在有哈希索引的条件中挑命中条数最少的一个；没有可用索引时返回 None。"""
+    candidates = [
+        (name, value)
+        for name, value in flt._asdict().items()
+        if value is not None and name in buffer.indexed
+    ]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda c: buffer.lookup_size(*c))
+
+
+# 聚合桶中估计基数的字段（不同源 IP / 目的 IP / 目的端口数）
+_FLOW_DISTINCT_FIELDS = ("orig_h", "resp_h", "resp_p")
+
+# /api/flows/top 支持的维度与指标：flows 按条数，bytes 按 orig_bytes + resp_bytes
+FLOW_TOP_DIMENSIONS = ("orig_h", "resp_h", "resp_p")
+FLOW_TOP_METRICS = ("flows", "bytes")
+
+TopTotals = list[tuple[tuple[str, str], list[tuple[int, dict]]]]
+
+
+def _flow_top_totals(batch: FlowBatch, window_seconds: int) -> TopTotals:
+    """按维度 × 指标 × 时间窗精确汇总一批 flow，供合并进 Top-N 摘要（在锁外计算）。"""
+    size = [
+        (ob if ob > 0 else 0) + (rb if rb > 0 else 0)
+        for ob, rb in zip(batch.orig_bytes, batch.resp_bytes)
+    ]
+    totals: TopTotals = []
+    for dim in FLOW_TOP_DIMENSIONS:
+        keys = getattr(batch, dim)
+        totals.append(((dim, "flows"), window_totals(batch.ts, keys, None, window_seconds)))
+        totals.append(((dim, "bytes"), window_totals(batch.ts, keys, size, window_seconds)))
+    return totals
+
+
+class Page(NamedTuple):
+    """
+    一页查询结果。
+
+    - last_seq：下一页从此 seq 之后继续（作为 after_seq 传回），不会重复也不会遗漏；
+    - skipped：游标落后过多、期间已被淘汰出内存而无法返回的条数。
+    """
+
+    items: list
+    last_seq: int
+    skipped: int = 0
 
 
 class InMemoryStorage:
     """
     简单的内存存储，适合初版与开发调试。
 
-    - 使用 deque 限制最大条目数，防止内存无限增长。
+    - 使用定长环形缓冲限制最大条目数，防止内存无限增长；
+    - 按时间戳维护有序索引，since/limit 查询只触及结果部分，
+      持锁时间与缓冲大小无关；Zeek 乱序写入的记录也会插入到正确位置；
+    - Flow 按列紧凑存放（见 _FlowColumns），可常驻数百万条，并按 service 分区索引，
+      按 service 查询（如 HTTP 流量）直接在分区上切片；
+    - 主机 / 端口 / uid / conn_state（告警为 src / dst / uid）维护哈希索引，
+      按这些字段过滤时只扫描命中的记录，flow 与告警、HTTP 可按 uid 互相关联；
+    - http.log 解析出的 HttpFlow 单独存放，有自己的时间索引与 seq；
+    - 可选挂接持久化后端（见 backends）：写入时同步入队落盘，
+      查询范围超出内存覆盖的时间段时由后端补齐更早的数据；离线导入的历史记录
+      只写入后端（见 add_history），不挤占实时数据的内存缓冲；
+    - 写入时增量更新按秒汇总（见 rollups），聚合查询不再遍历原始记录；
+      flow 汇总另带每分钟 / 每小时的 HyperLogLog，估计不同主机与端口数；
+    - 写入时按时间窗更新 Top-N 摘要（见 sketches），源 / 目的 IP、目的端口的
+      流量排行覆盖远超缓冲容量的记录，内存固定；
+    - 每条记录写入时分配单调递增的 seq（流量与告警各自编号），
+      after_seq 分页从上次的位置精确续读（见 page_flows / page_threats）。
+      seq 只在本进程内有效，epoch 用于识别重启前的游标；
+    - 每类记录有写入版本号（version），每次写入加 1，API 响应缓存据此判断结果是否过期。
     """
 
-    def __init__(self, max_flows: int = 10_000, max_threats: int = 10_000) -> None:
-        self._flows: Deque[Flow] = deque(maxlen=max_flows)
-        self._threats: Deque[ThreatEvent] = deque(maxlen=max_threats)
+    def __init__(
+        self,
+        max_flows: int = settings.storage_max_flows,
+        max_threats: int = settings.storage_max_threats,
+        max_http: int = settings.storage_max_http,
+        backend: Optional[StorageBackend] = None,
+    ) -> None:
+        self._flows: _TimeIndexedBuffer[Flow] = _TimeIndexedBuffer(
+            max_flows, _FlowColumns(), key_of=_flow_service, indexes=_flow_indexes(max_flows)
+        )
+        self._threats: _TimeIndexedBuffer[ThreatEvent] = _TimeIndexedBuffer(
+            max_threats, _ObjectSlots(), indexes=_threat_indexes()
+        )
+        self._http: _TimeIndexedBuffer[HttpFlow] = _TimeIndexedBuffer(
+            max_http, _ObjectSlots(), indexes=_uid_index(max_http)
+        )
         self._lock = threading.Lock()
+        self._backend = backend
+        self.epoch = secrets.token_hex(4)
+        # 各类记录的写入版本号：写入与汇总回灌时持锁加 1
+        self._versions = {"flows": 0, "threats": 0, "http": 0}
+        # flow: (条数, orig_bytes 和, resp_bytes 和)；threat: (条数,) + level/note 细分
+        self._flow_rollup = Rollup(
+            metrics=3,
+            distinct=len(_FLOW_DISTINCT_FIELDS),
+            precision=settings.rollup_hll_precision,
+        )
+        self._threat_rollup = Rollup(metrics=1, breakdowns=2)
+        self._flow_top = {
+            (dim, metric): HeavyHitters(
+                settings.top_capacity, settings.top_window_seconds, settings.top_windows
+            )
+            for dim in FLOW_TOP_DIMENSIONS
+            for metric in FLOW_TOP_METRICS
+        }
+
+        if backend is not None:
+            # 重启后内存为空：后端中已有的时间段都视为“内存未覆盖”
+            flow_max_ts, threat_max_ts, http_max_ts = backend.max_ts()
+            if flow_max_ts is not None:
+                self._flows.evicted_max_ts = flow_max_ts
+            if threat_max_ts is not None:
+                self._threats.evicted_max_ts = threat_max_ts
+            if http_max_ts is not None:
+                self._http.evicted_max_ts = http_max_ts
+            if flow_max_ts is not None or threat_max_ts is not None:
+                threading.Thread(
+                    target=self._warm_rollups,
+                    args=(flow_max_ts, threat_max_ts),
+                    name="storage-rollup-warmup",
+                    daemon=True,
+                ).start()
+
+    def version(self, kind: str) -> int:
+        """flows / threats / http 的写入版本号：两次读取相同说明其间没有写入。"""
+        return self._versions[kind]
 
     def add_flow(self, flow: Flow) -> None:
-        with self._lock:
-            self._flows.append(flow)
+        self.add_flows((flow,))
 
     def add_threat(self, threat: ThreatEvent) -> None:
+        self.add_threats((threat,))
+
+    def add_flows(self, flows: Sequence[Flow]) -> None:
+        self.add_flow_batch(FlowBatch.from_flows(flows))
+
+    def add_flow_batch(self, batch: FlowBatch) -> None:
+        """
+        按列批量写入：解析端产生的 FlowBatch 直接写入列存储与汇总，
+        不构造 Flow 模型；整批只获取一次锁，并整批交给持久化后端。
+        """
+        self._add_flow_batch(batch, buffered=True)
+
+    def _add_flow_batch(self, batch: FlowBatch, buffered: bool) -> None:
+        if not len(batch):
+            return
+        top = _flow_top_totals(batch, settings.top_window_seconds)
+        distinct = distinct_positions(
+            batch.ts,
+            [getattr(batch, name) for name in _FLOW_DISTINCT_FIELDS],
+            settings.rollup_hll_precision,
+        )
         with self._lock:
-            self._threats.append(threat)
+            if buffered:
+                self._flows.extend(batch.ts, batch)
+            else:
+                self._mark_backend_only(self._flows, max(batch.ts))
+            # 缺失的字节数（-1）在汇总中按 0 计
+            self._flow_rollup.add_many(
+                batch.ts, (batch.orig_bytes, batch.resp_bytes), missing=-1
+            )
+            for sec, positions in distinct:
+                self._flow_rollup.add_distinct(sec, positions)
+            for name, parts in top:
+                sketch = self._flow_top[name]
+                for window, exact in parts:
+                    sketch.add(window, exact)
+            self._versions["flows"] += 1
+        if self._backend is not None:
+            self._backend.write_flow_batch(batch)
+
+    def add_threats(self, threats: Sequence[ThreatEvent]) -> None:
+        """批量写入：整批只获取一次锁，并整批交给持久化后端。"""
+        self._add_threats(threats, buffered=True)
+
+    def _add_threats(self, threats: Sequence[ThreatEvent], buffered: bool) -> None:
+        items = list(threats)
+        if not items:
+            return
+        ts = array("d", [t.ts.timestamp() for t in items])
+        with self._lock:
+            if buffered:
+                self._threats.extend(ts, items)
+            else:
+                self._mark_backend_only(self._threats, max(ts))
+            for t, threat in zip(ts, items):
+                self._threat_rollup.add(t, (1,), (threat.level, threat.note))
+            self._versions["threats"] += 1
+        if self._backend is not None:
+            self._backend.write_threats(items)
+
+    def add_http_flows(self, flows: Sequence[HttpFlow]) -> None:
+        """批量写入 http.log 记录：整批只获取一次锁，并整批交给持久化后端。"""
+        self._add_http_flows(flows, buffered=True)
+
+    def _add_http_flows(self, flows: Sequence[HttpFlow], buffered: bool) -> None:
+        items = list(flows)
+        if not items:
+            return
+        ts = array("d", [f.ts.timestamp() for f in items])
+        with self._lock:
+            if buffered:
+                self._http.extend(ts, items)
+            else:
+                self._mark_backend_only(self._http, max(ts))
+            self._versions["http"] += 1
+        if self._backend is not None:
+            self._backend.write_http_flows(items)
+
+    def add_history(self, log: str, records: Any) -> None:
+        """
+        写入离线导入的历史记录（log 为 conn / http / notice / intel / weird）。
+
+        挂接持久化后端时只写入后端与汇总，不进入内存环形缓冲：导入数周的归档
+        不会淘汰实时数据，乱序的旧 ts 也不会在持锁期间逐条插入时间索引；
+        内存覆盖边界推进到导入记录的最大 ts，这之前的查询由后端补齐。
+        未挂接后端时只能写入内存缓冲，会按容量淘汰最早到达的记录。
+        """
+        buffered = self._backend is None
+        if log == "conn":
+            self._add_flow_batch(records, buffered)
+        elif log == "http":
+            self._add_http_flows(records, buffered)
+        else:
+            self._add_threats(records, buffered)
+
+    @staticmethod
+    def _mark_backend_only(buffer: _TimeIndexedBuffer, max_ts: float) -> None:
+        # 与淘汰相同：ts 不大于该值的查询交给后端（持锁调用）
+        if max_ts > buffer.evicted_max_ts:
+            buffer.evicted_max_ts = max_ts
 
     def list_flows(
         self,
         limit: int = 100,
         since: Optional[datetime] = None,
+        flt: Optional[FlowFilter] = None,
     ) -> List[Flow]:
-        with self._lock:
-            items = list(self._flows)
-        if since:
-            items = [f for f in items if f.ts >= since]
-        return items[-limit:]
+        return self.page_flows(limit, since, flt=flt).items
 
     def list_threats(
         self,
         limit: int = 100,
         since: Optional[datetime] = None,
-        source: Optional[str] = None,
+        flt: Optional[ThreatFilter] = None,
     ) -> List[ThreatEvent]:
+        return self.page_threats(limit, since, flt=flt).items
+
+    def list_http_flows(
+        self,
+        limit: int = 100,
+        since: Optional[datetime] = None,
+        uid: Optional[str] = None,
+    ) -> List[HttpFlow]:
+        return self.page_http_flows(limit, since, uid=uid).items
+
+    def page_flows(
+        self,
+        limit: int = 100,
+        since: Optional[datetime] = None,
+        after_seq: Optional[int] = None,
+        flt: Optional[FlowFilter] = None,
+        raw: bool = False,
+    ) -> Page:
+        """
+        after_seq 为空时返回 ts >= since 的最新 limit 条（按 ts 升序），last_seq 为查询时刻
+        最新的 seq；否则按到达顺序返回 seq > after_seq 的记录（只查内存，不查后端）。
+        raw=True 时 items 为字段 dict，不构造模型（API 直接编码为 JSON）。
+
+        flt 中有哈希索引的条件时只扫描命中条数最少的索引；只按 service 过滤时
+        在该 service 的分区索引上查询，代价与不过滤时相同；只按 proto 过滤需要顺序扫描。
+        """
+        flt = flt or FlowFilter()
+        indexed = any(
+            value is not None and name in self._flows.indexed
+            for name, value in flt._asdict().items()
+        )
+        # 走 service 分区时分区内的记录都属于该 service，不必逐条复核
+        return self._page(
+            self._flows,
+            limit,
+            since,
+            after_seq,
+            _flow_accept(flt if indexed else flt._replace(service=None)),
+            lambda: _pick_lookup(self._flows, flt),
+            None if indexed else flt.service,
+            lambda n, since_ts, until_ts: self._backend.query_flows(  # type: ignore[union-attr]
+                n, since_ts, until_ts, flt
+            ),
+            raw,
+        )
+
+    def page_threats(
+        self,
+        limit: int = 100,
+        since: Optional[datetime] = None,
+        after_seq: Optional[int] = None,
+        flt: Optional[ThreatFilter] = None,
+        raw: bool = False,
+    ) -> Page:
+        """语义同 page_flows；过滤时 last_seq 为最后扫描到的 seq（含未选中的记录）。"""
+        flt = flt or ThreatFilter()
+        return self._page(
+            self._threats,
+            limit,
+            since,
+            after_seq,
+            _object_accept(flt),
+            lambda: _pick_lookup(self._threats, flt),
+            None,
+            lambda n, since_ts, until_ts: self._backend.query_threats(  # type: ignore[union-attr]
+                n, since_ts, until_ts, flt
+            ),
+            raw,
+        )
+
+    def page_http_flows(
+        self,
+        limit: int = 100,
+        since: Optional[datetime] = None,
+        after_seq: Optional[int] = None,
+        uid: Optional[str] = None,
+        raw: bool = False,
+    ) -> Page:
+        """语义同 page_flows，查询 http.log 记录（HttpFlow），可按 uid 关联到 flow。"""
+        accept = lookup = None
+        if uid is not None:
+            accept = lambda f: f.uid == uid  # noqa: E731
+            lookup = ("uid", uid)
+        return self._page(
+            self._http,
+            limit,
+            since,
+            after_seq,
+            accept,
+            lambda: lookup,
+            None,
+            lambda n, since_ts, until_ts: self._backend.query_http_flows(  # type: ignore[union-attr]
+                n, since_ts, until_ts, uid
+            ),
+            raw,
+        )
+
+    def _page(
+        self,
+        buffer: _TimeIndexedBuffer,
+        limit: int,
+        since: Optional[datetime],
+        after_seq: Optional[int],
+        accept: Optional[Callable[[object], bool]],
+        pick: Callable[[], Optional[tuple[str, object]]],
+        key: Optional[str],
+        query_backend: Callable[[int, Optional[float], float], list],
+        raw: bool = False,
+    ) -> Page:
+        """page_* 的公共部分：pick 在持锁时挑选哈希索引，key 为分区（两者都有时用哈希索引）。"""
+        build = buffer.records if raw else buffer.build
+        if after_seq is not None:
+            with self._lock:
+                lookup = pick()
+                rows, last_seq, skipped = buffer.after(
+                    after_seq, limit, accept, None if lookup else key, lookup
+                )
+            return Page(build(rows), last_seq, skipped)
+
+        since_ts = since.timestamp() if since else None
+        with self._lock:
+            lookup = pick()
+            covered_ts = self._covered_since(buffer, since_ts)
+            evicted_max_ts = buffer.evicted_max_ts
+            rows = buffer.tail(limit, covered_ts, accept, None if lookup else key, lookup)
+            last_seq = buffer.last_seq
+        items = build(rows)
+        if self._backend is not None and len(items) < limit and covered_ts != since_ts:
+            # 已淘汰的记录可能仍在后端的写队列中：先等其落盘再查询
+            self._backend.sync()
+            older = query_backend(limit - len(items), since_ts, evicted_max_ts)
+            if raw:
+                older = [item.__dict__ for item in older]
+            items = older + items
+        return Page(items, last_seq)
+
+    def aggregate_flows(
+        self,
+        bucket_seconds: int = 60,
+        since: Optional[datetime] = None,
+    ) -> List[FlowAggregateBucket]:
+        since_ts = since.timestamp() if since else None
         with self._lock:
-            items = list(self._threats)
-        if since:
-            items = [t for t in items if t.ts >= since]
-        if source:
-            items = [t for t in items if t.source == source]
-        return items[-limit:]
+            buckets = list(self._flow_rollup.buckets(bucket_seconds, since_ts))
+        # 持锁期间只复制寄存器，合并与估计在锁外进行
+        return [
+            FlowAggregateBucket(
+                bucket_start=datetime.fromtimestamp(start, tz=timezone.utc),
+                bucket_end=datetime.fromtimestamp(start + bucket_seconds, tz=timezone.utc),
+                flow_count=count,
+                orig_bytes_sum=orig_bytes_sum,
+                resp_bytes_sum=resp_bytes_sum,
+                **{
+                    f"distinct_{name}": cardinality(sketches)
+                    for name, sketches in zip(_FLOW_DISTINCT_FIELDS, distinct)
+                },
+            )
+            for start, (count, orig_bytes_sum, resp_bytes_sum), _, distinct in buckets
+        ]
+
+    def aggregate_threats(
+        self,
+        bucket_seconds: int = 60,
+        since: Optional[datetime] = None,
+    ) -> List[ThreatAggregateBucket]:
+        since_ts = since.timestamp() if since else None
+        with self._lock:
+            buckets = list(self._threat_rollup.buckets(bucket_seconds, since_ts))
+        return [
+            ThreatAggregateBucket(
+                bucket_start=datetime.fromtimestamp(start, tz=timezone.utc),
+                bucket_end=datetime.fromtimestamp(start + bucket_seconds, tz=timezone.utc),
+                threat_count=count,
+                by_level=by_level,
+                by_note=by_note,
+            )
+            for start, (count,), (by_level, by_note), _ in buckets
+        ]
+
+    def top_flows(
+        self,
+        by: str,
+        metric: str = "bytes",
+        n: int = 20,
+        since: Optional[datetime] = None,
+    ) -> List[TopItem]:
+        """按 by（FLOW_TOP_DIMENSIONS）排行，metric 为 flows / bytes。"""
+        since_ts = since.timestamp() if since else None
+        with self._lock:
+            top = self._flow_top[by, metric].top(n, since_ts)
+        return [TopItem(key=key, value=value, error=error) for key, value, error in top]
+
+    def _warm_rollups(
+        self, flow_max_ts: Optional[float], threat_max_ts: Optional[float]
+    ) -> None:
+        """重启后从持久化后端回灌按秒汇总（只取重启前已落盘的部分，避免重复计数）。"""
+        assert self._backend is not None
+        try:
+            if flow_max_ts is not None:
+                for sec, count, orig_bytes_sum, resp_bytes_sum in self._backend.rollup_flows(
+                    flow_max_ts
+                ):
+                    with self._lock:
+                        self._flow_rollup.add(sec, (count, orig_bytes_sum, resp_bytes_sum))
+                        self._versions["flows"] += 1
+            if threat_max_ts is not None:
+                for sec, level, note, count in self._backend.rollup_threats(threat_max_ts):
+                    with self._lock:
+                        self._threat_rollup.add(sec, (count,), (level, note), weight=count)
+                        self._versions["threats"] += 1
+            if flow_max_ts is not None:
+                self._warm_distinct(flow_max_ts)
+                self._warm_top(flow_max_ts)
+        except Exception as e:
+            print(f"[storage] 回灌汇总数据失败: {e}")
+
+    def _warm_distinct(self, flow_max_ts: float) -> None:
+        """回灌汇总中的基数估计：逐字段取每分钟出现过的取值，按分钟写入。"""
+        assert self._backend is not None
+        precision = settings.rollup_hll_precision
+        for i, name in enumerate(_FLOW_DISTINCT_FIELDS):
+            rows = self._backend.rollup_distinct(name, flow_max_ts)
+            for minute, group in groupby(rows, key=operator.itemgetter(0)):
+                positions: list[list[int]] = [[] for _ in _FLOW_DISTINCT_FIELDS]
+                positions[i] = hll_positions((value for _, value in group), precision)
+                with self._lock:
+                    self._flow_rollup.add_distinct(minute, positions)
+                    self._versions["flows"] += 1
+
+    def _warm_top(self, flow_max_ts: float) -> None:
+        """回灌 Top-N 摘要：只取保留时间窗内、重启前已落盘的 flow。"""
+        assert self._backend is not None
+        window_seconds = settings.top_window_seconds
+        since_ts = (
+            math.floor(flow_max_ts) // window_seconds - settings.top_windows + 1
+        ) * window_seconds
+        for dim in FLOW_TOP_DIMENSIONS:
+            windows: dict[int, tuple[dict, dict]] = {}
+            for window, key, count, size in self._backend.rollup_top_flows(
+                dim, since_ts, flow_max_ts, window_seconds
+            ):
+                flows, octets = windows.setdefault(window, ({}, {}))
+                flows[key] = count
+                octets[key] = size
+            with self._lock:
+                for window in sorted(windows):
+                    flows, octets = windows[window]
+                    self._flow_top[dim, "flows"].add(window, flows)
+                    self._flow_top[dim, "bytes"].add(window, octets)
+                self._versions["flows"] += 1
+
+    def _covered_since(
+        self, buffer: _TimeIndexedBuffer, since_ts: Optional[float]
+    ) -> Optional[float]:
+        """
+        计算内存部分应查询的起始 ts。
 
+        挂接后端时，只有 ts 大于已淘汰最大 ts 的记录才保证完整在内存中，
+        更早的部分交给后端查询，避免两边重复。
+        """
+        if self._backend is None or buffer.evicted_max_ts == -math.inf:
+            return since_ts
+        floor = math.nextafter(buffer.evicted_max_ts, math.inf)
+        if since_ts is None or since_ts < floor:
+            return floor
+        return since_ts
 
-storage = InMemoryStorage()
+    def close(self) -> None:
+        """刷写并关闭持久化后端（应用退出时调用）。"""
+        if self._backend is not None:
+            self._backend.close()
 
 
+storage = InMemoryStorage(
+    backend=create_backend(settings.storage_backend, settings.storage_data_dir)
+)
@@ -0,0 +1,213 @@
+"""
+实时推送（/api/stream，Server-Sent Events）。
+
+采集流水线每写入一批记录就发布给所有订阅者：
+- 没有订阅者时发布直接返回，不做任何序列化；
+- 每批记录只序列化一次，各订阅者按自己的过滤条件挑选后拼成一条 SSE 消息；
+- 每个订阅者有界缓冲（按消息数），缓冲满说明客户端消费跟不上，
+  直接断开该客户端（发送 overflow 事件），不拖慢采集也不占用无界内存；
+- 流量安静时只有定期的心跳注释行，打开再多的看板也几乎没有开销。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import AsyncIterator, FrozenSet, List, NamedTuple, Optional, Sequence
+
+from .config import settings
+from .models import FlowBatch, HttpFlow, ThreatEvent
+from .serialize import dumps
+
+STREAM_KINDS = ("flows", "http", "threats")
+
+# 空闲时发送心跳的间隔（秒），同时用于及时发现已断开的连接
+_KEEPALIVE_SECONDS = 15.0
+
+
+class StreamFilter(NamedTuple):
+    """订阅过滤条件；为 None 的条件不过滤。"""
+
+    kinds: FrozenSet[str] = frozenset(STREAM_KINDS)
+    host: Optional[str] = None  # 匹配 orig_h/resp_h（告警为 src/dst）
+    proto: Optional[str] = None
+    service: Optional[str] = None  # 只作用于流量
+    source: Optional[str] = None  # 只作用于告警：notice/intel/weird
+
+
+class _Subscriber:
+    """单个客户端：有界消息缓冲 + 唤醒事件，只在所属事件循环中读写。"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, flt: StreamFilter, buffer: int) -> None:
+        self.loop = loop
+        self.filter = flt
+        self.buffer = buffer
+        self.messages: deque[str] = deque()
+        self.ready = asyncio.Event()
+        self.overflowed = False
+
+    def offer(self, message: str) -> None:
+        if self.overflowed:
+            return
+        if len(self.messages) >= self.buffer:
+            # 最慢的消费者：丢弃其缓冲并断开，客户端重连后重新拉取即可
+            self.overflowed = True
+            self.messages.clear()
+        else:
+            self.messages.append(message)
+        self.ready.set()
+
+
+def _flow_json(batch: FlowBatch) -> List[str]:
+    # 与 /api/flows 相同的编码（serialize.dumps，datetime 为 UTC、"Z" 结尾）
+    return [
+        dumps(
+            {
+                "ts": datetime.fromtimestamp(ts, tz=timezone.utc),
+                "uid": uid,
+                "orig_h": orig_h,
+                "orig_p": orig_p,
+                "resp_h": resp_h,
+                "resp_p": resp_p,
+                "proto": proto,
+                "service": service,
+                "duration": duration,
+                "orig_bytes": orig_bytes,
+                "resp_bytes": resp_bytes,
+                "conn_state": conn_state,
+            }
+        ).decode("utf-8")
+        for (
+            ts,
+            uid,
+            orig_h,
+            orig_p,
+            resp_h,
+            resp_p,
+            proto,
+            service,
+            duration,
+            orig_bytes,
+            resp_bytes,
+            conn_state,
+        ) in batch.rows()
+    ]
+
+
+def _flow_rows(batch: FlowBatch, flt: StreamFilter) -> Sequence[int]:
+    rows: Sequence[int] = range(len(batch))
+    if flt.host is not None:
+        host = flt.host
+        rows = [i for i in rows if batch.orig_h[i] == host or batch.resp_h[i] == host]
+    if flt.proto is not None:
+        proto = flt.proto
+        rows = [i for i in rows if batch.proto[i] == proto]
+    if flt.service is not None:
+        service = flt.service
+        rows = [i for i in rows if (batch.service[i] or "").lower() == service]
+    return rows
+
+
+def _http_match(flow: HttpFlow, flt: StreamFilter) -> bool:
+    return flt.host is None or flt.host in (flow.orig_h, flow.resp_h)
+
+
+def _threat_match(ev: ThreatEvent, flt: StreamFilter) -> bool:
+    if flt.host is not None and flt.host not in (ev.src, ev.dst):
+        return False
+    if flt.proto is not None and ev.proto != flt.proto:
+        return False
+    if flt.source is not None and ev.source != flt.source:
+        return False
+    return True
+
+
+def _sse(event: str, items: Sequence[str]) -> str:
+    return f"event: {event}\ndata: [{','.join(items)}]\n\n"
+
+
+class StreamHub:
+    """流水线写入 → SSE 客户端的广播中心；publish_* 可在任意线程调用。"""
+
+    def __init__(self, buffer: int = 256) -> None:
+        self.buffer = buffer
+        self._lock = threading.Lock()
+        self._subscribers: List[_Subscriber] = []
+
+    @property
+    def clients(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, flt: StreamFilter) -> _Subscriber:
+        sub = _Subscriber(asyncio.get_running_loop(), flt, self.buffer)
+        with self._lock:
+            self._subscribers = self._subscribers + [sub]
+        return sub
+
+    def unsubscribe(self, sub: _Subscriber) -> None:
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not sub]
+
+    def publish_flows(self, batch: FlowBatch) -> None:
+        subscribers = [s for s in self._subscribers if "flows" in s.filter.kinds]
+        if not subscribers or not len(batch):
+            return
+        encoded = _flow_json(batch)
+        for sub in subscribers:
+            rows = _flow_rows(batch, sub.filter)
+            if len(rows) == len(encoded):
+                self._send(sub, _sse("flows", encoded))
+            elif rows:
+                self._send(sub, _sse("flows", [encoded[i] for i in rows]))
+
+    def publish_threats(self, events: Sequence[ThreatEvent]) -> None:
+        subscribers = [s for s in self._subscribers if "threats" in s.filter.kinds]
+        if not subscribers or not events:
+            return
+        encoded = [dumps(ev).decode("utf-8") for ev in events]
+        for sub in subscribers:
+            picked = [e for ev, e in zip(events, encoded) if _threat_match(ev, sub.filter)]
+            if picked:
+                self._send(sub, _sse("threats", picked))
+
+    def publish_http(self, flows: Sequence[HttpFlow]) -> None:
+        subscribers = [s for s in self._subscribers if "http" in s.filter.kinds]
+        if not subscribers or not flows:
+            return
+        encoded = [dumps(f).decode("utf-8") for f in flows]
+        for sub in subscribers:
+            picked = [e for f, e in zip(flows, encoded) if _http_match(f, sub.filter)]
+            if picked:
+                self._send(sub, _sse("http", picked))
+
+    def _send(self, sub: _Subscriber, message: str) -> None:
+        try:
+            sub.loop.call_soon_threadsafe(sub.offer, message)
+        except RuntimeError:
+            # 事件循环已关闭（服务退出中）
+            self.unsubscribe(sub)
+
+    async def events(self, flt: StreamFilter) -> AsyncIterator[str]:
+        """单个客户端的 SSE 输出；客户端断开（生成器被关闭）时自动退订。"""
+        sub = self.subscribe(flt)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    await asyncio.wait_for(sub.ready.wait(), _KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                sub.ready.clear()
+                if sub.overflowed:
+                    yield "event: overflow\ndata: {}\n\n"
+                    return
+                while sub.messages:
+                    yield sub.messages.popleft()
+        finally:
+            self.unsubscribe(sub)
+
+
+stream_hub = StreamHub(settings.stream_buffer)
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import selectors
+import struct
+import threading
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (
+    _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class LogTailer:
+    """
+    跟随单个 Zeek 日志文件，只返回新增的完整行。
+
+    - 文件句柄保持打开，每次只读取新写入的字节；
+    - 不完整的行（Zeek 尚未写完）留到下一次读取；
+    - 通过 inode 检测轮转：路径指向新文件时，先把旧句柄读到 EOF 再切换，
+      快速轮转也不会丢行；同一 inode 变小视为截断，从头读取。
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._f: Optional[BinaryIO] = None
+        self._ino: Optional[int] = None
+        self._partial = b""
+
+    def read(self) -> bytes:
+        """读取新增数据，返回以换行结尾的完整行（可能为空）。"""
+        chunks: list[bytes] = []
+        while True:
+            if self._f is None and not self._open():
+                break
+            assert self._f is not None
+
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                st = None
+
+            if st is not None and st.st_ino == self._ino and st.st_size < self._f.tell():
+                # 原地截断：丢弃未完成的半行，从头开始
+                self._f.seek(0)
+                self._partial = b""
+
+            data = self._f.read()
+            if data:
+                chunks.append(data)
+
+            if st is None or st.st_ino == self._ino:
+                break
+            # 已轮转：旧文件已读到 EOF，切换到新文件继续读
+            self._close()
+            tail = chunks[-1] if chunks else self._partial
+            if tail and not tail.endswith(b"\n"):
+                # 旧文件最后一行没有换行符，也视为完整行
+                chunks.append(b"\n")
+
+        data = self._partial + b"".join(chunks)
+        end = data.rfind(b"\n") + 1
+        self._partial = data[end:]
+        return data[:end]
+
+    def read_lines(self) -> list[str]:
+        data = self.read()
+        if not data:
+            return []
+        return data.decode("utf-8", errors="ignore").splitlines()
+
+    def _open(self) -> bool:
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return False
+        self._f = f
+        self._ino = os.fstat(f.fileno()).st_ino
+        return True
+
+    def _close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+        self._f = None
+        self._ino = None
+
+    def close(self) -> None:
+        self._close()
+        self._partial = b""
+
+
+class _Inotify:
+    """通过 ctypes 调用 libc 的 inotify 接口（仅 Linux）。"""
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self.fd = fd
+
+    def add_watch(self, path: Path, mask: int) -> None:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(path)), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch 失败: {path}")
+
+    def read_names(self) -> set[str]:
+        names: set[str] = set()
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(buf):
+                _, _, _, name_len = _EVENT_HEADER.unpack_from(buf, offset)
+                offset += _EVENT_HEADER.size
+                name = buf[offset : offset + name_len].rstrip(b"\0")
+                offset += name_len
+                if name:
+                    names.add(os.fsdecode(name))
+        return names
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class LogWatcher:
+    """
+    等待日志目录中的文件变化。
+
+    优先使用 inotify 事件驱动（Zeek 刷盘后立即唤醒，空闲时不空转）；
+    inotify 不可用（非 Linux、达到 watch 上限等）时退化为定时轮询。
+    """
+
+    def __init__(self, directory: Path, poll_interval: float = 2.0) -> None:
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._wake_event = threading.Event()
+        self._inotify: Optional[_Inotify] = None
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._wake_pipe: Optional[tuple[int, int]] = None
+        try:
+            inotify = _Inotify()
+            try:
+                inotify.add_watch(directory, _WATCH_MASK)
+            except OSError:
+                inotify.close()
+                raise
+        except (OSError, AttributeError) as e:
+            print(f"[zeek-runner] inotify 不可用，改为每 {poll_interval}s 轮询: {e}")
+            return
+
+        self._inotify = inotify
+        # 自管道：wake() 写入一个字节即可打断 select，用于停止解析线程
+        r, w = os.pipe()
+        os.set_blocking(r, False)
+        os.set_blocking(w, False)
+        self._wake_pipe = (r, w)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(inotify.fd, selectors.EVENT_READ)
+        self._selector.register(r, selectors.EVENT_READ)
+
+    @property
+    def event_driven(self) -> bool:
+        return self._inotify is not None
+
+    def wait(self, timeout: float) -> Optional[set[str]]:
+        """
+        等待变化，返回发生变化的文件名集合。
+
+        轮询模式、超时（兜底全量检查）或被 wake() 唤醒时返回 None，
+        表示所有文件都需要检查。
+        """
+        if self._inotify is None or self._selector is None or self._wake_pipe is None:
+            self._wake_event.wait(min(timeout, self.poll_interval))
+            self._wake_event.clear()
+            return None
+
+        ready = self._selector.select(timeout)
+        if not ready:
+            return None
+        names: Optional[set[str]] = set()
+        for key, _ in ready:
+            if key.fd == self._wake_pipe[0]:
+                try:
+                    while os.read(self._wake_pipe[0], 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                names = None
+            elif names is not None:
+                names |= self._inotify.read_names()
+            else:
+                self._inotify.read_names()
+        return names
+
+    def wake(self) -> None:
+        """唤醒正在 wait() 的线程。"""
+        self._wake_event.set()
+        if self._wake_pipe is not None:
+            try:
+                os.write(self._wake_pipe[1], b"\0")
+            except (BlockingIOError, OSError):
+                pass
+
+    def close(self) -> None:
+        if self._selector is not None:
+            self._selector.close()
+        if self._inotify is not None:
+            self._inotify.close()
+        if self._wake_pipe is not None:
+            for fd in self._wake_pipe:
+                os.close(fd)
+        self._selector = None
+        self._inotify = None
+        self._wake_pipe = None
@@ -0,0 +1,165 @@
+"""
+Zeek 脚本路径的可加载性校验（生成 local.zeek 与 /api/rules/validate 共用）。
+
+- 结果按 (Zeek 可执行文件, 规则路径) 缓存并持久化到 ZEEK_CHECK_CACHE，
+  可执行文件以路径 + mtime + 大小 + `zeek --version` 标识，升级或替换 Zeek 后整体失效；
+  配置不变时重启 Zeek 只做一次 stat，不再启动任何 zeek 进程；
+- 未缓存的规则先用一次 `zeek -N <规则1> <规则2> ...` 批量校验，全部可加载时即结束；
+  批量失败再逐条并发校验（异步子进程，并发数不超过 ZEEK_CHECK_CONCURRENCY），找出不可加载的规则；
+- 超时或 Zeek 无法执行时视为不可加载，但不写入缓存，下次重新校验。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .config import settings
+
+# 单条规则 zeek -N 的超时（秒）；批量校验按规则数放宽
+_CHECK_TIMEOUT = 5.0
+_BATCH_TIMEOUT_PER_RULE = 0.5
+
+
+async def _run_zeek(
+    args: Sequence[str], timeout: float, output: bool = False
+) -> Tuple[Optional[int], str]:
+    """执行 zeek <args>，返回 (退出码, stdout)；超时或无法执行时退出码为 None（超时的进程会被结束）。"""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            str(settings.zeek_bin),
+            *args,
+            stdout=asyncio.subprocess.PIPE if output else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+    except OSError:
+        return None, ""
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return None, ""
+    return proc.returncode, (stdout or b"").decode("utf-8", "replace")
+
+
+class ScriptValidator:
+    """线程安全；check 在事件循环中调用，check_sync 供普通线程（启动 / 回放）调用。"""
+
+    def __init__(self, cache_path: Path) -> None:
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._binary: Optional[List[object]] = None  # [路径, mtime_ns, 大小, 版本]
+        self._results: Dict[str, bool] = {}
+        self._loaded = False
+
+    def _stat_binary(self) -> Optional[List[object]]:
+        try:
+            st = settings.zeek_bin.stat()
+        except OSError:
+            return None
+        return [str(settings.zeek_bin), st.st_mtime_ns, st.st_size]
+
+    def _load(self) -> None:
+        """首次使用时读取持久化的缓存；文件不存在或损坏时从空缓存开始。"""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            data = json.loads(self.cache_path.read_text(encoding="utf-8"))
+            binary, results = data["zeek"], data["results"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        if isinstance(binary, list) and len(binary) == 4 and isinstance(results, dict):
+            self._binary = binary
+            self._results = {k: v for k, v in results.items() if isinstance(v, bool)}
+
+    def _save(self) -> None:
+        data = {"zeek": self._binary, "results": self._results}
+        tmp = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding="utf-8")
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            print(f"[zeek-check] 写入校验缓存失败: {e}")
+
+    def _cached(self, rules: Sequence[str]) -> Tuple[Optional[List[object]], Dict[str, bool]]:
+        """返回 (当前可执行文件标识, 已缓存的结果)；可执行文件变化时返回空结果，由调用方重新取版本号。"""
+        stat = self._stat_binary()
+        with self._lock:
+            self._load()
+            if stat is None or self._binary is None or self._binary[:3] != stat:
+                return stat, {}
+            results = self._results
+            return self._binary, {r: results[r] for r in rules if r in results}
+
+    async def check(self, rules: Sequence[str]) -> Dict[str, bool]:
+        """校验各规则路径能否被当前 Zeek 加载，返回 {规则: 是否可加载}（重复的规则只校验一次）。"""
+        unique = list(dict.fromkeys(rules))
+        binary, found = self._cached(unique)
+        pending = [r for r in unique if r not in found]
+        if not pending:
+            return found
+        if binary is None:
+            # Zeek 不存在：全部视为不可加载，不缓存
+            return {r: False for r in unique}
+
+        if len(binary) == 3:
+            code, out = await _run_zeek(["--version"], _CHECK_TIMEOUT, output=True)
+            binary = binary + [out.strip() if code == 0 else ""]
+
+        checked = await self._check_uncached(pending)
+        definite = {r: ok for r, ok in checked.items() if ok is not None}
+        if definite:
+            with self._lock:
+                if self._binary != binary:
+                    self._binary, self._results = binary, {}
+                self._results.update(definite)
+                self._save()
+        found.update({r: bool(ok) for r, ok in checked.items()})
+        return {r: found[r] for r in unique}
+
+    async def _check_uncached(self, rules: List[str]) -> Dict[str, Optional[bool]]:
+        # 多数情况下规则全部可加载，一次 zeek 进程即可确认
+        if len(rules) > 1:
+            timeout = _CHECK_TIMEOUT + _BATCH_TIMEOUT_PER_RULE * len(rules)
+            code, _ = await _run_zeek(["-N", *rules], timeout)
+            if code == 0:
+                return dict.fromkeys(rules, True)
+
+        semaphore = asyncio.Semaphore(max(1, settings.zeek_check_concurrency))
+
+        async def check_one(rule: str) -> Optional[bool]:
+            async with semaphore:
+                code, _ = await _run_zeek(["-N", rule], _CHECK_TIMEOUT)
+            return None if code is None else code == 0
+
+        results = await asyncio.gather(*(check_one(rule) for rule in rules))
+        return dict(zip(rules, results))
+
+    def check_sync(self, rules: Sequence[str]) -> Dict[str, bool]:
+        """
+        check 的同步版本：全部命中缓存时直接返回，否则运行一个私有事件循环。
+
+        当前线程已在运行事件循环时（例如被同步的启动钩子直接调用）不能再 asyncio.run，
+        改在临时线程中运行并等待其结束。
+        """
+        unique = list(dict.fromkeys(rules))
+        _, found = self._cached(unique)
+        if len(found) == len(unique):
+            return found
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.check(unique))
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="zeek-check") as pool:
+            return pool.submit(asyncio.run, self.check(unique)).result()
+
+
+script_validator = ScriptValidator(settings.zeek_check_cache)
@@ -1,13 +1,156 @@
 from __future__ import annotations
 
+import argparse
+import multiprocessing
+import shutil
 import subprocess
 import threading
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Sequence
 
 from .config import settings
+from .detection import PYRULE_PREFIX
+from .importer import importer
+from .models import IngestChannelStats, ReplayStats, ZeekWorkerStatus
+from .pcap import split_pcap
+from .pipeline import IngestPipeline
 from .storage import storage
+from .zeek_check import script_validator
+
+
+def worker_log_dirs() -> List[Path]:
+    """各 Zeek worker 的日志目录：单进程时即日志目录本身，多进程时为 worker-N 子目录。"""
+    if settings.zeek_workers <= 1:
+        return [settings.logs_dir]
+    return [settings.logs_dir / f"worker-{i + 1}" for i in range(settings.zeek_workers)]
+
+
+def generation_log_dirs(generation: int) -> List[Path]:
+    """
+    第 generation 代 Zeek 的日志目录：偶数代为 worker_log_dirs()，奇数代为其下的 reload 子目录。
+
+    热加载规则时新旧两代进程并行运行，各自写入不同的目录。
+    """
+    dirs = worker_log_dirs()
+    return dirs if generation % 2 == 0 else [d / "reload" for d in dirs]
+
+
+def local_zeek_path(generation: int) -> Path:
+    """
+    第 generation 代 Zeek 加载的脚本：偶数代为 local.zeek，奇数代为 local.reload.zeek。
+
+    热加载时新配置写入新一代的文件，新进程启动失败也不影响旧进程（及其被监督线程重启时）使用的配置。
+    """
+    name = "local.zeek" if generation % 2 == 0 else "local.reload.zeek"
+    return settings.zeek_scripts_dir / name
+
+
+def _replay_zeek_path() -> Path:
+    # 离线回放单独生成，不改动实时抓包进程加载的脚本
+    return settings.zeek_scripts_dir / "local.replay.zeek"
+
+
+def _pump_stderr(proc: subprocess.Popen, log_path: Path, tag: str) -> None:
+    """持续读取 Zeek stderr，写入日志文件，方便排查启动/运行问题。"""
+    try:
+        with log_path.open("a", encoding="utf-8", errors="ignore") as log_f:
+            if proc.stderr is None:
+                return
+            for line in proc.stderr:
+                # 同时写入文件与标准输出（方便在终端直接看到）
+                log_f.write(line)
+                log_f.flush()
+                print(f"[{tag}] {line.rstrip()}")
+    except Exception:
+        # 不因日志线程异常影响主流程
+        pass
+
+
+class _ZeekWorker:
+    """一个 zeek -i 进程：日志目录、启动命令与重启记录。"""
+
+    # 连续快速退出时的重启间隔上限（秒）；运行超过 STABLE_SECONDS 后退出则从 1 秒重新计
+    MAX_BACKOFF = 60.0
+    STABLE_SECONDS = 60.0
+
+    def __init__(self, index: int, logs_dir: Path, cmd: List[str]) -> None:
+        self.index = index
+        self.logs_dir = logs_dir
+        self.cmd = cmd
+        self.proc: Optional[subprocess.Popen] = None
+        self.restarts = 0
+        self.last_exit_code: Optional[int] = None
+        self.started_at = 0.0
+        self.next_start = 0.0
+        self._backoff = 1.0
+
+    @property
+    def running(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def spawn(self) -> None:
+        self.logs_dir.mkdir(parents=True, exist_ok=True)
+        self.proc = subprocess.Popen(
+            self.cmd,
+            cwd=self.logs_dir,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        self.started_at = time.monotonic()
+        tag = "zeek stderr" if settings.zeek_workers <= 1 else f"zeek-{self.index + 1} stderr"
+        threading.Thread(
+            target=_pump_stderr,
+            args=(self.proc, self.logs_dir / "zeek_stderr.log", tag),
+            name=f"zeek-stderr-logger-{self.index}",
+            daemon=True,
+        ).start()
+
+    def check(self, now: float) -> None:
+        """进程意外退出时按退避间隔重启（由监督线程周期调用）。"""
+        if self.proc is None or self.running:
+            return
+        if self.next_start == 0.0:
+            self.last_exit_code = self.proc.returncode
+            if now - self.started_at >= self.STABLE_SECONDS:
+                self._backoff = 1.0
+            self.next_start = now + self._backoff
+            print(
+                f"[zeek-runner] Zeek worker {self.index + 1} 退出（{self.last_exit_code}），"
+                f"{self._backoff:.0f}s 后重启"
+            )
+            self._backoff = min(self._backoff * 2, self.MAX_BACKOFF)
+        elif now >= self.next_start:
+            self.next_start = 0.0
+            self.restarts += 1
+            try:
+                self.spawn()
+            except OSError as e:
+                print(f"[zeek-runner] 重启 Zeek worker {self.index + 1} 失败: {e}")
+                self.started_at = now
+
+    def terminate(self) -> None:
+        if self.proc is not None and self.running:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+    def status(self) -> ZeekWorkerStatus:
+        running = self.running
+        return ZeekWorkerStatus(
+            index=self.index + 1,
+            pid=self.proc.pid if running and self.proc else None,
+            running=running,
+            restarts=self.restarts,
+            last_exit_code=self.last_exit_code,
+            uptime_seconds=time.monotonic() - self.started_at if running else 0.0,
+            logs_dir=str(self.logs_dir),
+        )
 
 
 class ZeekRunner:
@@ -15,94 +158,349 @@ class ZeekRunner:
     负责启动/停止 Zeek，并持续解析日志写入 storage。
 
     初版策略：
-    - 使用接口抓取实时流量：zeek -i <iface> local.zeek（在 local.zeek 中启用 JSON writer）
+    - 使用接口抓取实时流量：zeek -i <iface> local.zeek
+      （ZEEK_JSON_LOGS=1 时 local.zeek 加载 policy/tuning/json-logs，输出 JSON 日志）
     - Zeek 进程与日志目录在同一进程内管理。
-    - 解析线程定期扫描 conn.log / notice.log / intel.log 增量更新。
+    - ZEEK_WORKERS > 1 时启动多个 zeek -i af_packet::<iface> 进程，通过 AF_PACKET
+      fanout 按流分担流量，各自写入 worker-N 日志目录；
+    - 监督线程在 Zeek 进程意外退出时按退避间隔自动重启，状态见 workers_status()。
+    - 热加载规则（reload）：新一代 Zeek 写入另一组日志目录（见 generation_log_dirs），
+      与旧进程并行运行 ZEEK_RELOAD_GRACE 秒确认未退出后，停止旧进程，采集流水线随之切换，
+      抓包与入库不中断；新进程启动失败时继续使用旧进程。
+    - 采集流水线（见 pipeline）跟随 conn.log / notice.log / intel.log / weird.log
+      增量解析入库：每种日志独立的跟随线程与队列，优先由 inotify 事件驱动；
+      多个 worker 的日志按 ts 合并入库。
+    - 离线回放（start_replay）：zeek -r 分析 pcap 文件，大文件按流切分后由多个
+      Zeek 进程并行分析，输出日志经离线导入（见 importer）写入 storage。
     """
 
     def __init__(self) -> None:
-        self._proc: Optional[subprocess.Popen] = None
-        self._parser_thread: Optional[threading.Thread] = None
-        self._stderr_thread: Optional[threading.Thread] = None
-        self._stop_event = threading.Event()
-        self._last_conn_size: int = 0
-        self._last_notice_size: int = 0
-        self._last_intel_size: int = 0
-        self._last_weird_size: int = 0
+        self._workers: List[_ZeekWorker] = []
+        self._supervisor: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        # 当前 Zeek 的代数（每次热加载加 1），决定日志目录与 fanout 组
+        self._generation = 0
+        # 启动 / 停止 / 热加载互斥
+        self._control_lock = threading.Lock()
+        # 采集流水线在多次启停之间保留，文件句柄与读取位置不丢失
+        self._pipeline = IngestPipeline(
+            worker_log_dirs(),
+            parser_workers=settings.ingest_parser_workers,
+            parser_mode=settings.ingest_parser_mode,
+            queue_size=settings.ingest_queue_size,
+            conn_overflow=settings.ingest_conn_overflow,
+        )
+        self._replay_lock = threading.Lock()
+        self._replay_thread: Optional[threading.Thread] = None
+        self._replay_stats: Optional[ReplayStats] = None
+        self._replay_started = 0.0
+        self._replay_procs: List[subprocess.Popen] = []
+        self._replay_cancel = threading.Event()
 
     @property
     def running(self) -> bool:
-        return self._proc is not None and self._proc.poll() is None
+        return any(w.running for w in self._workers)
 
     @property
     def pid(self) -> Optional[int]:
-        return self._proc.pid if self.running and self._proc else None
+        """第一个运行中的 Zeek 进程 PID（多 worker 时各自的 PID 见 workers_status）。"""
+        for w in self._workers:
+            if w.running and w.proc is not None:
+                return w.proc.pid
+        return None
+
+    def workers_status(self) -> List[ZeekWorkerStatus]:
+        return [w.status() for w in self._workers]
+
+    def ingest_stats(self) -> List[IngestChannelStats]:
+        return self._pipeline.stats()
 
     def start(self) -> None:
+        with self._control_lock:
+            self._start()
+
+    def _start(self) -> None:
         if self.running:
             return
+        if self._supervisor is not None:
+            # 上次启动的进程已全部退出（监督线程仍在等待重启）：停掉后重新启动
+            self._stopping.set()
+            self._supervisor.join(timeout=5)
+            self._supervisor = None
         if not settings.zeek_exists:
             raise RuntimeError(f"Zeek 不存在或不可执行: {settings.zeek_bin}")
 
         # 在启动 Zeek 前，根据规则配置生成 local.zeek
         try:
-            self._prepare_local_zeek()
+            self._prepare_local_zeek(local_zeek_path(self._generation))
         except Exception as e:
             # 不因为规则配置失败而阻止启动，但打印提示
             print(f"[zeek-runner] 生成 local.zeek 失败: {e}")
 
-        logs_dir: Path = settings.logs_dir
-        logs_dir.mkdir(parents=True, exist_ok=True)
+        self._workers = self._new_workers(self._generation)
+        for w in self._workers:
+            w.spawn()
+
+        self._stopping.clear()
+        self._supervisor = threading.Thread(
+            target=self._supervise, name="zeek-supervisor", daemon=True
+        )
+        self._supervisor.start()
+
+        # 启动日志采集流水线
+        self._pipeline.start()
+
+    @classmethod
+    def _new_workers(cls, generation: int) -> List[_ZeekWorker]:
+        dirs = generation_log_dirs(generation)
+        if len(dirs) > 1:
+            # AF_PACKET fanout：同一 fanout 组内的进程按流哈希分担网卡流量；
+            # 相邻两代使用不同的组（ZEEK_FANOUT_ID / +1），热加载并行期间各自收到完整的流量
+            source = ["-i", f"af_packet::{settings.capture_iface}"]
+            redefs = [
+                "AF_Packet::enable_fanout=T",
+                f"AF_Packet::fanout_id={settings.zeek_fanout_id + generation % 2}",
+                "AF_Packet::fanout_mode=AF_Packet::FANOUT_HASH",
+            ]
+        else:
+            source, redefs = ["-i", settings.capture_iface], []
+        script = local_zeek_path(generation)
+        return [
+            _ZeekWorker(i, d, cls._zeek_cmd(source, d, script, redefs))
+            for i, d in enumerate(dirs)
+        ]
+
+    def reload(self) -> bool:
+        """
+        按当前规则配置热加载 Zeek，Zeek 未运行时返回 False（规则在下次启动时生效）。
+
+        1. 按当前规则生成新一代的脚本（见 local_zeek_path），新一代 Zeek 写入另一组日志目录，
+           与旧进程并行抓包；旧进程使用的脚本不被改动；
+        2. 新进程全部运行满 ZEEK_RELOAD_GRACE 秒视为就绪，否则结束新进程、保留旧进程并抛出 RuntimeError；
+        3. 以就绪时刻为界，采集流水线只保留旧进程 ts 之前、新进程 ts 之后的记录，
+           随后停止旧进程（退出时写出仍在跟踪的连接），流水线读完旧文件后切换到新目录。
+        """
+        with self._control_lock:
+            if not self.running:
+                return False
+            generation = self._generation + 1
+            try:
+                self._prepare_local_zeek(local_zeek_path(generation))
+            except Exception as e:
+                raise RuntimeError(f"生成 local.zeek 失败: {e}") from e
 
-        cmd = [
+            workers = self._new_workers(generation)
+            try:
+                for w in workers:
+                    # 上上一代留下的日志已经入库，删除后新文件从头跟随
+                    for name in self._pipeline.log_names:
+                        (w.logs_dir / name).unlink(missing_ok=True)
+                    w.spawn()
+            except OSError as e:
+                for w in workers:
+                    w.terminate()
+                raise RuntimeError(f"启动新的 Zeek 进程失败: {e}") from e
+
+            deadline = time.monotonic() + settings.zeek_reload_grace
+            while time.monotonic() < deadline and all(w.running for w in workers):
+                time.sleep(0.2)
+            failed = [w for w in workers if not w.running]
+            if failed:
+                for w in workers:
+                    w.terminate()
+                w = failed[0]
+                raise RuntimeError(
+                    f"新的 Zeek 进程启动后退出（退出码 {w.proc.returncode if w.proc else None}），"
+                    f"继续使用原有规则运行；详见 {w.logs_dir / 'zeek_stderr.log'}"
+                )
+
+            self._pipeline.begin_handover([w.logs_dir for w in workers], time.time())
+            # 先替换监督线程看护的进程列表，旧进程退出后不会被重新拉起
+            old, self._workers = self._workers, workers
+            self._generation = generation
+            for w in old:
+                w.terminate()
+            self._pipeline.complete_handover()
+            return True
+
+    def _supervise(self) -> None:
+        while not self._stopping.wait(1.0):
+            now = time.monotonic()
+            for w in self._workers:
+                if self._stopping.is_set():
+                    return
+                w.check(now)
+
+    @staticmethod
+    def _zeek_cmd(
+        source: List[str], logs_dir: Path, script: Path, redefs: Sequence[str] = ()
+    ) -> List[str]:
+        return [
             str(settings.zeek_bin),
-            "-i",
-            settings.capture_iface,
+            *source,
             "-b",  # 不做 stdout buffer
             f"Log::default_logdir={logs_dir}",
-            str(settings.zeek_scripts_dir / "local.zeek"),
+            *redefs,
+            str(script),
         ]
 
-        self._stop_event.clear()
-        self._proc = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-
-        # 独立线程持续读取 Zeek stderr，写入日志文件，方便排查启动/运行问题
-        def _stderr_pump(proc: subprocess.Popen, log_path: Path) -> None:
-            try:
-                with log_path.open("a", encoding="utf-8", errors="ignore") as log_f:
-                    if proc.stderr is None:
-                        return
-                    for line in proc.stderr:
-                        # 同时写入文件与标准输出（方便在终端直接看到）
-                        log_f.write(line)
-                        log_f.flush()
-                        print(f"[zeek stderr] {line.rstrip()}")
-            except Exception:
-                # 不因日志线程异常影响主流程
-                pass
-
-        self._stderr_thread = threading.Thread(
-            target=_stderr_pump,
-            args=(self._proc, logs_dir / "zeek_stderr.log"),
-            name="zeek-stderr-logger",
-            daemon=True,
-        )
-        self._stderr_thread.start()
+    # ---- 离线 pcap 回放 ----
 
-        # 启动解析线程
-        self._parser_thread = threading.Thread(
-            target=self._parser_loop, name="zeek-log-parser", daemon=True
-        )
-        self._parser_thread.start()
+    @property
+    def replaying(self) -> bool:
+        return self._replay_thread is not None and self._replay_thread.is_alive()
+
+    def replay_stats(self) -> Optional[ReplayStats]:
+        with self._replay_lock:
+            if self._replay_stats is None:
+                return None
+            stats = self._replay_stats.model_copy(deep=True)
+        stats.running = self.replaying
+        if stats.running:
+            stats.elapsed_seconds = time.perf_counter() - self._replay_started
+        analysed = stats.split_seconds + stats.zeek_seconds
+        if analysed > 0:
+            stats.mb_per_sec = stats.pcap_bytes / analysed / (1024 * 1024)
+        return stats
+
+    def start_replay(self, pcaps: Sequence[Path], jobs: Optional[int] = None) -> ReplayStats:
+        """
+        后台回放 pcap 文件（zeek -r），立即返回初始统计。
 
-    def _prepare_local_zeek(self) -> None:
+        不依赖网卡与实时流量，可用于取证复查与可复现的吞吐基准。
+        日志写入 <logs_dir>/replay/<时间>/ 下各自的子目录，不会被实时采集流水线跟随。
+        """
+        if not settings.zeek_exists:
+            raise RuntimeError(f"Zeek 不存在或不可执行: {settings.zeek_bin}")
+        missing = [str(p) for p in pcaps if not p.is_file()]
+        if missing:
+            raise RuntimeError(f"pcap 文件不存在: {', '.join(missing)}")
+        jobs = max(1, jobs or settings.replay_jobs)
+        out_dir = settings.logs_dir / "replay" / datetime.now().strftime("%Y%m%d-%H%M%S")
+        with self._replay_lock:
+            if self.replaying:
+                raise RuntimeError("已有回放任务在运行")
+            self._replay_stats = ReplayStats(
+                running=True,
+                pcaps=[str(p) for p in pcaps],
+                jobs=jobs,
+                pcap_bytes=sum(p.stat().st_size for p in pcaps),
+                output_dir=str(out_dir),
+            )
+            self._replay_started = time.perf_counter()
+            self._replay_cancel.clear()
+            self._replay_thread = threading.Thread(
+                target=self._replay,
+                args=(list(pcaps), jobs, out_dir),
+                name="zeek-replay",
+                daemon=True,
+            )
+            self._replay_thread.start()
+        return self.replay_stats()  # type: ignore[return-value]
+
+    def run_replay(self, pcaps: Sequence[Path], jobs: Optional[int] = None) -> ReplayStats:
+        """同步回放（命令行 / 基准测试使用），返回最终统计。"""
+        self.start_replay(pcaps, jobs)
+        assert self._replay_thread is not None
+        self._replay_thread.join()
+        return self.replay_stats()  # type: ignore[return-value]
+
+    def _replay(self, pcaps: List[Path], jobs: int, out_dir: Path) -> None:
+        stats = self._replay_stats
+        assert stats is not None
+        shard_dir = out_dir / "shards"
+        try:
+            try:
+                self._prepare_local_zeek(_replay_zeek_path())
+            except Exception as e:
+                print(f"[zeek-runner] 生成 local.zeek 失败: {e}")
+
+            # 1. 大文件按流切分：每个文件分到的进程数 = jobs / 文件数（至少 1）
+            t = time.perf_counter()
+            per_file = max(1, jobs // len(pcaps))
+            shards = [
+                per_file if p.stat().st_size >= settings.replay_split_bytes else 1 for p in pcaps
+            ]
+            inputs: List[Path] = []
+            if max(shards) > 1:
+                # 切分是纯 Python 的 CPU 密集操作，多个文件在进程池中并行切分
+                with ProcessPoolExecutor(
+                    max_workers=min(jobs, len(pcaps)),
+                    mp_context=multiprocessing.get_context("spawn"),
+                ) as executor:
+                    futures = [
+                        executor.submit(split_pcap, p, shard_dir / f"{i:03d}", n)
+                        for i, (p, n) in enumerate(zip(pcaps, shards))
+                    ]
+                    for f in futures:
+                        inputs.extend(f.result())
+            else:
+                inputs = list(pcaps)
+            with self._replay_lock:
+                stats.split_seconds = time.perf_counter() - t
+                stats.shards = len(inputs)
+
+            # 2. 每个分片一个 zeek -r 进程，最多 jobs 个并行，各自独立的日志目录
+            t = time.perf_counter()
+            width = len(str(len(inputs)))
+            job_dirs = [out_dir / f"job-{i:0{width}d}" for i in range(len(inputs))]
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                list(pool.map(self._replay_one, inputs, job_dirs))
+            with self._replay_lock:
+                stats.zeek_seconds = time.perf_counter() - t
+            shutil.rmtree(shard_dir, ignore_errors=True)
+
+            # 3. 输出日志经离线导入写入 storage（与归档导入同一路径）
+            if not self._replay_cancel.is_set():
+                ingest = importer.run([out_dir])
+                with self._replay_lock:
+                    stats.ingest = ingest
+        except Exception as e:
+            with self._replay_lock:
+                stats.errors.append(f"回放中止: {e}")
+        finally:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+            with self._replay_lock:
+                stats.elapsed_seconds = time.perf_counter() - self._replay_started
+
+    def _replay_one(self, pcap: Path, logs_dir: Path) -> None:
+        if self._replay_cancel.is_set():
+            return
+        logs_dir.mkdir(parents=True, exist_ok=True)
+        with (logs_dir / "zeek_stderr.log").open("w", encoding="utf-8") as err:
+            proc = subprocess.Popen(
+                self._zeek_cmd(["-r", str(pcap)], logs_dir, _replay_zeek_path()),
+                cwd=logs_dir,
+                stdout=subprocess.DEVNULL,
+                stderr=err,
+            )
+            with self._replay_lock:
+                self._replay_procs.append(proc)
+            try:
+                code = proc.wait()
+            finally:
+                with self._replay_lock:
+                    self._replay_procs.remove(proc)
+        with self._replay_lock:
+            assert self._replay_stats is not None
+            if code == 0:
+                self._replay_stats.shards_done += 1
+            else:
+                self._replay_stats.errors.append(
+                    f"{pcap}: zeek 退出码 {code}，详见 {logs_dir / 'zeek_stderr.log'}"
+                )
+
+    def cancel_replay(self) -> None:
+        """终止正在运行的回放（已分析完的分片不再导入）。"""
+        self._replay_cancel.set()
+        with self._replay_lock:
+            procs = list(self._replay_procs)
+        for proc in procs:
+            proc.terminate()
+
+    def _prepare_local_zeek(self, path: Path) -> None:
         """
-        根据 /api/rules 保存的配置文件生成 Zeek 启动使用的 local.zeek。
+        根据 /api/rules 保存的配置文件生成 Zeek 启动使用的脚本（写入 path）。
 
         规则配置文件格式（JSON）示例：
         {
@@ -111,10 +509,8 @@ class ZeekRunner:
         }
         """
         import json
-        import subprocess
 
         config_path = settings.zeek_scripts_dir / "rules_config.json"
-        local_zeek_path = settings.zeek_scripts_dir / "local.zeek"
 
         enabled_rules = []
         custom_rule = ""
@@ -128,11 +524,21 @@ class ZeekRunner:
             enabled_rules = cfg.get("enabled_rules") or []
             custom_rule = cfg.get("custom_rule") or ""
 
+        # Zeek 内置脚本路径的校验结果按 Zeek 版本缓存（见 zeek_check），配置不变时不启动 zeek 进程
+        loadable = script_validator.check_sync(
+            [r for r in enabled_rules if r.startswith("policy/") or r.startswith("base/")]
+        )
+
         lines = []
         # 基础必要模块
         lines.append("@load base/protocols/conn")
+        # -b（bare mode）下协议分析脚本不会自动加载，需显式加载才会输出 http.log
+        lines.append("@load base/protocols/http")
         lines.append("@load base/frameworks/notice")
         lines.append("@load base/frameworks/intel")
+        if settings.zeek_json_logs:
+            # JSON writer：采集端自动识别，解析时免去占位符与字段映射
+            lines.append("@load policy/tuning/json-logs")
         lines.append("")
 
         # 已启用规则（Zeek 官方脚本通常直接 @load 路径）
@@ -141,23 +547,14 @@ class ZeekRunner:
             if rule.startswith("custom/"):
                 lines.append(f"# custom rule: {rule}")
                 continue
+            # Python 侧规则由采集流水线评估（见 detection），与 Zeek 无关
+            if rule.startswith(PYRULE_PREFIX):
+                lines.append(f"# python rule (zeek_py.detection): {rule}")
+                continue
 
-            # 只对 Zeek 内置脚本路径做一次本地校验，避免因为版本差异导致 Zeek 无法启动
+            # 只对 Zeek 内置脚本路径做本地校验，避免因为版本差异导致 Zeek 无法启动
             if rule.startswith("policy/") or rule.startswith("base/"):
-                try:
-                    proc = subprocess.run(
-                        [str(settings.zeek_bin), "-N", rule],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                        timeout=5.0,
-                    )
-                except Exception:
-                    # Zeek 无法执行时，为了不影响启动，直接忽略此规则
-                    lines.append(f"# skipped rule (zeek -N 失败): {rule}")
-                    continue
-
-                if proc.returncode != 0:
+                if not loadable.get(rule):
                     # 记录一行注释，方便在生成的 local.zeek 中排查
                     lines.append(f"# skipped rule (not available in this Zeek): {rule}")
                     continue
@@ -174,112 +571,62 @@ class ZeekRunner:
             lines.append(custom_rule)
             lines.append("# ---- custom rule snippet end ----")
 
-        with local_zeek_path.open("w", encoding="utf-8") as f:
+        with path.open("w", encoding="utf-8") as f:
             f.write("\n".join(lines) + "\n")
 
     def stop(self) -> None:
-        self._stop_event.set()
-        if self._proc and self.running:
-            self._proc.terminate()
-            try:
-                self._proc.wait(timeout=10)
-            except subprocess.TimeoutExpired:
-                self._proc.kill()
-        self._proc = None
+        with self._control_lock:
+            self._stop()
+
+    def _stop(self) -> None:
+        self.cancel_replay()
+        # 先停监督线程，避免把正在退出的进程重新拉起
+        self._stopping.set()
+        if self._supervisor is not None:
+            self._supervisor.join(timeout=5)
+            self._supervisor = None
+        for w in self._workers:
+            w.terminate()
+        # Zeek 退出后再停流水线，尽量把最后写出的日志也读完
+        self._pipeline.stop()
 
-    def _parser_loop(self) -> None:
-        """
-        简单轮询日志文件大小变化，重新解析整个文件。
-        为了实现简单可靠，使用“按字节偏移”的增量读取策略：
-        - 记录上次读取到的文件大小（字节数）；
-        - 如果文件变大，只解析新增的部分；
-        - 如果文件变小（如轮转），从头重新解析。
-        """
-        conn_log = settings.logs_dir / "conn.log"
-        notice_log = settings.logs_dir / "notice.log"
-        intel_log = settings.logs_dir / "intel.log"
-        weird_log = settings.logs_dir / "weird.log"
 
-        while not self._stop_event.is_set():
-            try:
-                # conn.log
-                if conn_log.is_file():
-                    size = conn_log.stat().st_size
-                    # 文件被截断/轮转：从头开始
-                    if size < self._last_conn_size:
-                        self._last_conn_size = 0
-
-                    if size > self._last_conn_size:
-                        # 仅解析新增部分
-                        with conn_log.open("r", encoding="utf-8", errors="ignore") as f:
-                            f.seek(self._last_conn_size)
-                            for line in f:
-                                from .parsers.conn_parser import parse_conn_line
-
-                                flow = parse_conn_line(line)
-                                if flow:
-                                    storage.add_flow(flow)
-                        self._last_conn_size = size
-
-                # notice.log
-                if notice_log.is_file():
-                    size = notice_log.stat().st_size
-                    if size < self._last_notice_size:
-                        self._last_notice_size = 0
-
-                    if size > self._last_notice_size:
-                        with notice_log.open(
-                            "r", encoding="utf-8", errors="ignore"
-                        ) as f:
-                            f.seek(self._last_notice_size)
-                            for line in f:
-                                from .parsers.threat_parser import parse_notice_line
-
-                                ev = parse_notice_line(line)
-                                if ev:
-                                    storage.add_threat(ev)
-                        self._last_notice_size = size
-
-                # intel.log
-                if intel_log.is_file():
-                    size = intel_log.stat().st_size
-                    if size < self._last_intel_size:
-                        self._last_intel_size = 0
-
-                    if size > self._last_intel_size:
-                        with intel_log.open("r", encoding="utf-8", errors="ignore") as f:
-                            f.seek(self._last_intel_size)
-                            for line in f:
-                                from .parsers.threat_parser import parse_intel_line
-
-                                ev = parse_intel_line(line)
-                                if ev:
-                                    storage.add_threat(ev)
-                        self._last_intel_size = size
-
-                # weird.log 也视作“告警”来源之一
-                if weird_log.is_file():
-                    size = weird_log.stat().st_size
-                    if size < self._last_weird_size:
-                        self._last_weird_size = 0
-
-                    if size > self._last_weird_size:
-                        with weird_log.open("r", encoding="utf-8", errors="ignore") as f:
-                            f.seek(self._last_weird_size)
-                            for line in f:
-                                from .parsers.threat_parser import parse_weird_line
-
-                                ev = parse_weird_line(line)
-                                if ev:
-                                    storage.add_threat(ev)
-                        self._last_weird_size = size
-            except Exception:
-                # 解析线程不应因异常退出，简单忽略错误
-                pass
-
-            time.sleep(2.0)
+zeek_runner = ZeekRunner()
 
 
-zeek_runner = ZeekRunner()
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """命令行回放 pcap：python -m zeek_py.zeek_runner replay a.pcap b.pcap -j 8"""
+    parser = argparse.ArgumentParser(prog="python -m zeek_py.zeek_runner")
+    sub = parser.add_subparsers(dest="command", required=True)
+    replay = sub.add_parser("replay", help="用 zeek -r 离线分析 pcap 并导入存储")
+    replay.add_argument("pcaps", nargs="+", type=Path)
+    replay.add_argument(
+        "-j", "--jobs", type=int, default=None, help="并行 Zeek 进程数（默认 REPLAY_JOBS）"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        stats = zeek_runner.run_replay(args.pcaps, args.jobs)
+    except RuntimeError as e:
+        parser.exit(1, f"[replay] {e}\n")
+    finally:
+        storage.close()
+    for err in stats.errors:
+        print(f"[replay] {err}")
+    ingest = stats.ingest
+    print(
+        f"[replay] {len(stats.pcaps)} 个 pcap（{stats.pcap_bytes / 1024 / 1024:.1f} MB）→ "
+        f"{stats.shards} 个分片 / {stats.jobs} 个 Zeek 进程：切分 {stats.split_seconds:.1f}s，"
+        f"分析 {stats.zeek_seconds:.1f}s，{stats.mb_per_sec:.1f} MB/s"
+    )
+    if ingest is not None:
+        print(
+            f"[replay] 导入 {ingest.records} 条记录，{ingest.lines_per_sec:,.0f} 行/s，"
+            f"日志目录 {stats.output_dir}"
+        )
+
+
+if __name__ == "__main__":
+    main()
 
 